@@ -2,4 +2,21 @@ import os
 
 ICU_MORTALITY_PREDICTION_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(ICU_MORTALITY_PREDICTION_DIR)
-DATA_DIR = os.path.join(ROOT_DIR, 'icu_mortality_prediction', 'data')
\ No newline at end of file
+DATA_DIR = os.path.join(ROOT_DIR, 'icu_mortality_prediction', 'data')
+
+# DATA LAYOUT, THE RAW QUERY EXTRACTS UNDER raw, INTERMEDIATE RESULTS UNDER interim
+RAW_DIR = os.path.join(DATA_DIR, 'raw')
+INTERIM_DIR = os.path.join(DATA_DIR, 'interim')
+EXTERNAL_DIR = os.path.join(DATA_DIR, 'external')
+FEATURES_DIR = os.path.join(DATA_DIR, 'features')
+PIPELINE_CACHE_DIR = os.path.join(INTERIM_DIR, 'pipeline')
+PARTITIONS_DIR = os.path.join(INTERIM_DIR, 'partitions')
+TENSOR_DIR = os.path.join(INTERIM_DIR, 'tensor')
+MODELS_DIR = os.path.join(ICU_MORTALITY_PREDICTION_DIR, 'models', 'store')
+REPORTS_DIR = os.path.join(ICU_MORTALITY_PREDICTION_DIR, 'reports')
+BENCHMARK_BASELINE = os.path.join(ICU_MORTALITY_PREDICTION_DIR, 'benchmarks', 'baseline.json')
+
+CHART_EVENTS_CSV = os.path.join(RAW_DIR, 'CHART_EVENTS_FIRST24.csv')
+LAB_EVENTS_CSV = os.path.join(RAW_DIR, 'LAB_EVENTS_FIRST24.csv')
+PTNT_DEMOG_CSV = os.path.join(INTERIM_DIR, 'PTNT_DEMOG_FIRST24.csv')
+HCUP_DEFINITIONS = os.path.join(EXTERNAL_DIR, 'hcup_ccs_2015_definitions.yaml')
@@ -0,0 +1,170 @@
+""" benchmark of the feature pipeline on synthetic data at several scales.
+
+for every scale (number of ICU stays) run_benchmark writes a synthetic extract with
+data/synthetic.py, unless one is already there, and runs the chart, lab and
+demographics stages and their combination uncached with telemetry on. the stage times
+come from a pass without memory tracing, since tracemalloc slows pandas down, and the
+peak memory from a second pass with it.
+
+the results are compared with a stored baseline. wall times are divided by the time
+of a fixed pandas workload measured on the same machine (calibrate), so a baseline
+recorded on one machine still flags regressions on another. a stage regresses when
+its normalized time grows by more than time_tolerance or its peak memory by more
+than memory_tolerance. stages under min_seconds or min_bytes in both runs are left
+out of that comparison, their measurements are mostly noise.
+
+no baseline is committed, the first run with --baseline writes it (by default to
+benchmarks/baseline.json in the package) and later runs compare with it. the
+calibration does not remove all of the difference between machines, so the baseline
+is best recorded on the machine that runs the comparisons. --update-baseline replaces it.
+
+    icu-mortality benchmark --scales 1000 10000 --baseline
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from .. import HCUP_DEFINITIONS
+from .data import synthetic
+from .features import build
+from .utils import telemetry
+from .utils.pipeline import Pipeline
+
+
+TARGETS = build.SELECTED + ['combined']
+
+COLUMNS = ['scale', 'name', 'parent', 'wall', 'cpu', 'peak_mem', 'rows_out', 'cols_out']
+
+# FILE MARKING A COMPLETELY WRITTEN SYNTHETIC EXTRACT
+MARKER = 'synthetic.json'
+
+
+def calibrate(repeat=3, rows=10 ** 6):
+    """ best of repeat timings of a fixed groupby and sort, in seconds """
+    rng = np.random.RandomState(0)
+    frame = pd.DataFrame({'icustay_id': rng.randint(0, rows // 20, rows), 'valuenum': rng.normal(size=rows)})
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        frame.groupby('icustay_id')['valuenum'].agg(['mean', 'std', 'max'])
+        frame.sort_values(['icustay_id', 'valuenum'])
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def synthetic_data(root, n_stays, seed=0, definitions_path=HCUP_DEFINITIONS):
+    """ paths of the synthetic extract of n_stays stays under root, written if it is not there """
+    marker = os.path.join(root, MARKER)
+    settings = {'n_stays': n_stays, 'seed': seed}
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == settings:
+                return synthetic.synthetic_paths(root)
+    paths = synthetic.write_synthetic(root, n_stays, seed=seed, definitions_path=definitions_path)
+    with open(marker, 'w') as f:
+        json.dump(settings, f)
+    return paths
+
+
+def scaled_stages(paths, n_stays):
+    """ the feature pipeline on the synthetic_paths with its sample thresholds scaled to n_stays """
+    return build.stages(paths['chart'], paths['labs'], paths['demographics'], paths['definitions'],
+                        scale=n_stays / float(synthetic.REFERENCE_STAYS))
+
+
+def _measure(stages, trace_memory):
+    recorder = telemetry.enable(trace_memory=trace_memory)
+    try:
+        # THE STAGES PRINT THEIR PROGRESS, WHICH WOULD DROWN THE RESULTS
+        with contextlib.redirect_stdout(io.StringIO()):
+            Pipeline(stages).run(TARGETS)
+    finally:
+        telemetry.disable()
+    return recorder.frame()
+
+
+def run_scale(n_stays, data_root, seed=0, trace_memory=True, definitions_path=HCUP_DEFINITIONS):
+    """ telemetry of one uncached run at n_stays, with peak memory from a second run if trace_memory """
+    paths = synthetic_data(os.path.join(data_root, 'stays_{}'.format(n_stays)), n_stays, seed, definitions_path)
+    stages = scaled_stages(paths, n_stays)
+    frame = _measure(stages, trace_memory=False)
+    if trace_memory:
+        memory = _measure(stages, trace_memory=True)
+        frame['peak_mem'] = frame['name'].map(memory.groupby('name')['peak_mem'].max())
+    frame['scale'] = n_stays
+    return frame[COLUMNS]
+
+
+def run_benchmark(scales, data_root, seed=0, trace_memory=True, definitions_path=HCUP_DEFINITIONS):
+    """ telemetry of every stage and statistic family at each scale, see run_scale """
+    frames = []
+    for n_stays in scales:
+        print("benchmarking {} stays".format(n_stays))
+        frames.append(run_scale(n_stays, data_root, seed, trace_memory, definitions_path))
+    return pd.concat(frames, ignore_index=True)
+
+
+def save_baseline(results, path, calibration):
+    """ store benchmark results with the calibration time of the machine they ran on """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    baseline = {'calibration': calibration, 'python': sys.version.split()[0], 'platform': platform.platform(),
+                'pandas': pd.__version__,
+                'records': json.loads(results[COLUMNS].to_json(orient='records'))}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def load_baseline(path):
+    """ (results, calibration) stored by save_baseline """
+    with open(path) as f:
+        baseline = json.load(f)
+    return pd.DataFrame(baseline['records'], columns=COLUMNS), baseline['calibration']
+
+
+def compare(results, calibration, baseline, baseline_calibration, time_tolerance=.5, memory_tolerance=.25,
+            min_seconds=.5, min_bytes=2 ** 20):
+    """ stages of results slower or larger than in the baseline.
+
+    :param calibration: calibrate() on the machine results ran on
+    :param baseline_calibration: calibrate() on the machine of the baseline
+    :param time_tolerance: allowed relative growth of the normalized wall time
+    :param memory_tolerance: allowed relative growth of the peak memory
+    :param min_seconds: stages below this wall time in both runs are not timed
+    :param min_bytes: stages below this peak memory in both runs are not measured
+    :return: frame of scale, name, metric, baseline, current and ratio, one row per regression
+    """
+    keys = ['scale', 'name', 'parent']
+    current = results.fillna({'parent': ''}).groupby(keys)[['wall', 'peak_mem']].sum(min_count=1)
+    previous = baseline.fillna({'parent': ''}).groupby(keys)[['wall', 'peak_mem']].sum(min_count=1)
+    merged = current.join(previous, how='inner', lsuffix='_current', rsuffix='_baseline').reset_index()
+    # WALL TIME OF THE BASELINE AS IT WOULD BE ON THIS MACHINE
+    merged['wall_baseline'] = merged['wall_baseline'] * calibration / float(baseline_calibration)
+
+    regressions = []
+    for metric, tolerance in [('wall', time_tolerance), ('peak_mem', memory_tolerance)]:
+        rows = merged.dropna(subset=[metric + '_current', metric + '_baseline'])
+        floor = min_seconds if metric == 'wall' else min_bytes
+        rows = rows[(rows[metric + '_current'] >= floor) | (rows[metric + '_baseline'] >= floor)]
+        ratio = rows[metric + '_current'] / rows[metric + '_baseline'].clip(lower=1e-9)
+        rows = rows.assign(metric=metric, baseline=rows[metric + '_baseline'], current=rows[metric + '_current'],
+                           ratio=ratio)
+        regressions.append(rows[rows['ratio'] > 1 + tolerance])
+    columns = ['scale', 'name', 'metric', 'baseline', 'current', 'ratio']
+    return pd.concat(regressions, ignore_index=True)[columns]
+
+
+def format_results(results):
+    """ wall time and peak memory of the stages per scale, statistic families left out """
+    stages = results[results['parent'].isnull()]
+    table = stages.pivot_table(index='name', columns='scale', values=['wall', 'peak_mem'],
+                               aggfunc='max', dropna=False)
+    table['peak_mem'] = table['peak_mem'] / 2. ** 20
+    return table.rename(columns={'wall': 'wall s', 'peak_mem': 'peak MB'}).round(2).to_string()
@@ -0,0 +1,357 @@
+""" synthetic MIMIC-shaped first 24h extracts for testing and benchmarking.
+
+write_synthetic writes CHART_EVENTS_FIRST24.csv, LAB_EVENTS_FIRST24.csv and
+PTNT_DEMOG_FIRST24.csv with the columns of the original queries, and a copy of the
+hcup ccs definitions, under the same layout as DATA_DIR, so the importers, the
+pipeline stages and the icu-mortality command run on them unchanged with --data-dir.
+
+the share of stays with each label and the measurements per stay follow the counts
+printed in CHARTEVENTS_FIRST24.ipynb and LABEVENTS_FIRST24.ipynb. labels measured
+together (arterial line, blood gas, ventilator, neuro checks) share a group, so their
+missingness is correlated as in the real extracts. every stay has a latent severity
+that shifts its measurements and sets its mortality, so the feature selection finds
+signal. labels below the sample thresholds of the exploratory scripts are included too.
+
+stays are generated and appended in batches, so the 1M stay scale needs no more
+memory than one batch.
+"""
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import yaml
+from scipy.special import expit, ndtr
+
+from ... import CHART_EVENTS_CSV, DATA_DIR, HCUP_DEFINITIONS, LAB_EVENTS_CSV, PTNT_DEMOG_CSV
+
+
+# STAYS IN THE ORIGINAL EXTRACTS, THE SAMPLE THRESHOLDS OF THE SCRIPTS ARE SET FOR THIS MANY
+REFERENCE_STAYS = 60000
+
+START = pd.Timestamp('2100-01-01')
+
+# GROUP -> SHARE OF STAYS
+CHART_GROUPS = {'vitals': 1.0, 'arterial': 0.29, 'bloods': 0.483, 'neuro': 0.482, 'vent': 0.235}
+LAB_GROUPS = {'panel': 1.0, 'bloodgas': 0.76}
+
+# (LABEL, GROUP, SHARE OF THE GROUP, MEASUREMENTS PER 24H, MEAN, SD, SHIFT PER SD OF SEVERITY,
+#  LOWER AND UPPER BOUND, DECIMALS)
+CHART_CONTINUOUS = [
+    ('Heart Rate', 'vitals', 1.0, 24, 87., 17., .35, 20, 250, 0),
+    ('Respiratory Rate', 'vitals', .87, 22, 19., 5., .3, 2, 60, 0),
+    ('Temperature C (calc)', 'vitals', .434, 6, 37., .7, .15, 30, 42, 1),
+    ('Temperature C', 'vitals', .095, 6, 37., .7, .15, 30, 42, 1),
+    ('Arterial BP Mean', 'arterial', .918, 24, 78., 13., -.35, 20, 200, 0),
+    ('Arterial BP [Diastolic]', 'arterial', .896, 24, 59., 11., -.3, 15, 150, 0),
+    ('Arterial BP [Systolic]', 'arterial', .922, 24, 118., 20., -.35, 40, 250, 0),
+    ('Arterial pH', 'arterial', 1.0, 4, 7.39, .07, -.4, 6.8, 7.7, 2),
+    ('Art.pH', 'arterial', .94, 4, 7.39, .07, -.4, 6.8, 7.7, 2),
+    ('ART BP Systolic', 'arterial', .07, 24, 118., 20., -.35, 40, 250, 0),
+    ('ART BP Diastolic', 'arterial', .069, 24, 59., 11., -.3, 15, 150, 0),
+    ('Arterial BP Mean #2', 'arterial', .019, 24, 78., 13., -.35, 20, 200, 0),
+    ('pH (Art)', 'arterial', .062, 4, 7.39, .07, -.4, 6.8, 7.7, 2),
+    ('Creatinine (0-1.3)', 'bloods', .997, 2, 1.4, .9, .45, .1, 12, 1),
+    ('Glucose (70-105)', 'bloods', 1.0, 4, 140., 45., .25, 20, 900, 0),
+    ('Hematocrit', 'bloods', 1.0, 3, 31., 5., -.2, 10, 60, 1),
+    ('Hemoglobin', 'bloods', .98, 3, 10.5, 1.8, -.2, 3, 20, 1),
+    ('Inspired O2 Fraction', 'vent', .83, 6, 50., 15., .35, 21, 100, 0),
+    ('Resp Rate (Total)', 'vent', 1.0, 12, 18., 5., .3, 2, 60, 0),
+    ('Resp Rate (Spont)', 'vent', .93, 12, 4., 5., -.1, 0, 50, 0),
+]
+
+# (LABEL, GROUP, SHARE OF THE GROUP, MEASUREMENTS, MEAN, SD, LOWER AND UPPER BOUND, DECIMALS)
+CHART_CONSTANT = [
+    ('Admission Weight (Kg)', 'vitals', .332, 1, 81., 22., 30, 250, 1),
+    ('Height (cm)', 'vitals', .146, 1, 169., 11., 130, 210, 0),
+]
+
+# (LABEL, GROUP, SHARE OF THE GROUP, MEASUREMENTS PER 24H, SHIFT PER SD OF SEVERITY,
+#  [(VALUE, VALUENUM, PROBABILITY)] FROM BEST TO WORST)
+CHART_CATEGORICAL = [
+    ('GCS Total', 'neuro', 1.0, 6, .8,
+     [(str(score), score, p) for score, p in zip(range(15, 2, -1),
+                                                 [.38, .1, .07, .06, .05, .05, .05, .04, .04, .03, .03, .04, .06])]),
+    ('GCS - Eye Opening', 'neuro', .806, 6, .8,
+     [('Spontaneously', 4, .55), ('To Speech', 3, .2), ('To Pain', 2, .1), ('No Response', 1, .15)]),
+    ('GCS - Motor Response', 'neuro', .805, 6, .8,
+     [('Obeys Commands', 6, .6), ('Localizes Pain', 5, .15), ('Flex-withdraws', 4, .1),
+      ('Abnormal Flexion', 3, .04), ('Abnormal extension', 2, .03), ('No response', 1, .08)]),
+    ('GCS - Verbal Response', 'neuro', .805, 6, .8,
+     [('Oriented', 5, .4), ('Confused', 4, .15), ('Inappropriate Words', 3, .05),
+      ('Incomprehensible sounds', 2, .05), ('No Response-ETT', 1, .3), ('No Response', 1, .05)]),
+    ('Capillary Refill', 'neuro', .205, 6, .6,
+     [('Brisk', np.nan, .75), ('Normal <3 secs', np.nan, .1), ('Delayed', np.nan, .1),
+      ('Abnormal >3 secs', np.nan, .05)]),
+]
+
+# (LABEL, GROUP, SHARE OF THE GROUP, MEASUREMENTS PER 24H, MEAN, SD, SHIFT PER SD OF SEVERITY,
+#  LOWER AND UPPER BOUND, DECIMALS, NORMAL RANGE)
+LAB_CONTINUOUS = [
+    ('Hematocrit', 'panel', .993, 3, 31., 5., -.2, 10, 60, 1, (36, 48)),
+    ('White Blood Cells', 'panel', .99, 2, 11.5, 5., .3, .1, 80, 1, (4, 11)),
+    ('Creatinine', 'panel', .885, 2, 1.4, .9, .45, .1, 12, 1, (.5, 1.2)),
+    ('Glucose', 'panel', .865, 3, 140., 45., .25, 20, 900, 0, (70, 105)),
+    ('Lactate Dehydrogenase (LD)', 'panel', .243, 1.3, 320., 150., .4, 50, 5000, 0, (94, 250)),
+    ('Creatinine, Urine', 'panel', .1124, 1.3, 80., 45., .1, 5, 400, 0, (20, 320)),
+    ('WBC Count', 'panel', .0029, 1, 11.5, 5., .3, .1, 80, 1, (4, 11)),
+    ('24 hr Creatinine', 'panel', .00035, 1, 1200., 400., .1, 100, 4000, 0, (700, 1600)),
+    ('Urine Creatinine', 'panel', .0001, 1, 80., 45., .1, 5, 400, 0, (20, 320)),
+    ('pH', 'bloodgas', 1.0, 6, 7.39, .07, -.4, 6.8, 7.7, 2, (7.35, 7.45)),
+    ('Lactate', 'bloodgas', .69, 3, 2.2, 1.6, .5, .3, 25, 1, (.5, 2.0)),
+    ('Oxygen Saturation', 'bloodgas', .42, 3, 94., 5., -.3, 50, 100, 0, (95, 100)),
+]
+
+DEMOG_COLUMNS = ['icustay_id', 'hadm_id', 'subject_id', 'first_careunit', 'gender', 'marital_status',
+                 'ethnicity', 'insurance', 'admission_type', 'admittime', 'dischtime', 'intime', 'outtime',
+                 'deathtime', 'dob', 'hospital_expire_flag', 'icd9_code', 'icd9_code.1', 'short_title',
+                 'seq_num']
+CHART_COLUMNS = ['subject_id', 'icustay_id', 'gender', 'charttime', 'label', 'value', 'valuenum',
+                 'hospital_expire_flag']
+LAB_COLUMNS = ['subject_id', 'icustay_id', 'gender', 'label', 'charttime', 'valuenum', 'flag',
+               'hospital_expire_flag']
+
+CATEGORIES = {'first_careunit': (['MICU', 'CSRU', 'SICU', 'CCU', 'TSICU'], [.35, .2, .15, .15, .15]),
+              'marital_status': (['MARRIED', 'SINGLE', 'WIDOWED', 'DIVORCED', None], [.45, .25, .13, .07, .1]),
+              'ethnicity': (['WHITE', 'BLACK/AFRICAN AMERICAN', 'HISPANIC OR LATINO', 'ASIAN',
+                             'UNKNOWN/NOT SPECIFIED', 'OTHER'], [.7, .09, .04, .03, .1, .04]),
+              'insurance': (['Medicare', 'Private', 'Medicaid', 'Government', 'Self Pay'],
+                            [.55, .3, .1, .03, .02]),
+              'admission_type': (['EMERGENCY', 'ELECTIVE', 'URGENT'], [.8, .16, .04])}
+
+# MIMIC SHIFTS THE DATE OF BIRTH OF PATIENTS OVER 89 SO THEIR AGE COMES OUT NEAR 300
+SHIFTED_AGE_RATE = .02
+
+STAYS_PER_PATIENT = 1.32
+
+_MINUTE = np.timedelta64(1, 'm')
+
+
+def mortality_intercept(rate, slope=1.2):
+    """ intercept a of p = expit(a + slope * severity) giving a mean mortality of rate for
+    a standard normal severity """
+    grid = np.linspace(-6, 6, 2001)
+    weights = np.exp(-grid ** 2 / 2.)
+    weights /= weights.sum()
+    low, high = -20., 20.
+    for _ in range(60):
+        mid = (low + high) / 2.
+        if (expit(mid + slope * grid) * weights).sum() < rate:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2.
+
+
+def _subjects(stay_pos):
+    # CONSECUTIVE STAYS SHARE A PATIENT, ABOUT STAYS_PER_PATIENT STAYS EACH
+    subjects = 10000 + (stay_pos * 100) // int(STAYS_PER_PATIENT * 100)
+    # GENDER FROM THE SUBJECT ID SO IT AGREES ACROSS BATCHES
+    gender = np.where((subjects * 2654435761 % 100) < 56, 'M', 'F')
+    return subjects, gender
+
+
+def make_stays(first, n, rng, mortality_rate=.11):
+    """ one row per stay with its ids, severity, outcome and times """
+    pos = np.arange(first, first + n)
+    subjects, gender = _subjects(pos)
+    severity = rng.randn(n)
+    died = (rng.rand(n) < expit(mortality_intercept(mortality_rate) + 1.2 * severity)).astype(int)
+    intime = START + pd.to_timedelta(rng.randint(0, 100 * 365 * 24 * 60, n), unit='m')
+    icu_hours = np.exp(rng.normal(3.9, .9, n)) + 24
+    stays = pd.DataFrame({'icustay_id': 200000 + pos, 'hadm_id': 100000 + pos, 'subject_id': subjects,
+                          'gender': gender, 'severity': severity, 'hospital_expire_flag': died,
+                          'intime': intime,
+                          'outtime': intime + pd.to_timedelta(icu_hours * 60, unit='m').round('s')})
+    stays['admittime'] = stays['intime'] - pd.to_timedelta(rng.exponential(12 * 60, n).astype(int), unit='m')
+    after = pd.to_timedelta(np.exp(rng.normal(4.5, 1., n)) * 60, unit='m').round('min')
+    stays['dischtime'] = stays['outtime'] + after
+    stays['deathtime'] = stays['dischtime'].where(died == 1)
+    return stays
+
+
+def _members(n, share, rng):
+    # EXACTLY round(share * n) MEMBERS, SO SAMPLE COUNTS AGAINST A THRESHOLD ARE REPRODUCIBLE
+    members = np.zeros(n, dtype=bool)
+    members[rng.permutation(n)[:int(round(share * n))]] = True
+    return members
+
+
+def _measurements(stays, groups, share, per_day, rng):
+    """ stay positions and chart times of the measurements of one label """
+    present = np.flatnonzero(groups & _members(len(stays), share, rng))
+    counts = 1 + rng.poisson(max(per_day - 1, 0), len(present))
+    rows = np.repeat(present, counts)
+    offsets = rng.randint(0, 24 * 60, len(rows)) * _MINUTE
+    times = stays['intime'].values[rows].astype('datetime64[m]') + offsets
+    return rows, times
+
+
+def _values(stays, rows, mean, sd, shift, low, high, decimals, rng):
+    # A PER STAY LEVEL AROUND THE SEVERITY SHIFT PLUS MEASUREMENT NOISE
+    level = shift * stays['severity'].values + .6 * rng.randn(len(stays))
+    values = mean + sd * (level[rows] + .5 * rng.randn(len(rows)))
+    return np.round(np.clip(values, low, high), decimals)
+
+
+def _levels(stays, rows, shift, levels, rng):
+    # A NOISY SEVERITY SCORE CUT AT THE CUMULATIVE LEVEL PROBABILITIES, BEST LEVEL FIRST
+    cum = np.cumsum([p for _, _, p in levels])
+    score = ndtr((shift * stays['severity'].values[rows] + rng.randn(len(rows))) / np.sqrt(1 + shift ** 2))
+    return np.minimum(np.searchsorted(cum / cum[-1], score), len(levels) - 1)
+
+
+def _group_members(stays, groups, rng):
+    return dict((name, _members(len(stays), share, rng)) for name, share in sorted(groups.items()))
+
+
+def _events_frame(stays, rows, times, labels, columns):
+    frame = pd.DataFrame({'subject_id': stays['subject_id'].values[rows],
+                          'icustay_id': stays['icustay_id'].values[rows],
+                          'gender': stays['gender'].values[rows],
+                          'charttime': times.astype('datetime64[ns]'),
+                          'hospital_expire_flag': stays['hospital_expire_flag'].values[rows]})
+    for name, values in labels.items():
+        frame[name] = values
+    order = np.lexsort((frame['charttime'].values, frame['icustay_id'].values))
+    return frame.iloc[order][columns]
+
+
+def _text(valuenum, decimals):
+    return (valuenum.astype(int) if decimals == 0 else valuenum).astype(str)
+
+
+def chart_events(stays, rng):
+    """ chart events of the stays, columns as in CHART_EVENTS_FIRST24.csv """
+    groups = _group_members(stays, CHART_GROUPS, rng)
+    parts = []
+    for label, group, share, per_day, mean, sd, shift, low, high, decimals in CHART_CONTINUOUS:
+        rows, times = _measurements(stays, groups[group], share, per_day, rng)
+        valuenum = _values(stays, rows, mean, sd, shift, low, high, decimals, rng)
+        parts.append((rows, times, label, _text(valuenum, decimals), valuenum))
+    for label, group, share, per_day, mean, sd, low, high, decimals in CHART_CONSTANT:
+        rows, times = _measurements(stays, groups[group], share, per_day, rng)
+        valuenum = _values(stays, rows, mean, sd, 0., low, high, decimals, rng)
+        parts.append((rows, times, label, _text(valuenum, decimals), valuenum))
+    for label, group, share, per_day, shift, levels in CHART_CATEGORICAL:
+        rows, times = _measurements(stays, groups[group], share, per_day, rng)
+        idx = _levels(stays, rows, shift, levels, rng)
+        parts.append((rows, times, label, np.array([value for value, _, _ in levels], dtype=object)[idx],
+                      np.array([num for _, num, _ in levels], dtype=float)[idx]))
+    rows = np.concatenate([part[0] for part in parts])
+    times = np.concatenate([part[1] for part in parts])
+    labels = {'label': np.concatenate([np.repeat(part[2], len(part[0])) for part in parts]),
+              'value': np.concatenate([part[3].astype(object) for part in parts]),
+              'valuenum': np.concatenate([part[4] for part in parts])}
+    return _events_frame(stays, rows, times, labels, CHART_COLUMNS)
+
+
+def lab_events(stays, rng):
+    """ lab events of the stays, columns as in LAB_EVENTS_FIRST24.csv """
+    groups = _group_members(stays, LAB_GROUPS, rng)
+    parts = []
+    for label, group, share, per_day, mean, sd, shift, low, high, decimals, normal in LAB_CONTINUOUS:
+        rows, times = _measurements(stays, groups[group], share, per_day, rng)
+        valuenum = _values(stays, rows, mean, sd, shift, low, high, decimals, rng)
+        flag = np.where((valuenum < normal[0]) | (valuenum > normal[1]), 'abnormal', None)
+        parts.append((rows, times, label, valuenum, flag))
+    rows = np.concatenate([part[0] for part in parts])
+    times = np.concatenate([part[1] for part in parts])
+    labels = {'label': np.concatenate([np.repeat(part[2], len(part[0])) for part in parts]),
+              'valuenum': np.concatenate([part[3] for part in parts]),
+              'flag': np.concatenate([part[4] for part in parts])}
+    return _events_frame(stays, rows, times, labels, LAB_COLUMNS)
+
+
+def load_diagnoses(definitions_path=HCUP_DEFINITIONS):
+    """ (category, codes, used in benchmark) of every hcup ccs category """
+    with open(definitions_path, 'r') as f:
+        definitions = yaml.safe_load(f)
+    return [(name, [str(code) for code in definitions[name]['codes']], bool(definitions[name]['use_in_benchmark']))
+            for name in sorted(definitions) if definitions[name]['codes']]
+
+
+def demographics(stays, diagnoses, rng):
+    """ PTNT_DEMOG rows of the stays, one per diagnosis """
+    n = len(stays)
+    frame = stays[['icustay_id', 'hadm_id', 'subject_id', 'gender', 'admittime', 'dischtime', 'intime',
+                   'outtime', 'deathtime', 'hospital_expire_flag']].copy()
+    for column, (values, probs) in sorted(CATEGORIES.items()):
+        frame[column] = np.array(values, dtype=object)[rng.choice(len(values), n, p=probs)]
+    age = np.clip(rng.normal(64, 17, n), 18, 89)
+    age[rng.rand(n) < SHIFTED_AGE_RATE] = 300
+    # 300 YEARS DO NOT FIT IN A TIMEDELTA64[ns], SUBTRACT WHOLE DAYS
+    days = (age * 365.25).astype(int).astype('timedelta64[D]')
+    frame['dob'] = (frame['intime'].values.astype('datetime64[D]') - days).astype('datetime64[ns]')
+
+    # BENCHMARK CATEGORIES WITH A FIXED PREVALENCE AND LINK TO SEVERITY, PLUS A FEW OTHER CODES
+    category_rng = np.random.RandomState(0)
+    rows = []
+    codes = []
+    titles = []
+    for name, category_codes, benchmark in diagnoses:
+        if benchmark:
+            prevalence = category_rng.uniform(.03, .3)
+            logit = np.log(prevalence / (1 - prevalence)) + category_rng.uniform(-.3, .8) * stays['severity'].values
+            present = np.flatnonzero(rng.rand(n) < expit(logit))
+        else:
+            present = np.flatnonzero(rng.rand(n) < 4. / len(diagnoses))
+        rows.append(present)
+        codes.append(np.array(category_codes, dtype=object)[rng.randint(0, len(category_codes), len(present))])
+        titles.append(np.repeat(name[:24], len(present)))
+    rows = np.concatenate(rows)
+    codes = np.concatenate(codes)
+    titles = np.concatenate(titles)
+    # STAYS WITHOUT ANY DIAGNOSIS STILL GET A ROW
+    missing = np.setdiff1d(np.arange(n), rows)
+    rows = np.concatenate([rows, missing])
+    codes = np.concatenate([codes, np.repeat(None, len(missing))])
+    titles = np.concatenate([titles, np.repeat(None, len(missing))])
+
+    order = np.argsort(rows, kind='mergesort')
+    out = frame.iloc[rows[order]].reset_index(drop=True)
+    out['icd9_code'] = codes[order]
+    out['icd9_code.1'] = codes[order]
+    out['short_title'] = titles[order]
+    out['seq_num'] = out.groupby('icustay_id').cumcount() + 1
+    return out[DEMOG_COLUMNS]
+
+
+def synthetic_paths(root):
+    """ chart, lab, demographics and diagnosis definitions paths under root, laid out as DATA_DIR """
+    paths = {'chart': CHART_EVENTS_CSV, 'labs': LAB_EVENTS_CSV, 'demographics': PTNT_DEMOG_CSV,
+             'definitions': HCUP_DEFINITIONS}
+    return {source: os.path.join(root, os.path.relpath(path, DATA_DIR)) for source, path in paths.items()}
+
+
+def write_synthetic(root, n_stays, seed=0, mortality_rate=.11, batch_stays=20000,
+                    definitions_path=HCUP_DEFINITIONS):
+    """ write synthetic chart, lab and demographics CSVs of n_stays stays under root.
+
+    :param root: data directory, the files go to root/raw and root/interim
+    :param n_stays: number of ICU stays, 1k to 1M
+    :param seed: the same seed and batch_stays write the same files
+    :param mortality_rate: share of stays with hospital_expire_flag = 1
+    :param batch_stays: stays generated and appended at a time
+    :param definitions_path: hcup ccs definitions, copied to the extract for the demographics stages
+    :return: dict of source -> path
+    """
+    paths = synthetic_paths(root)
+    for path in paths.values():
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+    if os.path.abspath(definitions_path) != os.path.abspath(paths['definitions']):
+        shutil.copyfile(definitions_path, paths['definitions'])
+    diagnoses = load_diagnoses(definitions_path)
+    date_format = '%Y-%m-%d %H:%M:%S'
+    for batch, first in enumerate(range(0, n_stays, batch_stays)):
+        rng = np.random.RandomState([seed, batch])
+        stays = make_stays(first, min(batch_stays, n_stays - first), rng, mortality_rate)
+        mode = 'w' if batch == 0 else 'a'
+        chart_events(stays, rng).to_csv(paths['chart'], index=False, mode=mode, header=batch == 0,
+                                        date_format=date_format)
+        lab_events(stays, rng).to_csv(paths['labs'], index=False, mode=mode, header=batch == 0,
+                                      date_format=date_format)
+        demographics(stays, diagnoses, rng).to_csv(paths['demographics'], index=False, mode=mode,
+                                                   header=batch == 0, date_format=date_format)
+        print("wrote stays {} to {}".format(first, first + len(stays)))
+    return paths
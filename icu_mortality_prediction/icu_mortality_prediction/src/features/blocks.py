@@ -0,0 +1,138 @@
+""" feature blocks as views over one shared feature matrix.
+
+the chart and lab scripts cut their merged per stay frame into blocks of columns that
+are recorded together and keep the complete cases of each with data3[cols].dropna(),
+then copy the blocks again before encoding them. a BlockView keeps only the row and
+column positions of a block in the shared frame, so a block costs two index arrays,
+and values are taken from the shared frame one column at a time when the encoding,
+the chi2 scores or combine.combine_blocks read them.
+
+    observed = blocks.observed_mask(data3)
+    view = blocks.complete_cases(data3, ['hospital_expire_flag', 'HR_mean', 'RR_mean'], observed)
+    view['HR_mean']          # Series of the complete cases
+    view.values(['HR_mean']) # 2d array
+    view.frame()             # a real DataFrame, only when one is needed
+"""
+import numpy as np
+import pandas as pd
+
+
+class BlockView(object):
+    """ rows and columns of a frame, by position, without a copy of their values.
+
+    :param matrix: the shared frame, never changed through the view
+    :param rows: positions of the rows of the block, in the order they are read
+    :param columns: positions of the columns of the block
+    """
+
+    def __init__(self, matrix, rows, columns):
+        self.matrix = matrix
+        self.rows = np.asarray(rows, dtype=np.intp)
+        self.positions = np.asarray(columns, dtype=np.intp)
+
+    @property
+    def columns(self):
+        return self.matrix.columns[self.positions]
+
+    @property
+    def index(self):
+        return self.matrix.index[self.rows]
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.positions)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return 'BlockView({} rows x {} columns)'.format(*self.shape)
+
+    def _position(self, name):
+        position = self.matrix.columns.get_loc(name)
+        if position not in self.positions:
+            raise KeyError(name)
+        return position
+
+    def column(self, name):
+        """ numpy values of one column at the rows of the block """
+        return self.matrix.iloc[:, self._position(name)].values[self.rows]
+
+    def __getitem__(self, name):
+        if isinstance(name, (list, pd.Index)):
+            return self.frame(name)
+        return pd.Series(self.column(name), index=self.index, name=name)
+
+    def select(self, columns):
+        """ view of some of the columns of the block over the same rows """
+        return BlockView(self.matrix, self.rows, [self._position(name) for name in columns])
+
+    def values(self, columns=None, dtype=float):
+        """ 2d array of the block, or of some of its columns, one column taken at a time """
+        columns = self.columns if columns is None else columns
+        data = np.empty((len(self.rows), len(columns)), dtype=dtype)
+        for i, name in enumerate(columns):
+            data[:, i] = self.column(name)
+        return data
+
+    def frame(self, columns=None):
+        """ the block, or some of its columns, as a new DataFrame """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame(dict((name, self.column(name)) for name in columns), index=self.index,
+                            columns=list(columns))
+
+
+def observed_mask(matrix):
+    """ boolean array of the cells holding a value, inf counting as missing as the scripts
+    replaced it with NaN before dropna """
+    observed = np.empty(matrix.shape, dtype=bool)
+    for i in range(matrix.shape[1]):
+        values = matrix.iloc[:, i].values
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'fc':
+            observed[:, i] = np.isfinite(values)
+        else:
+            observed[:, i] = pd.notnull(values)
+    return observed
+
+
+def complete_cases(matrix, columns, observed=None):
+    """ view of the rows of matrix with a value in every one of columns, the rows
+    data3[columns].replace([np.inf, -np.inf], np.nan).dropna() keeps.
+
+    :param observed: observed_mask(matrix), pass it when cutting several blocks
+    """
+    if observed is None:
+        observed = observed_mask(matrix)
+    positions = [matrix.columns.get_loc(name) for name in columns]
+    rows = np.flatnonzero(observed[:, positions].all(axis=1))
+    return BlockView(matrix, rows, positions)
+
+
+def as_view(block):
+    """ a BlockView of a block, frames become a view of all their rows and columns """
+    if isinstance(block, BlockView):
+        return block
+    return BlockView(block, np.arange(block.shape[0]), np.arange(block.shape[1]))
+
+
+def quartile_edges(values):
+    """ the 25th, 50th and 75th percentiles, the edges DataFrame.describe() reports """
+    return np.percentile(values, [25, 50, 75])
+
+
+def quartile_levels(view, columns):
+    """ frame of the quartile level, 'Q0' to 'Q3', of every value of columns in the view.
+
+    a value is in Q0 up to the 25th percentile of its column in the view, in Q1 up to the
+    median and so on, as quant_cats in the feature scripts assigns them. the levels are
+    categoricals of only the levels that occur, so pd.get_dummies gives the columns it
+    gave for the strings.
+    """
+    levels = {}
+    for name in columns:
+        values = view.column(name)
+        codes = np.searchsorted(quartile_edges(values), values, side='left')
+        present = np.unique(codes)
+        levels[name] = pd.Categorical.from_codes(np.searchsorted(present, codes),
+                                                 ['Q{}'.format(code) for code in present])
+    return pd.DataFrame(levels, index=view.index, columns=list(columns))
@@ -0,0 +1,147 @@
+""" build the chart, lab and demographics features as one pipeline.
+
+the stages of the three sources are independent until the selected blocks are
+combined, so with --jobs > 1 they run side by side on a process pool (see
+utils/executor.py) and memoized stages are read from --cache-dir instead of being
+recomputed.
+
+python -m icu_mortality_prediction.src.features.build --jobs 3 --cache-dir data/interim/pipeline
+"""
+import argparse
+import os
+import sys
+
+from ... import CHART_EVENTS_CSV, FEATURES_DIR, HCUP_DEFINITIONS, LAB_EVENTS_CSV, PARTITIONS_DIR, PTNT_DEMOG_CSV
+from . import chart_events
+from . import combine
+from . import feature_store
+from . import lab_events
+from . import ptnt_demog
+from ..utils.executor import Executor, PipelineError, format_report
+from ..utils.pipeline import Pipeline, Stage
+
+
+SELECTED = ['chart_selected', 'lab_selected', 'demog_selected']
+
+# SELECTION STAGE -> FEATURE MODULE OF ITS BLOCKS, AS THE FEATURE STORE RECORDS IT
+SELECTED_MODULES = {'chart_selected': 'chart_events', 'lab_selected': 'lab_events', 'demog_selected': 'ptnt_demog'}
+
+# THE ENCODED BLOCKS score_features OF EACH SOURCE SCORES, AND THE STAYS A CHART OR LAB
+# BLOCK NEEDS TO BE SCORED AT ALL, FOR THE 60K STAYS OF MIMIC-III
+ENCODED = ['chart_blocks', 'lab_dummies', 'demog_dummies']
+MIN_STAYS = {'chart_blocks': 5000, 'lab_dummies': 3000}
+
+
+def combine_stage(chart_selected, lab_selected, demog_selected, k=20, how='inner'):
+    """ design matrix of the global top k features of the selected blocks of every source """
+    blocks = {}
+    scores = {}
+    for selected in [chart_selected, lab_selected, demog_selected]:
+        for name, (frame, block_scores) in selected.items():
+            blocks[name] = frame
+            scores[name] = block_scores
+    outcomes = demog_selected['Ptnt_Demog_Features'][0][combine.OUTCOME]
+    return combine.combine_blocks(blocks, scores, outcomes, k=k, how=how, order='p_value')
+
+
+def stages(chart_path=CHART_EVENTS_CSV, lab_path=LAB_EVENTS_CSV,
+           demog_path=PTNT_DEMOG_CSV,
+           definitions_path=HCUP_DEFINITIONS, k=20, how='inner', chunksize=None, scale=1., partitions=None,
+           partition_dir=PARTITIONS_DIR, n_jobs=1):
+    """ the stages of all three sources followed by the combination of their blocks.
+
+    :param scale: factor on the sample thresholds of the chart and lab stages, which are
+                  set for the 60k stays of MIMIC-III. n_stays / 60000 for smaller extracts
+    :param partitions: split the chart and lab events by stay into this many files and
+                       calculate their statistics one file at a time on n_jobs processes
+    """
+    chart = chart_events.stages(chart_path, chunksize, min_samples=int(2000 * scale),
+                                min_stays=int(MIN_STAYS['chart_blocks'] * scale),
+                                partitions=partitions, partition_dir=partition_dir, n_jobs=n_jobs)
+    labs = lab_events.stages(lab_path, chunksize, min_samples=int(6000 * scale),
+                             min_stays=int(MIN_STAYS['lab_dummies'] * scale),
+                             partitions=partitions, partition_dir=partition_dir, n_jobs=n_jobs)
+    return chart + labs + \
+        ptnt_demog.stages(demog_path, definitions_path, chunksize) + \
+        [Stage('combined', combine_stage, SELECTED, params={'k': k, 'how': how})]
+
+
+def scored_blocks(results, scale=1.):
+    """ dict of block name -> the encoded blocks of the ENCODED results that the
+    score_features of their source scores """
+    encoded = {}
+    for stage in ENCODED:
+        stage_blocks = results[stage]
+        if not isinstance(stage_blocks, dict):
+            stage_blocks = {'Ptnt_Demog_Features': stage_blocks}
+        min_stays = int(MIN_STAYS.get(stage, 0) * scale)
+        for name, block in stage_blocks.items():
+            if len(block) > min_stays:
+                encoded[name] = block
+    return encoded
+
+
+def write_selected(results, root):
+    """ write the selected blocks and scores as the scripts did, and the combined matrix """
+    for name in SELECTED:
+        if name in results:
+            chart_events.write_features(results[name], root)
+    if 'demog_selected' in results:
+        frame = results['demog_selected']['Ptnt_Demog_Features'][0]
+        frame[[combine.OUTCOME]].to_csv(os.path.join(root, 'outcomes.csv'))
+    if 'combined' in results:
+        X, y = results['combined']
+        X.join(y).to_csv(os.path.join(root, 'combined.csv'))
+
+
+def write_store(results, root, window='24h'):
+    """ add the selected blocks of every source in results to a feature store as one new version """
+    selected = {}
+    sources = {}
+    for name in SELECTED:
+        for block, pair in results.get(name, {}).items():
+            selected[block] = pair
+            sources[block] = SELECTED_MODULES[name]
+    outcomes = None
+    if 'demog_selected' in results:
+        outcomes = results['demog_selected']['Ptnt_Demog_Features'][0][combine.OUTCOME]
+    return feature_store.write_blocks(root, selected, outcomes, sources, window)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="build the chart, lab and demographics features")
+    parser.add_argument('--chart', default=CHART_EVENTS_CSV)
+    parser.add_argument('--labs', default=LAB_EVENTS_CSV)
+    parser.add_argument('--demographics', default=PTNT_DEMOG_CSV)
+    parser.add_argument('--definitions', default=HCUP_DEFINITIONS)
+    parser.add_argument('--features-dir', default=FEATURES_DIR)
+    parser.add_argument('--cache-dir', default=None, help="memoize stage results in this directory")
+    parser.add_argument('--jobs', type=int, default=-1, help="worker processes, -1 for one per core")
+    parser.add_argument('--k', type=int, default=20, help="features kept in the combined matrix")
+    parser.add_argument('--how', choices=['inner', 'outer'], default='inner')
+    parser.add_argument('--targets', nargs='+', default=SELECTED + ['combined'])
+    parser.add_argument('--partitions', type=int, default=None,
+                        help="split the chart and lab events into this many partitions of whole stays")
+    parser.add_argument('--partition-dir', default=PARTITIONS_DIR)
+    parser.add_argument('--store', default=None, help="also add the selected blocks to this feature store")
+    args = parser.parse_args(argv)
+
+    pipe = Pipeline(stages(args.chart, args.labs, args.demographics, args.definitions, args.k, args.how,
+                           partitions=args.partitions, partition_dir=args.partition_dir, n_jobs=args.jobs),
+                    args.cache_dir)
+    executor = Executor(pipe, n_jobs=args.jobs)
+    try:
+        results = executor.run(args.targets)
+    except PipelineError as e:
+        print(str(e))
+        return 1
+    print(format_report(executor.report))
+    print("built in {:.1f}s".format(executor.wall_time))
+    write_selected(results, args.features_dir)
+    if args.store is not None:
+        write_store(results, args.store)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,83 +1,90 @@
 #import sys
 import os
 import pandas as pd
-import datetime as datetime
 import numpy as np
-from dateutil.relativedelta import relativedelta
-from sklearn.preprocessing import OneHotEncoder
-from matplotlib import pyplot as plt
 
-
-#from sklearn.model_selection import train_test_split
-from sklearn.feature_selection import SelectKBest
-from sklearn.feature_selection import chi2
+# sklearn IS IMPORTED WHERE IT IS USED AND THE PLOTS LIVE IN visualizations/plots.py,
+# SO IMPORTING THE PIPELINE STAYS FAST
+from ... import CHART_EVENTS_CSV, FEATURES_DIR, PARTITIONS_DIR, PIPELINE_CACHE_DIR
+from . import blocks
+from . import concepts
+from ..utils import partition
+from ..utils import telemetry
+from ..utils.pipeline import Pipeline, Stage
 #from sklearn.feature_selection import f_classif
 #from heapq import nlargest
 
 
 
 
-def import_chartevents_data():
-    print "importing chart data"
-    data = pd.DataFrame.from_csv('../data/CHART_EVENTS_FIRST24.csv')
+def import_chartevents_data(path=CHART_EVENTS_CSV, chunksize=None):
+    print("importing chart data")
+    data = pd.read_csv(path, index_col=0, parse_dates=True, chunksize=chunksize)
+    if chunksize is not None:
+        data = pd.concat(data)
     #print(data.head())
-    print "converting date-time data"
-    data.loc[:,'charttime']  = pd.to_datetime(data.loc[:,'charttime']) 
+    print("converting date-time data")
+    data['charttime'] = pd.to_datetime(data['charttime']) 
     data['subject_id'] = data.index
-    print "reorganizing data"
+    print("reorganizing data")
     data.set_index(np.arange(data.shape[0]), inplace = True)
     cols = list(data.columns)
     cols.insert(0, cols.pop(cols.index('icustay_id')))
     cols.insert(1, cols.pop(cols.index('subject_id')))
     data = data[cols]
+    # INTEGER CONCEPT OF EVERY EVENT, THE LATER STAGES SELECT BY IT INSTEAD OF BY LABEL
+    data = concepts.assign_concepts(data, 'chart')
     icu_stays = data.drop_duplicates('icustay_id', keep = 'first').shape[0]
     patients = data.drop_duplicates('subject_id', keep = 'first').shape[0]
-    print "The number of chart events = {}".format(data.shape)
-    print "The number of unique ICU stays = {}".format(icu_stays)
-    print "The number of unique patients  = {}".format(patients)
-    print "chart data import complete"
+    print("The number of chart events = {}".format(data.shape))
+    print("The number of unique ICU stays = {}".format(icu_stays))
+    print("The number of unique patients  = {}".format(patients))
+    print("chart data import complete")
     return data    
 
 
-def explore_data(data):
-    # display the different measurements captured in the database query
-    labels = list(data.label.unique())
-    #print "the measurements included in chart events are as follows:"
-    #for measurement in labels:
-    #    print(measurement) 
-    labels.sort()
-    
-    '''
-    # CODE FOR PRINTING THE NUMBER OF SAMPLES FOR EACH MEASUREMENT
-    for item in labels:
-        print "the number of samples for {} is {}".format(item, 
-                data['icustay_id'][data.label == item].dropna().unique().shape[0])
-    '''
-    
-    
-    
+def label_stays(data):
+    # NUMBER OF ICU STAYS WITH EACH MEASUREMENT CONCEPT, ADDS UP ACROSS PARTITIONS OF THE STAYS
+    return concepts.concept_stays(data)
+
+
+def explore_data(data, min_samples=2000):
+    return classify_labels(label_stays(data), min_samples)
+
+
+def classify_labels(stays_per_label, min_samples=2000):
+    # SORT THE MEASUREMENT CONCEPTS WITH ENOUGH STAYS INTO CONTINUOUS, CONSTANT AND
+    # CATEGORICAL ONES BY THE KIND IN THE CONCEPT MAP (SEE concepts.py)
+
     # REMOVE ALL VARIABLES WITH FEWER THAN 2000 SAMPLES
-    old_cols = [x for x in labels if (data['icustay_id'][data.label == x].dropna().unique().shape[0] >= 2000)]
-    print "There are {} measurements having > 2k samples".format(len(old_cols))
+    old_cols = [cid for cid in concepts.concept_ids('chart') if stays_per_label.get(cid, 0) >= min_samples]
+    print("There are {} measurements having >= {} samples".format(len(old_cols), min_samples))
     #CREATE LISTS FOR CONSTANT CATEGORICAL AND CONTINOUS DATA
     #CONSTANT VARIABLES INCLUDE ADMISSION WEIGHT, HEIGHT
-    old_cols_const = [old_cols[x] for x in [0, 14]]
-    print "contstant variables: \n ********************"
-    print old_cols_const
+    old_cols_const = [cid for cid in concepts.concept_ids('chart', 'constant') if cid in old_cols]
+    print("contstant variables: \n ********************")
+    print([concepts.label(cid) for cid in old_cols_const])
     #CATEGORICAL VARIABLES INCLUDE GLASGOW COMA SCALE (GSC)
     # AND CAPILLARY REFILL
-    old_cols_cat = [x for x in old_cols if 'GCS' in x]
-    old_cols_cat.append(old_cols[6])
-    print "categorical variables: \n ********************"
-    print old_cols_cat
+    old_cols_cat = [cid for cid in concepts.concept_ids('chart', 'categorical') if cid in old_cols]
+    print("categorical variables: \n ********************")
+    print([concepts.label(cid) for cid in old_cols_cat])
     # create list for continuous variables
-    old_cols_continuous = [x for x in old_cols if ((x not in old_cols_const) & (x not in old_cols_cat))]
-    print "continuous variables: \n ********************"
-    print old_cols_continuous
+    old_cols_continuous = [cid for cid in concepts.concept_ids('chart', 'continuous') if cid in old_cols]
+    print("continuous variables: \n ********************")
+    print([concepts.label(cid) for cid in old_cols_continuous])
     return old_cols_continuous, old_cols_const, old_cols_cat
 
 
 def calculate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat):
+    calc_dicts, const_dict, cat_dict = aggregate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat)
+    remove_stat_outliers(calc_dicts)
+    print("Complete")
+    return calc_dicts, const_dict, cat_dict
+
+
+def aggregate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat):
+    # PER STAY STATISTICS ONLY, EVERY ROW DEPENDS ON THE EVENTS OF ONE STAY
     
     # *** CODED MORE CONCISELY IN lab_events.py *** 
 
@@ -98,157 +105,144 @@ def calculate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat):
     slope_dict = {}
     delta_dict = {}
 
-    calc_dict_cols = ['pH2', 'BP_Mean', 'BP_Dia', 'BP_Sys', 'pH3', 'Creat2', 'GlucC', 'HR', 'Hemat','Hg', 'O2_Fraction', 
-                   'RR_Spont','RR_Total', 'RR', 'TempC', 'TempC_Calc']
-    const_dict_cols = ['Weight', 'Height', 'O2_Fraction', 'RR', 'TempC', 'TempC_Calc']
-    cat_dict_cols = ['GCS_Eye', 'GCS_Motor','GCS_Verbal', 'GCS_total', 'Cap_refill' ]
-
-
-    mean_dict_new_cols = []
-    med_dict_new_cols = []
-    std_dict_new_cols = []
-    skew_dict_new_cols = []
-    min_dict_new_cols = []
-    max_dict_new_cols = []
-    first_dict_new_cols = []
-    slope_dict_new_cols = []
-    delta_dict_new_cols = []
-    for x in calc_dict_cols:
-        mean_dict_new_cols.append(x + '_mean')
-        med_dict_new_cols.append(x + '_med')
-        std_dict_new_cols.append(x + '_std')
-        skew_dict_new_cols.append(x + '_skew')
-        min_dict_new_cols.append(x + '_min')
-        max_dict_new_cols.append(x + '_max')
-        first_dict_new_cols.append(x + '_first')
-        slope_dict_new_cols.append(x + '_slope')
-        delta_dict_new_cols.append(x + '_delta')
-
-
-    # height and weight are left out from the calculated measures because there was only one
-    # measurement so they are constant.
-
-    # IF I SWITCH THE ORDER OF THESE, I CAN MAKE THE OLD COLS KEYS FOR EACH DICT, THEN 
-    # I CAN LOOP THROUGH THE OLD COLS AND DO CALCULATIONS FOR EACH DICT RATHER THAN ITERATING THROUGH 
-    # THE COLUMNS FOR EACH 
-    mean_dict_names = dict(zip(mean_dict_new_cols, old_cols_continuous))
-    med_dict_names = dict(zip(med_dict_new_cols, old_cols_continuous))
-    std_dict_names = dict(zip(std_dict_new_cols, old_cols_continuous))
-    skew_dict_names = dict(zip(skew_dict_new_cols, old_cols_continuous))
-    min_dict_names = dict(zip(min_dict_new_cols, old_cols_continuous))
-    max_dict_names = dict(zip(max_dict_new_cols, old_cols_continuous))
-    first_dict_names = dict(zip(first_dict_new_cols, old_cols_continuous))
-    slope_dict_names = dict(zip(slope_dict_new_cols, old_cols_continuous))
-    delta_dict_names = dict(zip(delta_dict_new_cols, old_cols_continuous))
-    const_dict_names = dict(zip(const_dict_cols, old_cols_const))
-    cat_dict_names = dict(zip(cat_dict_cols, old_cols_cat))
-    #display(mean_dict_names)
-    #display(const_dict_names)
-    #display(cat_dict_names)
-
-    print "dict_name creation complete"
-
+    # THE FEATURE NAME OF EVERY CONCEPT COMES FROM THE CONCEPT MAP, SO A MEASUREMENT
+    # MISSING FROM THE EXTRACT NO LONGER SHIFTS THE NAMES OF THE OTHERS
+    def names(cids, suffix=''):
+        return dict((concepts.name(cid) + suffix, cid) for cid in cids)
+
+    mean_dict_names = names(old_cols_continuous, '_mean')
+    med_dict_names = names(old_cols_continuous, '_med')
+    std_dict_names = names(old_cols_continuous, '_std')
+    skew_dict_names = names(old_cols_continuous, '_skew')
+    min_dict_names = names(old_cols_continuous, '_min')
+    max_dict_names = names(old_cols_continuous, '_max')
+    first_dict_names = names(old_cols_continuous, '_first')
+    slope_dict_names = names(old_cols_continuous, '_slope')
+    delta_dict_names = names(old_cols_continuous, '_delta')
+    const_dict_names = names(old_cols_const)
+    cat_dict_names = names(old_cols_cat)
+
+    # THE EVENTS OF EACH CONCEPT, SELECTED ONCE BY INTEGER ID INSTEAD OF ONCE PER STATISTIC BY LABEL
+    events = concepts.split_concepts(data, old_cols_continuous + old_cols_const + old_cols_cat)
+
+    print("dict_name creation complete")
     # COULD POSSIBLY WRAP ALL THIS UP AND ITERATE BUT THAT MIGHT BE TOO CONFUSING....
 
     # ITERATING THROUGH THE VARIABLES, CALCULATING MEANS, MEDIANS, STD, SKEWNESS, MIN AND MAX'S FOR EACH ITERATION
     # COME BACK AND REFINE THIS SO THAT THE DATA COLUMN NAMES ARE THE DICTIONARY KEYS, THEN WE CAN JUST ITERATE 
     # THROUGH THOSE AND DO CALCULATIONS FOR EACH DICT IN A SINGLE LOOP
     # ** CAN BE REPRESENTED MORE CONCISELY, SEE LABEVENTS_FIRST24.ipynb ** 
-    print "calculating mean values"
-    for col in mean_dict_names.keys():
-        mean_dict[col] = pd.DataFrame(data[data.label == mean_dict_names[col]].groupby('icustay_id')['valuenum'].mean())
-        mean_dict[col].columns = [mean_dict_names[col]]
-        mean_dict[col]['hospital_expired_flag'] = data[data.label == mean_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        mean_dict[col]['gender'] = data[data.label == mean_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, mean_dict[col].shape)
-    print "calculating med values"
-    for col in med_dict_names.keys():
-        med_dict[col] = pd.DataFrame(data[data.label == med_dict_names[col]].groupby('icustay_id')['valuenum'].median())
-        med_dict[col].columns = [med_dict_names[col]]
-        med_dict[col]['hospital_expired_flag'] = data[data.label == med_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        med_dict[col]['gender'] = data[data.label == med_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, med_dict[col].shape)
-    print "calculating std values"
-    for col in std_dict_names.keys(): 
-        std_dict[col] = pd.DataFrame(data[data.label == std_dict_names[col]].groupby('icustay_id')['valuenum'].std())
-        std_dict[col].columns = [std_dict_names[col]]
-        std_dict[col]['hospital_expired_flag'] = data[data.label == std_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        std_dict[col]['gender'] = data[data.label == std_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, std_dict[col].shape)
-    print "calculating skewness values"
-    for col in skew_dict_names.keys(): 
-        skew_dict[col] = pd.DataFrame(data[data.label == skew_dict_names[col]].groupby('icustay_id')['valuenum'].skew())
-        skew_dict[col].columns = [skew_dict_names[col]]
-        skew_dict[col]['hospital_expired_flag'] = data[data.label == skew_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        skew_dict[col]['gender'] = data[data.label == skew_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, skew_dict[col].shape)
-    print "calculating min values"
-    for col in min_dict_names.keys():   
-        min_dict[col] = pd.DataFrame(data[data.label == min_dict_names[col]].groupby('icustay_id')['valuenum'].min())
-        min_dict[col].columns = [min_dict_names[col]]
-        min_dict[col]['hospital_expired_flag'] = data[data.label == min_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        min_dict[col]['gender'] = data[data.label == min_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, min_dict[col].shape)
-    print "calculating max values"
-    for col in max_dict_names.keys():       
-        max_dict[col] = pd.DataFrame(data[data.label == max_dict_names[col]].groupby('icustay_id')['valuenum'].max())
-        max_dict[col].columns = [max_dict_names[col]]
-        max_dict[col]['hospital_expired_flag'] = data[data.label == max_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        max_dict[col]['gender'] = data[data.label == max_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, max_dict[col].shape)
-
-    print "extracting first measurements"
-    for col in first_dict_names.keys():    
-        first_dict[col] = pd.DataFrame(data[data.label == first_dict_names[col]].groupby('icustay_id')['valuenum'].first())
-        first_dict[col].columns = [first_dict_names[col]]
-        first_dict[col]['hospital_expired_flag'] = data[data.label == first_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        first_dict[col]['gender'] = data[data.label == first_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, first_dict[col].shape)
-
-    print "calculating delta"
-    for col in delta_dict_names.keys():
-        delta_dict[col] = pd.DataFrame(data[data.label == delta_dict_names[col]].groupby('icustay_id')['valuenum'].last() - 
-                                       data[data.label == delta_dict_names[col]].groupby('icustay_id')['valuenum'].first())
-        delta_dict[col].columns = [delta_dict_names[col]]
-        delta_dict[col]['hospital_expired_flag'] = data[data.label == delta_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        delta_dict[col]['gender'] = data[data.label == delta_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, delta_dict[col].shape)
-
-    print "calculating slope"
-    for col in slope_dict_names.keys():
-        val_last = data[data.label == slope_dict_names[col]].groupby('icustay_id')['valuenum'].last()  
-        val_first = data[data.label == slope_dict_names[col]].groupby('icustay_id')['valuenum'].first()
-        time_last = data[data.label == slope_dict_names[col]].groupby('icustay_id')['charttime'].last()  
-        time_first = data[data.label == slope_dict_names[col]].groupby('icustay_id')['charttime'].first()
-        slope_dict[col] = pd.DataFrame((val_last - val_first)/((time_last - time_first)/np.timedelta64(1,'h')))  
-        slope_dict[col].columns = [slope_dict_names[col]]
-        slope_dict[col]['hospital_expired_flag'] = data[data.label == slope_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
-        slope_dict[col]['gender'] = data[data.label == slope_dict_names[col]].groupby('icustay_id').gender.first()
-        #print "{} number of samples = {}".format(col, slope_dict[col].shape)
-
-
-    print "Summary Calculations Complete"
-
+    print("calculating mean values")
+    with telemetry.section('chart_stats.mean') as record:
+        for col in mean_dict_names.keys():
+            mean_dict[col] = pd.DataFrame(events[mean_dict_names[col]].groupby('icustay_id')['valuenum'].mean())
+            mean_dict[col].columns = [concepts.label(mean_dict_names[col])]
+            mean_dict[col]['hospital_expired_flag'] = events[mean_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            mean_dict[col]['gender'] = events[mean_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, mean_dict[col].shape)
+        record.output(mean_dict)
+    print("calculating med values")
+    with telemetry.section('chart_stats.med') as record:
+        for col in med_dict_names.keys():
+            med_dict[col] = pd.DataFrame(events[med_dict_names[col]].groupby('icustay_id')['valuenum'].median())
+            med_dict[col].columns = [concepts.label(med_dict_names[col])]
+            med_dict[col]['hospital_expired_flag'] = events[med_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            med_dict[col]['gender'] = events[med_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, med_dict[col].shape)
+        record.output(med_dict)
+    print("calculating std values")
+    with telemetry.section('chart_stats.std') as record:
+        for col in std_dict_names.keys(): 
+            std_dict[col] = pd.DataFrame(events[std_dict_names[col]].groupby('icustay_id')['valuenum'].std())
+            std_dict[col].columns = [concepts.label(std_dict_names[col])]
+            std_dict[col]['hospital_expired_flag'] = events[std_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            std_dict[col]['gender'] = events[std_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, std_dict[col].shape)
+        record.output(std_dict)
+    print("calculating skewness values")
+    with telemetry.section('chart_stats.skew') as record:
+        for col in skew_dict_names.keys(): 
+            skew_dict[col] = pd.DataFrame(events[skew_dict_names[col]].groupby('icustay_id')['valuenum'].skew())
+            skew_dict[col].columns = [concepts.label(skew_dict_names[col])]
+            skew_dict[col]['hospital_expired_flag'] = events[skew_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            skew_dict[col]['gender'] = events[skew_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, skew_dict[col].shape)
+        record.output(skew_dict)
+    print("calculating min values")
+    with telemetry.section('chart_stats.min') as record:
+        for col in min_dict_names.keys():   
+            min_dict[col] = pd.DataFrame(events[min_dict_names[col]].groupby('icustay_id')['valuenum'].min())
+            min_dict[col].columns = [concepts.label(min_dict_names[col])]
+            min_dict[col]['hospital_expired_flag'] = events[min_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            min_dict[col]['gender'] = events[min_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, min_dict[col].shape)
+        record.output(min_dict)
+    print("calculating max values")
+    with telemetry.section('chart_stats.max') as record:
+        for col in max_dict_names.keys():       
+            max_dict[col] = pd.DataFrame(events[max_dict_names[col]].groupby('icustay_id')['valuenum'].max())
+            max_dict[col].columns = [concepts.label(max_dict_names[col])]
+            max_dict[col]['hospital_expired_flag'] = events[max_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            max_dict[col]['gender'] = events[max_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, max_dict[col].shape)
+        record.output(max_dict)
+
+    print("extracting first measurements")
+    with telemetry.section('chart_stats.first') as record:
+        for col in first_dict_names.keys():    
+            first_dict[col] = pd.DataFrame(events[first_dict_names[col]].groupby('icustay_id')['valuenum'].first())
+            first_dict[col].columns = [concepts.label(first_dict_names[col])]
+            first_dict[col]['hospital_expired_flag'] = events[first_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            first_dict[col]['gender'] = events[first_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, first_dict[col].shape)
+        record.output(first_dict)
+
+    print("calculating delta")
+    with telemetry.section('chart_stats.delta') as record:
+        for col in delta_dict_names.keys():
+            delta_dict[col] = pd.DataFrame(events[delta_dict_names[col]].groupby('icustay_id')['valuenum'].last() - 
+                                           events[delta_dict_names[col]].groupby('icustay_id')['valuenum'].first())
+            delta_dict[col].columns = [concepts.label(delta_dict_names[col])]
+            delta_dict[col]['hospital_expired_flag'] = events[delta_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            delta_dict[col]['gender'] = events[delta_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, delta_dict[col].shape)
+        record.output(delta_dict)
+
+    print("calculating slope")
+    with telemetry.section('chart_stats.slope') as record:
+        for col in slope_dict_names.keys():
+            val_last = events[slope_dict_names[col]].groupby('icustay_id')['valuenum'].last()  
+            val_first = events[slope_dict_names[col]].groupby('icustay_id')['valuenum'].first()
+            time_last = events[slope_dict_names[col]].groupby('icustay_id')['charttime'].last()  
+            time_first = events[slope_dict_names[col]].groupby('icustay_id')['charttime'].first()
+            slope_dict[col] = pd.DataFrame((val_last - val_first)/((time_last - time_first)/np.timedelta64(1,'h')))  
+            slope_dict[col].columns = [concepts.label(slope_dict_names[col])]
+            slope_dict[col]['hospital_expired_flag'] = events[slope_dict_names[col]].groupby('icustay_id').hospital_expire_flag.first()
+            slope_dict[col]['gender'] = events[slope_dict_names[col]].groupby('icustay_id').gender.first()
+            #print "{} number of samples = {}".format(col, slope_dict[col].shape)
+        record.output(slope_dict)
+
+
+    print("Summary Calculations Complete")
     for col in const_dict_names.keys():
 
-        dummy = data[data.label == const_dict_names[col]].groupby('icustay_id')
+        dummy = events[const_dict_names[col]].groupby('icustay_id')
         const_dict[col] = pd.DataFrame(dummy.valuenum.first())
-        const_dict[col].columns = [const_dict_names[col]]
+        const_dict[col].columns = [concepts.label(const_dict_names[col])]
         const_dict[col]['hospital_expired_flag'] = dummy.hospital_expire_flag.first()
         const_dict[col]['gender'] = dummy.gender.first()
 
 
     # GCS MEASURES DO HAVE CORRESPONDING VALUENUMS AS CATEGORIES. WILL NOT INCLUDE PRESENTLY
     for col in cat_dict_names.keys():
-        dummy = data[data.label == cat_dict_names[col]].groupby('icustay_id')
+        dummy = events[cat_dict_names[col]].groupby('icustay_id')
         cat_dict[col] = pd.DataFrame(dummy.value.first()) 
-        cat_dict[col].columns = [cat_dict_names[col]]
+        cat_dict[col].columns = [concepts.label(cat_dict_names[col])]
         cat_dict[col]['hospital_expired_flag'] = dummy.hospital_expire_flag.first()
         cat_dict[col]['gender'] = dummy.gender.first()
 
 
-    print "Categorical Dataframes Complete"
-
+    print("Categorical Dataframes Complete")
     '''    
     calc_dicts = [mean_dict, med_dict, std_dict, skew_dict, min_dict, max_dict, first_dict, 
                  slope_dict, delta_dict]
@@ -263,7 +257,11 @@ def calculate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat):
                'slope' : slope_dict, 
                'delta' : delta_dict
                }
-    
+    return calc_dicts, const_dict, cat_dict
+
+
+def remove_stat_outliers(calc_dicts):
+    # THE IQR BOUNDS TAKE THE STATISTICS OF ALL STAYS, CHANGES calc_dicts IN PLACE
     names_dict = {}
     suffix = '_outliers'
 
@@ -281,16 +279,12 @@ def calculate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat):
             # TODO: Use the interquartile range to calculate an outlier step (1.5 times the interquartile range)
             step = 1.5*(Q3 - Q1)
             names_dict[col+suffix] = dummy[~((dummy[col2] >= Q1 - step) & (dummy[col2] <= Q3 + step))].index
-            dummy.set_value(names_dict[col+suffix], col2, np.NaN)
+            dummy.loc[names_dict[col+suffix], col2] = np.nan
             #print "{}   {}     {}".format(col, col2, dummy.dropna().shape)
 
 
 
-    print "Outlier Removal Complete"
-
-
-    print "Complete"
-    return calc_dicts, const_dict, cat_dict
+    print("Outlier Removal Complete")
 
 
 
@@ -298,183 +292,19 @@ def calculate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat):
 def remove_non_variable_features(calc_dicts):
 
     # REMOVE FRAMES/VARIABLES FOR WHICH THERE IS ONLY ONE VALUE I.E. SINGULAR
+    # RETURNS NEW DICTS SO THE CALCULATED STATS ARE LEFT AS THEY WERE
+    variable = {}
     for frame in calc_dicts.keys():
+        variable[frame] = {}
         for col in calc_dicts[frame].keys():
-            col2 = calc_dicts[frame][col].keys()[0]
+            col2 = calc_dicts[frame][col].columns[0]
             unique_vals = len(calc_dicts[frame][col][col2].dropna().unique())
             if unique_vals < 2:
-                print "removing due to only one value  = {}".format(col)
-                calc_dicts[frame].pop(col) 
-
-
-
-def plot_feature_density(dummy, col, save_flag):
-
-    x25 = dummy[col].dropna().quantile(0.25)
-    x50 = dummy[col].dropna().quantile(0.50)
-    x75 = dummy[col].dropna().quantile(0.75)
-    
-    plt.subplots(figsize=(10,6))
-    print "plotting feature {}".format(col)
-    dummy[dummy.hospital_expired_flag==1][col].dropna().plot.kde(
-            alpha=1.0,label='Non-survival')
-    dummy[dummy.hospital_expired_flag==0][col].dropna().plot.kde(
-            alpha=1.0,label='Survival')
-
-    plt.subplots_adjust(left = 0.1, bottom = 0.1, 
-                    right = 0.9, top = 0.9)
-
-
-
-    plt.axvline(x = x25, color='k', linestyle='-')
-    plt.text(x25+0.05,0.05,'Q1',rotation=0)
-    plt.axvline(x = x50, color = 'k', linestyle = '-')
-    plt.text(x50+0.05,0.05,'Q2',rotation=0)
-    plt.axvline(x = x75, color = 'k', linestyle = '-')
-    plt.text(x75+0.05,0.05,'Q3 ',rotation=0)
-
-    plt.title('Mean Temperature Measurement Distributions for Survivors and Non-Survivors ')
-    plt.xlabel(col)
-    plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
-    plt.show()
-    if save_flag:
-        save_file_name = "../figures/" + col + "_" + gend + "_" + "plot.png"
-        print "saving {}".format(save_file_name)
-        plt.savefig(save_file_name)
-        
-    #plt.close()
-
-
-
-
-def plot_categorical_features(cat_dict, save_flag):
-    for col in cat_dict.keys():
-        col2 = cat_dict[col].keys()[0]
-        #print col
-        #print col2
-        vals = list(cat_dict[col][col2].unique())
-        #display(vals)
-        total = cat_dict[col].groupby(col2)[col2].count()
-   
-        dead = cat_dict[col][cat_dict[col].hospital_expired_flag == 1].groupby(col2)[col2].count()
-        dead.name = 'Survivors'
-        dead_percent = 100.00*(dead / total)
-        live = cat_dict[col][cat_dict[col].hospital_expired_flag == 0].groupby(col2)[col2].count()
-        live.name = 'Non_Survivors'
-        live_percent = 100.00*(live / total)
-        monkey = pd.concat([live_percent, dead_percent], axis = 1)
-
-        #display(monkey)
-        plt.subplots(figsize=(10,6))
-        print "plotting feature {}".format(col)
-        
-        monkey.plot.bar(stacked = True, figsize = (10,6), edgecolor = 'black', linewidth = 3, 
-                                    alpha = 0.5, title = "Survival Rate for " + col)
-        
-        plt.subplots_adjust(left = 0.1, bottom = 0.3, 
-                    right = 0.9, top = 0.9)    
-        plt.xticks(rotation = 15, ha = 'right')  
-                          
-        if save_flag:
-            save_file_name = "../figures/" + col + "_" + col2 + "_" + "plot.png"
-            print "saving {}".format(save_file_name)
-            plt.savefig(save_file_name)
-                                    
-        
-def plot_continuous_features(frame, save_flag):
-    # PLOT MEAN DISTRIBUTION
-    for col in frame.keys():
-        dummy = frame[col]
-        col2 = dummy.columns[0]
-       
-        plt.subplots(figsize=(10,6))
-        print "plotting feature {}".format(col)
-        dummy[col2][dummy.hospital_expired_flag==1].dropna().plot.kde(
-            alpha=1.0,label='Non-survival')
-        dummy[col2][dummy.hospital_expired_flag==0].dropna().plot.kde(
-            alpha=1.0,label='Survival')
-
-            # add title, labels etc.
-        plt.subplots_adjust(left = 0.1, bottom = 0.1, 
-                    right = 0.9, top = 0.9) 
-        plt.title('{} measurement on ICU admission '.format(col) +
-                    'vs ICU mortality \n')
-        plt.xlabel(col)
-        plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
-        
-        if save_flag:
-            save_file_name = "../figures/" + col + "_" + gend + "_"+ "plot.png"
-            print "saving {}".format(save_file_name)
-            plt.savefig(save_file_name)
-        calc_dicts
-        
-    
-    print "complete"
-    
-
-
-
-def plot_constant_features(const_dict, save_flag):
-
-    # PLOTTING CONSTANT VALUES LIKE HEIGHT AND WEIGHT
-    for col in const_dict.keys():
+                print("removing due to only one value  = {}".format(col))
+            else:
+                variable[frame][col] = calc_dicts[frame][col]
+    return variable 
 
-        col2 = const_dict[col].keys()[0]
-        vals = list(const_dict[col][col2].unique())
-
-        gender = ['M', 'F'] 
-
-        for gend in gender:
-    
-            print gend
-            dead = const_dict[col][(const_dict[col].hospital_expired_flag == 1)&
-                                  (const_dict[col].gender == gend)]
-                              #&(const_dict[col][col2] >20)]
-            dead.name = 'Non_Survivors'
-            live = const_dict[col][(const_dict[col].hospital_expired_flag == 0)&
-                                  (const_dict[col].gender == gend)]
-                              #&(const_dict[col][col2] >20)]
-            live.name = 'Survivors'
-
-
-            #display(dummy.head())
-        
-            maxx = 0.99
-            minn = 0.01
-
-            live_max = live[col2].quantile(maxx)
-            live_min = live[col2].quantile(minn)
-            dead_max = dead[col2].quantile(maxx)
-            dead_min = dead[col2].quantile(minn)
-            maxlim = max(live_max, dead_max)
-            minlim = min(live_min, dead_min)
-
-
-            plt.subplots(figsize=(10,6))
-    
-       
-            live[(live[col2] < live_max) & (live[col2] > live_min)][col2].plot.hist(bins = 100, 
-                                                                                alpha=0.3,label='Survivors')
-
-            dead[(dead[col2] < dead_max) & (dead[col2] > dead_min)][col2].plot.hist(bins = 100, 
-                                                                                alpha=1.0,label='Non-Survivors')
-            # add title, labels etc.
-            plt.subplots_adjust(left = 0.1, bottom = 0.1, 
-                    right = 0.9, top = 0.9) 
-                
-            plt.title('{} measurement on ICU admission'.format(col) + 
-                       'vs ICU mortality by gender = {}\n'.format(gend))
-            plt.xlabel(col)
-            plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
-
-
-            print "{}    {}".format(maxlim, minlim)
-            plt.xlim(minlim, maxlim)
-        
-            if save_flag:
-                save_file_name = "../figures/" + col + "plot.png"
-                print "saving {}".format(save_file_name)
-                plt.savefig(save_file_name)
 
 
 def merge_continuous_data(data, calc_dicts, const_dict):
@@ -483,13 +313,13 @@ def merge_continuous_data(data, calc_dicts, const_dict):
     # QUESTION UTILITY OF HAVING INDIVIDUAL FRAMES
     # ** CAN BE CODED MORE EFFICIENTLY. SEE LABEVENTS_FIRST24.ipynb ** 
     data2 = data.drop_duplicates('icustay_id', keep = 'first')
-    data3 = data2.drop(['label', 'value', 'valuenum'], axis = 1)
+    data3 = data2.drop(['label', 'concept', 'value', 'valuenum'], axis = 1)
     data3.set_index(['icustay_id'], inplace = True)
 
     for frame in calc_dicts.keys():
-        print "Merging {} Values".format(frame)
+        print("Merging {} Values".format(frame))
         for key in calc_dicts[frame].keys():
-            col = calc_dicts[frame][key].keys()[0]
+            col = calc_dicts[frame][key].columns[0]
             #print "merging {}   {}".format(frame, col)
             #print(calc_dicts[frame][key][col].head())
             data3 = data3.merge(pd.DataFrame(calc_dicts[frame][key][col]), left_index = True, 
@@ -501,8 +331,8 @@ def merge_continuous_data(data, calc_dicts, const_dict):
             data3.columns = newcols
      
     for col in const_dict.keys():
-        col2 = const_dict[col].keys()[0]
-        print "merging {}   {}".format(col, col2)
+        col2 = const_dict[col].columns[0]
+        print("merging {}   {}".format(col, col2))
         #print(const_dict[col][col2].head())
         data3 = data3.merge(pd.DataFrame(const_dict[col][col2]), left_index = True, right_index = True, 
                            how = 'left', sort = True)
@@ -526,12 +356,11 @@ def merge_continuous_data(data, calc_dicts, const_dict):
     
 
 def categorical_to_dummy(data3, cat_dict):
-    dummies = data3[data3.columns[:3]]
-    dummies.set_index(['icustay_id'], inplace = True)
-    
-    
+    dummies = data3[data3.columns[:3]].set_index('icustay_id')
+
+
     for col in cat_dict.keys():
-        col2 = cat_dict[col].keys()[0]
+        col2 = cat_dict[col].columns[0]
         chimp = pd.get_dummies(cat_dict[col][col2], prefix = cat_dict[col][col2].name)
         dummies = dummies.merge(chimp, left_index = True, right_index = True, 
                            how = 'left', sort = True)
@@ -545,34 +374,37 @@ def categorical_affinity_blocks(dummies):
     # MEASURES HAVE LOW AFFINITY I.E. WHEN WE DROP NAN VALUES THERE ARE VERY FEW SAMPLES LEFT 
     # SO BREAKING THESE UP INTO HIGH AFFINITY DATAFRAMES FOR PROCESSING. 
     # ** MAY CONSIDER PROCESSING GCS_TOTAL AS A CONTINUOUS BUT, FOR NOW CREATING DUMMIES
+    # THE BLOCKS ARE VIEWS OF THE COMPLETE CASES OF dummies (SEE blocks.py), NOT COPIES
+    observed = blocks.observed_mask(dummies)
 
-    print "Shape of Capillary Block"
+    print("Shape of Capillary Block")
     # NUMBER OF NON NAN SAMPLES IN CAPILLARY REFILL
-    print(dummies[[x for x in dummies.columns if 'Capillary' in x]].dropna().shape)
+    print(blocks.complete_cases(dummies, [x for x in dummies.columns if 'Capillary' in x], observed).shape)
 
     # NUMBER OF NON NAN SAMPLES IN GCS_TOTAL ONLY
-    print "Shape of GCS_Total Block"
-    print(dummies[[x for x in dummies.columns if 'Total' in x]].dropna().shape)
+    print("Shape of GCS_Total Block")
+    print(blocks.complete_cases(dummies, [x for x in dummies.columns if 'Total' in x], observed).shape)
     # NUMBER OF NON NAN SAMPLES IN GCS MEASURES WITHOUT TOTAL 
-    print "Shape of GCS Block"
-    print(dummies[[x for x in dummies.columns if (('GCS' in x) & ('Total' not in x))]].dropna().shape)
+    print("Shape of GCS Block")
+    print(blocks.complete_cases(dummies, [x for x in dummies.columns if (('GCS' in x) & ('Total' not in x))],
+                                observed).shape)
     # NUMBER OF NON NAN SAMPLES IN GCS TOTAL AND MEASEURES
-    print "Shape of All GCS  Block"
-    print(dummies[[x for x in dummies.columns if 'GCS' in x]].dropna().shape)
+    print("Shape of All GCS  Block")
+    print(blocks.complete_cases(dummies, [x for x in dummies.columns if 'GCS' in x], observed).shape)
     # NUMBER OF NON NAN SAMPLES IN GCS MEASURES AND CAP REFILL
-    print "Shape of Capillary and GCS Block"
-    print(dummies[[x for x in dummies.columns if 'Total' not in x]].dropna().shape)
+    print("Shape of Capillary and GCS Block")
+    print(blocks.complete_cases(dummies, [x for x in dummies.columns if 'Total' not in x], observed).shape)
 
     #CREATE 3 BLOCKS BASED ON AFFINITY I.E. SIZE AFTER NAN VALUES DROPPED
     cap_cols = [x for x in dummies.columns if 'Capillary' in x]
     cap_cols.insert(0, 'hospital_expire_flag')
-    Cap_dummies = dummies[cap_cols].dropna()
+    Cap_dummies = blocks.complete_cases(dummies, cap_cols, observed)
     GCS_Tot_cols = [x for x in dummies.columns if 'Total' in x]
     GCS_Tot_cols.insert(0, 'hospital_expire_flag')
-    GCS_Total_dummies = dummies[GCS_Tot_cols].dropna()
+    GCS_Total_dummies = blocks.complete_cases(dummies, GCS_Tot_cols, observed)
     GCS_cols = [x for x in dummies.columns if (('GCS' in x) & ('Total' not in x))]
     GCS_cols.insert(0, 'hospital_expire_flag')
-    GCS_dummies = dummies[GCS_cols].dropna()
+    GCS_dummies = blocks.complete_cases(dummies, GCS_cols, observed)
     
     cat_dummy_dict = {'Cap_dummies': Cap_dummies, 
                       'GCS_Total_dummies': GCS_Total_dummies, 
@@ -604,11 +436,12 @@ def continuous_affinity_blocks(data3):
         cols4.insert(0, thing)
 
     #print(cols1)
-    data3.replace([np.inf, -np.inf], np.nan, inplace = True)
-    BP_data = data3[cols1].dropna()
-    CreatGlucHgHmT_data = data3[cols2].dropna()
-    HR_RR_data = data3[cols3].dropna()
-    pH_data = data3[cols4].dropna()
+    # VIEWS OF THE COMPLETE CASES OF data3, INF COUNTING AS MISSING
+    observed = blocks.observed_mask(data3)
+    BP_data = blocks.complete_cases(data3, cols1, observed)
+    CreatGlucHgHmT_data = blocks.complete_cases(data3, cols2, observed)
+    HR_RR_data = blocks.complete_cases(data3, cols3, observed)
+    pH_data = blocks.complete_cases(data3, cols4, observed)
                                  
     
     cont_blocks = { 'BP_data': BP_data, 
@@ -632,18 +465,18 @@ def drop_sparse_data(data3):
     '''
     for col in drop_cols:
         print(col)
-    print "****************************************************"
-    print "*************** DATA 3 Columns !!!******************"
-    print "****************************************************"
+    print("****************************************************")
+    print("*************** DATA 3 Columns !!!******************")
+    print("****************************************************")
     print(data3.columns)
-    print "****************************************************"
-    print "*************** DROP  Columns !!!******************"
-    print "****************************************************"
+    print("****************************************************")
+    print("*************** DROP  Columns !!!******************")
+    print("****************************************************")
     print(drop_cols) 
     '''
-    data3.drop(drop_cols, inplace = True, axis = 1)
+    data3 = data3.drop(drop_cols, axis = 1)
     data3.set_index(np.arange(data3.shape[0]), inplace = True)    
-    print "Data3 Shape = {}".format(data3.shape)
+    print("Data3 Shape = {}".format(data3.shape))
     return data3
 '''   
 calc_dict_cols = ['pH2', 'BP_Mean', 'BP_Dia', 'BP_Sys', 'pH3', 'Creat2', 'GlucC', 'HR', 'Hemat','Hg', 'O2_Fraction', 
@@ -671,30 +504,15 @@ def quant_cats(feature, Q1, Q2, Q3):
 
 
 def continuous_to_categorical(cont_blocks):
-    
-    BP_cat_data = cont_blocks['BP_data'].copy()
-    CreatGlucHgHmT_cat_data = cont_blocks['CreatGlucHgHmT_data'].copy()
-    HR_RR_cat_data = cont_blocks['HR_RR_data'].copy()
-    pH_cat_data = cont_blocks['pH_data'].copy()
-    print "BP_cat_data shape = {}".format(BP_cat_data.shape)
-    
-    
-    
-    cont_cat_blocks = {
-                       'BP_cat_data':BP_cat_data,
-                       'CreatGlucHgHmT_cat_data': CreatGlucHgHmT_cat_data,
-                       'HR_RR_cat_data' : HR_RR_cat_data, 
-                       'pH_cat_data' : pH_cat_data
-                      }
-
-    for key in cont_cat_blocks.keys():
-        frame = cont_cat_blocks[key]
-        frame_stats = frame.describe()
-        for col in frame.columns[3:]:
-            Q1 = frame_stats[col].loc['25%']
-            Q2 = frame_stats[col].loc['50%']
-            Q3 = frame_stats[col].loc['75%']
-            frame[col] = frame[col].apply(lambda x: quant_cats(x, Q1, Q2, Q3))
+    # THE HEADER COLUMNS OF EVERY BLOCK VIEW FOLLOWED BY THE QUARTILE LEVEL OF EACH FEATURE,
+    # AS quant_cats ASSIGNS THEM, SO THE BLOCKS ARE READ BUT NEVER COPIED
+    cont_cat_blocks = {}
+    for key in ['BP_data', 'CreatGlucHgHmT_data', 'HR_RR_data', 'pH_data']:
+        view = cont_blocks[key]
+        header = view.frame(view.columns[:3])
+        levels = blocks.quartile_levels(view, view.columns[3:])
+        cont_cat_blocks[key.replace('_data', '_cat_data')] = pd.concat([header, levels], axis = 1)
+    print("BP_cat_data shape = {}".format(cont_cat_blocks['BP_cat_data'].shape))
 
         
 
@@ -706,7 +524,7 @@ def continuous_categorical_to_dummies(dummies, cont_cat_blocks):
 
     pre_cols = cont_cat_blocks['BP_cat_data'].columns[:1]
     post_cols = cont_cat_blocks['BP_cat_data'].columns[1:]
-    print "BPS_cat_data pre columns"
+    print("BPS_cat_data pre columns")
     print(pre_cols)
     
     BP_dummies = cont_cat_blocks['BP_cat_data'][pre_cols].merge(
@@ -718,7 +536,7 @@ def continuous_categorical_to_dummies(dummies, cont_cat_blocks):
     CreatGlucHgHmT_dummies = cont_cat_blocks['CreatGlucHgHmT_cat_data'][pre_cols].merge(
                     pd.get_dummies(cont_cat_blocks['CreatGlucHgHmT_cat_data'][post_cols]), 
                     left_index = True, right_index = True, how = 'left', sort = True)
-    print "CreatGlucHgHmT_cat_data pre columns"
+    print("CreatGlucHgHmT_cat_data pre columns")
     print(pre_cols)                       
     
     pre_cols = cont_cat_blocks['HR_RR_cat_data'].columns[:1]
@@ -726,7 +544,7 @@ def continuous_categorical_to_dummies(dummies, cont_cat_blocks):
     HR_RR_dummies = cont_cat_blocks['HR_RR_cat_data'][pre_cols].merge(pd.get_dummies(
                             cont_cat_blocks['HR_RR_cat_data'][post_cols]), left_index = True, 
                             right_index = True, how = 'left', sort = True)
-    print "HR_RR_cat_data"
+    print("HR_RR_cat_data")
     print(pre_cols)  
     
     
@@ -736,7 +554,7 @@ def continuous_categorical_to_dummies(dummies, cont_cat_blocks):
                             cont_cat_blocks['pH_cat_data'][post_cols]), left_index = True, 
                             right_index = True, how = 'left', sort = True)
     
-    print "pH_cat_data"
+    print("pH_cat_data")
     print(pre_cols)  
     
     cont_dummy_dict = {'BP_dummies': BP_dummies, 
@@ -753,112 +571,187 @@ def continuous_categorical_to_dummies(dummies, cont_cat_blocks):
     return cont_dummy_dict
 
 
-def select_features(features_dict): 
-    # CREATGLUC ETC HAS ONLY 874 SAMPLES AND SO WON'T BE HELPFUL. 
-
-    root = '../data/features/'
-
-    for name, frame in features_dict.iteritems():#frame = cat_dummy_frames[0]
-        X_continuous = frame[frame.columns[1:]]
-        y = frame['hospital_expire_flag']
-        #display(X_continuous.shape)
-        #display(y.shape)
+def score_features(features_dict, min_stays=5000, alpha=.001):
+    # CHI2 SCORES OF EVERY BLOCK WITH ENOUGH STAYS, KEEPING THE FEATURES WITH P < ALPHA
+    # CREATGLUC ETC HAS ONLY 874 SAMPLES AND SO WON'T BE HELPFUL.
+    # THE BLOCKS ARE FRAMES OR blocks.BlockView, ONLY THE SELECTED COLUMNS ARE COPIED OUT
+    from sklearn.feature_selection import SelectKBest, chi2
+    selected = {}
+    for name, block in features_dict.items():
+        block = blocks.as_view(block)
+        features = block.columns[1:]
+        y = block.column('hospital_expire_flag')
         # ONLY PASSING FRAMES W/ > 5000 ICUSTAYS
-        if y.shape[0] > 5000:
-        
+        if y.shape[0] > min_stays:
+
             # SELECT K BEST FEATURES BASED ON CHI2 SCORES
             selector = SelectKBest(score_func = chi2, k = 'all')
-            selector.fit(X_continuous, y)
-            p_vals = pd.Series(selector.pvalues_, name = 'p_values', index = X_continuous.columns)
-            scores = pd.Series(selector.scores_, name = 'scores', index = X_continuous.columns)
+            selector.fit(block.values(features), y)
+            p_vals = pd.Series(selector.pvalues_, name = 'p_values', index = features)
+            scores = pd.Series(selector.scores_, name = 'scores', index = features)
             cont_features_df = pd.concat([p_vals, scores], axis = 1)
             cont_features_df.sort_values(by ='scores', ascending = False, inplace = True)
-            best_features = frame[cont_features_df[cont_features_df.p_values < .001].index]
-            frame = pd.DataFrame(y).merge(best_features, left_index = True, right_index = True, 
-                           how = 'left', sort = True)
-            print "{}     {}".format(name, frame.shape)
-            frame.to_csv(root + name + '.csv')
-            cont_features_df[cont_features_df.p_values < .001].to_csv(root + name + 'Scores.csv')
-
+            best = list(cont_features_df[cont_features_df.p_values < alpha].index)
+            frame = block.frame(['hospital_expire_flag'] + best).sort_index()
+            print("{}     {}".format(name, frame.shape))
+            selected[name] = (frame, cont_features_df[cont_features_df.p_values < alpha])
+    return selected
 
 
+def write_features(selected, root=FEATURES_DIR):
+    # WRITE EACH SELECTED BLOCK AND ITS SCORES TO FILE
+    for name, (frame, scores) in selected.items():
+        frame.to_csv(os.path.join(root, name + '.csv'))
+        scores.to_csv(os.path.join(root, name + 'Scores.csv'))
 
-# IMPORT AND REORGANIZE DATA
-print "********************************************************************************"
-print "************************ Processing Chart Events Data **************************"
-print "********************************************************************************"
 
-data = import_chartevents_data()
-# FILTER OUT VARIABLES WITH FEWER THAN 2K SAMPLES AND ORGANIZED 
-# DATA BY TYPE, CONTINUOUS, CATEGORICAL, CONSTANT
-old_cols_continuous, old_cols_const, old_cols_cat = explore_data(data)
+def select_features(features_dict, root=FEATURES_DIR):
+    write_features(score_features(features_dict), root)
 
 
+# PIPELINE STAGES. EACH TAKES THE RESULTS OF THE STAGES NAMED IN STAGES AND RETURNS
+# A NEW OBJECT, SO MEMOIZED RESULTS ARE NEVER CHANGED BY A LATER STAGE
 
+def stats_stage(data, columns):
+    old_cols_continuous, old_cols_const, old_cols_cat = columns
+    return calculate_stats(data, old_cols_continuous, old_cols_const, old_cols_cat)
 
-# CALCULATE STATISTICS ON DATA
-calc_dicts, const_dict, cat_dict = calculate_stats(data, old_cols_continuous, 
-                old_cols_const, old_cols_cat)
 
-
-'''
-frame = calc_dicts.keys()[0]
-col = calc_dicts[frame].keys()[0]
-col2 = calc_dicts[frame][col].keys()[0]
-dummy = calc_dicts[frame][col]
-#plot_feature_density(dummy, col, False)
-'''
-remove_non_variable_features(calc_dicts)
-#plot_categorical_features(cat_dict, True)
-
-#plot_continuous_features(frame, True)
-#plot_constant_features(const_dict, True)
-
-
-# MERGING CONTINUOUS AND CONSTANT DATA
-data3 = merge_continuous_data(data, calc_dicts, const_dict)
-dummies = categorical_to_dummy(data3, cat_dict)
-#Cap_dummies, GCS_Total_dummies, GCS_dummies = categorical_affinity_blocks(dummies)
-cat_dummy_dict = categorical_affinity_blocks(dummies)
+def variable_stage(stats):
+    return remove_non_variable_features(stats[0])
 
 
-data3 = drop_sparse_data(data3)
+def merge_stage(data, stats, calc_dicts):
+    # MERGING CONTINUOUS AND CONSTANT DATA
+    return merge_continuous_data(data, calc_dicts, stats[1])
 
 
-cont_blocks = continuous_affinity_blocks(data3)
-for key in cont_blocks.keys():
-    print "the shape of {} is {}".format(key, cont_blocks[key].shape)
-# CONSIDER PACKING THESE UP IN A LIST OR DICT
-cont_cat_blocks = continuous_to_categorical(cont_blocks)
-for key in cont_cat_blocks.keys():
-    print "the shape of {} is {}".format(key, cont_cat_blocks[key].shape)
-print "Data3 first 3 columns are..... "
-print(data3.columns[:3])
+def categorical_stage(data3, stats):
+    return categorical_affinity_blocks(categorical_to_dummy(data3, stats[2]))
 
 
-dummies = data3[data3.columns[:3]]
-dummies.set_index(['icustay_id'], inplace = True)
-cont_dummy_dict = continuous_categorical_to_dummies(dummies, cont_cat_blocks)
-
-for key in cont_dummy_dict.keys():
-    print "the shape of {} is {}".format(key, cont_dummy_dict[key].shape)
-    
-  
-dummy_frames = [cont_dummy_dict['BP_dummies'], 
-                cont_dummy_dict['CreatGlucHgHmT_dummies'],
-                cont_dummy_dict['HR_RR_dummies'], 
-                cont_dummy_dict['pH_dummies'], 
-                cat_dummy_dict['GCS_Total_dummies'], 
-                cat_dummy_dict['GCS_dummies']]
-                
-dummy_frame_filenames = ['BP_Features', 'CreatGlucHgHmT_Features', 'HrRr_Features', 
-                     'GCSTotal_Features','GCS_Features']
-features_dict = dict(zip(dummy_frame_filenames, dummy_frames))
-for key in features_dict.keys():
-    print "the first 10 columns of {} is:".format(key)
-    print(features_dict[key][features_dict[key].columns[:6]].head(3))
-
+def continuous_stage(data3):
+    cont_blocks = continuous_affinity_blocks(data3)
+    for key in cont_blocks.keys():
+        print("the shape of {} is {}".format(key, cont_blocks[key].shape))
+    return cont_blocks
 
-select_features(features_dict)
-print "Chart Events Feature Selection Complete"
 
+def continuous_dummies_stage(data3, cont_blocks):
+    cont_cat_blocks = continuous_to_categorical(cont_blocks)
+    dummies = data3[data3.columns[:3]].set_index('icustay_id')
+    return continuous_categorical_to_dummies(dummies, cont_cat_blocks)
+
+
+def feature_blocks_stage(cont_dummy_dict, cat_dummy_dict):
+    features_dict = {'BP_Features': cont_dummy_dict['BP_dummies'],
+                     'CreatGlucHgHmT_Features': cont_dummy_dict['CreatGlucHgHmT_dummies'],
+                     'HrRr_Features': cont_dummy_dict['HR_RR_dummies'],
+                     'pH_Features': cont_dummy_dict['pH_dummies'],
+                     'GCSTotal_Features': cat_dummy_dict['GCS_Total_dummies'],
+                     'GCS_Features': cat_dummy_dict['GCS_dummies']}
+    for key in features_dict.keys():
+        print("the shape of {} is {}".format(key, features_dict[key].shape))
+    return features_dict
+
+
+# OUT-OF-CORE STAGES. THE EVENTS ARE SPLIT INTO PARTITIONS OF WHOLE STAYS (SEE
+# utils/partition.py), THE PER STAY STATISTICS ARE CALCULATED ONE PARTITION PER WORKER
+# AND JOINED, AND THE STEPS OVER ALL STAYS RUN ON THE JOINED RESULTS
+
+def _partition_label_stays(path):
+    data = pd.read_csv(path, usecols=lambda col: col in ('icustay_id', 'itemid', 'label'))
+    return label_stays(concepts.assign_concepts(data, 'chart'))
+
+
+def _partition_stats(path, columns):
+    data = import_chartevents_data(path)
+    calc_dicts, const_dict, cat_dict = aggregate_stats(data, *columns)
+    return calc_dicts, const_dict, cat_dict, data.drop_duplicates('icustay_id', keep = 'first')
+
+
+def partition_label_stays_stage(paths, n_jobs=1):
+    counts = partition.map_partitions(_partition_label_stays, paths, n_jobs)
+    return pd.concat(counts).groupby(level=0).sum()
+
+
+def partition_stats_stage(paths, columns, n_jobs=1):
+    parts = partition.map_partitions(_partition_stats, paths, n_jobs, columns)
+    stays = pd.concat([part[3] for part in parts]).sort_values('icustay_id', kind='mergesort')
+    stays.set_index(np.arange(stays.shape[0]), inplace = True)
+    return partition.concat_partitions([part[:3] for part in parts]) + (stays,)
+
+
+def partition_outliers_stage(partial):
+    calc_dicts = dict((frame, dict((col, stats.copy()) for col, stats in partial[0][frame].items()))
+                      for frame in partial[0])
+    remove_stat_outliers(calc_dicts)
+    return calc_dicts, partial[1], partial[2]
+
+
+def stays_stage(partial):
+    # FIRST EVENT OF EVERY STAY, ALL merge_continuous_data TAKES FROM THE EVENTS
+    return partial[3]
+
+
+def stages(path=CHART_EVENTS_CSV, chunksize=None, min_samples=2000, min_stays=5000, partitions=None,
+           partition_dir=PARTITIONS_DIR, n_jobs=1):
+    """ the chart events pipeline as a list of pipeline.Stage.
+
+    min_samples (stays per measurement concept) and min_stays (stays per feature block) are set for
+    the 60k stays of MIMIC-III, smaller extracts need them scaled down.
+
+    with partitions the events are never loaded whole: they are split by stay into that
+    many files under partition_dir/chart and the statistics are calculated per file on
+    n_jobs processes. the results are the same as without.
+    """
+    if partitions:
+        events = 'chart_stays'
+        first = [
+            Stage('chart_partitions', partition.partition_csv,
+                  params={'path': path, 'root': os.path.join(partition_dir, 'chart'), 'n_partitions': partitions,
+                          'chunksize': chunksize},
+                  files=['path'], cache=False, untracked=['chunksize']),
+            Stage('chart_label_stays', partition_label_stays_stage, ['chart_partitions'], params={'n_jobs': n_jobs},
+                  untracked=['n_jobs']),
+            Stage('chart_columns', classify_labels, ['chart_label_stays'], params={'min_samples': min_samples},
+                  cache=False),
+            Stage('chart_partial_stats', partition_stats_stage, ['chart_partitions', 'chart_columns'],
+                  params={'n_jobs': n_jobs}, untracked=['n_jobs']),
+            Stage('chart_stats', partition_outliers_stage, ['chart_partial_stats']),
+            Stage('chart_stays', stays_stage, ['chart_partial_stats'], cache=False),
+        ]
+    else:
+        events = 'chart_events'
+        first = [
+            Stage('chart_events', import_chartevents_data, params={'path': path, 'chunksize': chunksize},
+                  files=['path'], untracked=['chunksize']),
+            # FILTER OUT VARIABLES WITH FEWER THAN 2K SAMPLES AND ORGANIZED
+            # DATA BY TYPE, CONTINUOUS, CATEGORICAL, CONSTANT
+            Stage('chart_columns', explore_data, ['chart_events'], params={'min_samples': min_samples}, cache=False),
+            Stage('chart_stats', stats_stage, ['chart_events', 'chart_columns']),
+        ]
+    return first + [
+        Stage('chart_variable', variable_stage, ['chart_stats'], cache=False),
+        Stage('chart_merged', merge_stage, [events, 'chart_stats', 'chart_variable']),
+        Stage('chart_categorical', categorical_stage, ['chart_merged', 'chart_stats']),
+        Stage('chart_dense', drop_sparse_data, ['chart_merged']),
+        Stage('chart_continuous', continuous_stage, ['chart_dense']),
+        Stage('chart_continuous_dummies', continuous_dummies_stage, ['chart_dense', 'chart_continuous']),
+        Stage('chart_blocks', feature_blocks_stage, ['chart_continuous_dummies', 'chart_categorical'],
+              cache=False),
+        Stage('chart_selected', score_features, ['chart_blocks'], params={'min_stays': min_stays}),
+    ]
+
+
+def main(cache_dir=None, path=CHART_EVENTS_CSV, root=FEATURES_DIR):
+    print("********************************************************************************")
+    print("************************ Processing Chart Events Data **************************")
+    print("********************************************************************************")
+    selected = Pipeline(stages(path), cache_dir).run(['chart_selected'])['chart_selected']
+    write_features(selected, root)
+    print("Chart Events Feature Selection Complete")
+
+
+if __name__ == "__main__":
+    main(cache_dir=PIPELINE_CACHE_DIR)
@@ -0,0 +1,124 @@
+""" combine the chart, lab and demographics feature blocks into one design matrix.
+
+ICU_MORTALITY_FIRST24.ipynb appends the block score frames one by one, sorts them by
+p-value and then inner merges the outcomes with every selected column in turn,
+sorting after each merge. here the global top k is taken from all the scores at once,
+the stays are aligned once and the selected columns are stacked in a single pass.
+"""
+import numpy as np
+import pandas as pd
+
+from . import feature_store
+
+
+OUTCOME = 'hospital_expire_flag'
+
+# COLUMN RENAMES APPLIED IN THE NOTEBOOK AFTER THE MERGE
+NOTEBOOK_RENAMES = {'Pneumonia (except that caused by tuberculosis or sexually transmitted disease)': 'Pneumonia',
+                    'Respiratory failure; insufficiency; arrest (adult)': 'Respiratory Failure'}
+
+
+def top_features(scores, k=20):
+    """ names of the k features with the smallest p-values over all blocks.
+
+    :param scores: dict of block name -> score frame indexed by feature with a p_values
+                   column (the *Scores.csv files), or a list of such frames
+    :return: list of feature names, smallest p-value first, ties in block order
+    """
+    frames = [scores[name] for name in sorted(scores)] if isinstance(scores, dict) else list(scores)
+    p_values = pd.concat([frame['p_values'] for frame in frames])
+    p_values = p_values[~p_values.index.duplicated()]
+    return list(p_values.sort_values(kind='mergesort').index[:k])
+
+
+def combine_blocks(blocks, scores, outcomes, k=20, how='inner', order='blocks', rename=None):
+    """ design matrix of the global top k features and the matching outcomes.
+
+    :param blocks: dict of block name -> feature frame indexed by icustay_id, or a
+                   blocks.BlockView of one, an outcome column in a block is ignored
+    :param scores: score frames of the blocks, see top_features
+    :param outcomes: series or frame with a hospital_expire_flag column, indexed by icustay_id
+    :param k: number of features to keep
+    :param how: 'inner' keeps the stays present in every block that contributes a
+                feature, as the notebook's merges did, 'outer' keeps the stays present
+                in any of them. stays without an outcome are always dropped
+    :param order: 'blocks' orders the columns by block name and then by their position
+                  in the block, as the notebook did, 'p_value' puts the smallest p-value
+                  first
+    :param rename: optional dict of column renames, e.g. NOTEBOOK_RENAMES
+    :return: X frame and y series indexed by the sorted icustay_ids
+    """
+    if how not in ('inner', 'outer'):
+        raise ValueError("how must be 'inner' or 'outer', not {}".format(how))
+    if order not in ('blocks', 'p_value'):
+        raise ValueError("order must be 'blocks' or 'p_value', not {}".format(order))
+    y = outcomes[OUTCOME] if isinstance(outcomes, pd.DataFrame) else outcomes
+    selected = top_features(scores, k)
+    wanted = set(selected)
+
+    # (BLOCK, COLUMN) OF EVERY SELECTED FEATURE, THE FIRST BLOCK WINS FOR DUPLICATE NAMES
+    sources = {}
+    for name in sorted(blocks):
+        for col in blocks[name].columns:
+            if col in wanted and col not in sources and col != OUTCOME:
+                sources[col] = name
+    missing = [col for col in selected if col not in sources]
+    if missing:
+        raise KeyError("selected features not in any block: {}".format(missing))
+    if order == 'p_value':
+        columns = list(selected)
+    else:
+        columns = [col for name in sorted(blocks) for col in blocks[name].columns if sources.get(col) == name]
+
+    index = pd.Index(y.index)
+    contributing = sorted(set(sources.values()))
+    if how == 'inner':
+        for name in contributing:
+            index = index.intersection(blocks[name].index)
+    else:
+        union = blocks[contributing[0]].index
+        for name in contributing[1:]:
+            union = union.union(blocks[name].index)
+        index = index.intersection(union)
+    index = index.sort_values()
+
+    data = np.column_stack([blocks[sources[col]][col].reindex(index).values for col in columns]) \
+        if columns else np.empty((len(index), 0))
+    X = pd.DataFrame(data, index=index, columns=columns)
+    X.index.name = 'icustay_id'
+    if rename:
+        X = X.rename(columns=rename)
+    return X, y.reindex(index).astype(int)
+
+
+def top_store_features(root, k=20, version=None):
+    """ names of the k features of a feature store with the smallest recorded p-values """
+    schema = feature_store.describe(root, version)
+    scored = schema[schema.index != OUTCOME]
+    if 'p_value' not in scored.columns:
+        raise KeyError("no p-values recorded in the feature store {}".format(root))
+    scored = scored['p_value'].dropna().sort_values(kind='mergesort')
+    return list(scored.index[:k])
+
+
+def combine_from_store(root, k=20, how='inner', order='p_value', version=None, rename=None):
+    """ design matrix of the top k features in a feature store, by their recorded p-values.
+
+    only the selected columns and the outcome are read. with how='inner' the stays with
+    a missing value in any selected column are dropped.
+
+    :param order: 'p_value' or 'store' for the order the columns were written in
+    :return: X frame and y series
+    """
+    selected = top_store_features(root, k, version)
+    if order == 'store':
+        schema = feature_store.describe(root, version)
+        selected = [col for col in schema.index if col in set(selected)]
+    frame = feature_store.read_features(root, columns=[OUTCOME] + selected, version=version)
+    frame = frame[frame[OUTCOME].notnull()]
+    if how == 'inner':
+        frame = frame.dropna()
+    X = frame[selected].astype(float)
+    if rename:
+        X = X.rename(columns=rename)
+    return X, frame[OUTCOME].astype(int)
@@ -0,0 +1,185 @@
+""" MIMIC-III items mapped to the measurements the chart and lab features are built from.
+
+the feature scripts picked their measurements out of the sorted list of labels by
+position and compared the label string of every event once per statistic. a concept
+here is one measurement with an integer id, the name its feature columns start with
+and the label its events are given, and the MIMIC itemids that record it: the CareVue
+and MetaVision items of the same vital sign, and the items in other units, converted
+with valuenum * factor + offset (Fahrenheit to Celsius, lbs to kg, inches to cm).
+
+assign_concepts adds the concept id of every event as an integer column at ingest,
+from the itemid when the extract has one and otherwise from the label, looked up once
+per distinct label. the later stages select their events by concept id.
+
+    data = concepts.assign_concepts(data, 'chart')
+    data[data['concept'].values == concepts.concept_id('chart', 'HR')]
+"""
+import numpy as np
+import pandas as pd
+
+
+# CONCEPT OF THE EVENTS OF ITEMS THAT ARE NOT IN THE MAP
+UNMAPPED = -1
+
+KINDS = ['continuous', 'constant', 'categorical']
+
+_F_TO_C = (5. / 9, -160. / 9)
+_LBS_TO_KG = (.45359237, 0.)
+_INCHES_TO_CM = (2.54, 0.)
+
+# (CONCEPT ID, SOURCE, NAME, KIND, LABEL, [(ITEMID, LABEL OF THE ITEM, FACTOR, OFFSET)])
+# CAREVUE ITEMIDS ARE BELOW 10000, METAVISION ITEMIDS START AT 220000. WITHIN A SOURCE
+# AND KIND THE CONCEPTS ARE IN THE ORDER THE FEATURE SCRIPTS ZIPPED THEIR NAMES IN
+CONCEPTS = [
+    (1, 'chart', 'pH2', 'continuous', 'Art.pH', [(1126, 'Art.pH', 1., 0.)]),
+    (2, 'chart', 'BP_Mean', 'continuous', 'Arterial BP Mean',
+     [(52, 'Arterial BP Mean', 1., 0.), (220052, 'Arterial Blood Pressure mean', 1., 0.)]),
+    (3, 'chart', 'BP_Dia', 'continuous', 'Arterial BP [Diastolic]',
+     [(8368, 'Arterial BP [Diastolic]', 1., 0.), (220051, 'Arterial Blood Pressure diastolic', 1., 0.)]),
+    (4, 'chart', 'BP_Sys', 'continuous', 'Arterial BP [Systolic]',
+     [(51, 'Arterial BP [Systolic]', 1., 0.), (220050, 'Arterial Blood Pressure systolic', 1., 0.)]),
+    (5, 'chart', 'pH3', 'continuous', 'Arterial pH', [(780, 'Arterial pH', 1., 0.), (223830, 'PH (Arterial)', 1., 0.)]),
+    (6, 'chart', 'Creat2', 'continuous', 'Creatinine (0-1.3)',
+     [(791, 'Creatinine (0-1.3)', 1., 0.), (220615, 'Creatinine', 1., 0.)]),
+    (7, 'chart', 'GlucC', 'continuous', 'Glucose (70-105)',
+     [(811, 'Glucose (70-105)', 1., 0.), (220621, 'Glucose (serum)', 1., 0.)]),
+    (8, 'chart', 'HR', 'continuous', 'Heart Rate', [(211, 'Heart Rate', 1., 0.), (220045, 'Heart Rate', 1., 0.)]),
+    (9, 'chart', 'Hemat', 'continuous', 'Hematocrit',
+     [(813, 'Hematocrit', 1., 0.), (220545, 'Hematocrit (serum)', 1., 0.)]),
+    (10, 'chart', 'Hg', 'continuous', 'Hemoglobin', [(814, 'Hemoglobin', 1., 0.), (220228, 'Hemoglobin', 1., 0.)]),
+    (11, 'chart', 'O2_Fraction', 'continuous', 'Inspired O2 Fraction', [(223835, 'Inspired O2 Fraction', 1., 0.)]),
+    (12, 'chart', 'RR_Spont', 'continuous', 'Resp Rate (Spont)',
+     [(614, 'Resp Rate (Spont)', 1., 0.), (224689, 'Respiratory Rate (spontaneous)', 1., 0.)]),
+    (13, 'chart', 'RR_Total', 'continuous', 'Resp Rate (Total)',
+     [(615, 'Resp Rate (Total)', 1., 0.), (224690, 'Respiratory Rate (Total)', 1., 0.)]),
+    (14, 'chart', 'RR', 'continuous', 'Respiratory Rate',
+     [(618, 'Respiratory Rate', 1., 0.), (220210, 'Respiratory Rate', 1., 0.)]),
+    (15, 'chart', 'TempC', 'continuous', 'Temperature C',
+     [(676, 'Temperature C', 1., 0.), (223762, 'Temperature Celsius', 1., 0.),
+      (678, 'Temperature F', _F_TO_C[0], _F_TO_C[1]), (223761, 'Temperature Fahrenheit', _F_TO_C[0], _F_TO_C[1])]),
+    (16, 'chart', 'TempC_Calc', 'continuous', 'Temperature C (calc)',
+     [(677, 'Temperature C (calc)', 1., 0.), (679, 'Temperature F (calc)', _F_TO_C[0], _F_TO_C[1])]),
+    (17, 'chart', 'Weight', 'constant', 'Admission Weight (Kg)',
+     [(226512, 'Admission Weight (Kg)', 1., 0.), (762, 'Admit Wt', 1., 0.),
+      (226531, 'Admission Weight (lbs.)', _LBS_TO_KG[0], _LBS_TO_KG[1])]),
+    (18, 'chart', 'Height', 'constant', 'Height (cm)',
+     [(226730, 'Height (cm)', 1., 0.), (226707, 'Height', _INCHES_TO_CM[0], _INCHES_TO_CM[1]),
+      (920, 'Admit Ht', _INCHES_TO_CM[0], _INCHES_TO_CM[1])]),
+    (19, 'chart', 'GCS_Eye', 'categorical', 'GCS - Eye Opening',
+     [(220739, 'GCS - Eye Opening', 1., 0.), (184, 'Eye Opening', 1., 0.)]),
+    (20, 'chart', 'GCS_Motor', 'categorical', 'GCS - Motor Response',
+     [(223901, 'GCS - Motor Response', 1., 0.), (454, 'Motor Response', 1., 0.)]),
+    (21, 'chart', 'GCS_Verbal', 'categorical', 'GCS - Verbal Response',
+     [(223900, 'GCS - Verbal Response', 1., 0.), (723, 'Verbal Response', 1., 0.)]),
+    (22, 'chart', 'GCS_total', 'categorical', 'GCS Total', [(198, 'GCS Total', 1., 0.)]),
+    (23, 'chart', 'Cap_refill', 'categorical', 'Capillary Refill',
+     [(3348, 'Capillary Refill', 1., 0.), (223951, 'Capillary Refill R', 1., 0.),
+      (224308, 'Capillary Refill L', 1., 0.)]),
+    (101, 'labs', 'Creat', 'continuous', 'Creatinine', [(50912, 'Creatinine', 1., 0.)]),
+    (102, 'labs', 'CreatUrine', 'continuous', 'Creatinine, Urine', [(51082, 'Creatinine, Urine', 1., 0.)]),
+    (103, 'labs', 'Gluc', 'continuous', 'Glucose', [(50931, 'Glucose', 1., 0.), (50809, 'Glucose', 1., 0.)]),
+    (104, 'labs', 'Hemat', 'continuous', 'Hematocrit',
+     [(51221, 'Hematocrit', 1., 0.), (50810, 'Hematocrit, Calculated', 1., 0.)]),
+    (105, 'labs', 'Lac', 'continuous', 'Lactate', [(50813, 'Lactate', 1., 0.)]),
+    (106, 'labs', 'LacDehyd', 'continuous', 'Lactate Dehydrogenase (LD)',
+     [(50954, 'Lactate Dehydrogenase (LD)', 1., 0.)]),
+    (107, 'labs', 'O2sat', 'continuous', 'Oxygen Saturation', [(50817, 'Oxygen Saturation', 1., 0.)]),
+    (108, 'labs', 'pH', 'continuous', 'pH', [(50820, 'pH', 1., 0.)]),
+    (109, 'labs', 'WBC', 'continuous', 'White Blood Cells',
+     [(51301, 'White Blood Cells', 1., 0.), (51300, 'WBC Count', 1., 0.)]),
+]
+
+_BY_ID = dict((concept[0], concept) for concept in CONCEPTS)
+
+
+def concept_ids(source, kind=None):
+    """ ids of the concepts of a source ('chart' or 'labs'), of one kind if given, in table order """
+    return [concept[0] for concept in CONCEPTS if concept[1] == source and (kind is None or concept[3] == kind)]
+
+
+def concept_id(source, name):
+    """ id of the concept of a source with this feature name """
+    for concept in CONCEPTS:
+        if concept[1] == source and concept[2] == name:
+            return concept[0]
+    raise KeyError("no {} concept named {}".format(source, name))
+
+
+def name(cid):
+    """ feature name of a concept, e.g. 'HR' """
+    return _BY_ID[cid][2]
+
+
+def label(cid):
+    """ label the events of a concept are given, e.g. 'Heart Rate' """
+    return _BY_ID[cid][4]
+
+
+def item_table(source, key='itemid'):
+    """ frame of concept, factor and offset indexed by the itemid, or by the item label
+    for key='label', of every item of a source. a label shared by items of different
+    units would be ambiguous, the first item wins """
+    rows = [(item[0] if key == 'itemid' else item[1], concept[0], item[2], item[3])
+            for concept in CONCEPTS if concept[1] == source for item in concept[5]]
+    table = pd.DataFrame(rows, columns=[key, 'concept', 'factor', 'offset'])
+    return table.drop_duplicates(key, keep='first').set_index(key)
+
+
+def item_map(source, key='itemid'):
+    """ dict of itemid, or item label for key='label', -> (label of its concept, factor,
+    offset), to map events one at a time as assign_concepts maps a frame """
+    table = item_table(source, key)
+    return dict((item, (label(cid), factor, offset)) for item, cid, factor, offset
+                in zip(table.index, table['concept'], table['factor'], table['offset']))
+
+
+def _lookup(table, keys):
+    # ROW OF EVERY KEY IN THE TABLE, -1 WHERE IT IS NOT THERE
+    return pd.Index(table.index).get_indexer(keys)
+
+
+def assign_concepts(data, source):
+    """ add an int16 concept column to the events, in place, convert their values to the
+    unit of the concept and replace their labels by its label. the itemid column is used
+    when present and dropped, otherwise the labels are looked up one distinct label at a
+    time. events of items outside the map keep their label and get the UNMAPPED concept.
+    """
+    if 'itemid' in data.columns:
+        table = item_table(source, 'itemid')
+        rows = _lookup(table, data['itemid'].values)
+        del data['itemid']
+    else:
+        table = item_table(source, 'label')
+        codes, labels = pd.factorize(data['label'])
+        rows = np.where(codes >= 0, _lookup(table, labels)[codes], -1)
+    mapped = rows >= 0
+    concept = np.full(len(data), UNMAPPED, dtype=np.int16)
+    concept[mapped] = table['concept'].values[rows[mapped]]
+    data['concept'] = concept
+
+    factor = table['factor'].values[rows[mapped]]
+    offset = table['offset'].values[rows[mapped]]
+    converted = (factor != 1) | (offset != 0)
+    if 'valuenum' in data.columns and converted.any():
+        positions = np.flatnonzero(mapped)[converted]
+        values = data['valuenum'].values.astype(float)
+        values[positions] = values[positions] * factor[converted] + offset[converted]
+        data['valuenum'] = values
+    if 'label' in data.columns:
+        labels = np.array([label(cid) for cid in table['concept'].values], dtype=object)
+        current = data['label'].values.astype(object)
+        current[mapped] = labels[rows[mapped]]
+        data['label'] = current
+    return data
+
+
+def concept_stays(data):
+    """ number of ICU stays with each mapped concept, adds up across partitions of the stays """
+    mapped = data[data['concept'].values != UNMAPPED]
+    return mapped.groupby('concept')['icustay_id'].nunique()
+
+
+def split_concepts(data, cids):
+    """ dict of concept id -> the events of that concept, in their order in data """
+    concept = data['concept'].values
+    return dict((cid, data[concept == cid]) for cid in cids)
@@ -0,0 +1,381 @@
+""" per stay feature store replacing the CSVs in data/features.
+
+the feature scripts write one CSV per block plus a *Scores.csv and outcomes.csv, and
+the training notebook parses all of them and inner merges the features column by
+column. the store keeps every feature as a typed column aligned to one sorted array
+of icustay_ids,
+
+    <root>/schema/v0001.json
+    <root>/stays/v0001.npy
+    <root>/columns/00000.npy
+                  /00001.npy
+                  ...
+
+every write creates a new schema version that lists the stays file and, for each
+column, its file, dtype and provenance (the module it came from, the statistic, the
+time window and anything else the writer records, such as its chi2 p-value). files
+are never rewritten, so earlier versions stay readable. reads open only the
+requested columns with mmap and take only the requested stays from them.
+
+values a column does not have for some stays are NaN in float columns and are
+recorded in a separate missing mask for the other types. string columns are stored
+as categorical codes.
+
+`icu-mortality features all --store DIR` writes the selected blocks of a pipeline run
+into the store with write_blocks (see build.write_store), without the CSV round trip.
+import_feature_csvs loads blocks that were already written as CSVs.
+"""
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from . import preprocessing
+
+
+FORMAT_VERSION = 1
+SCHEMA_DIR = 'schema'
+STAYS_DIR = 'stays'
+COLUMNS_DIR = 'columns'
+OUTCOME = 'hospital_expire_flag'
+
+# BLOCK NAME -> FEATURE MODULE THAT WRITES IT, SEE feature_blocks_stage IN chart_events.py,
+# categorical_to_dummy IN lab_events.py AND score_features IN ptnt_demog.py
+BLOCK_SOURCES = {'BP_Features': 'chart_events', 'CreatGlucHgHmT_Features': 'chart_events',
+                 'HrRr_Features': 'chart_events', 'pH_Features': 'chart_events',
+                 'GCSTotal_Features': 'chart_events', 'GCS_Features': 'chart_events',
+                 'Lab_CreatGlucHemWBC_Features': 'lab_events', 'Lab_pHLacO2Sat_Features': 'lab_events',
+                 'Lab_AbnFlag_Features': 'lab_events', 'Ptnt_Demog_Features': 'ptnt_demog'}
+
+
+def list_versions(root):
+    """ schema versions of the store, oldest first """
+    schema_dir = os.path.join(root, SCHEMA_DIR)
+    if not os.path.isdir(schema_dir):
+        return []
+    return sorted(name[:-5] for name in os.listdir(schema_dir) if name.startswith('v') and name.endswith('.json'))
+
+
+def read_schema(root, version=None):
+    """ schema of a version, the latest by default """
+    versions = list_versions(root)
+    if not versions:
+        raise KeyError("no feature store in {}".format(root))
+    if version is None:
+        version = versions[-1]
+    elif isinstance(version, int):
+        version = 'v{:04d}'.format(version)
+    if version not in versions:
+        raise KeyError("feature store {} has no version {}".format(root, version))
+    with open(os.path.join(root, SCHEMA_DIR, version + '.json')) as f:
+        return json.load(f)
+
+
+def describe(root, version=None):
+    """ one row per column with its dtype, the version that wrote it and its provenance """
+    schema = read_schema(root, version)
+    rows = []
+    for name in schema['order']:
+        col = schema['columns'][name]
+        row = {'column': name, 'dtype': col['dtype'], 'version': col['version'],
+               'missing': col['missing'] is not None}
+        row.update(col['provenance'])
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('column')
+
+
+def _next_file(root, schema):
+    name = os.path.join(COLUMNS_DIR, '{:05d}.npy'.format(schema['next_file']))
+    schema['next_file'] += 1
+    return name
+
+
+def _save(root, relpath, arr):
+    np.save(os.path.join(root, relpath), np.ascontiguousarray(arr))
+
+
+def _load(root, relpath, mmap=True):
+    return np.load(os.path.join(root, relpath), mmap_mode='r' if mmap else None)
+
+
+def _encode(series):
+    """ numpy data, missing mask (None when complete), dtype name and categories of a column """
+    missing = series.isnull().values
+    if series.dtype == object or isinstance(series.dtype, pd.CategoricalDtype) \
+            or pd.api.types.is_string_dtype(series.dtype):
+        cat = series.astype('category')
+        return cat.cat.codes.values.astype(np.int32), None, 'category', [str(x) for x in cat.cat.categories]
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'fbiuM':
+        return series.values, None, str(series.dtype), None
+    # NULLABLE EXTENSION TYPES, E.G. Int64 OR boolean
+    numpy_dtype = series.dtype.numpy_dtype
+    data = series.fillna(False if numpy_dtype.kind == 'b' else 0).values.astype(numpy_dtype)
+    return data, (missing if missing.any() else None), str(numpy_dtype), None
+
+
+def _spread(data, missing, positions, n_stays, dtype):
+    """ place a column's values at their positions among n_stays stays.
+
+    stays without a value are NaN in float columns, code -1 in categorical columns and
+    flagged in the returned missing mask otherwise.
+    """
+    if dtype == 'category':
+        spread = np.full(n_stays, -1, dtype=data.dtype)
+    elif data.dtype.kind == 'f':
+        spread = np.full(n_stays, np.nan, dtype=data.dtype)
+    else:
+        spread = np.zeros(n_stays, dtype=data.dtype)
+    spread[positions] = data
+    if dtype == 'category' or data.dtype.kind == 'f':
+        return spread, None
+    mask = np.ones(n_stays, dtype=bool)
+    mask[positions] = False if missing is None else missing
+    return spread, (mask if mask.any() else None)
+
+
+def _provenance(provenance, col, window):
+    if provenance is None:
+        entry = {}
+    elif all(isinstance(val, dict) for val in provenance.values()) and provenance:
+        entry = dict(provenance.get(col, {}))
+    else:
+        entry = dict(provenance)
+    entry.setdefault('window', window)
+    return dict((key, val.item() if isinstance(val, np.generic) else val) for key, val in entry.items())
+
+
+def _write_column(root, schema, data, missing, dtype, categories, version, provenance):
+    entry = {'file': _next_file(root, schema), 'missing': None, 'dtype': dtype, 'categories': categories,
+             'version': version, 'provenance': provenance}
+    _save(root, entry['file'], data)
+    if missing is not None:
+        entry['missing'] = _next_file(root, schema)
+        _save(root, entry['missing'], missing)
+    return entry
+
+
+def write_features(root, frame, provenance=None, window='24h', replace=True):
+    """ add the columns of a frame to the store as a new schema version.
+
+    stays the store does not have yet are added, and the existing columns are written
+    again with missing values for them.
+
+    :param frame: frame indexed by icustay_id
+    :param provenance: dict of column -> dict of provenance ('source', 'statistic', ...),
+                       or one dict for every column
+    :param window: time window of the features, recorded in the provenance
+    :param replace: replace columns that already exist, otherwise raise
+    :return: the new version
+    """
+    versions = list_versions(root)
+    if versions:
+        parent = read_schema(root)
+    else:
+        for sub in [SCHEMA_DIR, STAYS_DIR, COLUMNS_DIR]:
+            os.makedirs(os.path.join(root, sub))
+        parent = {'version': None, 'stays': None, 'columns': {}, 'order': [], 'next_file': 0}
+    version = 'v{:04d}'.format(int(versions[-1][1:]) + 1 if versions else 1)
+
+    clash = [col for col in frame.columns if col in parent['columns']]
+    if clash and not replace:
+        raise ValueError("columns already in the store: {}".format(clash))
+    if frame.index.has_duplicates:
+        raise ValueError("frame has duplicate icustay_ids")
+
+    schema = {'format': FORMAT_VERSION, 'version': version, 'parent': parent['version'],
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'columns': {},
+              'order': [col for col in parent['order'] if col not in frame.columns],
+              'next_file': parent['next_file'],
+              'changes': {'added': [col for col in frame.columns if col not in clash], 'replaced': clash}}
+
+    old_stays = _load(root, parent['stays'], mmap=False) if parent['stays'] else np.array([], dtype=np.int64)
+    new_ids = np.asarray(frame.index, dtype=np.int64)
+    stays = np.union1d(old_stays, new_ids)
+    if parent['stays'] is not None and len(stays) == len(old_stays):
+        schema['stays'] = parent['stays']
+        for col in schema['order']:
+            schema['columns'][col] = parent['columns'][col]
+    else:
+        schema['stays'] = os.path.join(STAYS_DIR, version + '.npy')
+        _save(root, schema['stays'], stays)
+        # EXISTING COLUMNS ARE WRITTEN AGAIN OVER THE LARGER SET OF STAYS
+        positions = np.searchsorted(stays, old_stays)
+        for col in schema['order']:
+            old = parent['columns'][col]
+            missing = _load(root, old['missing'], mmap=False) if old['missing'] else None
+            data, missing = _spread(_load(root, old['file'], mmap=False), missing, positions,
+                                    len(stays), old['dtype'])
+            schema['columns'][col] = _write_column(root, schema, data, missing, old['dtype'], old['categories'],
+                                                   old['version'], old['provenance'])
+
+    positions = np.searchsorted(stays, new_ids)
+    for col in frame.columns:
+        data, missing, dtype, categories = _encode(frame[col])
+        data, missing = _spread(data, missing, positions, len(stays), dtype)
+        schema['columns'][col] = _write_column(root, schema, data, missing, dtype, categories, version,
+                                               _provenance(provenance, col, window))
+        schema['order'].append(col)
+
+    _write_schema(root, schema)
+    print("feature store {}: {} stays, {} columns".format(version, len(stays), len(schema['order'])))
+    return version
+
+
+def _write_schema(root, schema):
+    with open(os.path.join(root, SCHEMA_DIR, schema['version'] + '.json'), 'w') as f:
+        json.dump(schema, f, indent=2, sort_keys=True)
+
+
+def drop_columns(root, columns):
+    """ new schema version without the given columns, their files stay for older versions """
+    parent = read_schema(root)
+    missing = [col for col in columns if col not in parent['columns']]
+    if missing:
+        raise KeyError("columns not in the store: {}".format(missing))
+    schema = dict(parent)
+    schema['version'] = 'v{:04d}'.format(int(parent['version'][1:]) + 1)
+    schema['parent'] = parent['version']
+    schema['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    schema['order'] = [col for col in parent['order'] if col not in columns]
+    schema['columns'] = dict((col, parent['columns'][col]) for col in schema['order'])
+    schema['changes'] = {'removed': list(columns)}
+    _write_schema(root, schema)
+    return schema['version']
+
+
+def read_stays(root, version=None):
+    """ sorted icustay_ids of a version """
+    return np.asarray(_load(root, read_schema(root, version)['stays']))
+
+
+def read_features(root, columns=None, stays=None, version=None, mmap=True):
+    """ read columns of the store for some or all stays.
+
+    only the requested column files are opened and, with mmap, only the pages holding
+    the requested stays are read.
+
+    :param columns: column names, defaults to every column
+    :param stays: icustay_ids, defaults to every stay, in the order given
+    :param version: schema version, defaults to the latest
+    :return: frame indexed by icustay_id. float columns hold NaN for missing values,
+             other columns with missing values are returned as float with NaN and
+             string columns as categoricals
+    """
+    schema = read_schema(root, version)
+    columns = schema['order'] if columns is None else list(columns)
+    unknown = [col for col in columns if col not in schema['columns']]
+    if unknown:
+        raise KeyError("columns not in the store: {}".format(unknown))
+
+    all_stays = _load(root, schema['stays'])
+    if stays is None:
+        rows = slice(None)
+        index = np.asarray(all_stays)
+    else:
+        index = np.asarray(stays, dtype=np.int64)
+        rows = np.searchsorted(all_stays, index)
+        found = (rows < len(all_stays)) & (np.asarray(all_stays)[np.minimum(rows, len(all_stays) - 1)] == index)
+        if not found.all():
+            raise KeyError("{} stays are not in the store, e.g. {}".format((~found).sum(), index[~found][:5]))
+
+    data = {}
+    for col in columns:
+        entry = schema['columns'][col]
+        values = np.asarray(_load(root, entry['file'], mmap)[rows])
+        if entry['dtype'] == 'category':
+            values = pd.Categorical.from_codes(values, categories=entry['categories'])
+        elif entry['missing'] is not None:
+            missing = np.asarray(_load(root, entry['missing'], mmap)[rows])
+            if missing.any():
+                values = np.where(missing, np.nan, values.astype(float))
+        data[col] = values
+    return pd.DataFrame(data, index=pd.Index(index, name='icustay_id'), columns=columns)
+
+
+def _column_provenance(name, block, source):
+    """ provenance of a feature CSV column, parsing the statistic from names like HR_mean_Q3 """
+    entry = {'source': source, 'block': block}
+    parts = name.split('_')
+    for i, part in enumerate(parts[1:], 1):
+        if part in preprocessing.EVENT_STATS or part == 'abnflag':
+            entry['statistic'] = part
+            entry['label'] = '_'.join(parts[:i])
+            if i + 1 < len(parts):
+                entry['level'] = '_'.join(parts[i + 1:])
+            break
+    return entry
+
+
+def _nullable(frame):
+    # A BLOCK HOLDS ONLY SOME OF THE STAYS. ALIGNED WITH THE OTHERS, ITS bool DUMMIES WOULD
+    # TURN INTO object AND ITS INTEGER FLAGS INTO float, AS NULLABLE TYPES THEY KEEP THEIR
+    # VALUES AND _encode RECORDS THE MISSING STAYS IN A MASK. DUMMIES MERGED WITH how='left'
+    # ARE ALREADY object COLUMNS OF True AND False
+    dtypes = {}
+    for col in frame.columns:
+        kind = frame[col].dtype.kind
+        if kind == 'b' or (kind == 'O' and pd.api.types.infer_dtype(frame[col], skipna=True) == 'boolean'):
+            dtypes[col] = 'boolean'
+        elif kind in 'iu':
+            dtypes[col] = 'Int64'
+    return frame.astype(dtypes) if dtypes else frame
+
+
+def write_blocks(root, selected, outcomes=None, sources=None, window='24h'):
+    """ add selected feature blocks and the outcome to the store as one new version.
+
+    a column in more than one block is taken from the first block by name, with its
+    provenance, as combine.combine_blocks takes it.
+
+    :param selected: dict of block name -> (frame indexed by icustay_id, score frame with
+                     p_values and scores columns or None), as the score_features of the
+                     feature modules return them
+    :param outcomes: frame or series of the outcome indexed by icustay_id, defaults to the
+                     outcome columns of the blocks
+    :param sources: dict of block name -> feature module, defaults to BLOCK_SOURCES
+    :return: the new version
+    """
+    sources = BLOCK_SOURCES if sources is None else sources
+    if outcomes is None:
+        outcomes = pd.concat([frame[OUTCOME] for frame, _ in selected.values() if OUTCOME in frame.columns])
+        outcomes = outcomes[~outcomes.index.duplicated()]
+    outcomes = outcomes[OUTCOME] if isinstance(outcomes, pd.DataFrame) else outcomes
+    frames = [_nullable(outcomes.rename(OUTCOME).to_frame())]
+    provenance = {OUTCOME: {'source': 'ptnt_demog', 'block': 'outcomes', 'statistic': 'outcome'}}
+    for block in sorted(selected):
+        frame, scores = selected[block]
+        frame = frame[[col for col in frame.columns if col not in provenance]]
+        for col in frame.columns:
+            provenance[col] = _column_provenance(col, block, sources.get(block))
+            if scores is not None and col in scores.index:
+                provenance[col]['p_value'] = float(scores.loc[col, 'p_values'])
+                provenance[col]['score'] = float(scores.loc[col, 'scores'])
+        frames.append(_nullable(frame))
+
+    features = pd.concat(frames, axis=1, sort=True)
+    features.index.name = 'icustay_id'
+    return write_features(root, features, provenance, window)
+
+
+def import_feature_csvs(features_dir, root, window='24h'):
+    """ load the block CSVs, their *Scores.csv and outcomes.csv into the store.
+
+    the blocks are the *Features.csv files, as main.read_blocks reads them, so
+    combined.csv is left out. each column's chi2 p-value and score from the matching
+    Scores CSV go into its provenance, so feature selection can read them from the schema.
+
+    :return: the new version
+    """
+    names = sorted(name[:-4] for name in os.listdir(features_dir) if name.endswith('.csv'))
+    selected = {}
+    for block in [name for name in names if name.endswith('Features')]:
+        frame = pd.read_csv(os.path.join(features_dir, block + '.csv'), index_col=0)
+        scores = None
+        if block + 'Scores' in names:
+            scores = pd.read_csv(os.path.join(features_dir, block + 'Scores.csv'), index_col=0)
+        selected[block] = (frame, scores)
+    outcomes = None
+    if 'outcomes' in names:
+        outcomes = pd.read_csv(os.path.join(features_dir, 'outcomes.csv'), index_col=0)
+    return write_blocks(root, selected, outcomes, window=window)
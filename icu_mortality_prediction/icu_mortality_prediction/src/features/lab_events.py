@@ -1,17 +1,23 @@
 import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.feature_selection import SelectKBest
-from sklearn.feature_selection import chi2
 
+from ... import FEATURES_DIR, LAB_EVENTS_CSV, PARTITIONS_DIR, PIPELINE_CACHE_DIR
+from . import blocks
+from . import concepts
+from ..utils import partition
+from ..utils import telemetry
+from ..utils.pipeline import Pipeline, Stage
 
 
-def import_labevents_data():
-    
-    
-    data = pd.DataFrame.from_csv('../data/LAB_EVENTS_FIRST24.csv')
-    data.loc[:,'charttime']  = pd.to_datetime(data.loc[:,'charttime'])
+
+def import_labevents_data(path=LAB_EVENTS_CSV, chunksize=None):
+
+
+    data = pd.read_csv(path, index_col=0, parse_dates=True, chunksize=chunksize)
+    if chunksize is not None:
+        data = pd.concat(data)
+    data['charttime'] = pd.to_datetime(data['charttime'])
     data = data.sort_values(['icustay_id', 'charttime'],ascending=True)
     # print "data head:"
     # print(data.head(5))
@@ -20,14 +26,16 @@ def import_labevents_data():
     subject_id data to a column, creates a proper index and reorganizes the columns 
     to have the lab results grouped together.
     '''
-    print "reorganizing data"
+    print("reorganizing data")
     data['subject_id'] = data.index
     data.set_index(np.arange(data.shape[0]), inplace = True)
     cols = list(data.columns)
     cols.insert(0, cols.pop(cols.index('icustay_id')))
     cols.insert(1, cols.pop(cols.index('subject_id')))
     data = data[cols]
-    print "reorganized data"
+    # INTEGER CONCEPT OF EVERY EVENT, THE LATER STAGES SELECT BY IT INSTEAD OF BY LABEL
+    data = concepts.assign_concepts(data, 'labs')
+    print("reorganized data")
     # print(data.head(5))
     
     # keep the first measurement from each icu-stay 
@@ -35,36 +43,40 @@ def import_labevents_data():
     # data3 = data.drop_duplicates('subject_id', keep = 'first')
 
 
-    print "The number of unique ICU stays = {}".format(data.drop_duplicates('icustay_id', keep = 'first').shape[0])
-    print "The number of unique patients  = {}".format(data.drop_duplicates('subject_id', keep = 'first').shape[0])
-
+    print("The number of unique ICU stays = {}".format(data.drop_duplicates('icustay_id', keep = 'first').shape[0]))
+    print("The number of unique patients  = {}".format(data.drop_duplicates('subject_id', keep = 'first').shape[0]))
     # display the different measurements captured in the database query
     labels = data.label.unique()
-    print "The different measurements captured include:"
+    print("The different measurements captured include:")
     print(labels)
     # print "The number of different measurements captured:"
     # print(len(labels))
     
     return data
     
-def remove_sparse_data(data):
+def remove_sparse_data(data, min_samples=6000):
     # REMOVE VARIABLES FOR WHICH THERE IS LITTLE DATA / FEW ICUSTAYS FOR WHICH DATA WAS RECORDED
-    labels = data.label.unique()
+    return select_labels(label_stays(data), min_samples)
+
+
+def label_stays(data):
+    # NUMBER OF ICU STAYS WITH AT LEAST ONE SAMPLE OF EACH MEASUREMENT CONCEPT
+    return concepts.concept_stays(data)
+
+
+def select_labels(stays_per_label, min_samples=6000):
     labels2 = []
     
     # determine the number of samples for each measurement in labels
     # if the measurement has greater than 6k data points, add to labels2
     # essentially removing measurements w/ fewer than 6k data points
-    for item in labels:
-        
-        num_samps = data['icustay_id'][data.label == item].dropna().unique().shape[0]
-        #num_measures = data[data.label == item][['icustay_id', 'label']].dropna().groupby('icustay_id').count()
-        print "{}    {}".format(item, num_samps) #, num_measures)
-        if num_samps > 6000:
-            print "adding {}".format(item)
+    for item, num_samps in stays_per_label.items():
+        print("{}    {}".format(concepts.label(item), num_samps)) #, num_measures)
+        if num_samps > min_samples:
+            print("adding {}".format(concepts.label(item)))
             labels2.append(item)
-    labels2.sort(key=str.lower)
-    return labels2
+    # CONCEPT IDS IN THE ORDER OF THE CONCEPT MAP
+    return [cid for cid in concepts.concept_ids('labs') if cid in labels2]
 
 # code for calculating and displaying affinity maps. 
 # come back to later to clean up
@@ -72,42 +84,19 @@ def number_of_samples_per_feature(data, labels2):
     # calculating the number of samples taken in 24 hours for each measurement
     item = labels2[0]
 
-    num_samps_df =  data[data.label == item][['icustay_id', 'label']].dropna().groupby('icustay_id').count()
+    num_samps_df =  data[data.concept.values == item][['icustay_id', 'label']].dropna().groupby('icustay_id').count()
    
     for item in labels2[1:]:
         #num_samps = data['icustay_id'][data.label == item].dropna().unique().shape[0]
-        monkey = data[data.label == item][['icustay_id', 'label']].dropna().groupby('icustay_id').count()
-        monkey.columns = [item]
+        monkey = data[data.concept.values == item][['icustay_id', 'label']].dropna().groupby('icustay_id').count()
+        monkey.columns = [concepts.label(item)]
         num_samps_df = num_samps_df.merge(monkey,left_index = True, right_index = True, how = 'left', sort = True) 
         #print "{}    {}".format(item, num_measures) #, num_measures)
 
     #num_samps_df.drop('label', axis=1, inplace = True)
     return num_samps_df  
 
-# code for displaying affinity maps. not essential but including. 
-# 
-def affinity_maps(num_samps_df):
-    missing = num_samps_df.copy()
-
-    for col in missing.columns:
-            missing[col] = missing[col].apply(lambda x: 1 if pd.isnull(x) else 0)
-        
 
-    missing = missing.sort_values(by ='Oxygen Saturation', axis = 0, ascending = True)
-    #plt.rc('font', size=15)   
-    #plt.figure(figsize= (5,8))
-    plt.xticks(np.arange(0.5, len(missing.columns), 1), missing.columns)
-    plt.xticks(rotation = 30, ha = 'right')
-    plt.margins(0.0)
-    plt.subplots_adjust(bottom = 0.25)
-    print "plotting colormap"
-    plt.pcolor(missing)
-    #ax.set_ylim([0.0,missing.shape[0]])
-    plt.savefig("affinity_plot.png")
-    plt.show()
-    
-    plt.close() 
-    
 def calculate_stats(data, labels2):
     # height and weight are left out from the calculated measures because there was only one
     # measurement so they are constant.
@@ -116,21 +105,22 @@ def calculate_stats(data, labels2):
     
 
 
-    # labels2 were sorted alphabetically so we order this list accordingly before zipping
-    dict_names = ['Creat','CreatUrine', 'Gluc', 'Hemat', 'Lac', 'LacDehyd', 'O2sat', 'pH', 'WBC']
+    # labels2 ARE CONCEPT IDS, THEIR FEATURE NAMES COME FROM THE CONCEPT MAP
+    def names(suffix):
+        return dict((concepts.name(cid) + suffix, cid) for cid in labels2)
 
     # CREATE DICTS OF VARIABLE NAMES WITH MEASUREMENT INDICATOR APPENDED AS KEYS AND 
-    # LABELS AS ENTRIES
-    first_dict_names = dict(zip([item + '_first' for item in dict_names], labels2))
-    mean_dict_names = dict(zip([item + '_mean' for item in dict_names], labels2))
-    med_dict_names = dict(zip([item + '_med' for item in dict_names], labels2))
-    std_dict_names = dict(zip([item + '_std' for item in dict_names], labels2))
-    skew_dict_names = dict(zip([item + '_skew' for item in dict_names], labels2))
-    min_dict_names = dict(zip([item + '_min' for item in dict_names], labels2))
-    max_dict_names = dict(zip([item + '_max' for item in dict_names], labels2))
-    slope_dict_names = dict(zip([item + '_slope' for item in dict_names], labels2))
-    delta_dict_names = dict(zip([item + '_delta' for item in dict_names], labels2))
-    abnflag_dict_names = dict(zip([item + '_abnflag' for item in dict_names], labels2))
+    # CONCEPTS AS ENTRIES
+    first_dict_names = names('_first')
+    mean_dict_names = names('_mean')
+    med_dict_names = names('_med')
+    std_dict_names = names('_std')
+    skew_dict_names = names('_skew')
+    min_dict_names = names('_min')
+    max_dict_names = names('_max')
+    slope_dict_names = names('_slope')
+    delta_dict_names = names('_delta')
+    abnflag_dict_names = names('_abnflag')
 
     # CREATE LIST OF NAMES_DICTS FOR EASY TRAVERSAL / ITERATION AND FOR ZIPPING INTO DICTIONARY
     names_list = [first_dict_names, mean_dict_names, med_dict_names, std_dict_names, skew_dict_names, 
@@ -160,112 +150,63 @@ def calculate_stats(data, labels2):
 
     # ITERATING THROUGH THE VARIABLES, CALCULATING MEANS, MEDIANS, STD, SKEWNESS, MIN AND MAX'S FOR EACH ITERATION
     # VARIABLES WITH TOO FEW MEASUREMENTS TO CALCULATE THINGS LIKE STD WILL BE AUTOMATICALLY ASSIGNED 'NaN' VALUE
-    print "Creating data frames for each summary statistic for each time course variable"
+    # THE EVENTS OF EACH CONCEPT, SELECTED ONCE BY INTEGER ID INSTEAD OF ONCE PER STATISTIC BY LABEL
+    events = concepts.split_concepts(data, labels2)
+    print("Creating data frames for each summary statistic for each time course variable")
     for calc_key in calc_dict.keys():
-        for col_key in names_dict[calc_key].keys(): 
-            if calc_key == 'mean':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].mean())
-            elif calc_key == 'med':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].median())
-            elif calc_key == 'std':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].std())
-            elif calc_key == 'max':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].max())
-            elif calc_key == 'min':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].min())
-            elif calc_key == 'first': 
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].first())
-            elif calc_key == 'skew':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].skew())
-            elif calc_key == 'delta': 
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].last() -
-                                                            data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].first())
-            elif calc_key == 'abnflag':
-                calc_dict[calc_key][col_key] = pd.DataFrame(data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['flag'].apply(lambda x: int(1) if 'abnormal' in x.values else int(0)))
+        with telemetry.section('lab_stats.' + calc_key) as record:
+            for col_key in names_dict[calc_key].keys(): 
+                if calc_key == 'mean':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].mean())
+                elif calc_key == 'med':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].median())
+                elif calc_key == 'std':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].std())
+                elif calc_key == 'max':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].max())
+                elif calc_key == 'min':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].min())
+                elif calc_key == 'first': 
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].first())
+                elif calc_key == 'skew':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].skew())
+                elif calc_key == 'delta': 
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].last() -
+                                                                events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].first())
+                elif calc_key == 'abnflag':
+                    calc_dict[calc_key][col_key] = pd.DataFrame(events[names_dict[calc_key][col_key]].groupby('icustay_id')['flag'].apply(lambda x: int(1) if 'abnormal' in x.values else int(0)))
               
-            elif calc_key == 'slope':
-                time_last = data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['charttime'].last()
-                time_first = data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['charttime'].first()
-                val_last = data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].last()
-                val_first = data[data.label == names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].first()
-                calc_dict[calc_key][col_key] = pd.DataFrame((val_last - val_first)/((time_last - time_first)/np.timedelta64(1,'h')))           
+                elif calc_key == 'slope':
+                    time_last = events[names_dict[calc_key][col_key]].groupby('icustay_id')['charttime'].last()
+                    time_first = events[names_dict[calc_key][col_key]].groupby('icustay_id')['charttime'].first()
+                    val_last = events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].last()
+                    val_first = events[names_dict[calc_key][col_key]].groupby('icustay_id')['valuenum'].first()
+                    calc_dict[calc_key][col_key] = pd.DataFrame((val_last - val_first)/((time_last - time_first)/np.timedelta64(1,'h')))           
         
             
-            else: 
-                print "need to add code for calculating {}".format(calc_key)
-                break
+                else: 
+                    print("need to add code for calculating {}".format(calc_key))
+                    break
             
-            calc_dict[calc_key][col_key].replace([np.inf, -np.inf], np.nan, inplace = True)
-            calc_dict[calc_key][col_key].columns = [col_key]
-            calc_dict[calc_key][col_key]['hospital_expire_flag'] = data.groupby('icustay_id').hospital_expire_flag.first()
-            calc_dict[calc_key][col_key]['gender'] = data.groupby('icustay_id').gender.first()
+                calc_dict[calc_key][col_key].replace([np.inf, -np.inf], np.nan, inplace = True)
+                calc_dict[calc_key][col_key].columns = [col_key]
+                calc_dict[calc_key][col_key]['hospital_expire_flag'] = data.groupby('icustay_id').hospital_expire_flag.first()
+                calc_dict[calc_key][col_key]['gender'] = data.groupby('icustay_id').gender.first()
+            record.output(calc_dict[calc_key])
 
-    print "complete"
+    print("complete")
     return calc_dict
 
 
-def plot_features(dummy):
-    
-    for col in dummy.keys():
-    
-        col2 = dummy[col].columns[0]
-    
-    
-        gender = ['M', 'F'] 
-    
-        for gend in gender:
-        
-            #print gend
-            dead = dummy[col][(dummy[col].hospital_expire_flag == 1)&
-                                  (dummy[col].gender == gend)]
-                              #&(const_dict[col][col2] >20)]
-            dead.name = 'Non_Survivors'
-            live = dummy[col][(dummy[col].hospital_expire_flag == 0)&
-                                  (dummy[col].gender == gend)]
-                              #&(const_dict[col][col2] >20)]
-            live.name = 'Survivors'
-    
-    
-            maxx = 0.99
-            minn = 0.01
-    
-            live_max = live[col2].dropna().max()#quantile(0.999)
-            live_min = live[col2].dropna().min()#quantile(0.001)
-            dead_max = dead[col2].dropna().max()#quantile(0.999)
-            dead_min = dead[col2].dropna().min()#quantile(0.001)
-            maxlim = max(live_max, dead_max)
-            minlim = min(live_min, dead_min)
-        
-            
-            plt.subplots(figsize = (10,6))
-            live[(live[col2] < live_max) & (live[col2] > live_min)][col2].plot.kde(
-                                                                                alpha=1.0,label='Survival')
-            dead[(dead[col2] < dead_max) & (dead[col2] > dead_min)][col2].plot.kde(
-                                                                                alpha=1.0,label='Non-Survivors')
-            
-            
-            plt.subplots_adjust(left = 0.1, bottom = 0.1, 
-                    right = 0.9, top = 0.9)
-            plt.xlim(minlim, maxlim)
-            plt.title('{} measurement on ICU admission'.format(col) + 
-                       'vs ICU mortality by gender = {}\n'.format(gend))
-            plt.xlabel(col)
-
-            
-            
-            # add title, labels etc.
-           
-            plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
-            save_file_name = "../figures/" + col + "_" + gend + "_" + "plot.png"
-            print "saving {}".format(save_file_name)
-            plt.savefig(save_file_name)
-            plt.close()
         
 def remove_outliers(calc_dict):
     names_dict = {}
     suffix = '_outliers'
 
     # SETTING OUTLIER DATA POINTS TO NAN FOR REMOVAL USING DROPNA()
+    # ON COPIES, THE CALCULATED STATS ARE LEFT AS THEY WERE
+    calc_dict = dict((calc, dict((col, frame.copy()) for col, frame in calc_dict[calc].items()))
+                     for calc in calc_dict.keys())
     for calc in calc_dict.keys():
         frame = calc_dict[calc]
         for col in frame.keys():
@@ -280,18 +221,19 @@ def remove_outliers(calc_dict):
             # TODO: Use the interquartile range to calculate an outlier step (1.5 times the interquartile range)
             step = 1.5*(Q3 - Q1)
             names_dict[col+suffix] = dummy[~((dummy[col2] >= Q1 - step) & (dummy[col2] <= Q3 + step))].index
-            dummy.set_value(names_dict[col+suffix], col2, np.NaN)
+            dummy.loc[names_dict[col+suffix], col2] = np.nan
             #print "{}   {}     {}".format(col, col2, dummy.dropna().shape)
+    return calc_dict
     
 
 def merge_dataframes(data, calc_dict):
     # MERGING INDIVIDUAL CALCULATED FRAMES INTO A SINGLE DATAFRAMEs
     data2 = data.drop_duplicates('icustay_id', keep = 'first')
-    data3 = data2.drop(['label', 'charttime', 'valuenum', 'flag'], axis = 1)
+    data3 = data2.drop(['label', 'concept', 'charttime', 'valuenum', 'flag'], axis = 1)
     data3.set_index(['icustay_id'], inplace = True)
 
     for calc_key in calc_dict.keys():
-        print "merging {} dataframe".format(calc_key)
+        print("merging {} dataframe".format(calc_key))
         for col_key in calc_dict[calc_key].keys(): 
             col2 = calc_dict[calc_key][col_key]
             data3 = data3.merge(pd.DataFrame(calc_dict[calc_key][col_key][col_key]), left_index = True, 
@@ -327,7 +269,7 @@ def drop_features(data3):
     # we could just return the drop_cols variable and do this outside the function
     #print "data3 shape prior to dropping columns"
     #print(data3.dropna().shape)
-    data3.drop(drop_cols, inplace = True, axis = 1)
+    return data3.drop(drop_cols, axis = 1)
     
 
 def create_feature_blocks(data3): 
@@ -352,17 +294,18 @@ def create_feature_blocks(data3):
   
 
     #display(cols1)
-    data3.replace([np.inf, -np.inf], np.nan, inplace = True)
-    pHLacO2Sat_data = data3[cols1].dropna()
-    print "pHLacO2Sat_data: Shape = "
+    # VIEWS OF THE COMPLETE CASES OF data3 (SEE blocks.py), INF COUNTING AS MISSING
+    observed = blocks.observed_mask(data3)
+    pHLacO2Sat_data = blocks.complete_cases(data3, cols1, observed)
+    print("pHLacO2Sat_data: Shape = ")
     print(pHLacO2Sat_data.shape)                              
 
-    CreatGlucHemWBC_data = data3[cols2].dropna()
-    print "CreatGlucHemWBC_data: Shape = "
+    CreatGlucHemWBC_data = blocks.complete_cases(data3, cols2, observed)
+    print("CreatGlucHemWBC_data: Shape = ")
     print(CreatGlucHemWBC_data.shape)
 
-    AbnFlag_data = data3[cols3].dropna()
-    print "AbnFlag_data: Shape = "
+    AbnFlag_data = blocks.complete_cases(data3, cols3, observed)
+    print("AbnFlag_data: Shape = ")
     print(AbnFlag_data.shape)
 
        
@@ -381,20 +324,12 @@ def quant_cats(feature, Q1, Q2, Q3):
         return 'Q3'
 
 def continuous_to_categorical(cont_frames):
-
-    
-    CreatGlucHemWBC_cat_data = cont_frames[1].copy()
-    pHLacO2Sat_cat_data = cont_frames[0].copy()
-
-    cont_cat_frames = [CreatGlucHemWBC_cat_data, pHLacO2Sat_cat_data]
-
-    for frame in cont_cat_frames:
-        frame_stats = frame.describe()
-        for col in frame.columns[1:]:
-            Q1 = frame_stats[col].loc['25%']
-            Q2 = frame_stats[col].loc['50%']
-            Q3 = frame_stats[col].loc['75%']
-            frame[col] = frame[col].apply(lambda x: quant_cats(x, Q1, Q2, Q3))
+    # THE OUTCOME OF EVERY BLOCK VIEW FOLLOWED BY THE QUARTILE LEVEL OF EACH FEATURE,
+    # AS quant_cats ASSIGNS THEM, SO THE BLOCKS ARE READ BUT NEVER COPIED
+    cont_cat_frames = []
+    for view in [cont_frames[1], cont_frames[0]]:
+        levels = blocks.quartile_levels(view, view.columns[1:])
+        cont_cat_frames.append(pd.concat([view.frame(view.columns[:1]), levels], axis = 1))
 
     return cont_cat_frames    
 
@@ -412,76 +347,155 @@ def categorical_to_dummy(cont_cat_frames, AbnFlag_data):
     dummy_frame_filenames = ['Lab_CreatGlucHemWBC_Features', 'Lab_pHLacO2Sat_Features', 'Lab_AbnFlag_Features']
     dummy_dict = dict(zip(dummy_frame_filenames, dummy_frames))
 
-    for name, frame in dummy_dict.iteritems():
-        print "{}      {}".format(name, frame.shape[0])
-    
+    for name, frame in dummy_dict.items():
+        print("{}      {}".format(name, frame.shape[0]))
     return dummy_dict
                        
 
-def select_best_features(dummy_dict):
-#select k best features using chi2 score and write those features to file
-
-    for name, frame in dummy_dict.iteritems():
-        print "{}      {}".format(name, frame.shape[0])
+def score_features(dummy_dict, min_stays=3000, alpha=.001):
+    # CHI2 SCORES OF EVERY BLOCK WITH ENOUGH STAYS, KEEPING THE FEATURES WITH P < ALPHA
+    # CREATGLUC ETC HAS ONLY 874 SAMPLES AND SO WON'T BE HELPFUL.
+    # THE BLOCKS ARE FRAMES OR blocks.BlockView, ONLY THE SELECTED COLUMNS ARE COPIED OUT
+    from sklearn.feature_selection import SelectKBest, chi2
+    selected = {}
+    for name, block in dummy_dict.items():
+        block = blocks.as_view(block)
+        features = block.columns[1:]
+        y = block.column('hospital_expire_flag')
+        # ONLY PASSING FRAMES W/ > 3000 ICUSTAYS
+        if y.shape[0] > min_stays:
 
-    # CREATGLUC ETC HAS ONLY 874 SAMPLES AND SO WON'T BE HELPFUL. 
-
-    root = '../data/features/'
-
-    for name, frame in dummy_dict.iteritems():#frame = cat_dummy_frames[0]
-        X_continuous = frame[frame.columns[1:]]
-        y = frame['hospital_expire_flag']
-        #display(X_continuous.shape)
-        #display(y.shape)
-        # ONLY PASSING FRAMES W/ > 5000 ICUSTAYS
-        if y.shape[0] > 3000:
-        
             # SELECT K BEST FEATURES BASED ON CHI2 SCORES
             selector = SelectKBest(score_func = chi2, k = 'all')
-            selector.fit(X_continuous, y)
-            p_vals = pd.Series(selector.pvalues_, name = 'p_values', index = X_continuous.columns)
-            scores = pd.Series(selector.scores_, name = 'scores', index = X_continuous.columns)
+            selector.fit(block.values(features), y)
+            p_vals = pd.Series(selector.pvalues_, name = 'p_values', index = features)
+            scores = pd.Series(selector.scores_, name = 'scores', index = features)
             cont_features_df = pd.concat([p_vals, scores], axis = 1)
             cont_features_df.sort_values(by ='scores', ascending = False, inplace = True)
-            best_features = frame[cont_features_df[cont_features_df.p_values < .001].index]
-            frame = pd.DataFrame(y).merge(best_features, left_index = True, right_index = True, 
-                           how = 'left', sort = True)
-            print "{}     {}".format(name, frame.shape)
-            frame.to_csv(root + name + '.csv')
-            cont_features_df[cont_features_df.p_values < .001].to_csv(root + name + 'Scores.csv')
-
-
-
-
-
-data = import_labevents_data()
-print(data.head())
-labels2 = remove_sparse_data(data)
-print(labels2)
-# code for displaying affinity maps and saving figure to file
-#num_samps_df = number_of_samples_per_feature(data, labels2)
-#affinity_maps(num_samps_df)
-calc_dict = calculate_stats(data, labels2)
-print(calc_dict['mean'].keys())
-#print "plotting mean values"
-#dummy = calc_dict['mean']
-#plot_features(dummy)
-print "calc_dict dropna shape with outliers= {}".format(calc_dict['mean']['WBC_mean'].dropna().shape)
-
-remove_outliers(calc_dict)
-print "calc_dict dropna shape without outliers= {}".format(calc_dict['mean']['WBC_mean'].dropna().shape)
-dummy = calc_dict['mean']
-plot_features(dummy)
-data3 = merge_dataframes(data, calc_dict)
-print(data3.columns)
-drop_features(data3)
-cont_frames, cat_frames = create_feature_blocks(data3)
-print(cont_frames[0].columns)
-print(cont_frames[1].columns)
-print(cat_frames[0].columns)
-cont_cat_frames = continuous_to_categorical(cont_frames)
-print(cont_cat_frames[0].head())
-dummy_dict = categorical_to_dummy(cont_cat_frames, cat_frames[0])
-select_best_features(dummy_dict)
+            best = list(cont_features_df[cont_features_df.p_values < alpha].index)
+            frame = block.frame(['hospital_expire_flag'] + best).sort_index()
+            print("{}     {}".format(name, frame.shape))
+            selected[name] = (frame, cont_features_df[cont_features_df.p_values < alpha])
+    return selected
+
+
+def write_features(selected, root=FEATURES_DIR):
+    # WRITE EACH SELECTED BLOCK AND ITS SCORES TO FILE
+    for name, (frame, scores) in selected.items():
+        frame.to_csv(os.path.join(root, name + '.csv'))
+        scores.to_csv(os.path.join(root, name + 'Scores.csv'))
+
+
+def select_best_features(dummy_dict, root=FEATURES_DIR):
+#select k best features using chi2 score and write those features to file
+    for name, frame in dummy_dict.items():
+        print("{}      {}".format(name, frame.shape[0]))
+    write_features(score_features(dummy_dict), root)
+
+
+# PIPELINE STAGES. EACH TAKES THE RESULTS OF THE STAGES NAMED IN STAGES AND RETURNS
+# A NEW OBJECT, SO MEMOIZED RESULTS ARE NEVER CHANGED BY A LATER STAGE
+
+def outliers_stage(calc_dict):
+    print("calc_dict dropna shape with outliers= {}".format(calc_dict['mean']['WBC_mean'].dropna().shape))
+    calc_dict = remove_outliers(calc_dict)
+    print("calc_dict dropna shape without outliers= {}".format(calc_dict['mean']['WBC_mean'].dropna().shape))
+    return calc_dict
 
 
+def dummies_stage(blocks):
+    cont_frames, cat_frames = blocks
+    cont_cat_frames = continuous_to_categorical(cont_frames)
+    return categorical_to_dummy(cont_cat_frames, cat_frames[0])
+
+
+# OUT-OF-CORE STAGES, AS IN chart_events: STATISTICS PER PARTITION OF WHOLE STAYS,
+# THE OUTLIER BOUNDS AND QUARTILES ON THE JOINED PER STAY RESULTS
+
+def _partition_label_stays(path):
+    data = pd.read_csv(path, usecols=lambda col: col in ('icustay_id', 'itemid', 'label'))
+    return label_stays(concepts.assign_concepts(data, 'labs'))
+
+
+def _partition_stats(path, labels2):
+    data = import_labevents_data(path)
+    return calculate_stats(data, labels2), data.drop_duplicates('icustay_id', keep = 'first')
+
+
+def partition_label_stays_stage(paths, n_jobs=1):
+    counts = partition.map_partitions(_partition_label_stays, paths, n_jobs)
+    return pd.concat(counts).groupby(level=0).sum()
+
+
+def partition_stats_stage(paths, labels2, n_jobs=1):
+    parts = partition.map_partitions(_partition_stats, paths, n_jobs, labels2)
+    stays = pd.concat([part[1] for part in parts]).sort_values('icustay_id', kind='mergesort')
+    stays.set_index(np.arange(stays.shape[0]), inplace = True)
+    return partition.concat_partitions([part[0] for part in parts]), stays
+
+
+def stats_stage(partial):
+    return partial[0]
+
+
+def stays_stage(partial):
+    # FIRST EVENT OF EVERY STAY, ALL merge_dataframes TAKES FROM THE EVENTS
+    return partial[1]
+
+
+def stages(path=LAB_EVENTS_CSV, chunksize=None, min_samples=6000, min_stays=3000, partitions=None,
+           partition_dir=PARTITIONS_DIR, n_jobs=1):
+    """ the lab events pipeline as a list of pipeline.Stage.
+
+    min_samples (stays per label) and min_stays (stays per feature block) are set for
+    the 60k stays of MIMIC-III, smaller extracts need them scaled down.
+
+    with partitions the events are split by stay into that many files under
+    partition_dir/labs and the statistics are calculated per file on n_jobs processes,
+    see chart_events.stages.
+    """
+    if partitions:
+        events = 'lab_stays'
+        first = [
+            Stage('lab_partitions', partition.partition_csv,
+                  params={'path': path, 'root': os.path.join(partition_dir, 'labs'), 'n_partitions': partitions,
+                          'chunksize': chunksize},
+                  files=['path'], cache=False, untracked=['chunksize']),
+            Stage('lab_label_stays', partition_label_stays_stage, ['lab_partitions'], params={'n_jobs': n_jobs},
+                  untracked=['n_jobs']),
+            Stage('lab_labels', select_labels, ['lab_label_stays'], params={'min_samples': min_samples},
+                  cache=False),
+            Stage('lab_partial_stats', partition_stats_stage, ['lab_partitions', 'lab_labels'],
+                  params={'n_jobs': n_jobs}, untracked=['n_jobs']),
+            Stage('lab_stats', stats_stage, ['lab_partial_stats'], cache=False),
+            Stage('lab_stays', stays_stage, ['lab_partial_stats'], cache=False),
+        ]
+    else:
+        events = 'lab_events'
+        first = [
+            Stage('lab_events', import_labevents_data, params={'path': path, 'chunksize': chunksize},
+                  files=['path'], untracked=['chunksize']),
+            Stage('lab_labels', remove_sparse_data, ['lab_events'], params={'min_samples': min_samples},
+                  cache=False),
+            Stage('lab_stats', calculate_stats, ['lab_events', 'lab_labels']),
+        ]
+    return first + [
+        Stage('lab_outliers', outliers_stage, ['lab_stats']),
+        Stage('lab_merged', merge_dataframes, [events, 'lab_outliers']),
+        Stage('lab_dense', drop_features, ['lab_merged']),
+        Stage('lab_blocks', create_feature_blocks, ['lab_dense']),
+        Stage('lab_dummies', dummies_stage, ['lab_blocks']),
+        Stage('lab_selected', score_features, ['lab_dummies'], params={'min_stays': min_stays}),
+    ]
+
+
+def main(cache_dir=None, path=LAB_EVENTS_CSV, root=FEATURES_DIR, plot=True):
+    results = Pipeline(stages(path), cache_dir).run(['lab_selected', 'lab_outliers'])
+    if plot:
+        from ..visualizations import plots
+        plots.plot_features(results['lab_outliers']['mean'])
+    write_features(results['lab_selected'], root)
+
+
+if __name__ == "__main__":
+    main(cache_dir=PIPELINE_CACHE_DIR)
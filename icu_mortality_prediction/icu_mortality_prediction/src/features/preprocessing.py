@@ -0,0 +1,380 @@
+""" persisted preprocessing that turns raw first 24h events into model features.
+
+the exploratory scripts refit quartiles, outlier bounds and dummies on whatever data
+they are given. here the preprocessing is fitted once on the training stays and kept
+as a JSON serializable spec, so new stays are encoded exactly as the training stays
+were.
+
+the spec is built from definitions, one per base column of the final features,
+
+    'HR_mean':        {'source': 'chart', 'label': 'Heart Rate', 'stat': 'mean',
+                       'encoding': 'quartiles'}
+    'GCS Total':      {'source': 'chart', 'label': 'GCS Total', 'stat': 'value',
+                       'encoding': 'dummies'}
+    'Creat_abnflag':  {'source': 'lab', 'label': 'Creatinine', 'stat': 'abnflag',
+                       'encoding': 'flag'}
+    'age':            {'source': 'demographics', 'label': 'age', 'encoding': 'quartiles',
+                       'bounds': [None, 110]}
+    'Shock':          {'source': 'diagnoses', 'label': 'Shock', 'codes': ['78550', ...],
+                       'encoding': 'flag'}
+
+a feature is either a base column itself ('Creat_abnflag', 'Shock') or a base column
+and a level joined by '_' ('HR_mean_Q3', 'GCS Total_15', 'first_careunit_MICU'), as
+pd.get_dummies names them. only the (label, statistic) pairs behind the selected
+features are computed.
+
+pipeline_definitions builds the definitions of features named as the feature pipeline
+names them, from the concept map (see concepts.py) and the hcup ccs definitions, so a
+spec can be fitted for the columns of combined.csv when a model is trained.
+"""
+import numpy as np
+import pandas as pd
+
+from . import concepts
+from . import ptnt_demog
+
+
+SPEC_FORMAT = 1
+SOURCES = ['chart', 'lab', 'demographics', 'diagnoses']
+ENCODINGS = ['quartiles', 'dummies', 'flag', 'none']
+
+# STATISTIC NAME -> PANDAS GROUPBY AGGREGATION OF valuenum
+_AGGREGATIONS = {'first': 'first', 'last': 'last', 'mean': 'mean', 'med': 'median',
+                 'std': 'std', 'skew': 'skew', 'min': 'min', 'max': 'max'}
+EVENT_STATS = sorted(list(_AGGREGATIONS) + ['delta', 'slope', 'abnflag', 'value'])
+
+# SOURCE OF THE DEFINITIONS -> SOURCE OF THE CONCEPT MAP
+CONCEPT_SOURCES = {'chart': 'chart', 'lab': 'labs'}
+
+# STATISTICS OF THE CONTINUOUS CHART AND LAB CONCEPTS, AS calculate_stats NAMES THEM
+PIPELINE_STATS = ['mean', 'med', 'std', 'skew', 'min', 'max', 'first', 'slope', 'delta']
+
+# PTNT_DEMOG COLUMNS ptnt_demog.py BINS INTO QUARTILES, WITH THEIR BOUNDS, AND THOSE IT TURNS INTO DUMMIES
+DEMOGRAPHIC_QUARTILES = {'age': [None, 110], 'icu_stay': None, 'hosp_stay': None}
+DEMOGRAPHIC_DUMMIES = ['first_careunit', 'gender', 'marital_status', 'ethnicity', 'insurance', 'admission_type']
+
+# FEATURE MODULE, AS THE FEATURE STORE RECORDS IT, -> SOURCES OF ITS DEFINITIONS
+MODULE_SOURCES = {'chart_events': ['chart'], 'lab_events': ['lab'], 'ptnt_demog': ['demographics', 'diagnoses']}
+
+
+def event_stats(events, wanted):
+    """ per stay summary statistics of the first 24h events, for the wanted pairs only.
+
+    the statistics follow calculate_stats in chart_events.py and lab_events.py: first and
+    last skip missing values, delta is last - first, slope is delta per hour between
+    the first and last chart times and abnflag is 1 when any result is flagged abnormal.
+
+    :param events: long frame with icustay_id, label, charttime, valuenum and, for the
+                   'value' and 'abnflag' statistics, value and flag columns
+    :param wanted: iterable of (label, statistic) pairs, statistics from EVENT_STATS
+    :return: frame indexed by icustay_id with (label, statistic) columns
+    """
+    wanted = sorted(set((label, stat) for label, stat in wanted))
+    for _, stat in wanted:
+        if stat not in EVENT_STATS:
+            raise ValueError("unknown statistic {}, expected one of {}".format(stat, EVENT_STATS))
+    columns = pd.MultiIndex.from_tuples(wanted, names=['label', 'stat']) if wanted else None
+    stats = set(stat for _, stat in wanted)
+
+    data = events[events['label'].isin(set(label for label, _ in wanted))]
+    data = data.sort_values(['icustay_id', 'charttime'], kind='mergesort')
+    keys = [data['icustay_id'], data['label']]
+
+    parts = []
+    numeric = stats & set(_AGGREGATIONS)
+    if stats & set(['delta', 'slope']):
+        numeric |= set(['first', 'last'])
+    if numeric:
+        numeric = sorted(numeric)
+        agg = data.groupby(keys)['valuenum'].agg([_AGGREGATIONS[stat] for stat in numeric])
+        agg.columns = numeric
+        if stats & set(['delta', 'slope']):
+            agg['delta'] = agg['last'] - agg['first']
+        if 'slope' in stats:
+            times = pd.to_datetime(data['charttime']).groupby(keys).agg(['min', 'max'])
+            agg['slope'] = agg['delta'] / ((times['max'] - times['min']) / np.timedelta64(1, 'h'))
+        parts.append(agg.replace([np.inf, -np.inf], np.nan))
+    if 'abnflag' in stats:
+        parts.append((data['flag'] == 'abnormal').astype(int).groupby(keys).max().rename('abnflag'))
+    if 'value' in stats:
+        parts.append(data.groupby(keys)['value'].first().rename('value'))
+
+    if not parts:
+        return pd.DataFrame(index=pd.Index([], name='icustay_id'), columns=columns)
+    table = pd.concat(parts, axis=1).unstack('label')
+    table.columns = table.columns.swaplevel(0, 1)
+    table = table.reindex(columns=columns)
+    table.index.name = 'icustay_id'
+    return table
+
+
+def stay_durations(demographics):
+    """ one row per stay with age, icu_stay and hosp_stay added, vectorized.
+
+    the durations are counted as calculate_durations in ptnt_demog.py counts them, the
+    number of year ends between dob and intime and the number of hours started between
+    intime and outtime, admittime and dischtime.
+    """
+    stays = demographics.drop_duplicates('icustay_id').set_index('icustay_id')
+    times = dict((col, pd.to_datetime(stays[col])) for col in ['dob', 'intime', 'outtime',
+                                                              'admittime', 'dischtime'])
+    stays = stays.copy()
+    stays['age'] = (times['intime'].dt.year - times['dob'].dt.year).astype(float)
+    stays['icu_stay'] = np.floor((times['outtime'] - times['intime']) / np.timedelta64(1, 'h')) + 1
+    stays['hosp_stay'] = np.floor((times['dischtime'] - times['admittime']) / np.timedelta64(1, 'h')) + 1
+    return stays
+
+
+def diagnosis_definitions(hcup_definitions, categories):
+    """ definitions for diagnosis category features.
+
+    :param hcup_definitions: the parsed hcup_ccs_2015_definitions.yaml
+    :param categories: categories used as features
+    """
+    return dict((category, {'source': 'diagnoses', 'label': category, 'encoding': 'flag',
+                            'codes': [str(code) for code in hcup_definitions[category]['codes']]})
+                for category in categories)
+
+
+def _pipeline_bases(hcup_definitions=None):
+    # (BASE COLUMN, DEFINITION) OF EVERY COLUMN THE FEATURE PIPELINE WRITES, CHART FIRST
+    bases = []
+    for source in ['chart', 'lab']:
+        stats = PIPELINE_STATS + (['abnflag'] if source == 'lab' else [])
+        for cid in concepts.concept_ids(CONCEPT_SOURCES[source], 'continuous'):
+            for stat in stats:
+                bases.append((concepts.name(cid) + '_' + stat,
+                              {'source': source, 'label': concepts.label(cid), 'stat': stat,
+                               'encoding': 'flag' if stat == 'abnflag' else 'quartiles'}))
+    for cid in concepts.concept_ids('chart', 'constant'):
+        bases.append((concepts.name(cid), {'source': 'chart', 'label': concepts.label(cid), 'stat': 'first',
+                                           'encoding': 'none'}))
+    # get_dummies PREFIXES THE CATEGORICAL CHART LEVELS WITH THE LABEL, E.G. 'GCS Total_15'
+    for cid in concepts.concept_ids('chart', 'categorical'):
+        bases.append((concepts.label(cid), {'source': 'chart', 'label': concepts.label(cid), 'stat': 'value',
+                                            'encoding': 'dummies'}))
+    for col in sorted(DEMOGRAPHIC_QUARTILES):
+        d = {'source': 'demographics', 'label': col, 'encoding': 'quartiles'}
+        if DEMOGRAPHIC_QUARTILES[col] is not None:
+            d['bounds'] = list(DEMOGRAPHIC_QUARTILES[col])
+        bases.append((col, d))
+    for col in DEMOGRAPHIC_DUMMIES:
+        bases.append((col, {'source': 'demographics', 'label': col, 'encoding': 'dummies'}))
+    if hcup_definitions is not None:
+        bases.extend(sorted(diagnosis_definitions(hcup_definitions, hcup_definitions).items()))
+    return bases
+
+
+def pipeline_definitions(features, hcup_definitions=None, modules=None):
+    """ definitions of the base columns behind features named as the feature pipeline names them.
+
+    chart and lab statistics ('RR_med_Q3', 'Creat_abnflag') and categorical chart levels
+    ('GCS Total_15') are looked up in the concept map, demographics ('age_Q1',
+    'gender_M') in DEMOGRAPHIC_QUARTILES and DEMOGRAPHIC_DUMMIES and diagnosis categories
+    in the hcup ccs definitions.
+
+    :param features: feature names, e.g. the columns of combined.csv
+    :param hcup_definitions: the parsed hcup_ccs_2015_definitions.yaml, needed for
+                             diagnosis features
+    :param modules: optional dict of feature -> feature module that wrote it
+                    ('chart_events', 'lab_events' or 'ptnt_demog', as the feature store
+                    records it). the chart and lab Hematocrit both write Hemat_mean_Q0,
+                    without a module the chart column is taken, as combine_blocks takes it
+    :return: base column -> definition, for fit_preprocessing with the same features
+    """
+    bases = _pipeline_bases(hcup_definitions)
+    definitions = {}
+    for feature in features:
+        allowed = MODULE_SOURCES.get((modules or {}).get(feature), SOURCES)
+        matches = [(base, d) for base, d in bases
+                   if d['source'] in allowed and (feature == base or feature.startswith(base + '_'))]
+        if not matches:
+            raise ValueError("no pipeline column for feature {}".format(feature))
+        # THE LONGEST BASE WINS AS IN feature_columns, THEN THE FIRST SOURCE
+        base, d = max(matches, key=lambda match: len(match[0]))
+        if definitions.get(base, d) != d:
+            raise ValueError("features of {} come from more than one source".format(base))
+        definitions[base] = d
+    return definitions
+
+
+def feature_columns(features, definitions):
+    """ map each feature to its base column and level, None when the feature is the base.
+
+    the longest base column that prefixes a feature wins, so 'BP_Mean_mean_Q0' maps to
+    'BP_Mean_mean' and not 'BP_Mean'.
+    """
+    bases = sorted(definitions, key=len, reverse=True)
+    columns = {}
+    for feature in features:
+        if feature in definitions:
+            columns[feature] = [feature, None]
+            continue
+        for base in bases:
+            if feature.startswith(base + '_'):
+                columns[feature] = [base, feature[len(base) + 1:]]
+                break
+        else:
+            raise ValueError("no definition for feature {}".format(feature))
+    return columns
+
+
+def _stays(stays, events, labs, demographics):
+    if stays is not None:
+        return pd.Index(stays, name='icustay_id')
+    ids = [frame['icustay_id'] for frame in [events, labs, demographics] if frame is not None]
+    if not ids:
+        raise ValueError("no stays given and no data to take them from")
+    return pd.Index(np.unique(np.concatenate([np.asarray(x) for x in ids])), name='icustay_id')
+
+
+def base_values(definitions, events=None, labs=None, demographics=None, stays=None):
+    """ raw value of every base column for every stay, before outlier removal and encoding.
+
+    :param definitions: base column -> definition, see the module docstring
+    :param events: chart events, needed for 'chart' definitions. events without a concept
+                   column are mapped with concepts.assign_concepts first, the caller's
+                   frame is left as it is
+    :param labs: lab events, needed for 'lab' definitions, mapped in the same way
+    :param demographics: PTNT_DEMOG rows, one per (stay, diagnosis), needed for
+                         'demographics' and 'diagnoses' definitions
+    :param stays: icustay_ids of the rows, defaults to every stay in the data
+    :return: frame indexed by icustay_id with one column per base column
+    """
+    stays = _stays(stays, events, labs, demographics)
+    values = pd.DataFrame(index=stays)
+    by_source = dict((source, dict((base, d) for base, d in definitions.items() if d['source'] == source))
+                     for source in SOURCES)
+    for base, d in definitions.items():
+        if d['source'] not in SOURCES:
+            raise ValueError("unknown source {} for {}".format(d['source'], base))
+
+    for source, data in [('chart', events), ('lab', labs)]:
+        if not by_source[source]:
+            continue
+        if data is None:
+            raise ValueError("{} events are needed for {}".format(source, sorted(by_source[source])))
+        if 'concept' not in data.columns:
+            # RAW EVENTS ARE MAPPED AS AT INGEST, SO THE LABELS AND UNITS MATCH THE TRAINING STAYS
+            data = concepts.assign_concepts(data.copy(deep=False), CONCEPT_SOURCES[source])
+        stats = event_stats(data, [(d['label'], d['stat']) for d in by_source[source].values()])
+        for base, d in by_source[source].items():
+            values[base] = stats[(d['label'], d['stat'])].reindex(stays)
+
+    if by_source['demographics'] or by_source['diagnoses']:
+        if demographics is None:
+            raise ValueError("demographics are needed for {}".format(
+                sorted(by_source['demographics']) + sorted(by_source['diagnoses'])))
+    if by_source['demographics']:
+        stay_rows = stay_durations(demographics).reindex(stays)
+        for base, d in by_source['demographics'].items():
+            values[base] = stay_rows[d['label']]
+    if by_source['diagnoses']:
+        code_map = {}
+        for base, d in by_source['diagnoses'].items():
+            for code in d['codes']:
+                code_map[code] = base
+        diagnoses = pd.DataFrame({'HCUP_CCS_2015': demographics['icd9_code'].astype(str).map(code_map).values},
+                                 index=demographics['icustay_id'].values)
+        matrix, categories = ptnt_demog.create_diagnoses_matrix(diagnoses, stays,
+                                                                categories=sorted(by_source['diagnoses']),
+                                                                level='ccs')
+        for i, base in enumerate(categories):
+            values[base] = matrix[:, i].toarray().ravel()
+    return values
+
+
+def fit_preprocessing(features, definitions, events=None, labs=None, demographics=None,
+                      stays=None, edge_stays=None):
+    """ learn the outlier bounds and quartile edges of the selected features on training stays.
+
+    chart and lab statistics are bounded by the 1.5 x IQR outlier step used in the
+    exploratory scripts, unless the definition gives its own 'bounds' (either may be
+    None for an open end). the quartile edges are the 25%, 50% and 75% points of the
+    values inside the bounds.
+
+    :param features: final feature list, in the order the model expects
+    :param definitions: base column -> definition, see the module docstring
+    :param edge_stays: optional dict of base column -> stays its quartile edges are taken
+                       from, the bounds are still taken from every stay. the feature
+                       pipeline takes the edges of a chart or lab statistic from the
+                       stays of its block
+    :return: JSON serializable preprocessing spec
+    """
+    columns = feature_columns(features, definitions)
+    used = dict((base, dict(definitions[base])) for base, _ in columns.values())
+    for base, d in used.items():
+        if d.get('encoding', 'none') not in ENCODINGS:
+            raise ValueError("unknown encoding {} for {}".format(d.get('encoding'), base))
+
+    raw = base_values(used, events, labs, demographics, stays)
+    for base, d in used.items():
+        if d.get('encoding') != 'quartiles':
+            continue
+        values = pd.to_numeric(raw[base], errors='coerce').dropna()
+        if 'bounds' not in d:
+            if d['source'] in ('chart', 'lab') and len(values):
+                Q1, Q3 = np.percentile(values, [25, 75])
+                step = 1.5 * (Q3 - Q1)
+                d['bounds'] = [float(Q1 - step), float(Q3 + step)]
+            else:
+                d['bounds'] = [None, None]
+        if edge_stays is not None and base in edge_stays:
+            values = values[values.index.isin(edge_stays[base])]
+        values = values[_in_bounds(values.values, d['bounds'])]
+        d['edges'] = [float(x) for x in np.percentile(values, [25, 50, 75])] if len(values) else None
+    return {'format': SPEC_FORMAT, 'features': list(features), 'columns': columns, 'definitions': used}
+
+
+def _in_bounds(values, bounds):
+    keep = ~np.isnan(values)
+    lower, upper = bounds
+    if lower is not None:
+        keep &= values >= lower
+    if upper is not None:
+        keep &= values <= upper
+    return keep
+
+
+def quartile_levels(values, edges):
+    """ 'Q0' .. 'Q3' codes 0 .. 3 of values as quant_cats assigns them, -1 where missing.
+
+    quant_cats puts x <= Q1 in Q0, Q1 < x <= Q2 in Q1 and so on, which is the number of
+    edges strictly below x.
+    """
+    values = np.asarray(values, dtype=float)
+    levels = np.searchsorted(np.asarray(edges, dtype=float), values, side='left')
+    return np.where(np.isnan(values), -1, levels)
+
+
+def encode(raw, spec):
+    """ apply the spec's bounds, edges and dummies to base values.
+
+    stays with a missing or out of bounds value get 0 for every level of that column.
+
+    :param raw: frame from base_values
+    :return: float frame with spec['features'] as columns
+    """
+    encoded = np.zeros((len(raw), len(spec['features'])))
+    levels = {}
+    for j, feature in enumerate(spec['features']):
+        base, level = spec['columns'][feature]
+        d = spec['definitions'][base]
+        encoding = d.get('encoding', 'none')
+        if encoding == 'quartiles':
+            if base not in levels:
+                values = pd.to_numeric(raw[base], errors='coerce').values.astype(float)
+                values = np.where(_in_bounds(values, d['bounds']), values, np.nan)
+                levels[base] = quartile_levels(values, d['edges']) if d['edges'] else np.full(len(values), -1)
+            encoded[:, j] = levels[base] == int(level[1:])
+        elif encoding == 'dummies':
+            encoded[:, j] = (raw[base].astype(str) == level).values & raw[base].notnull().values
+        else:
+            encoded[:, j] = pd.to_numeric(raw[base], errors='coerce').fillna(0).values
+    return pd.DataFrame(encoded, index=raw.index, columns=spec['features'])
+
+
+def transform(spec, events=None, labs=None, demographics=None, stays=None):
+    """ model features of new stays, computed from only the data the spec needs """
+    raw = base_values(spec['definitions'], events, labs, demographics, stays)
+    return encode(raw, spec)
@@ -1,10 +1,10 @@
 import os
 import pandas as pd
-from sklearn.feature_selection import SelectKBest
-from sklearn.feature_selection import chi2
-import yaml
 import numpy as np
 
+from ... import FEATURES_DIR, HCUP_DEFINITIONS, PIPELINE_CACHE_DIR, PTNT_DEMOG_CSV
+from ..utils.pipeline import Pipeline, Stage
+
 
 def quant_cats(feature, Q1, Q2, Q3):
     
@@ -18,10 +18,12 @@ def quant_cats(feature, Q1, Q2, Q3):
         return 'Q3'
 
 
-def import_demog_data():
-    
-    print("Importing patient demographic data")  
-    ptnt_demog = pd.read_csv('../data/Ptnt_Demog_First24.csv')
+def import_demog_data(path=PTNT_DEMOG_CSV, chunksize=None):
+
+    print("Importing patient demographic data")
+    ptnt_demog = pd.read_csv(path, chunksize=chunksize)
+    if chunksize is not None:
+        ptnt_demog = pd.concat(ptnt_demog, ignore_index=True)
     return ptnt_demog
     
     
@@ -30,32 +32,19 @@ def convert_datetimes(ptnt_demog2):
     dates_and_times = ['dob', 'admittime', 'dischtime', 'intime', 'outtime', 'deathtime']
     for thing in dates_and_times:
         print("converting {}".format(thing))
-        new_series = pd.to_datetime(ptnt_demog2.loc[:,thing])
-        ptnt_demog2.loc[:,thing] = new_series
+        ptnt_demog2[thing] = pd.to_datetime(ptnt_demog2[thing])
 
     return ptnt_demog2
 
 def calculate_durations(ptnt_demog2):    
 
     print("Calculating ages, duration of stays")
-    # len(pd.date_range()) APPEARS TO TAKE A VERY LONG TIME
-    for index, row in ptnt_demog2.iterrows():
-        if (pd.notnull(row['intime']) & pd.notnull(row['dob'])):
-            age_val = len(pd.date_range(end = row['intime'], start = row['dob'], freq = 'A'))
-        else: 
-            age_val = np.nan
-        if (pd.notnull(row['intime']) & pd.notnull(row['outtime'])):
-            icu_stay_val = len(pd.date_range(end = row['outtime'], start = row['intime'], freq = 'H'))
-        else: 
-            icu_stay_val = np.nan
-        if (pd.notnull(row['admittime']) & pd.notnull(row['dischtime'])):
-            hosp_stay_val = len(pd.date_range(end = row['dischtime'], start = row['admittime'], freq = 'H'))
-        else:
-            hosp_stay_val = np.nan
-    
-        ptnt_demog2.set_value(index, 'age', age_val)
-        ptnt_demog2.set_value(index, 'icu_stay', icu_stay_val)
-        ptnt_demog2.set_value(index, 'hosp_stay', hosp_stay_val)
+    # COUNTS AS len(pd.date_range()) DID, YEAR ENDS FROM DOB TO INTIME AND HOURS STARTED
+    # DURING THE STAYS, WITHOUT BUILDING A DATE RANGE FOR EVERY ROW
+    ptnt_demog2 = ptnt_demog2.copy()
+    ptnt_demog2['age'] = (ptnt_demog2['intime'].dt.year - ptnt_demog2['dob'].dt.year).astype(float)
+    ptnt_demog2['icu_stay'] = np.floor((ptnt_demog2['outtime'] - ptnt_demog2['intime']) / np.timedelta64(1, 'h')) + 1
+    ptnt_demog2['hosp_stay'] = np.floor((ptnt_demog2['dischtime'] - ptnt_demog2['admittime']) / np.timedelta64(1, 'h')) + 1
     print("Reconfiguring columns")
     cols = list(ptnt_demog2.columns)
     cols.pop(cols.index('icd9_code'))
@@ -86,18 +75,32 @@ def calculate_durations(ptnt_demog2):
     print ("replacing age outliers")
 
     age_replace_vals = list(ptnt_demog2[ptnt_demog2['age'] > 110]['age'].unique())
-    ptnt_demog2['age'].replace(age_replace_vals, np.nan, inplace = True)
+    ptnt_demog2['age'] = ptnt_demog2['age'].replace(age_replace_vals, np.nan)
 
     return ptnt_demog2
     
     
 
-def create_diagnoses_defs(ptnt_demog2):   
+def create_diagnoses_defs(diagnoses_data, definitions_path=HCUP_DEFINITIONS):
+    """ hcup ccs 2015 category of every diagnosis.
+
+    :param diagnoses_data: the PTNT_DEMOG rows, one per (stay, diagnosis) and indexed by
+                           icustay_id, as demographics_stage returns them. not the frame
+                           of calculate_durations, which keeps one row per stay and drops
+                           icd9_code
+    :return: list of the benchmark categories and the diagnoses frame, one row per
+             diagnosis
+    """
     #phenotypes = add_hcup_ccs_2015_groups(diagnoses, yaml.load(open(args.phenotype_definitions, 'r')))
     print("creating diagnoses definitions")
-    definitions = yaml.load(open('../data/hcup_ccs_2015_definitions.yaml', 'r'))
+    if 'icd9_code' not in diagnoses_data.columns:
+        raise ValueError("create_diagnoses_defs needs the rows of every diagnosis with their icd9_code, "
+                         "not the one row per stay of calculate_durations")
+    import yaml
+    with open(definitions_path, 'r') as f:
+        definitions = yaml.safe_load(f)
 
-    diagnoses = ptnt_demog[['hadm_id', 'icd9_code', 'short_title']].copy()
+    diagnoses = diagnoses_data[['hadm_id', 'icd9_code', 'short_title']].copy()
 
     # create mapping of hcup_ccs_2015_definitions to diagnoses icd9 codes
     def_map = {}
@@ -123,6 +126,46 @@ def create_diagnoses_defs(ptnt_demog2):
     return diagnoses_bm, diagnoses
     
     
+def create_diagnoses_matrix(diagnoses, icustays, categories=None, level='benchmark'):
+    """ build the icustay x diagnosis indicator matrix as a scipy.sparse csr matrix.
+
+    each row of diagnoses is a (stay, code) pair keyed by its index. the pairs are
+    mapped to row and column positions and scattered into the matrix in a single
+    step, duplicate pairs collapse to 1.
+
+    :param diagnoses: frame returned by create_diagnoses_defs
+    :param icustays: index labels forming the rows of the matrix
+    :param categories: column labels, defaults to the sorted codes present in diagnoses
+    :param level: 'benchmark' for hcup ccs categories used in benchmarking, 'ccs' for
+                  every hcup ccs category or 'icd9' for the raw icd9 codes
+    :return: csr matrix of int8, list of column labels
+    """
+    if level == 'benchmark':
+        codes = diagnoses['HCUP_CCS_2015'].where(diagnoses['USE_IN_BENCHMARK'] == 1)
+    elif level == 'ccs':
+        codes = diagnoses['HCUP_CCS_2015']
+    elif level == 'icd9':
+        codes = diagnoses['icd9_code'].where(diagnoses['icd9_code'].isnull(),
+                                             diagnoses['icd9_code'].astype(str))
+    else:
+        raise ValueError("level must be 'benchmark', 'ccs' or 'icd9', not {}".format(level))
+
+    if categories is None:
+        categories = sorted(codes.dropna().unique())
+    categories = list(categories)
+
+    rows = pd.Index(icustays).get_indexer(diagnoses.index)
+    cols = pd.Categorical(codes, categories=categories).codes
+    keep = (rows >= 0) & (cols >= 0)
+
+    from scipy import sparse
+    matrix = sparse.csr_matrix((np.ones(keep.sum(), dtype=np.int8), (rows[keep], cols[keep])),
+                               shape=(len(icustays), len(categories)))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, categories
+
+
 def create_diagnoses_df(ptnt_demog2, diagnoses_bm, diagnoses):
     
     icustays = list(ptnt_demog2.index)
@@ -130,14 +173,9 @@ def create_diagnoses_df(ptnt_demog2, diagnoses_bm, diagnoses):
     # create dataframe with hcup_ccp diagnoses benchmark categories as columns and
     # icustay_id information as indices. if the diagnosis is present for a given icustay the 
     # value is 1, otherwise 0. 
+    matrix, categories = create_diagnoses_matrix(diagnoses, icustays, categories=diagnoses_bm)
+    diagnoses2 = pd.DataFrame(matrix.toarray(), columns=categories, index=icustays)
 
-    diagnoses2 = pd.DataFrame(columns = diagnoses_bm, index = icustays)
-    diagnoses2.fillna(0, inplace = True)
-    #print "created empty diagnoses dataframe"
-    for row in diagnoses.iterrows():
-        if row[1]['USE_IN_BENCHMARK'] == 1:
-            diagnoses2.loc[row[0]][row[1]['HCUP_CCS_2015']] = 1
-    
     #print "filled diagnoses dataframe "   
     ptnt_demog2.drop(['subject_id', 'deathtime', 'hadm_id'], inplace = True, axis = 1)
     cols = list(ptnt_demog2.columns)
@@ -172,13 +210,14 @@ def categorical_to_dummies(ptnt_demog_data):
     
 
 
-def write_best_features(dummies):
-    
+def score_features(dummies, alpha=.001):
+
+    from sklearn.feature_selection import SelectKBest, chi2
     frame = dummies
     X = frame[frame.columns[1:]]
     y = frame['hospital_expire_flag']
 
-        
+
     # SELECT K BEST FEATURES BASED ON CHI2 SCORES
     selector = SelectKBest(score_func = chi2, k = 'all')
     selector.fit(X, y)
@@ -189,26 +228,69 @@ def write_best_features(dummies):
     print("Feature scores/p_values in descending/ascending order")
     print(features_df.head(20))
 
-    best_features = frame[features_df[features_df.p_values < .001].index]
+    best_features = frame[features_df[features_df.p_values < alpha].index]
 
-    frame = pd.DataFrame(y).merge(best_features, left_index = True, right_index = True, 
+    frame = pd.DataFrame(y).merge(best_features, left_index = True, right_index = True,
                     how = 'left', sort = True)
+    return {'Ptnt_Demog_Features': (frame, features_df[features_df.p_values < alpha])}
+
 
+def write_best_features(dummies, root=FEATURES_DIR):
 
+    selected = score_features(dummies)
+    frame, scores = selected['Ptnt_Demog_Features']
     print("head of selected feature frame ")
     print(frame.head())
-    #code for writing features to file    
-    root = '../data/features/'
-    name = 'Ptnt_Demog_Features.csv'
-    name2 = 'Ptnt_Demog_FeaturesScores.csv'
-    frame.to_csv(root + name)
-    features_df[features_df.p_values < .001].to_csv(root + name2)
-    y = pd.DataFrame(y)
-    y.to_csv(root + 'outcomes.csv')
+    #code for writing features to file
+    frame.to_csv(os.path.join(root, 'Ptnt_Demog_Features.csv'))
+    scores.to_csv(os.path.join(root, 'Ptnt_Demog_FeaturesScores.csv'))
+    y = pd.DataFrame(frame['hospital_expire_flag'])
+    y.to_csv(os.path.join(root, 'outcomes.csv'))
+
+
+# PIPELINE STAGES, AS IN PATIENT_DEMOGRAPHICS_FIRST24.ipynb. EACH RETURNS A NEW OBJECT SO
+# MEMOIZED RESULTS ARE NEVER CHANGED BY A LATER STAGE
+
+def demographics_stage(ptnt_demog):
+    # ONE ROW PER (STAY, DIAGNOSIS), INDEXED BY ICUSTAY_ID
+    ptnt_demog2 = convert_datetimes(ptnt_demog.copy())
+    if 'icustay_id' in ptnt_demog2.columns:
+        ptnt_demog2 = ptnt_demog2.set_index('icustay_id')
+    return ptnt_demog2
+
+
+def durations_stage(ptnt_demog2):
+    # ONE ROW PER STAY
+    return calculate_durations(ptnt_demog2[~ptnt_demog2.index.duplicated(keep='first')])
+
 
+def dummies_stage(ptnt_demog2, diagnoses_defs):
+    diagnoses_bm, diagnoses = diagnoses_defs
+    ptnt_demog_data, diagnoses2 = create_diagnoses_df(ptnt_demog2.copy(), diagnoses_bm, diagnoses)
+    continuous_to_categorical(ptnt_demog_data)
+    dummies = categorical_to_dummies(ptnt_demog_data)
+    return dummies.merge(diagnoses2, left_index = True, right_index = True, how = 'left')
 
 
+def stages(path=PTNT_DEMOG_CSV, definitions_path=HCUP_DEFINITIONS, chunksize=None):
+    """ the patient demographics pipeline as a list of pipeline.Stage """
+    return [
+        Stage('demog_events', import_demog_data, params={'path': path, 'chunksize': chunksize},
+              files=['path'], untracked=['chunksize']),
+        Stage('demog_converted', demographics_stage, ['demog_events']),
+        # THE DIAGNOSES COME FROM THE ROWS OF EVERY DIAGNOSIS, BEFORE THE DURATIONS KEEP ONE ROW PER STAY
+        Stage('demog_diagnoses', create_diagnoses_defs, ['demog_converted'],
+              params={'definitions_path': definitions_path}, files=['definitions_path']),
+        Stage('demog_durations', durations_stage, ['demog_converted']),
+        Stage('demog_dummies', dummies_stage, ['demog_durations', 'demog_diagnoses']),
+        Stage('demog_selected', score_features, ['demog_dummies']),
+    ]
 
 
+def main(cache_dir=None, path=PTNT_DEMOG_CSV, root=FEATURES_DIR):
+    dummies = Pipeline(stages(path), cache_dir).run(['demog_dummies'])['demog_dummies']
+    write_best_features(dummies, root)
 
 
+if __name__ == "__main__":
+    main(cache_dir=PIPELINE_CACHE_DIR)
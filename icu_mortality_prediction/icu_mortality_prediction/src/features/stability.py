@@ -0,0 +1,198 @@
+""" bootstrap stability of the chi2 feature selection.
+
+score_features keeps the features of a block with a chi2 p-value below .001 and
+combine.top_features takes the 20 smallest p-values over all blocks, from a single
+fit. with one death in nine stays that top 20 changes with the stays in the extract.
+stability_selection repeats the ranking on bootstrap resamples of the stays and
+reports how often each encoded feature makes the top k, by chi2 and by mutual
+information, with the interval of its rank.
+
+the dummies of all blocks are stacked once into a sparse stays x features matrix,
+shared with the workers through utils/parallel.py. a resample is a vector of stay
+weights, the bootstrap counts, so its chi2 and mutual information come from two
+sparse products, the weighted class counts of every feature, without copying rows.
+each feature is scored on the stays of its own block, as score_features does.
+
+    report, resamples = stability.stability_selection(blocks, n_resamples=500, k=20,
+                                                      time_budget=600, n_jobs=8)
+"""
+import time
+import numpy as np
+import pandas as pd
+
+from . import blocks as feature_blocks
+from ..utils import parallel
+
+
+OUTCOME = 'hospital_expire_flag'
+
+# PERCENTILES OF THE RANK REPORTED AS ITS INTERVAL
+RANK_INTERVAL = (5, 95)
+
+
+def encode(blocks):
+    """ the dummies of every block stacked into one sparse matrix over the union of their stays.
+
+    :param blocks: dict of block name -> frame or blocks.BlockView indexed by icustay_id
+                   with the outcome as its first column
+    :return: dict of the arrays of the CSR matrix ('data', 'indices', 'indptr'), the
+             outcome 'y', the stays x blocks 'membership' and the block of every feature
+             'feature_block', and the frame of the features with their block, by column
+    """
+    from scipy import sparse
+    names = sorted(blocks)
+    views = [feature_blocks.as_view(blocks[name]) for name in names]
+    stays = views[0].index
+    for view in views[1:]:
+        stays = stays.union(view.index)
+    stays = stays.sort_values()
+
+    y = np.zeros(len(stays), dtype=np.int8)
+    membership = np.zeros((len(stays), len(names)), dtype=np.int8)
+    rows, cols, values, features, owners = [], [], [], [], []
+    for b, view in enumerate(views):
+        positions = stays.get_indexer(view.index)
+        y[positions] = view.column(OUTCOME)
+        membership[positions, b] = 1
+        for name in view.columns[1:]:
+            column = view.column(name).astype(float)
+            nonzero = np.flatnonzero(column)
+            rows.append(positions[nonzero])
+            cols.append(np.full(len(nonzero), len(features), dtype=np.intp))
+            values.append(column[nonzero])
+            features.append(name)
+            owners.append(b)
+    X = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(stays), len(features)))
+    arrays = {'data': X.data, 'indices': X.indices, 'indptr': X.indptr, 'y': y, 'membership': membership,
+              'feature_block': np.array(owners, dtype=np.intp)}
+    return arrays, pd.DataFrame({'block': [names[b] for b in owners]}, index=pd.Index(features, name='feature'))
+
+
+def _matrix(arrays):
+    from scipy import sparse
+    shape = (len(arrays['y']), len(arrays['feature_block']))
+    X = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape)
+    indicator = X if np.all(arrays['data'] == 1) else \
+        sparse.csr_matrix((np.ones(len(arrays['data'])), arrays['indices'], arrays['indptr']), shape=shape)
+    return X, indicator
+
+
+def weighted_scores(X, indicator, arrays, weights):
+    """ chi2 statistic and mutual information (nats) of every feature for stay weights.
+
+    with unit weights these are sklearn's chi2 and mutual_info_classif with
+    discrete_features=True on the stays of the feature's block. the mutual information
+    is that of the feature being nonzero, the same thing for dummies.
+    """
+    y = arrays['y']
+    by_class = np.column_stack([weights * (y == 0), weights * (y == 1)])
+    block_classes = arrays['membership'].T.dot(by_class)[arrays['feature_block']]
+    block_totals = block_classes.sum(axis=1)
+
+    # CHI2 OF THE CLASS SUMS OF EVERY FEATURE, AS sklearn.feature_selection.chi2
+    observed = np.asarray(X.T.dot(by_class))
+    expected = block_classes / block_totals[:, None] * observed.sum(axis=1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chi2 = ((observed - expected) ** 2 / expected).sum(axis=1)
+
+        # MUTUAL INFORMATION OF THE 2 x 2 TABLE OF CLASS AND FEATURE PRESENCE
+        present = np.asarray(indicator.T.dot(by_class))
+        table = np.stack([block_classes - present, present], axis=2)
+        marginal = block_classes[:, :, None] * table.sum(axis=1)[:, None, :] / block_totals[:, None, None]
+        cells = np.where(table > 0, table * np.log(table / marginal), 0.)
+    mutual_info = cells.sum(axis=(1, 2)) / block_totals
+    return np.nan_to_num(chi2), np.nan_to_num(mutual_info)
+
+
+def ranks(scores):
+    """ rank of every score, 1 for the largest, ties in column order """
+    order = np.argsort(-scores, kind='mergesort')
+    result = np.empty(len(scores), dtype=np.int32)
+    result[order] = np.arange(1, len(scores) + 1)
+    return result
+
+
+def bootstrap_weights(y, seed):
+    """ bootstrap counts of the stays, the deaths and the survivors resampled separately
+    so every resample keeps the mortality rate of the cohort """
+    rng = np.random.RandomState(seed)
+    weights = np.zeros(len(y))
+    for cls in (0, 1):
+        members = np.flatnonzero(y == cls)
+        if len(members):
+            weights += np.bincount(members[rng.randint(0, len(members), len(members))], minlength=len(y))
+    return weights
+
+
+def _resample_batch(task):
+    # CHI2 AND MUTUAL INFORMATION RANKS OF A BATCH OF RESAMPLES, ON THE SHARED MATRIX
+    from scipy.stats import chi2 as chi2_dist
+    paths, seeds, k, alpha = task
+    arrays = parallel.load_shared(paths)
+    X, indicator = _matrix(arrays)
+    chi2_ranks = np.empty((len(seeds), X.shape[1]), dtype=np.int32)
+    mi_ranks = np.empty_like(chi2_ranks)
+    chi2_selected = np.empty(chi2_ranks.shape, dtype=bool)
+    for i, seed in enumerate(seeds):
+        chi2, mutual_info = weighted_scores(X, indicator, arrays, bootstrap_weights(arrays['y'], seed))
+        chi2_ranks[i] = ranks(chi2)
+        mi_ranks[i] = ranks(mutual_info)
+        chi2_selected[i] = (chi2_ranks[i] <= k) & (chi2_dist.sf(chi2, 1) < alpha)
+    return chi2_ranks, mi_ranks, chi2_selected
+
+
+def stability_selection(blocks, n_resamples=200, k=20, alpha=.001, time_budget=None, n_jobs=1, batch_size=25,
+                        seed=0, scratch_dir=None):
+    """ selection frequencies and rank intervals of every encoded feature over bootstrap
+    resamples of the stays.
+
+    a feature is selected by chi2 in a resample when it is among the k largest chi2
+    statistics of all blocks and its p-value is below alpha, as combine.top_features
+    would pick it, and by mutual information when it is among the k largest. the
+    resamples run in batches of batch_size on n_jobs processes, one batch per worker a
+    round. a round that is not projected to finish inside time_budget (seconds) is
+    skipped, the first round always runs.
+
+    :param blocks: dict of block name -> encoded feature block, see encode
+    :return: frame indexed by feature with its block, the chi2, p_value and mutual_info
+             of all stays, the chi2_frequency and mi_frequency of selection and the
+             median, low and high percentiles of its chi2 and mi ranks, most stable
+             first, and the number of resamples run
+    """
+    from scipy.stats import chi2 as chi2_dist
+    start = time.time()
+    arrays, report = encode(blocks)
+    X, indicator = _matrix(arrays)
+    chi2, mutual_info = weighted_scores(X, indicator, arrays, np.ones(len(arrays['y'])))
+    report['chi2'] = chi2
+    report['p_value'] = chi2_dist.sf(chi2, 1)
+    report['mutual_info'] = mutual_info
+
+    n_workers = parallel.resolve_jobs(n_jobs)
+    seeds = [[seed, i] for i in range(n_resamples)]
+    batches = [seeds[i:i + batch_size] for i in range(0, n_resamples, batch_size)]
+    results = []
+    last_round = None
+    with parallel.shared_arrays(arrays, scratch_dir) as paths:
+        for rnd in range(0, len(batches), n_workers):
+            if last_round is not None and time_budget is not None and time.time() - start + last_round > time_budget:
+                print("stopping after {} of {} resamples: {:.1f}s a round, budget {}s".format(
+                      sum(len(batch) for batch in batches[:rnd]), n_resamples, last_round, time_budget))
+                break
+            round_start = time.time()
+            tasks = [(paths, batch, k, alpha) for batch in batches[rnd:rnd + n_workers]]
+            results.extend(parallel.run_tasks(_resample_batch, tasks, n_jobs))
+            last_round = time.time() - round_start
+
+    chi2_ranks, mi_ranks, chi2_selected = [np.concatenate(arrs) for arrs in zip(*results)]
+    low, high = RANK_INTERVAL
+    report['chi2_frequency'] = chi2_selected.mean(axis=0)
+    report['mi_frequency'] = (mi_ranks <= k).mean(axis=0)
+    for name, arr in [('chi2', chi2_ranks), ('mi', mi_ranks)]:
+        report[name + '_rank_median'] = np.median(arr, axis=0)
+        report[name + '_rank_low'] = np.percentile(arr, low, axis=0)
+        report[name + '_rank_high'] = np.percentile(arr, high, axis=0)
+    report = report.sort_values(['chi2_frequency', 'chi2_rank_median'], ascending=[False, True], kind='mergesort')
+    print("{} resamples of {} stays in {:.1f}s".format(len(chi2_ranks), len(arrays['y']), time.time() - start))
+    return report, len(chi2_ranks)
@@ -0,0 +1,175 @@
+""" hourly stay x channel x hour tensor of the first 24h events, for sequence models.
+
+a channel is one (source, label) pair, so the chart and the lab Hematocrit, which share
+their label, are two channels. the labels are those of the concepts the events were
+mapped to at ingest (see features/concepts.py), so every item of a concept falls in
+the channel of the concept.
+
+build_tensor bins the valuenum of the chart and lab events into n_hours hourly bins
+per stay and channel and writes them as one float32 array of shape (stays, channels,
+hours), with NaN in the cells without a sample, and a bit mask of the observed cells
+packed along the hour axis. the events are placed with one vectorized scatter over
+flat cell numbers, no pivot, and the arrays are written through np.memmap, so the
+tensor is never held in memory whole,
+
+    <root>/tensor.json     channels, hours and aggregator
+    <root>/stays.npy       sorted icustay_ids
+    <root>/values.npy      float32 (stays, channels, hours)
+    <root>/observed.npy    uint8 (stays, channels, ceil(hours / 8)), np.packbits of the mask
+
+load_tensor opens them with mmap and iter_batches reads mini-batches of stays from
+disk, so a training job only holds the batch it works on.
+
+    icu-mortality tensor --aggregator mean
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+TENSOR_FILE = 'tensor.json'
+
+# HOW THE SAMPLES OF ONE STAY, CHANNEL AND HOUR ARE REDUCED TO ONE VALUE
+AGGREGATORS = ['last', 'mean', 'max']
+
+COLUMNS = ['icustay_id', 'label', 'charttime', 'valuenum']
+
+
+def hour_bins(stay_ids, charttime, start=None):
+    """ hours started since the start of each event's stay, the first hour is 0.
+
+    :param start: Series of start times indexed by icustay_id, e.g. the ICU intime.
+                  defaults to the first event of every stay
+    """
+    charttime = pd.to_datetime(pd.Series(np.asarray(charttime)))
+    stay_ids = pd.Series(np.asarray(stay_ids))
+    if start is None:
+        start = charttime.groupby(stay_ids.values).min()
+    first = stay_ids.map(pd.to_datetime(start))
+    return np.floor((charttime - first).values / np.timedelta64(1, 'h'))
+
+
+def _events(frames):
+    """ the columns the tensor needs from every frame and its source, in one frame """
+    frames = [frame[COLUMNS].assign(source=source) for source, frame in sorted(frames.items())]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _reduce(cells, values, times, aggregator):
+    """ the cells with at least one sample and the aggregated value of each """
+    if not len(cells):
+        return cells, values[:0]
+    if aggregator == 'mean':
+        observed, inverse = np.unique(cells, return_inverse=True)
+        sums = np.bincount(inverse, weights=values)
+        return observed, sums / np.bincount(inverse)
+    # SORTED BY CELL, THEN BY TIME OR VALUE, SO THE LAST SAMPLE OF EVERY CELL IS ITS RESULT
+    order = np.lexsort((times if aggregator == 'last' else values, cells))
+    cells = cells[order]
+    last = np.append(cells[1:] != cells[:-1], True)
+    return cells[last], values[order][last]
+
+
+def build_tensor(frames, root, channels=None, n_hours=24, aggregator='last', start=None):
+    """ write the hourly tensor of the events in frames to root.
+
+    :param frames: dict of source -> event frame with icustay_id, label, charttime and
+                   valuenum columns, e.g. {'chart': chart_events, 'labs': lab_events}
+    :param channels: (source, label) pairs to keep, in this order, by default every pair
+                     with a valuenum, sorted
+    :param aggregator: 'last' sample, 'mean' or 'max' of every hourly bin
+    :param start: Series of start times indexed by icustay_id, see hour_bins
+    :return: the tensor as load_tensor returns it
+    """
+    if aggregator not in AGGREGATORS:
+        raise ValueError("unknown aggregator {}, expected one of {}".format(aggregator, AGGREGATORS))
+    events = _events(frames)
+    stays = np.unique(events['icustay_id'].dropna().values.astype(np.int64))
+    values = pd.to_numeric(events['valuenum'], errors='coerce').values.astype(float)
+    keys = pd.MultiIndex.from_arrays([events['source'], events['label']])
+    if channels is None:
+        channels = sorted((key for key in keys[np.isfinite(values)].unique() if key[1] == key[1]), key=str)
+    channels = [tuple(channel) for channel in channels]
+
+    print("binning {} events into {} stays x {} channels x {} hours".format(len(events), len(stays),
+                                                                              len(channels), n_hours))
+    charttime = pd.to_datetime(events['charttime']).values
+    hours = hour_bins(events['icustay_id'].values, charttime, start)
+    channel_codes = np.full(len(events), -1)
+    if channels:
+        channel_codes = pd.MultiIndex.from_tuples(channels).get_indexer(keys)
+    stay_ids = events['icustay_id']
+    stay_codes = np.searchsorted(stays, stay_ids.fillna(-1).values.astype(np.int64))
+    keep = stay_ids.notnull().values & np.isfinite(values) & (channel_codes >= 0) & (hours >= 0) & (hours < n_hours)
+    # FLAT NUMBER OF THE (STAY, CHANNEL, HOUR) CELL OF EVERY EVENT
+    cells = (stay_codes[keep] * len(channels) + channel_codes[keep]) * n_hours + hours[keep].astype(np.int64)
+    observed, aggregated = _reduce(cells, values[keep], charttime[keep], aggregator)
+
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    np.save(os.path.join(root, 'stays.npy'), stays)
+    shape = (len(stays), len(channels), n_hours)
+    tensor = np.lib.format.open_memmap(os.path.join(root, 'values.npy'), mode='w+', dtype=np.float32, shape=shape)
+    tensor[:] = np.nan
+    tensor.reshape(-1)[observed] = aggregated
+    tensor.flush()
+    # THE MASK IS PACKED STRAIGHT FROM THE OBSERVED CELLS, BIT 7 - hour % 8 OF BYTE hour // 8
+    n_bytes = (n_hours + 7) // 8
+    row, hour = np.divmod(observed, n_hours)
+    byte, bits = np.unique(row * n_bytes + hour // 8, return_inverse=True)
+    packed = np.lib.format.open_memmap(os.path.join(root, 'observed.npy'), mode='w+', dtype=np.uint8,
+                                       shape=shape[:2] + (n_bytes,))
+    packed.reshape(-1)[byte] = np.bincount(bits, weights=2 ** (7 - hour % 8)).astype(np.uint8)
+    packed.flush()
+    del tensor, packed
+
+    with open(os.path.join(root, TENSOR_FILE), 'w') as f:
+        json.dump({'channels': [list(channel) for channel in channels], 'n_hours': n_hours, 'aggregator': aggregator, 'shape': list(shape),
+                   'observed': int(len(observed))}, f, indent=2)
+    print("tensor written to {}, {:.1%} of the cells observed".format(
+        root, len(observed) / float(max(1, np.prod(shape)))))
+    return load_tensor(root)
+
+
+def load_tensor(root, mmap=True):
+    """ (stays, channels, values, observed) of the tensor under root, channels as
+    (source, label) tuples.
+
+    values and the packed observed mask are memory mapped unless mmap is False, use
+    unpack_observed or iter_batches for the boolean mask.
+    """
+    with open(os.path.join(root, TENSOR_FILE)) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    return (np.load(os.path.join(root, 'stays.npy')), [tuple(channel) for channel in meta['channels']],
+            np.load(os.path.join(root, 'values.npy'), mmap_mode=mode),
+            np.load(os.path.join(root, 'observed.npy'), mmap_mode=mode))
+
+
+def unpack_observed(packed, n_hours):
+    """ boolean mask of observed cells from the packed bits """
+    return np.unpackbits(np.asarray(packed), axis=-1, count=n_hours).astype(bool)
+
+
+def iter_batches(root, batch_size=256, stays=None, shuffle=False, seed=0):
+    """ yield (icustay_ids, values, observed) for batches of batch_size stays read from disk.
+
+    :param stays: icustay_ids to read, by default every stay
+    :param shuffle: visit the stays in a random order, each batch still reads its rows in
+                    file order
+    """
+    all_stays, _, values, packed = load_tensor(root)
+    if stays is None:
+        rows = np.arange(len(all_stays))
+    else:
+        stays = np.asarray(stays, dtype=np.int64)
+        rows = np.searchsorted(all_stays, stays)
+        if not np.array_equal(all_stays[np.minimum(rows, len(all_stays) - 1)], stays):
+            raise KeyError("stays not in the tensor under {}".format(root))
+    if shuffle:
+        rows = np.random.RandomState(seed).permutation(rows)
+    n_hours = values.shape[2]
+    for begin in range(0, len(rows), batch_size):
+        batch = np.sort(rows[begin:begin + batch_size])
+        yield all_stays[batch], np.asarray(values[batch]), unpack_observed(packed[batch], n_hours)
@@ -1,4 +1,569 @@
-import ptnt_demog
+""" icu-mortality command line.
 
+    icu-mortality ingest [chart labs demographics]
+    icu-mortality features {chart,labs,demographics,all} [--store data/features/store]
+    icu-mortality select --k 20
+    icu-mortality stability --resamples 500 --time-budget 600
+    icu-mortality train --classifiers LSVC Tree
+    icu-mortality update --store data/features/store --name SGD_hinge
+    icu-mortality evaluate
+    icu-mortality score --name LSVC_recall
+    icu-mortality figures --jobs 8
+    icu-mortality tensor --aggregator mean
+    icu-mortality synthesize --stays 10000 --data-dir /tmp/synthetic
+    icu-mortality benchmark --scales 1000 10000 --baseline
 
-ptnt_demog.import_demog_data()
\ No newline at end of file
+every subcommand takes --jobs, --cache-dir, --chunk-size, --memory-budget and
+--profile. --partitions N splits the chart and lab events into N files of whole stays
+and computes their statistics a file at a time (see utils/partition.py), so the
+events never have to fit in memory at once. --compact-dtypes narrows the dtypes of
+every stage result: ids to int32, flags to int8, measurements to float32 and repeated
+strings to categories. the narrower measurements can move the statistics and so the
+selected features, so it is only on when asked for. --memory-budget reads the CSVs in
+chunks and partitions the events when their parsed size would exceed the budget.
+
+--telemetry report.json (or .csv) records the wall time, CPU time, peak memory and
+input and output shapes of every stage, statistic family and model fit (see
+utils/telemetry.py), and --profile-stages DIR adds a cProfile dump per stage.
+
+the input and output paths default to the layout under DATA_DIR (see the package
+__init__), so the commands work from any directory, and --data-dir points them at
+another copy of the data, with the model store and the reports under it.
+
+the model, synthetic data and benchmark modules are imported by the subcommands that
+use them, and sklearn, scipy and yaml by the functions that use them, so the command
+starts without loading them.
+"""
+import argparse
+import cProfile
+import glob
+import math
+import os
+import pstats
+import sys
+import numpy as np
+import pandas as pd
+
+from .. import (BENCHMARK_BASELINE, CHART_EVENTS_CSV, DATA_DIR, FEATURES_DIR, HCUP_DEFINITIONS, LAB_EVENTS_CSV,
+                MODELS_DIR, PARTITIONS_DIR, PIPELINE_CACHE_DIR, PTNT_DEMOG_CSV, REPORTS_DIR, TENSOR_DIR)
+from .features import build
+from .features import combine
+from .features import feature_store
+from .features import preprocessing
+from .models import artifacts
+from .utils import data_utils
+from .utils import parallel
+from .utils import telemetry
+from .utils.executor import Executor, PipelineError, format_report
+from .utils.pipeline import Pipeline
+
+
+# SOURCE -> (STAGE PARSING ITS CSV, STAGE SELECTING ITS FEATURES)
+SOURCES = {'chart': ('chart_events', 'chart_selected'),
+           'labs': ('lab_events', 'lab_selected'),
+           'demographics': ('demog_events', 'demog_selected')}
+
+# PATH OPTIONS AND THEIR DEFAULTS, KEPT RELATIVE TO DATA_DIR SO --data-dir MOVES THEM ALL
+PATHS = {'chart': CHART_EVENTS_CSV, 'labs': LAB_EVENTS_CSV, 'demographics': PTNT_DEMOG_CSV,
+         'definitions': HCUP_DEFINITIONS, 'features_dir': FEATURES_DIR, 'cache_dir': PIPELINE_CACHE_DIR,
+         'partition_dir': PARTITIONS_DIR, 'tensor_dir': TENSOR_DIR}
+
+# OUTPUT DIRECTORIES AND THEIR PLACE UNDER ANOTHER --data-dir
+OUTPUT_PATHS = {'models_dir': MODELS_DIR, 'reports_dir': REPORTS_DIR}
+OUTPUT_PATHS_UNDER_DATA = {'models_dir': ('models', 'store'), 'reports_dir': ('reports',)}
+
+# ROUGH IN-MEMORY SIZE OF A PARSED CSV AS A MULTIPLE OF ITS SIZE ON DISK
+PARSED_SIZE_FACTOR = 4
+
+_UNITS = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+def parse_size(text):
+    """ bytes in a size such as '512M', '4G' or '1000000' """
+    text = str(text).strip().upper().rstrip('B')
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(float(text))
+
+
+def budget_jobs(n_jobs, memory_budget, paths, partitions=None):
+    """ worker count that keeps one parsed copy of the largest input, or of one of its
+    partitions, per worker within the budget """
+    n_jobs = parallel.resolve_jobs(n_jobs)
+    sizes = [os.path.getsize(path) for path in paths if path and os.path.exists(path)]
+    if memory_budget is None or not sizes:
+        return n_jobs
+    per_job = max(sizes) * PARSED_SIZE_FACTOR / float(partitions or 1)
+    return max(1, min(n_jobs, int(memory_budget // per_job)))
+
+
+def budget_partitions(memory_budget, paths):
+    """ number of partitions of whole stays that brings one parsed partition of the largest
+    event file to half the budget, None when the parsed file fits in the budget """
+    sizes = [os.path.getsize(path) for path in paths if path and os.path.exists(path)]
+    if memory_budget is None or not sizes:
+        return None
+    projected = max(sizes) * PARSED_SIZE_FACTOR
+    if projected <= memory_budget:
+        return None
+    return int(math.ceil(projected / (memory_budget / 2.)))
+
+
+def budget_chunk_size(path, memory_budget, sample_lines=1000):
+    """ CSV rows per chunk so that one parsed chunk takes about a tenth of the budget """
+    if memory_budget is None or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        f.readline()
+        sample = [f.readline() for _ in range(sample_lines)]
+    row_bytes = max(1.0, sum(len(line) for line in sample) / float(max(1, len([s for s in sample if s]))))
+    return max(1000, int(memory_budget / 10 / (row_bytes * PARSED_SIZE_FACTOR)))
+
+
+def resolve_paths(args):
+    """ fill the path options left unset from the data directory """
+    for option, default in PATHS.items():
+        if getattr(args, option, None) is None:
+            setattr(args, option, os.path.join(args.data_dir, os.path.relpath(default, DATA_DIR)))
+    # THE MODEL STORE AND REPORTS LIVE NEXT TO DATA_DIR, UNDER ANOTHER --data-dir THEY MOVE INTO IT
+    moved = os.path.abspath(args.data_dir) != os.path.abspath(DATA_DIR)
+    for option, default in OUTPUT_PATHS.items():
+        if getattr(args, option, None) is None:
+            setattr(args, option, os.path.join(args.data_dir, *OUTPUT_PATHS_UNDER_DATA[option]) if moved else default)
+    return args
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+
+def _pipeline(args, sources, partitioned=True):
+    """ executor of the feature pipeline. under --memory-budget the CSVs are read in
+    chunks and, unless partitioned is False, the events are partitioned when their parsed
+    size would exceed the budget. --compact-dtypes gives the stage results narrower dtypes """
+    paths = [getattr(args, source) for source in sources]
+    chunk_size = args.chunk_size
+    if chunk_size is None and args.memory_budget is not None:
+        chunk_size = min([size for size in [budget_chunk_size(path, args.memory_budget) for path in paths]
+                          if size is not None] or [None])
+    partitions = args.partitions
+    if partitions is None and partitioned:
+        partitions = budget_partitions(args.memory_budget, [getattr(args, source) for source in sources
+                                                            if source in ['chart', 'labs']])
+        if partitions:
+            print("the parsed events would exceed the memory budget, running {} partitions".format(partitions))
+    jobs = budget_jobs(args.jobs, args.memory_budget, paths, partitions)
+    pipe = Pipeline(build.stages(args.chart, args.labs, args.demographics, args.definitions,
+                                 k=args.k, how=args.how, chunksize=chunk_size, scale=args.threshold_scale,
+                                 partitions=partitions, partition_dir=args.partition_dir, n_jobs=jobs),
+                    args.cache_dir, boundary=data_utils.compact if args.compact_dtypes else None)
+    if jobs != parallel.resolve_jobs(args.jobs):
+        print("running {} jobs to stay within the memory budget".format(jobs))
+    return Executor(pipe, n_jobs=jobs)
+
+
+def _run(executor, targets):
+    try:
+        results = executor.run(targets)
+    except PipelineError as e:
+        print(str(e))
+        return None
+    print(format_report(executor.report))
+    return results
+
+
+def ingest(args):
+    """ parse the raw CSVs and memoize them in the stage cache """
+    sources = args.sources or sorted(SOURCES)
+    results = _run(_pipeline(args, sources, partitioned=False), [SOURCES[source][0] for source in sources])
+    if results is None:
+        return 1
+    for source in sources:
+        events = results[SOURCES[source][0]]
+        print("{}: {} rows, {} stays".format(source, len(events), events['icustay_id'].nunique()))
+    return 0
+
+
+def features(args):
+    """ select the feature blocks of one or all sources and write them to the features directory """
+    sources = sorted(SOURCES) if args.source == 'all' else [args.source]
+    targets = [SOURCES[source][1] for source in sources]
+    if args.source == 'all':
+        targets.append('combined')
+    results = _run(_pipeline(args, sources), targets)
+    if results is None:
+        return 1
+    _makedirs(args.features_dir)
+    build.write_selected(results, args.features_dir)
+    if args.store is not None:
+        build.write_store(results, args.store)
+    return 0
+
+
+def figures(args):
+    """ write the survivor / non-survivor density plot of every chart and lab feature """
+    from .visualizations import report
+    results = _run(_pipeline(args, ['chart', 'labs']), ['chart_variable', 'chart_stats', 'lab_outliers'])
+    if results is None:
+        return 1
+    frames = {'chart': results['chart_variable'], 'chart_constant': results['chart_stats'][1],
+              'labs': results['lab_outliers']}
+    report.render_report(frames, args.figures_dir or os.path.join(args.reports_dir, 'figures'), n_jobs=args.jobs,
+                         by_gender=not args.no_gender)
+    return 0
+
+
+def tensor(args):
+    """ write the hourly stay x channel x hour tensor of the chart and lab events """
+    from .features import tensor as hourly
+    results = _run(_pipeline(args, ['chart', 'labs'], partitioned=False), ['chart_events', 'lab_events'])
+    if results is None:
+        return 1
+    hourly.build_tensor({'chart': results['chart_events'], 'labs': results['lab_events']}, args.tensor_dir,
+                        n_hours=args.hours, aggregator=args.aggregator)
+    return 0
+
+
+def stability(args):
+    """ bootstrap selection frequencies and rank intervals of every encoded feature """
+    from .features import stability as bootstrap
+    results = _run(_pipeline(args, sorted(SOURCES)), build.ENCODED)
+    if results is None:
+        return 1
+    report, resamples = telemetry.measure(
+        'stability', bootstrap.stability_selection, build.scored_blocks(results, args.threshold_scale),
+        n_resamples=args.resamples, k=args.k, alpha=args.alpha, time_budget=args.time_budget, n_jobs=args.jobs,
+        seed=args.seed)
+    output = args.output or os.path.join(args.reports_dir, 'stability.csv')
+    _makedirs(os.path.dirname(os.path.abspath(output)))
+    report.to_csv(output)
+    print(report.head(args.k)[['block', 'chi2_frequency', 'chi2_rank_low', 'chi2_rank_high', 'mi_frequency']])
+    print("{} resamples written to {}".format(resamples, output))
+    return 0
+
+
+def read_blocks(features_dir):
+    """ the selected blocks, their scores and the outcomes written by the features command """
+    blocks = {}
+    scores = {}
+    for path in sorted(glob.glob(os.path.join(features_dir, '*Features.csv'))):
+        name = os.path.basename(path)[:-len('.csv')]
+        scores_path = os.path.join(features_dir, name + 'Scores.csv')
+        if os.path.exists(scores_path):
+            blocks[name] = pd.read_csv(path, index_col=0)
+            scores[name] = pd.read_csv(scores_path, index_col=0)
+    outcomes = pd.read_csv(os.path.join(features_dir, 'outcomes.csv'), index_col=0)
+    return blocks, scores, outcomes
+
+
+def read_design_matrix(args):
+    frame = pd.read_csv(os.path.join(args.features_dir, 'combined.csv'), index_col=0)
+    return frame.drop(combine.OUTCOME, axis=1), frame[combine.OUTCOME].astype(int)
+
+
+def select(args):
+    """ combine the global top k features into the design matrix combined.csv """
+    if args.store is not None:
+        X, y = combine.combine_from_store(args.store, k=args.k, how=args.how)
+    else:
+        blocks, scores, outcomes = read_blocks(args.features_dir)
+        X, y = combine.combine_blocks(blocks, scores, outcomes, k=args.k, how=args.how, order='p_value')
+    _makedirs(args.features_dir)
+    X.join(y).to_csv(os.path.join(args.features_dir, 'combined.csv'))
+    print("{} stays x {} features".format(*X.shape))
+    return 0
+
+
+def fit_spec(args, X):
+    """ preprocessing spec of the columns of the design matrix, fitted on the raw CSVs, so
+    the stored models can score new stays (see models/scoring.py) """
+    import yaml
+    features = list(X.columns)
+    # THE BLOCK OF EVERY FEATURE, THE FIRST BY NAME THAT SCORED IT AS combine_blocks TAKES IT
+    blocks = {}
+    for path in sorted(glob.glob(os.path.join(args.features_dir, '*FeaturesScores.csv'))):
+        block = os.path.basename(path)[:-len('Scores.csv')]
+        for feature in pd.read_csv(path, index_col=0).index:
+            blocks.setdefault(feature, block)
+    modules = dict((feature, feature_store.BLOCK_SOURCES.get(block)) for feature, block in blocks.items())
+    with open(args.definitions, 'r') as f:
+        hcup_definitions = yaml.safe_load(f)
+    definitions = preprocessing.pipeline_definitions(features, hcup_definitions, modules)
+
+    # THE BOUNDS COME FROM EVERY STAY AND THE QUARTILE EDGES OF A CHART OR LAB STATISTIC
+    # FROM THE STAYS OF ITS BLOCK, AS IN THE PIPELINE, SO THE STAYS OF combined.csv ARE
+    # ENCODED AS THEY ARE THERE
+    block_stays = {}
+    edge_stays = {}
+    for feature, (base, _) in preprocessing.feature_columns(features, definitions).items():
+        if feature in blocks and definitions[base]['source'] in ('chart', 'lab'):
+            if blocks[feature] not in block_stays:
+                path = os.path.join(args.features_dir, blocks[feature] + '.csv')
+                block_stays[blocks[feature]] = pd.read_csv(path, usecols=[0]).iloc[:, 0].values
+            edge_stays[base] = block_stays[blocks[feature]]
+
+    needed = set(d['source'] for d in definitions.values())
+    events = pd.read_csv(args.chart, parse_dates=['charttime']) if 'chart' in needed else None
+    labs = pd.read_csv(args.labs, parse_dates=['charttime']) if 'lab' in needed else None
+    demographics = pd.read_csv(args.demographics) if needed & set(['demographics', 'diagnoses']) else None
+    return preprocessing.fit_preprocessing(features, definitions, events, labs, demographics, edge_stays=edge_stays)
+
+
+def train(args):
+    """ search the candidate classifiers and store the optimized ones, with the preprocessing
+    of their features, as new model versions """
+    from .models import search
+    X, y = read_design_matrix(args)
+    spec = telemetry.measure('fit_preprocessing', fit_spec, args, X)
+    cv_results, test_results, optimized_clfs = telemetry.measure(
+        'train', search.search_classifiers, X, y, names=args.classifiers, n_jobs=args.jobs)
+    _makedirs(args.reports_dir)
+    cv_results.to_csv(os.path.join(args.reports_dir, 'cv_results.csv'), index=False)
+    test_results.to_csv(os.path.join(args.reports_dir, 'test_results.csv'), index=False)
+    artifacts.save_optimized_clfs(args.models_dir, optimized_clfs, data_hash=artifacts.hash_data(X, y),
+                                  preprocessing=spec)
+    return 0
+
+
+def update(args):
+    """ continue the checkpoint of an online classifier on the stays new in the feature store """
+    from .models import incremental
+    telemetry.measure('update', incremental.update_model, args.store, args.models_dir, args.name, k=args.k,
+                      batch_size=args.batch_size, epochs=args.epochs, refit=args.refit, seed=args.seed)
+    return 0
+
+
+def evaluate(args):
+    """ cv and test predictions of the stored models, summarized per model """
+    from .models import evaluation
+    X, y = read_design_matrix(args)
+    names = args.names or artifacts.list_models(args.models_dir)
+    models = {}
+    for name in names:
+        clf, metadata = artifacts.load_model(args.models_dir, name, mmap=False)
+        models[name] = {'CLF': clf, 'FEATURES': metadata['features']}
+    predictions = telemetry.measure('evaluate', evaluation.collect_predictions, models, X, y, n_jobs=args.jobs)
+    _makedirs(args.reports_dir)
+    evaluation.save_predictions(predictions, os.path.join(args.reports_dir, 'predictions.csv'))
+    summary = evaluation.summarize(evaluation.score_table(predictions))
+    summary.to_csv(os.path.join(args.reports_dir, 'evaluation.csv'))
+    print(summary)
+    return 0
+
+
+def split_by_stay(frame, stays, batch):
+    """ the rows of a frame for each batch of batch consecutive stays, found in one pass """
+    batch_of = stays.get_indexer(frame['icustay_id'].values) // batch
+    positions = pd.Series(np.arange(len(frame))).groupby(batch_of).indices
+    empty = np.array([], dtype=np.intp)
+    return [frame.iloc[positions.get(b, empty)] for b in range(int(math.ceil(len(stays) / float(batch))))]
+
+
+def score(args):
+    """ risk scores of the stays in raw first 24h CSVs, in batches of --chunk-size stays.
+
+    the CSVs are read whole and split by stay once, each batch aggregates only the events
+    of its own stays.
+    """
+    from .models import scoring
+    events = pd.read_csv(args.chart, parse_dates=['charttime'])
+    labs = pd.read_csv(args.labs, parse_dates=['charttime'])
+    demographics = pd.read_csv(args.demographics)
+    model = scoring.load_scorer(args.models_dir, args.name, args.version)
+    stays = pd.Index(demographics['icustay_id'].unique())
+    batch = max(1, args.chunk_size or len(stays))
+    batches = zip(*[split_by_stay(frame, stays, batch) for frame in [events, labs, demographics]])
+    del events, labs
+    scores = pd.concat([telemetry.measure('score', scoring.score_stays, batch_events, batch_labs, batch_demographics,
+                                          model=model, stays=stays[b * batch:(b + 1) * batch])
+                        for b, (batch_events, batch_labs, batch_demographics) in enumerate(batches)])
+    output = args.output or os.path.join(args.reports_dir, '{}_scores.csv'.format(args.name))
+    _makedirs(os.path.dirname(os.path.abspath(output)))
+    scores.to_csv(output)
+    print("scored {} stays to {}".format(len(scores), output))
+    return 0
+
+
+def synthesize(args):
+    """ write a synthetic MIMIC-shaped extract under --data-dir """
+    from .data import synthetic
+    # THE DEFINITIONS ARE COPIED INTO --data-dir, TAKE THEM FROM DATA_DIR UNTIL THEY ARE THERE
+    definitions = args.definitions if os.path.exists(args.definitions) else HCUP_DEFINITIONS
+    synthetic.write_synthetic(args.data_dir, args.stays, seed=args.seed, mortality_rate=args.mortality_rate,
+                              definitions_path=definitions)
+    return 0
+
+
+def run_benchmark(args):
+    """ time and memory profile the feature stages on synthetic data, exit 1 on a regression """
+    from . import benchmark
+    calibration = benchmark.calibrate()
+    definitions = args.definitions if os.path.exists(args.definitions) else HCUP_DEFINITIONS
+    results = benchmark.run_benchmark(args.scales, os.path.join(args.data_dir, 'synthetic'), seed=args.seed,
+                                      trace_memory=not args.no_trace_memory, definitions_path=definitions)
+    print(benchmark.format_results(results))
+    if args.output is not None:
+        telemetry.write_report(results, args.output)
+    if args.baseline is None:
+        return 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        benchmark.save_baseline(results, args.baseline, calibration)
+        print("baseline written to {}".format(args.baseline))
+        return 0
+    baseline, baseline_calibration = benchmark.load_baseline(args.baseline)
+    regressions = benchmark.compare(results, calibration, baseline, baseline_calibration,
+                                    time_tolerance=args.time_tolerance, memory_tolerance=args.memory_tolerance)
+    if len(regressions):
+        print("regressions against {}:".format(args.baseline))
+        print(regressions.to_string(index=False))
+        return 1
+    print("no regressions against {}".format(args.baseline))
+    return 0
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--data-dir', default=DATA_DIR, help="data directory the default paths are taken from")
+    common.add_argument('--jobs', type=int, default=-1, help="worker processes, -1 for one per core")
+    common.add_argument('--cache-dir', default=None, help="stage cache, defaults to data/interim/pipeline")
+    common.add_argument('--chunk-size', type=int, default=None,
+                        help="CSV rows read at a time, or stays scored per batch by score")
+    common.add_argument('--memory-budget', type=parse_size, default=None,
+                        help="e.g. 8G, limits the worker count and the CSV chunk size and partitions events "
+                             "that would not fit")
+    common.add_argument('--compact-dtypes', action='store_true',
+                        help="narrow the dtypes of every stage result, see utils/data_utils.py, float32 "
+                             "measurements can change the selected features")
+    common.add_argument('--profile', nargs='?', const='icu-mortality.prof', default=None,
+                        help="profile the command with cProfile and write the stats to this file")
+    common.add_argument('--telemetry', default=None,
+                        help="write the time, memory and shapes of every stage to this .json or .csv file")
+    common.add_argument('--profile-stages', default=None, help="write a cProfile dump of every stage to this directory")
+    common.add_argument('--no-trace-memory', action='store_true',
+                        help="leave peak memory out of the telemetry, tracing allocations slows pandas down")
+    common.add_argument('--chart', default=None, help="chart events CSV")
+    common.add_argument('--labs', default=None, help="lab events CSV")
+    common.add_argument('--demographics', default=None, help="PTNT_DEMOG CSV")
+    common.add_argument('--definitions', default=None, help="hcup_ccs_2015_definitions.yaml")
+    common.add_argument('--features-dir', default=None)
+    common.add_argument('--models-dir', default=None, help="model artifact store, default models/store, or "
+                                                           "models/store under --data-dir when it is given")
+    common.add_argument('--reports-dir', default=None, help="default reports, or reports under --data-dir")
+    common.add_argument('--k', type=int, default=20, help="features kept in the design matrix")
+    common.add_argument('--how', choices=['inner', 'outer'], default='inner', help="stays kept when combining")
+    common.add_argument('--threshold-scale', type=float, default=1.,
+                        help="factor on the per label sample thresholds, stays / 60000 for smaller extracts")
+    common.add_argument('--partitions', type=int, default=None,
+                        help="split the chart and lab events into this many partitions of whole stays")
+    common.add_argument('--partition-dir', default=None, help="defaults to data/interim/partitions")
+
+    parser = argparse.ArgumentParser(prog='icu-mortality', description="ICU mortality prediction from MIMIC-III")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    sub = commands.add_parser('ingest', parents=[common], help=ingest.__doc__)
+    sub.add_argument('sources', nargs='*', choices=sorted(SOURCES))
+    sub.set_defaults(func=ingest)
+    sub = commands.add_parser('features', parents=[common], help=features.__doc__)
+    sub.add_argument('source', choices=sorted(SOURCES) + ['all'])
+    sub.add_argument('--store', default=None, help="also add the selected blocks to this feature store")
+    sub.set_defaults(func=features)
+    sub = commands.add_parser('figures', parents=[common], help=figures.__doc__)
+    sub.add_argument('--figures-dir', default=None, help="default reports/figures")
+    sub.add_argument('--no-gender', action='store_true', help="leave out the plots per gender")
+    sub.set_defaults(func=figures)
+    sub = commands.add_parser('tensor', parents=[common], help=tensor.__doc__)
+    sub.add_argument('--tensor-dir', default=None, help="default data/interim/tensor")
+    sub.add_argument('--aggregator', choices=['last', 'mean', 'max'], default='last',
+                     help="value of an hour with several samples")
+    sub.add_argument('--hours', type=int, default=24)
+    sub.set_defaults(func=tensor)
+    sub = commands.add_parser('stability', parents=[common], help=stability.__doc__)
+    sub.add_argument('--resamples', type=int, default=200, help="bootstrap resamples of the stays")
+    sub.add_argument('--time-budget', type=float, default=None, help="wall clock seconds for the resamples")
+    sub.add_argument('--alpha', type=float, default=.001, help="chi2 p-value a selected feature stays below")
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--output', default=None, help="report CSV, default reports/stability.csv")
+    sub.set_defaults(func=stability)
+    sub = commands.add_parser('select', parents=[common], help=select.__doc__)
+    sub.add_argument('--store', default=None, help="take the features from this feature store instead")
+    sub.set_defaults(func=select)
+    sub = commands.add_parser('train', parents=[common], help=train.__doc__)
+    sub.add_argument('--classifiers', nargs='+', default=None, help="candidates to search, default all")
+    sub.set_defaults(func=train)
+    sub = commands.add_parser('update', parents=[common], help=update.__doc__)
+    sub.add_argument('--store', required=True, help="feature store the stays are read from")
+    sub.add_argument('--name', default='SGD_hinge', help="online candidate, SGD_hinge or SGD_log")
+    sub.add_argument('--batch-size', type=int, default=1000, help="stays per partial_fit")
+    sub.add_argument('--epochs', type=int, default=1, help="passes over the new stays")
+    sub.add_argument('--refit', action='store_true', help="train from scratch on every stay in the store")
+    sub.add_argument('--seed', type=int, default=42)
+    sub.set_defaults(func=update)
+    sub = commands.add_parser('evaluate', parents=[common], help=evaluate.__doc__)
+    sub.add_argument('--names', nargs='+', default=None, help="stored models, default all")
+    sub.set_defaults(func=evaluate)
+    sub = commands.add_parser('score', parents=[common], help=score.__doc__)
+    sub.add_argument('--name', required=True, help="stored model")
+    sub.add_argument('--version', default=None)
+    sub.add_argument('--output', default=None, help="scores CSV, default reports/<name>_scores.csv")
+    sub.set_defaults(func=score)
+    sub = commands.add_parser('synthesize', parents=[common], help=synthesize.__doc__)
+    sub.add_argument('--stays', type=int, required=True, help="ICU stays to generate")
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--mortality-rate', type=float, default=.11)
+    sub.set_defaults(func=synthesize)
+    sub = commands.add_parser('benchmark', parents=[common], help=run_benchmark.__doc__)
+    sub.add_argument('--scales', type=int, nargs='+', default=[1000, 10000], help="ICU stays per run")
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--baseline', nargs='?', const=BENCHMARK_BASELINE, default=None,
+                     help="baseline JSON, written by the first run, without a path benchmarks/baseline.json")
+    sub.add_argument('--update-baseline', action='store_true', help="replace the baseline with this run")
+    sub.add_argument('--output', default=None, help="write the results to this .json or .csv file")
+    sub.add_argument('--time-tolerance', type=float, default=.5, help="allowed growth of the normalized wall time")
+    sub.add_argument('--memory-tolerance', type=float, default=.25, help="allowed growth of the peak memory")
+    sub.set_defaults(func=run_benchmark)
+    return parser
+
+
+def run_command(args):
+    if args.profile is None:
+        return args.func(args)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(args.func, args)
+    finally:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        print("profile written to {}".format(args.profile))
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = resolve_paths(parser.parse_args(argv))
+    if args.profile is not None and args.profile_stages is not None:
+        # ONLY ONE cProfile PROFILER CAN BE ACTIVE AT A TIME
+        parser.error("--profile and --profile-stages cannot be combined")
+    if args.command == 'benchmark' and (args.telemetry is not None or args.profile_stages is not None):
+        parser.error("benchmark records its own telemetry, use --output instead of --telemetry")
+    if args.command in ['ingest', 'tensor'] and args.partitions:
+        # BOTH WORK ON THE PARSED EVENTS, WHICH PARTITIONED RUNS NEVER HOLD WHOLE
+        parser.error("{} parses the events whole, --partitions only applies to the feature commands".format(
+            args.command))
+    if args.partitions is not None and args.partitions < 1:
+        parser.error("--partitions must be at least 1")
+    if args.telemetry is None and args.profile_stages is None:
+        return run_command(args)
+    telemetry.enable(trace_memory=not args.no_trace_memory, profile_dir=args.profile_stages)
+    try:
+        return run_command(args)
+    finally:
+        frame = telemetry.disable().frame()
+        print(telemetry.format_report(frame))
+        if args.telemetry is not None:
+            telemetry.write_report(frame, args.telemetry)
+            print("telemetry written to {}".format(args.telemetry))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+""" versioned store for fitted models, replacing the Optimized_Classifiers.txt pickle.
+
+each model version gets its own directory,
+
+    <root>/<model name>/v0001/metadata.json
+                             /<attribute>.npy
+                             /residual.pkl
+
+metadata.json holds the classifier class and parameters, its small fitted attributes,
+the feature list, bin edges and preprocessing spec, the hash of the data it was trained
+on and its scores.
+numeric arrays (coefficients, support vectors, the KNN training set, ...) are written
+as separate .npy files and opened with mmap when the model is loaded. the few fitted
+attributes that are neither JSON nor numeric arrays (a decision tree's tree_, an
+MLP's optimizer state) go to residual.pkl. loading one model reads only its own
+directory, and load_metadata reads only the JSON.
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import importlib
+import numpy as np
+
+
+METADATA_FILE = 'metadata.json'
+RESIDUAL_FILE = 'residual.pkl'
+FORMAT_VERSION = 1
+
+# FITTED ATTRIBUTES THAT ARE CHEAPER TO REBUILD THAN TO STORE, THEY HOLD A SECOND COPY
+# OF THE TRAINING DATA
+_REBUILT = ['_tree']
+
+
+def _to_json(obj):
+    """ convert obj to JSON types, tagging tuples and dicts with non string keys """
+    if isinstance(obj, (np.integer, np.floating, np.bool_)):
+        return obj.item()
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, tuple):
+        return {'__tuple__': [_to_json(x) for x in obj]}
+    if isinstance(obj, list):
+        return [_to_json(x) for x in obj]
+    if isinstance(obj, dict):
+        if all(isinstance(key, str) for key in obj):
+            return dict((key, _to_json(val)) for key, val in obj.items())
+        return {'__items__': [[_to_json(key), _to_json(val)] for key, val in obj.items()]}
+    raise TypeError("{} is not JSON serializable".format(type(obj).__name__))
+
+
+def _from_json(obj):
+    """ inverse of _to_json """
+    if isinstance(obj, list):
+        return [_from_json(x) for x in obj]
+    if isinstance(obj, dict):
+        if '__tuple__' in obj:
+            return tuple(_from_json(x) for x in obj['__tuple__'])
+        if '__items__' in obj:
+            return dict((_from_json(key), _from_json(val)) for key, val in obj['__items__'])
+        return dict((key, _from_json(val)) for key, val in obj.items())
+    return obj
+
+
+def _is_numeric_array(obj):
+    return isinstance(obj, np.ndarray) and obj.dtype.kind in 'biuf'
+
+
+def hash_data(X, y=None):
+    """ sha256 of the column names and values of the training data """
+    digest = hashlib.sha256()
+    if hasattr(X, 'columns'):
+        digest.update(json.dumps([str(col) for col in X.columns]).encode('utf-8'))
+    digest.update(np.ascontiguousarray(np.asarray(X, dtype=float)).tobytes())
+    if y is not None:
+        digest.update(np.ascontiguousarray(np.asarray(y, dtype=float)).tobytes())
+    return digest.hexdigest()
+
+
+def list_models(root):
+    """ names of the models in the store """
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+
+
+def list_versions(root, name):
+    """ versions of a model, oldest first """
+    model_dir = os.path.join(root, name)
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(v for v in os.listdir(model_dir)
+                  if v.startswith('v') and os.path.isfile(os.path.join(model_dir, v, METADATA_FILE)))
+
+
+def _version_dir(root, name, version=None):
+    versions = list_versions(root, name)
+    if not versions:
+        raise KeyError("no versions of model {} in {}".format(name, root))
+    if version is None:
+        version = versions[-1]
+    elif isinstance(version, int):
+        version = 'v{:04d}'.format(version)
+    if version not in versions:
+        raise KeyError("model {} has no version {}".format(name, version))
+    return os.path.join(root, name, version)
+
+
+def save_model(root, name, clf, features, bin_edges=None, data_hash=None, params=None,
+               scores=None, extra=None, preprocessing=None):
+    """ write a fitted classifier as a new version of the named model.
+
+    :param root: store directory
+    :param name: model name, e.g. 'LSVC_recall'
+    :param clf: fitted classifier
+    :param features: feature columns the classifier was trained on, in order, None when
+                     only the feature count in params is known
+    :param bin_edges: dict of column -> quartile edges used to categorize the inputs
+    :param data_hash: hash_data of the training data
+    :param params: training settings such as the feature count and test size
+    :param scores: dict of scores, or the text classification report of old models
+    :param extra: any other JSON serializable metadata
+    :param preprocessing: spec from features.preprocessing.fit_preprocessing, its quartile
+                          edges are used as bin_edges when those are not given
+    :return: path of the new version directory
+    """
+    if preprocessing is not None and bin_edges is None:
+        bin_edges = dict((base, d['edges']) for base, d in preprocessing['definitions'].items()
+                         if d.get('encoding') == 'quartiles')
+    versions = list_versions(root, name)
+    number = int(versions[-1][1:]) + 1 if versions else 1
+    version = 'v{:04d}'.format(number)
+    version_dir = os.path.join(root, name, version)
+    os.makedirs(version_dir)
+
+    state = {}
+    arrays = {}
+    array_lists = {}
+    residual = {}
+    for attr, val in vars(clf).items():
+        if attr in _REBUILT:
+            continue
+        if _is_numeric_array(val):
+            arrays[attr] = attr + '.npy'
+            np.save(os.path.join(version_dir, arrays[attr]), val)
+        elif isinstance(val, list) and val and all(_is_numeric_array(x) for x in val):
+            array_lists[attr] = len(val)
+            for i, x in enumerate(val):
+                np.save(os.path.join(version_dir, '{}.{}.npy'.format(attr, i)), x)
+        else:
+            try:
+                state[attr] = _to_json(val)
+            except TypeError:
+                residual[attr] = val
+    if residual:
+        with open(os.path.join(version_dir, RESIDUAL_FILE), 'wb') as f:
+            pickle.dump(residual, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    cls = type(clf)
+    metadata = {'format': FORMAT_VERSION,
+                'name': name,
+                'version': version,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'class': cls.__module__ + '.' + cls.__name__,
+                'params': _to_json(clf.get_params()),
+                'state': state,
+                'arrays': arrays,
+                'array_lists': array_lists,
+                'residual': RESIDUAL_FILE if residual else None,
+                'features': None if features is None else list(features),
+                'bin_edges': _to_json(bin_edges),
+                'data_hash': data_hash,
+                'train_params': _to_json(params),
+                'scores': _to_json(scores),
+                'extra': _to_json(extra),
+                'preprocessing': _to_json(preprocessing)}
+    with open(os.path.join(version_dir, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2, sort_keys=True)
+    print("saved {} {}".format(name, version))
+    return version_dir
+
+
+def load_metadata(root, name, version=None):
+    """ read the metadata of a model version (the latest by default) without its arrays """
+    with open(os.path.join(_version_dir(root, name, version), METADATA_FILE)) as f:
+        metadata = json.load(f)
+    # VERSIONS SAVED BEFORE THE PREPROCESSING SPEC WAS ADDED HAVE NO 'preprocessing' KEY
+    for key in ['params', 'state', 'bin_edges', 'train_params', 'scores', 'extra', 'preprocessing']:
+        metadata[key] = _from_json(metadata.get(key))
+    return metadata
+
+
+def load_model(root, name, version=None, mmap=True):
+    """ rebuild a fitted classifier from its version directory.
+
+    :param mmap: open the arrays read-only with mmap instead of reading them into memory
+    :return: classifier, metadata
+    """
+    version_dir = _version_dir(root, name, version)
+    metadata = load_metadata(root, name, version)
+    module, cls_name = metadata['class'].rsplit('.', 1)
+    clf = getattr(importlib.import_module(module), cls_name)(**metadata['params'])
+
+    mmap_mode = 'r' if mmap else None
+    for attr, val in metadata['state'].items():
+        setattr(clf, attr, val)
+    for attr, filename in metadata['arrays'].items():
+        setattr(clf, attr, np.load(os.path.join(version_dir, filename), mmap_mode=mmap_mode))
+    for attr, length in metadata['array_lists'].items():
+        setattr(clf, attr, [np.load(os.path.join(version_dir, '{}.{}.npy'.format(attr, i)),
+                                    mmap_mode=mmap_mode) for i in range(length)])
+    if metadata['residual']:
+        with open(os.path.join(version_dir, metadata['residual']), 'rb') as f:
+            for attr, val in pickle.load(f).items():
+                setattr(clf, attr, val)
+    _rebuild(clf)
+    return clf, metadata
+
+
+def _rebuild(clf):
+    """ recreate the attributes in _REBUILT that save_model left out """
+    fit_method = getattr(clf, '_fit_method', None)
+    if fit_method in ('kd_tree', 'ball_tree'):
+        from sklearn.neighbors import KDTree, BallTree
+        tree_class = KDTree if fit_method == 'kd_tree' else BallTree
+        clf._tree = tree_class(np.asarray(clf._fit_X), clf.leaf_size,
+                               metric=clf.effective_metric_, **(clf.effective_metric_params_ or {}))
+    elif fit_method is not None:
+        clf._tree = None
+
+
+def save_optimized_clfs(root, optimized_clfs, data_hash=None, bin_edges=None, preprocessing=None):
+    """ store every entry of an optimized_clfs dict ('CLF', 'PARAMS', 'SCORES' and
+    optionally 'FEATURES') as a new version of the model with the same name """
+    paths = {}
+    for name, entry in optimized_clfs.items():
+        paths[name] = save_model(root, name, entry['CLF'], entry.get('FEATURES'), bin_edges=bin_edges,
+                                 data_hash=data_hash, params=entry['PARAMS'], scores=entry.get('SCORES'),
+                                 preprocessing=preprocessing)
+    return paths
+
+
+def import_pickle(pickle_path, root):
+    """ convert the python 2 Optimized_Classifiers.txt pickle into the artifact store.
+
+    the estimators in it were fitted with an old scikit-learn, so they only load where
+    a compatible version is installed. the text classification reports are kept as the
+    scores.
+    """
+    with open(pickle_path, 'rb') as f:
+        optimized_clfs = pickle.load(f, encoding='latin1')
+    return save_optimized_clfs(root, optimized_clfs)
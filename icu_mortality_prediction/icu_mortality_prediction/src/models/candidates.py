@@ -0,0 +1,90 @@
+""" candidate classifiers and the parameter spaces they are optimized over.
+
+the grids are the ones used in ICU_MORTALITY_FIRST24.ipynb.
+"""
+from sklearn import svm
+from sklearn.linear_model import SGDClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.neighbors import KNeighborsClassifier
+
+
+# NEAREST NEIGHBOR CLASSIFIER PARAMETERS
+KNEIGHBORS_PARAMS = {'n_neighbors': [2, 4, 6, 8, 10, 12],
+                     'weights': ['uniform', 'distance'],
+                     'algorithm': ['auto', 'ball_tree', 'kd_tree', 'brute'],
+                     }
+
+# LINEARSVC CLASSIFIER PARAMETERS
+LSVC_PARAMS = {'C': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1],
+               'class_weight': [{1: 3, 0: 1}, {1: 3.5, 0: 1}, {1: 4, 0: 1},
+                                {1: 4.5, 0: 1}, {1: 5, 0: 1}, {1: 5.5, 0: 1}, {1: 6, 0: 1}],
+               'loss': ['hinge', 'squared_hinge']
+               }
+
+# SVC CLASSIFIER PARAMETERS
+SVC_PARAMS = {'C': [0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1],
+              'class_weight': [{1: 3, 0: 1}, {1: 4, 0: 1}, {1: 5, 0: 1}],
+              'kernel': ['rbf', 'sigmoid', 'poly'],
+              'degree': [2, 3, 4],
+              'decision_function_shape': ['ovr', 'ovo']
+              }
+
+MLP_PARAMS = {'activation': ['identity', 'logistic', 'tanh', 'relu'],
+              'solver': ['lbfgs', 'sgd', 'adam']
+              }
+
+TREE_PARAMS = {'class_weight': [{1: 1, 0: 1}, {1: 2, 0: 1}, {1: 2.5, 0: 1},
+                                {1: 3, 0: 1}, {1: 3.5, 0: 1}, {1: 4, 0: 1},
+                                {1: 4.5, 0: 1}, {1: 5, 0: 1}, {1: 5.5, 0: 1}, {1: 6, 0: 1}],
+               'criterion': ['gini', 'entropy']
+               }
+
+# NAME -> (CLASSIFIER CLASS, FIXED SETTINGS, PARAMETER GRID)
+CANDIDATES = {'Kneighbors': (KNeighborsClassifier, {}, KNEIGHBORS_PARAMS),
+              'LSVC': (svm.LinearSVC, {'random_state': 42}, LSVC_PARAMS),
+              'SVC': (svm.SVC, {'random_state': 42}, SVC_PARAMS),
+              'MLP': (MLPClassifier, {'random_state': 42}, MLP_PARAMS),
+              'Tree': (DecisionTreeClassifier, {'random_state': 42}, TREE_PARAMS)
+              }
+
+
+# LINEAR CANDIDATES THAT LEARN WITH partial_fit, SEE incremental.py. THE HINGE LOSS IS
+# THE LINEAR SVM OF LinearSVC, LOG LOSS A LOGISTIC REGRESSION. NOT SEARCHED BY search.py
+ONLINE = {'SGD_hinge': (SGDClassifier, {'loss': 'hinge', 'alpha': 1e-4, 'class_weight': {1: 4, 0: 1},
+                                        'random_state': 42}),
+          'SGD_log': (SGDClassifier, {'loss': 'log_loss', 'alpha': 1e-4, 'class_weight': {1: 4, 0: 1},
+                                      'random_state': 42})
+          }
+
+
+def make_online(name, **params):
+    """ create an unfitted online candidate, params override its settings in ONLINE """
+    clf_class, settings = ONLINE[name]
+    settings = dict(settings)
+    settings.update(params)
+    return clf_class(**settings)
+
+
+def make_classifier(name, num_feats=None, **params):
+    """ create an unfitted candidate classifier.
+
+    the MLP hidden layers are sized to the number of input features, (num_feats, num_feats/2),
+    as in the notebook.
+
+    :param name: key in CANDIDATES
+    :param num_feats: number of input features
+    :param params: parameters overriding the fixed settings
+    :return: classifier
+    """
+    clf_class, settings, _ = CANDIDATES[name]
+    settings = dict(settings)
+    if name == 'MLP' and num_feats is not None:
+        settings['hidden_layer_sizes'] = (num_feats, max(1, num_feats // 2))
+    settings.update(params)
+    return clf_class(**settings)
+
+
+def param_grid(name):
+    """ return the parameter grid searched for the named candidate """
+    return CANDIDATES[name][2]
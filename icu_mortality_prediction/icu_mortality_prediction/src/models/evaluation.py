@@ -0,0 +1,219 @@
+""" evaluation tables computed from cached predictions.
+
+the notebook builds its score tables by splitting metrics.classification_report text
+and refits a classifier for every cross_val_score call and every metric. here each
+model is fitted once per cv fold and once on the training split, the predicted labels
+and decision scores are kept in a tidy predictions frame, and every table (metrics,
+confusion matrices, per class reports, cv summaries) is derived from that frame
+without refitting. a new metric is a function of the cached arrays.
+
+the predictions frame has one row per (model, split, fold, stay),
+
+    model  split  fold  stay  y_true  y_pred  score
+
+split is 'cv' for the held out part of a cv fold of the training split and 'test' for
+the test split, whose fold is -1. score is the probability of death when the model has
+one and its decision function otherwise.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+
+from . import metrics
+from . import scoring
+from . import search
+from ..utils import parallel
+
+
+COLUMNS = ['model', 'split', 'fold', 'stay', 'y_true', 'y_pred', 'score']
+
+
+def model_columns(entry, columns):
+    """ classifier and feature columns of a models entry """
+    if isinstance(entry, dict):
+        clf = entry['CLF']
+        if entry.get('FEATURES') is not None:
+            return clf, list(entry['FEATURES'])
+        return clf, columns[:entry['PARAMS']['features']]
+    return entry, columns
+
+
+def _predict_fold(task):
+    """ fit a clone of a classifier on one cv fold, or the training split when fold is -1 """
+    paths, name, clf, cols, fold = task
+    data = parallel.load_shared(paths)
+    X, y, folds = data['X_train'], data['y_train'], data['folds']
+    if fold < 0:
+        train = np.ones(len(y), dtype=bool)
+        X_eval, rows = data['X_test'], np.arange(len(data['y_test']))
+        y_eval = data['y_test']
+    else:
+        train = folds != fold
+        rows = np.flatnonzero(~train)
+        X_eval, y_eval = X[rows], y[rows]
+    clf = clone(clf)
+    clf.fit(X[train][:, cols], y[train])
+    X_eval = X_eval[:, cols]
+    return {'model': name, 'split': 'test' if fold < 0 else 'cv', 'fold': fold, 'rows': rows,
+            'y_true': np.asarray(y_eval), 'y_pred': clf.predict(X_eval),
+            'score': scoring.risk_scores(clf, X_eval)}
+
+
+def collect_predictions(models, X, y, cv=5, test_size=0.30, random_state=42, n_jobs=1,
+                        scratch_dir=None):
+    """ fit every model once per cv fold and once on the training split and keep its outputs.
+
+    the split and folds are the ones used by search.search_classifiers.
+
+    :param models: dict of name -> classifier, or an optimized_clfs dict whose entries
+                   hold 'CLF' and 'FEATURES' or PARAMS['features']. classifiers are
+                   cloned, so fitted and unfitted ones both work
+    :param X: feature frame
+    :param y: outcomes
+    :return: predictions frame, see the module docstring
+    """
+    columns = list(X.columns)
+    index = np.asarray(X.index)
+    positions = np.arange(len(X))
+    # THE SAME SPLIT AS search.split_arrays, KEEPING THE ROW POSITIONS
+    X_train, X_test, y_train, y_test, train_pos, test_pos = train_test_split(
+        np.asarray(X, dtype=float), np.asarray(y).astype(int), positions,
+        test_size=test_size, random_state=random_state)
+    stays = {'cv': index[train_pos], 'test': index[test_pos]}
+
+    tasks = []
+    arrays = {'X_train': X_train, 'y_train': y_train, 'X_test': X_test, 'y_test': y_test,
+              'folds': search.cv_folds(y_train, cv)}
+    with parallel.shared_arrays(arrays, scratch_dir) as paths:
+        for name, entry in models.items():
+            clf, cols = model_columns(entry, columns)
+            col_idx = [columns.index(col) for col in cols]
+            tasks.extend((paths, name, clf, col_idx, fold) for fold in list(range(cv)) + [-1])
+        print("fitting {} folds".format(len(tasks)))
+        results = parallel.run_tasks(_predict_fold, tasks, n_jobs)
+
+    frames = []
+    for result in results:
+        frames.append(pd.DataFrame({'model': result['model'], 'split': result['split'],
+                                    'fold': result['fold'], 'stay': stays[result['split']][result['rows']],
+                                    'y_true': result['y_true'].astype(int),
+                                    'y_pred': np.asarray(result['y_pred']).astype(int),
+                                    'score': np.asarray(result['score'], dtype=float)},
+                                   columns=COLUMNS))
+    return pd.concat(frames, ignore_index=True)
+
+
+def save_predictions(predictions, path):
+    """ write a predictions frame as CSV """
+    predictions.to_csv(path, index=False)
+
+
+def load_predictions(path):
+    """ read a predictions frame written by save_predictions """
+    return pd.read_csv(path)
+
+
+def _groups(predictions, by):
+    by = list(by)
+    codes = predictions.groupby(by, sort=True).ngroup().values
+    keys = predictions[by].drop_duplicates().sort_values(by).reset_index(drop=True)
+    return codes, keys
+
+
+def confusion_table(predictions, by=('model', 'split', 'fold')):
+    """ tn, fp, fn and tp per group, counted in one pass over the cached labels """
+    codes, keys = _groups(predictions, by)
+    cells = codes * 4 + 2 * predictions['y_true'].values + predictions['y_pred'].values
+    counts = np.bincount(cells, minlength=4 * len(keys)).reshape(len(keys), 4)
+    for i, name in enumerate(['tn', 'fp', 'fn', 'tp']):
+        keys[name] = counts[:, i]
+    return keys
+
+
+def roc_auc(predictions, by=('model', 'split', 'fold')):
+    """ area under the ROC curve of the decision scores per group, from rank sums """
+    by = list(by)
+    ranks = predictions.groupby(by)['score'].rank()
+    frame = predictions[by].assign(pos_rank=ranks.where(predictions['y_true'] == 1, 0.0),
+                                   pos=predictions['y_true'] == 1, neg=predictions['y_true'] == 0)
+    sums = frame.groupby(by).sum()
+    n_pos, n_neg = sums['pos'].astype(float), sums['neg'].astype(float)
+    auc = (sums['pos_rank'] - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+    return auc.where((n_pos > 0) & (n_neg > 0)).rename('roc auc').reset_index()
+
+
+def score_table(predictions, by=('model', 'split', 'fold'), extra_metrics=None):
+    """ every metric in metrics.METRICS, the per class scores and the roc auc per group.
+
+    :param by: columns to group the predictions by
+    :param extra_metrics: dict of name -> function(y_true, y_pred, score) for metrics
+                          that are not built in, evaluated per group on the cached arrays
+    :return: one row per group with the confusion counts and scores
+    """
+    table = confusion_table(predictions, by)
+    scores = metrics.scores_from_counts(table['tn'].values, table['fp'].values,
+                                        table['fn'].values, table['tp'].values)
+    for name in sorted(scores):
+        table[name] = scores[name]
+    table = table.merge(roc_auc(predictions, by), on=list(by), how='left')
+    for name, func in (extra_metrics or {}).items():
+        values = predictions.groupby(list(by)).apply(
+            lambda g: func(g['y_true'].values, g['y_pred'].values, g['score'].values))
+        table = table.merge(values.rename(name).reset_index(), on=list(by), how='left')
+    return table
+
+
+def summarize(table, by=('model', 'split'), columns=None):
+    """ mean and standard deviation of the scores across folds, as cross_val_score gave them """
+    if columns is None:
+        columns = [col for col in table.columns if col not in ('fold', 'tn', 'fp', 'fn', 'tp')
+                   and col not in by]
+    return table.groupby(list(by))[columns].agg(['mean', 'std'])
+
+
+def confusion_matrices(predictions, by=('model', 'split')):
+    """ tidy confusion matrices, one row per (group, actual, predicted) cell """
+    table = confusion_table(predictions, by)
+    frames = []
+    for cell, (actual, predicted) in zip(['tn', 'fp', 'fn', 'tp'], [(0, 0), (0, 1), (1, 0), (1, 1)]):
+        frame = table[list(by)].copy()
+        frame['actual'] = metrics.CLASSES[actual]
+        frame['predicted'] = metrics.CLASSES[predicted]
+        frame['count'] = table[cell].values
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True).sort_values(list(by) + ['actual', 'predicted'],
+                                                            ascending=[True] * len(by) + [False, False],
+                                                            kind='mergesort').reset_index(drop=True)
+
+
+def classification_report_frame(predictions, by=('model', 'split')):
+    """ the numbers in metrics.classification_report as a frame.
+
+    :return: frame indexed by the group and 'Classes' (Survivors, Non-Survivors,
+             Avg/Total weighted by support) with precision, recall, f1-score and support
+    """
+    table = score_table(predictions, by)
+    support = [table['tn'] + table['fp'], table['fn'] + table['tp']]
+    rows = []
+    for i, cls in enumerate(metrics.CLASSES):
+        suffix = ' survivors' if i == 0 else ' non-survivors'
+        frame = table[list(by)].copy()
+        frame['Classes'] = cls
+        frame['precision'] = table['precision' + suffix]
+        frame['recall'] = table['recall' + suffix]
+        frame['f1-score'] = table['f1' + suffix]
+        frame['support'] = support[i]
+        rows.append(frame)
+    total = support[0] + support[1]
+    frame = table[list(by)].copy()
+    frame['Classes'] = 'Avg/Total'
+    for col in ['precision', 'recall', 'f1-score']:
+        frame[col] = (rows[0][col] * support[0] + rows[1][col] * support[1]) / total
+    frame['support'] = total
+    rows.append(frame)
+    order = dict((cls, i) for i, cls in enumerate(metrics.CLASSES + ['Avg/Total']))
+    report = pd.concat(rows, ignore_index=True)
+    report['order'] = report['Classes'].map(order)
+    report = report.sort_values(list(by) + ['order'], kind='mergesort').drop('order', axis=1)
+    return report.set_index(list(by) + ['Classes'])
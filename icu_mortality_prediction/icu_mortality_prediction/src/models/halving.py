@@ -0,0 +1,149 @@
+""" budgeted successive halving search.
+
+the exhaustive SVC grid is 432 parameter sets for every feature count from 8 to 20 and
+takes hours. successive halving evaluates every (feature count, parameters) candidate
+on a small subsample of the training stays, keeps the best 1/factor of them and repeats
+with factor times as many stays, ending on the full training set. a round that is not
+projected to finish inside the wall clock budget is skipped and the leader of the last
+completed round is kept.
+
+the folds and train/test split are the ones used by search.search_classifiers, so the
+final round scores can be compared directly with the exhaustive grid.
+"""
+import math
+import time
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import ParameterGrid
+
+from . import candidates
+from . import metrics
+from . import search
+from ..utils import parallel
+
+
+def resource_schedule(n_candidates, max_resources, min_resources=100, factor=3):
+    """ number of training stays used in each round, the last round using all of them.
+
+    there are enough rounds to halve the candidates down to one, limited by how many
+    times min_resources can be multiplied by factor before reaching max_resources.
+    """
+    min_resources = min(min_resources, max_resources)
+    n_rounds = min(int(math.ceil(math.log(max(n_candidates, 1), factor))) + 1,
+                   int(math.floor(math.log(max_resources / float(min_resources), factor))) + 1)
+    return [int(max_resources / factor ** (n_rounds - 1 - rnd)) for rnd in range(n_rounds)]
+
+
+def halving_search(X, y, name='SVC', feature_counts=None, scoring='recall', factor=3,
+                   min_resources=100, time_budget=None, cv=5, test_size=0.30,
+                   random_state=42, n_jobs=1, scratch_dir=None):
+    """ successive halving over the parameter grid and feature set sizes of one candidate.
+
+    the cost of the next round is projected from the last one, scaled by the number of
+    candidates and stays. the first round always runs.
+
+    :param X: feature frame with columns ranked best first
+    :param y: outcomes
+    :param name: candidate classifier, see candidates.CANDIDATES
+    :param feature_counts: numbers of leading columns to try, defaults to 8 .. all
+    :param scoring: cv metric candidates are ranked by
+    :param factor: 1/factor of the candidates survive each round
+    :param min_resources: training stays per fold in the first round
+    :param time_budget: wall clock seconds, None for no limit
+    :return: history frame with one row per fit and a 'round' column, and the best
+             candidate as an optimized_clfs entry with 'CLF', 'PARAMS', 'PARAMS_ID',
+             'FEATURES', 'SCORES' (test split), 'CV_SCORE', 'COMPLETE' and 'ELAPSED'
+    """
+    start = time.time()
+    columns = list(X.columns)
+    if feature_counts is None:
+        feature_counts = range(min(8, len(columns)), len(columns) + 1)
+
+    X_train, X_test, y_train, y_test = search.split_arrays(X, y, test_size, random_state)
+    folds = search.cv_folds(y_train, cv)
+    order = np.random.RandomState(random_state).permutation(len(y_train))
+    grid = list(ParameterGrid(candidates.param_grid(name)))
+    cands = [(num_feats, pid) for num_feats in feature_counts for pid in range(len(grid))]
+
+    max_resources = len(y_train) - np.bincount(folds).max()
+    schedule = resource_schedule(len(cands), max_resources, min_resources, factor)
+    n_workers = parallel.resolve_jobs(n_jobs)
+
+    history = []
+    last_round = None
+    complete = True
+    with parallel.shared_arrays({'X': X_train, 'y': y_train, 'folds': folds, 'order': order},
+                                scratch_dir) as paths:
+        for rnd, n_samples in enumerate(schedule):
+            if last_round is not None and time_budget is not None:
+                projected = (last_round['elapsed'] * len(cands) / float(last_round['candidates']) *
+                             n_samples / float(last_round['n_samples']))
+                if time.time() - start + projected > time_budget:
+                    print("stopping before round {}: {:.1f}s projected, budget {}s".format(
+                          rnd, projected, time_budget))
+                    complete = False
+                    break
+
+            print("round {}: {} candidates on {} stays".format(rnd, len(cands), n_samples))
+            round_start = time.time()
+            # THE LAST ROUND FITS ON THE FULL TRAINING FOLDS, LIKE THE EXHAUSTIVE GRID
+            n_used = None if rnd == len(schedule) - 1 else n_samples
+            tasks = [(paths, name, num_feats, pid, grid[pid], fold, n_used)
+                     for num_feats, pid in cands for fold in range(cv)]
+            results = pd.DataFrame(parallel.run_tasks(search._fit_fold, tasks, n_jobs,
+                                                      chunksize=max(1, len(tasks) // (4 * n_workers))))
+            results['round'] = rnd
+            history.append(results)
+            last_round = {'candidates': len(cands), 'n_samples': n_samples,
+                          'elapsed': time.time() - round_start}
+
+            # RANK BEST FIRST, TIES KEEP GRID ORDER
+            means = results.groupby(['features', 'params_id'])[scoring].mean()
+            ranked = list(means.sort_values(ascending=False, kind='mergesort').index)
+            keep = 1 if rnd == len(schedule) - 1 else int(math.ceil(len(ranked) / float(factor)))
+            cands = ranked[:keep]
+            cv_score = means.loc[cands[0]]
+
+        num_feats, pid = cands[0]
+        clf = search._fit_full((paths, name, num_feats, grid[pid]))
+
+    history = pd.concat(history, ignore_index=True)
+    history['params'] = [grid[pid] for pid in history['params_id']]
+    params = dict(grid[pid])
+    params['features'] = num_feats
+    best = {'CLF': clf, 'PARAMS': params, 'PARAMS_ID': pid, 'FEATURES': columns[:num_feats],
+            'SCORES': metrics.score_predictions(y_test, clf.predict(X_test[:, :num_feats])),
+            'CV_SCORE': cv_score, 'COMPLETE': complete, 'ELAPSED': time.time() - start}
+    print("best {} after {:.1f}s: {}".format(scoring, best['ELAPSED'], params))
+    return history, best
+
+
+def compare_to_exhaustive(history, best, cv_results, scoring='recall'):
+    """ report how close the halving search came to the exhaustive grid.
+
+    :param history: history frame from halving_search
+    :param best: best entry from halving_search
+    :param cv_results: cv_results of search.search_classifiers run on the same data with
+                       the same cv, test_size and random_state
+    :return: series with the best exhaustive cv score, the cv score of the halving pick
+             on the full training folds, the gap and ratio between them, the rank of the
+             pick in the exhaustive grid, and the fits, training rows and fit time used
+             by each search
+    """
+    name = history['classifier'].iloc[0]
+    exhaustive = cv_results[cv_results.classifier == name]
+    means = exhaustive.groupby(['features', 'params_id'])[scoring].mean()
+    pick = means.loc[(best['PARAMS']['features'], best['PARAMS_ID'])]
+    report = {'exhaustive_best': means.max(),
+              'halving_pick': pick,
+              'gap': means.max() - pick,
+              'ratio': pick / means.max() if means.max() else np.nan,
+              'rank': int((means > pick).sum()) + 1,
+              'candidates': len(means),
+              'halving_fits': len(history),
+              'exhaustive_fits': len(exhaustive),
+              'halving_rows': history['n_samples'].sum(),
+              'exhaustive_rows': exhaustive['n_samples'].sum(),
+              'halving_fit_time': history['fit_time'].sum(),
+              'exhaustive_fit_time': exhaustive['fit_time'].sum()}
+    return pd.Series(report, name=scoring)
@@ -0,0 +1,140 @@
+""" incremental training of the linear candidates from the feature store.
+
+search_classifiers refits every candidate on the whole design matrix, as the notebook
+refit on all_data. the online candidates (candidates.ONLINE, SGD with the hinge loss of
+LinearSVC or the logistic loss) learn with partial_fit instead. update_model continues
+the latest checkpoint of a model in the artifact store on the stays added to the
+feature store since that checkpoint, in shuffled mini-batches read from the store,
+and saves the result as a new version of the model.
+
+every stay is assigned to validation or training by a hash of its icustay_id (see
+utils/partition.py), so the validation stays are the same in every update and are never
+trained on. the validation scores of each update are saved with the checkpoint, with
+those of the updates before it.
+
+a checkpoint is continued only while the top k features of the store are the features
+it was trained on. when they change, or with refit=True, the model is trained again
+from scratch on every training stay.
+
+    clf, metadata = incremental.update_model('data/features/store', MODELS_DIR, 'SGD_hinge')
+"""
+import os
+import numpy as np
+
+from . import artifacts
+from . import candidates
+from . import metrics
+from ..features import combine
+from ..features import feature_store
+from ..utils import partition
+
+
+OUTCOME = 'hospital_expire_flag'
+
+# ONE STAY IN VALIDATION_PARTITIONS IS HELD OUT FOR VALIDATION
+VALIDATION_PARTITIONS = 10
+
+CLASSES = np.array([0, 1])
+
+
+def validation_mask(stays, n_partitions=VALIDATION_PARTITIONS):
+    """ True for the held out validation stays, the same stays in every run """
+    return partition.partition_of(stays, n_partitions) == 0
+
+
+def iter_batches(root, stays, features, batch_size=1000, rng=None, version=None):
+    """ (X, y) mini-batches of the stays from the store, shuffled when rng is given.
+
+    stays with a missing feature or outcome are left out, as combine_from_store's inner
+    join leaves them out. the stays of a batch are read in sorted order, so a batch
+    reads the store's memory mapped columns front to back.
+    """
+    stays = np.asarray(stays)
+    if rng is not None:
+        stays = stays[rng.permutation(len(stays))]
+    for start in range(0, len(stays), batch_size):
+        frame = feature_store.read_features(root, columns=[OUTCOME] + list(features),
+                                            stays=np.sort(stays[start:start + batch_size]), version=version)
+        frame = frame.dropna()
+        if len(frame):
+            yield frame[list(features)].values.astype(float), frame[OUTCOME].values.astype(int)
+
+
+def validation_scores(clf, root, stays, features, batch_size=1000, version=None):
+    """ metrics.score_predictions of the classifier on the stays, predicted batch by batch """
+    y_true = []
+    y_pred = []
+    for X, y in iter_batches(root, stays, features, batch_size, version=version):
+        y_true.append(y)
+        y_pred.append(clf.predict(X))
+    if not y_true:
+        return {}
+    return metrics.score_predictions(np.concatenate(y_true), np.concatenate(y_pred))
+
+
+def latest_checkpoint(models_root, name):
+    """ (classifier, metadata) of the latest version of a model, None when it has none """
+    if not artifacts.list_versions(models_root, name):
+        return None
+    # IN MEMORY, partial_fit UPDATES THE COEFFICIENTS IN PLACE
+    return artifacts.load_model(models_root, name, mmap=False)
+
+
+def update_model(store, models_root, name='SGD_hinge', k=20, batch_size=1000, epochs=1, refit=False, seed=42,
+                 **params):
+    """ train an online candidate on the stays the store gained since its last checkpoint.
+
+    :param store: feature store directory
+    :param models_root: artifact store, the model is checkpointed there under name
+    :param name: key in candidates.ONLINE
+    :param k: features, the top k of the store by p-value
+    :param epochs: passes over the new training stays
+    :param refit: train from scratch on every training stay even if the features are unchanged
+    :param params: settings of a new classifier, overriding those in candidates.ONLINE
+    :return: classifier and metadata of the new version, or of the latest checkpoint when
+             the store has no new training stays
+    """
+    if name not in candidates.ONLINE:
+        raise KeyError("{} is not an online candidate, expected one of {}".format(name, sorted(candidates.ONLINE)))
+    store_version = feature_store.read_schema(store)['version']
+    features = combine.top_store_features(store, k, store_version)
+    stays = feature_store.read_stays(store, store_version)
+    checkpoint = None if refit else latest_checkpoint(models_root, name)
+    if checkpoint is not None and checkpoint[1]['features'] != features:
+        print("the top {} features of the store changed, refitting {}".format(k, name))
+        checkpoint = None
+
+    history = []
+    if checkpoint is None:
+        clf = candidates.make_online(name, **params)
+        new_stays = stays
+        trained = 0
+    else:
+        clf, metadata = checkpoint
+        history = list(metadata['scores'].get('history', []))
+        trained = metadata['extra']['trained_stays']
+        new_stays = np.setdiff1d(stays, feature_store.read_stays(store, metadata['extra']['store_version']))
+    train_stays = new_stays[~validation_mask(new_stays)]
+    if checkpoint is not None and not len(train_stays):
+        print("no new training stays in {} since {}".format(store_version, checkpoint[1]['extra']['store_version']))
+        return checkpoint
+
+    rng = np.random.RandomState(seed + len(history))
+    for epoch in range(epochs):
+        for X, y in iter_batches(store, train_stays, features, batch_size, rng, store_version):
+            clf.partial_fit(X, y, classes=CLASSES)
+    trained += len(train_stays)
+
+    validation = stays[validation_mask(stays)]
+    scores = validation_scores(clf, store, validation, features, batch_size, store_version)
+    history.append({'store_version': store_version, 'refit': checkpoint is None, 'trained_stays': trained,
+                    'new_stays': int(len(train_stays)), 'validation_stays': int(len(validation)),
+                    'recall metric': scores.get('recall metric'), 'f1 metric': scores.get('f1 metric')})
+    print("{}: {} new stays, validation recall metric {:.3f} on {} stays".format(
+          name, len(train_stays), scores.get('recall metric', np.nan), len(validation)))
+    version_dir = artifacts.save_model(
+        models_root, name, clf, features,
+        params={'k': k, 'batch_size': batch_size, 'epochs': epochs, 'validation_partitions': VALIDATION_PARTITIONS},
+        scores={'validation': scores, 'history': history},
+        extra={'store_version': store_version, 'trained_stays': trained})
+    return clf, artifacts.load_metadata(models_root, name, os.path.basename(version_dir))
@@ -0,0 +1,68 @@
+""" classification scores computed directly from label arrays.
+
+class 0 is survivors and class 1 is non-survivors. the 'f1 metric' and 'recall metric'
+reward classifiers that score well on both classes and penalize the gap between them,
+
+    metric = surv + mort - |surv - mort|
+"""
+import numpy as np
+
+
+CLASSES = ['Survivors', 'Non-Survivors']
+
+METRICS = ['accuracy', 'precision', 'recall', 'f1', 'f1 metric', 'recall metric']
+
+
+def _ratio(num, den):
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+
+def balance_metric(surv, mort):
+    """ a metric that maximizes both class scores and minimizes the difference between them """
+    return surv + mort - np.abs(surv - mort)
+
+
+def confusion_counts(y_true, y_pred):
+    """ return the tn, fp, fn and tp counts for binary labels.
+
+    the last axis holds the samples, so a 2d array of predictions (one row per fold
+    or candidate) gives one count per row.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    y_pred = np.asarray(y_pred).astype(bool)
+    tp = np.sum(y_true & y_pred, axis=-1)
+    fp = np.sum(~y_true & y_pred, axis=-1)
+    fn = np.sum(y_true & ~y_pred, axis=-1)
+    tn = np.sum(~y_true & ~y_pred, axis=-1)
+    return tn, fp, fn, tp
+
+
+def scores_from_counts(tn, fp, fn, tp):
+    """ precision, recall and f1 for both classes plus the balance metrics.
+
+    :return: dict of metric name -> score for the non-survivor class, with the
+             per class scores under '<metric> survivors' and '<metric> non-survivors'
+    """
+    precision = [_ratio(tn, tn + fn), _ratio(tp, tp + fp)]
+    recall = [_ratio(tn, tn + fp), _ratio(tp, tp + fn)]
+    f1 = [_ratio(2 * tn, 2 * tn + fn + fp), _ratio(2 * tp, 2 * tp + fp + fn)]
+
+    scores = {'accuracy': _ratio(tp + tn, tn + fp + fn + tp),
+              'precision': precision[1],
+              'recall': recall[1],
+              'f1': f1[1],
+              'f1 metric': balance_metric(f1[0], f1[1]),
+              'recall metric': balance_metric(recall[0], recall[1])}
+    for name, per_class in [('precision', precision), ('recall', recall), ('f1', f1)]:
+        scores[name + ' survivors'] = per_class[0]
+        scores[name + ' non-survivors'] = per_class[1]
+    return scores
+
+
+def score_predictions(y_true, y_pred):
+    """ every metric in METRICS (and the per class scores) from one set of predictions """
+    scores = scores_from_counts(*confusion_counts(y_true, y_pred))
+    return dict((name, float(val)) if np.ndim(val) == 0 else (name, val)
+                for name, val in scores.items())
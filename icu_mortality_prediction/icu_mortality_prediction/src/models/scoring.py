@@ -0,0 +1,77 @@
+""" batch mortality risk scoring of new stays from their raw first 24h data.
+
+a stored model version carries the preprocessing spec it was trained with (see
+features.preprocessing), so scoring applies the persisted bounds, edges and dummies
+and never refits them on the stays being scored.
+"""
+import time
+import pandas as pd
+
+from . import artifacts
+from ..features import preprocessing
+
+
+def load_scorer(root, name, version=None):
+    """ load a stored model and check that it can score raw data.
+
+    :return: classifier, metadata
+    """
+    clf, metadata = artifacts.load_model(root, name, version)
+    if metadata.get('preprocessing') is None:
+        raise ValueError("model {} {} was saved without a preprocessing spec".format(name, metadata['version']))
+    return clf, metadata
+
+
+def risk_scores(clf, X):
+    """ probability of death when the classifier has one, its decision function otherwise """
+    if hasattr(clf, 'predict_proba') and getattr(clf, 'probability', True):
+        return clf.predict_proba(X)[:, 1]
+    return clf.decision_function(X)
+
+
+def score_stays(events, labs, demographics, root=None, name=None, version=None, model=None,
+                stays=None):
+    """ mortality risk of a batch of stays.
+
+    :param events: chart events of the first 24h (icustay_id, label, charttime, valuenum, value)
+    :param labs: lab events of the first 24h (icustay_id, label, charttime, valuenum, flag)
+    :param demographics: PTNT_DEMOG rows of the stays
+    :param root: artifact store directory
+    :param name: model name in the store
+    :param version: model version, defaults to the latest
+    :param model: (classifier, metadata) from load_scorer, instead of root and name
+    :param stays: icustay_ids to score, defaults to every stay in the data
+    :return: frame indexed by icustay_id with 'risk' and 'prediction' (1 = non-survivor)
+    """
+    clf, metadata = load_scorer(root, name, version) if model is None else model
+    spec = metadata['preprocessing']
+    features = preprocessing.transform(spec, events, labs, demographics, stays)
+    X = features[metadata['features'] or spec['features']].values
+    return pd.DataFrame({'risk': risk_scores(clf, X), 'prediction': clf.predict(X)},
+                        index=features.index, columns=['risk', 'prediction'])
+
+
+def benchmark_scoring(events, labs, demographics, root, name, version=None, repeats=3):
+    """ throughput of score_stays on the given batch.
+
+    the model is loaded once, as a scoring service would, and the batch is scored
+    repeats times.
+
+    :return: series with the number of stays, the model load time, the best and mean
+             seconds per batch and the stays per second of the best batch
+    """
+    start = time.time()
+    model = load_scorer(root, name, version)
+    load_time = time.time() - start
+
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        scores = score_stays(events, labs, demographics, model=model)
+        times.append(time.time() - start)
+    best = min(times)
+    report = {'stays': len(scores), 'load_time': load_time, 'best_time': best,
+              'mean_time': sum(times) / len(times),
+              'stays_per_sec': len(scores) / best if best > 0 else float('inf')}
+    print("scored {} stays in {:.3f}s, {:.0f} stays/sec".format(len(scores), best, report['stays_per_sec']))
+    return pd.Series(report, name=name)
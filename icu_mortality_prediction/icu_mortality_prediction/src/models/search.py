@@ -0,0 +1,148 @@
+""" multi metric hyperparameter search for the candidate classifiers.
+
+replaces the GridSearchCV loops in ICU_MORTALITY_FIRST24.ipynb, which ran one search per
+metric and so fitted every fold twice. here each (feature count, parameters, fold)
+combination is fitted once and all metrics are scored from the same predictions. the
+fits are spread over a process pool that reads the training data through memory
+mapped files.
+"""
+import time
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
+
+from . import candidates
+from . import metrics
+from ..utils import parallel
+
+
+# CV SCORE USED TO PICK THE PARAMETERS -> HELD OUT SCORE USED TO PICK THE FEATURE COUNT
+SELECTION_METRICS = {'f1': 'f1 metric', 'recall': 'recall metric'}
+
+
+def _fit_fold(task):
+    """ fit one candidate on the training part of a fold and score the held out part.
+
+    when n_samples is given only that many training rows are used, taken in the
+    shared 'order' so that every candidate sees the same subsample.
+    """
+    paths, name, num_feats, params_id, params, fold, n_samples = task
+    data = parallel.load_shared(paths)
+    X, y, folds = data['X'], data['y'], data['folds']
+    train = folds != fold
+    if n_samples is None:
+        rows = train
+    else:
+        order = data['order']
+        rows = order[train[order]][:n_samples]
+
+    clf = candidates.make_classifier(name, num_feats, **params)
+    start = time.time()
+    clf.fit(X[rows, :num_feats], y[rows])
+    fit_time = time.time() - start
+    y_pred = clf.predict(X[~train, :num_feats])
+
+    row = {'classifier': name, 'features': num_feats, 'params_id': params_id,
+           'fold': fold, 'n_samples': int(train.sum()) if n_samples is None else len(rows),
+           'fit_time': fit_time}
+    row.update(metrics.score_predictions(y[~train], y_pred))
+    return row
+
+
+def _fit_full(task):
+    """ refit a candidate on the whole training set """
+    paths, name, num_feats, params = task
+    data = parallel.load_shared(paths)
+    clf = candidates.make_classifier(name, num_feats, **params)
+    clf.fit(data['X'][:, :num_feats], data['y'])
+    return clf
+
+
+def cv_folds(y, cv=5):
+    """ fold number of every sample, stratified as GridSearchCV does for classifiers """
+    folds = np.empty(len(y), dtype=np.int8)
+    for fold, (_, valid) in enumerate(StratifiedKFold(n_splits=cv).split(np.zeros(len(y)), y)):
+        folds[valid] = fold
+    return folds
+
+
+def split_arrays(X, y, test_size=0.30, random_state=42):
+    """ numeric train and test arrays, split as in the notebook """
+    return train_test_split(np.asarray(X, dtype=float), np.asarray(y).astype(int),
+                            test_size=test_size, random_state=random_state)
+
+
+def search_classifiers(X, y, names=None, feature_counts=None, scoring=('f1', 'recall'),
+                       cv=5, test_size=0.30, random_state=42, n_jobs=1, scratch_dir=None):
+    """ optimize the candidate classifiers over their parameter grids and feature set sizes.
+
+    for every feature count the parameters are picked by the mean cv score of each metric
+    in scoring. the winners are refitted on the training split and the feature count is
+    picked by the balance metric on the test split, as in the notebook.
+
+    :param X: feature frame with columns ranked best first
+    :param y: outcomes
+    :param names: candidates to search, defaults to all of candidates.CANDIDATES
+    :param feature_counts: numbers of leading columns to try, defaults to 8 .. all
+    :param scoring: metrics the parameters are optimized to
+    :param n_jobs: worker processes, -1 for one per core
+    :param scratch_dir: where the memory mapped copies of the data are written
+    :return: cv_results frame (one row per fit), test_results frame (one row per
+             classifier, metric and feature count) and the optimized_clfs dict keyed
+             '<classifier>_<metric>' holding 'CLF', 'PARAMS', 'FEATURES' and 'SCORES'
+    """
+    names = list(candidates.CANDIDATES) if names is None else list(names)
+    columns = list(X.columns)
+    if feature_counts is None:
+        feature_counts = range(min(8, len(columns)), len(columns) + 1)
+    feature_counts = list(feature_counts)
+
+    X_train, X_test, y_train, y_test = split_arrays(X, y, test_size, random_state)
+    grids = dict((name, list(ParameterGrid(candidates.param_grid(name)))) for name in names)
+
+    with parallel.shared_arrays({'X': X_train, 'y': y_train, 'folds': cv_folds(y_train, cv)},
+                                scratch_dir) as paths:
+        tasks = [(paths, name, num_feats, params_id, params, fold, None)
+                 for name in names
+                 for num_feats in feature_counts
+                 for params_id, params in enumerate(grids[name])
+                 for fold in range(cv)]
+        print("fitting {} folds".format(len(tasks)))
+        n_workers = parallel.resolve_jobs(n_jobs)
+        cv_results = pd.DataFrame(parallel.run_tasks(_fit_fold, tasks, n_jobs,
+                                                     chunksize=max(1, len(tasks) // (4 * n_workers))))
+        cv_results['params'] = [grids[name][pid] for name, pid in
+                                zip(cv_results['classifier'], cv_results['params_id'])]
+
+        # BEST PARAMETERS FOR EVERY CLASSIFIER, FEATURE COUNT AND METRIC
+        cv_means = cv_results.groupby(['classifier', 'features', 'params_id'])[list(scoring)].mean()
+        best = {}
+        for score in scoring:
+            for (name, num_feats), idx in cv_means[score].groupby(level=[0, 1]).idxmax().items():
+                best[(name, num_feats, score)] = idx[2]
+
+        # REFIT EACH WINNER ONCE EVEN WHEN SEVERAL METRICS PICKED THE SAME PARAMETERS
+        refits = sorted(set((name, num_feats, pid) for (name, num_feats, _), pid in best.items()))
+        fitted = parallel.run_tasks(_fit_full, [(paths, name, num_feats, grids[name][pid])
+                                                for name, num_feats, pid in refits], n_jobs)
+        fitted = dict(zip(refits, fitted))
+
+    test_rows = []
+    optimized_clfs = {}
+    for (name, num_feats, score), pid in sorted(best.items()):
+        clf = fitted[(name, num_feats, pid)]
+        test_scores = metrics.score_predictions(y_test, clf.predict(X_test[:, :num_feats]))
+        row = {'classifier': name, 'score': score, 'features': num_feats, 'params_id': pid}
+        row.update(test_scores)
+        test_rows.append(row)
+
+        key = name + '_' + score
+        selection = SELECTION_METRICS.get(score, score)
+        if key not in optimized_clfs or test_scores[selection] > optimized_clfs[key]['SCORES'][selection]:
+            params = dict(grids[name][pid])
+            params['features'] = num_feats
+            optimized_clfs[key] = {'CLF': clf, 'PARAMS': params,
+                                   'FEATURES': columns[:num_feats], 'SCORES': test_scores}
+
+    print("ANALYSIS COMPLETE")
+    return cv_results, pd.DataFrame(test_rows), optimized_clfs
@@ -0,0 +1,108 @@
+""" sensitivity of the optimized classifiers to the train/test split.
+
+the notebook's final evaluation refits every optimized classifier for each test size
+in np.linspace(0.1, 0.5, 9), one classifier after another and with a single split
+seed. here the classifier x test size x seed grid runs in a process pool over one
+memory mapped copy of the feature matrix. repeated seeds give the spread of each
+score, and every fit is timed.
+
+the fits are handed to the pool largest training set first so the long fits are not
+left until the end, and each worker takes one fit at a time, so the sweep finishes
+close to the time of the slowest single classifier.
+"""
+import time
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+
+from . import evaluation
+from . import metrics
+from . import search
+from ..utils import parallel
+
+
+TEST_SIZES = np.linspace(0.1, 0.5, 9)
+
+
+def _fit_split(task):
+    """ fit a clone of one classifier on one split of the shared data and score it """
+    paths, name, clf, cols, test_size, seed = task
+    data = parallel.load_shared(paths)
+    X, y = data['X'], data['y']
+    train, test = train_test_split(np.arange(len(y)), test_size=test_size, random_state=seed)
+    X_train = X[train][:, cols]
+    X_test = X[test][:, cols]
+
+    clf = clone(clf)
+    start = time.time()
+    clf.fit(X_train, y[train])
+    fit_time = time.time() - start
+    start = time.time()
+    y_pred = clf.predict(X_test)
+    predict_time = time.time() - start
+
+    row = {'classifier': name, 'test_size': test_size, 'seed': seed, 'n_train': len(train),
+           'n_test': len(test), 'fit_time': fit_time, 'predict_time': predict_time}
+    row.update(metrics.score_predictions(y[test], y_pred))
+    return row
+
+
+def split_size_sweep(models, X, y, test_sizes=None, seeds=(42,), n_jobs=-1, scratch_dir=None):
+    """ refit each classifier for every test size and split seed.
+
+    :param models: dict of name -> classifier, or an optimized_clfs dict, see
+                   evaluation.collect_predictions
+    :param X: feature frame
+    :param y: outcomes
+    :param test_sizes: test split fractions, defaults to TEST_SIZES as in the notebook
+    :param seeds: split random states, several for variance estimates
+    :param n_jobs: worker processes, -1 for one per core
+    :return: frame with one row per (classifier, test size, seed) fit holding the split
+             sizes, fit and predict times and the test scores
+    """
+    test_sizes = TEST_SIZES if test_sizes is None else test_sizes
+    test_sizes = [round(float(size), 6) for size in test_sizes]
+    columns = list(X.columns)
+
+    tasks = []
+    with parallel.shared_arrays({'X': np.asarray(X, dtype=float), 'y': np.asarray(y).astype(int)},
+                                scratch_dir) as paths:
+        for name, entry in models.items():
+            clf, cols = evaluation.model_columns(entry, columns)
+            col_idx = [columns.index(col) for col in cols]
+            tasks.extend((paths, name, clf, col_idx, size, seed) for size in test_sizes for seed in seeds)
+        # LARGEST TRAINING SETS FIRST, THE ORDER ONLY AFFECTS SCHEDULING
+        tasks.sort(key=lambda task: task[4])
+        print("fitting {} splits".format(len(tasks)))
+        results = pd.DataFrame(parallel.run_tasks(_fit_split, tasks, n_jobs))
+
+    order = dict((name, i) for i, name in enumerate(models))
+    results['order'] = results['classifier'].map(order)
+    results = results.sort_values(['order', 'test_size', 'seed'], kind='mergesort')
+    return results.drop('order', axis=1).reset_index(drop=True)
+
+
+def summarize_sweep(results, columns=None):
+    """ mean, standard deviation and count over seeds per classifier and test size """
+    if columns is None:
+        columns = metrics.METRICS + ['fit_time']
+    return results.groupby(['classifier', 'test_size'])[columns].agg(['mean', 'std', 'count'])
+
+
+def best_test_sizes(results, selection=None):
+    """ test size with the best mean selection score for each classifier.
+
+    :param selection: metric to pick by, defaults to the one search.SELECTION_METRICS
+                      gives for the classifier name's suffix ('LSVC_recall' -> 'recall
+                      metric'), as the notebook picked the test size
+    :return: frame indexed by classifier with the test size and its mean score
+    """
+    rows = []
+    means = results.groupby(['classifier', 'test_size']).mean(numeric_only=True)
+    for name in results['classifier'].unique():
+        metric = selection or search.SELECTION_METRICS.get(name.rsplit('_', 1)[-1], 'f1 metric')
+        scores = means.loc[name, metric]
+        rows.append({'classifier': name, 'metric': metric, 'test_size': scores.idxmax(),
+                     'score': scores.max()})
+    return pd.DataFrame(rows).set_index('classifier')
@@ -0,0 +1,553 @@
+""" streaming bedside scorer that updates a stay's risk as its first 24h events arrive.
+
+every stay keeps running aggregates of the chart and lab labels the model uses, so an
+event updates one accumulator, re-encodes only the features built from it with the
+persisted preprocessing spec and re-scores the stay. for linear models the decision
+value is kept per stay and adjusted by the changed features' weights, which costs a
+few microseconds; other models are re-scored on the stay's feature row.
+
+events are mapped to their concept label and unit (see features/concepts.py) as they
+arrive, as the training events were at ingest. the statistics match
+features.preprocessing.event_stats on the same events whatever order they arrive in:
+first and last are taken by chart time, mean, std and skew are updated with running
+moments and the median keeps the stay's sorted values.
+
+the service reads events from an async source (a CSV file, a socket of newline
+delimited JSON or an asyncio.Queue) into a bounded queue. when scoring falls behind
+the queue fills and the reader waits, which pushes back on the source. run as a
+module to replay historical CSVs,
+
+    python -m icu_mortality_prediction.src.models.streaming --root models/store
+        --name LSVC_recall --chart CHARTEVENTS.csv --labs LABEVENTS.csv
+        --demographics PTNT_DEMOG.csv --speedup 3600
+"""
+import math
+import json
+import time
+import bisect
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+
+from . import scoring
+from ..features import concepts
+from ..features import preprocessing
+
+
+class RunningStats(object):
+    """ running summary statistics of one label for one stay """
+    __slots__ = ['n', 'mean', 'M2', 'M3', 'min', 'max', 'first', 'first_time', 'last', 'last_time',
+                 'time_min', 'time_max', 'value', 'value_time', 'abnormal', 'values']
+
+    def __init__(self, keep_values=False):
+        self.n = 0
+        self.mean = self.M2 = self.M3 = 0.0
+        self.min = self.max = self.first = self.last = self.value = None
+        self.first_time = self.last_time = self.time_min = self.time_max = self.value_time = None
+        self.abnormal = 0
+        self.values = [] if keep_values else None
+
+    def add(self, hours, valuenum=None, value=None, flag=None):
+        """ add one event, hours is its chart time as a number of hours """
+        if self.time_min is None or hours < self.time_min:
+            self.time_min = hours
+        if self.time_max is None or hours > self.time_max:
+            self.time_max = hours
+        if flag == 'abnormal':
+            self.abnormal = 1
+        if value is not None and value == value and (self.value_time is None or hours < self.value_time):
+            self.value, self.value_time = value, hours
+        if valuenum is None or valuenum != valuenum:
+            return
+
+        # TIES KEEP ARRIVAL ORDER, AS THE STABLE SORT IN event_stats DOES
+        if self.first_time is None or hours < self.first_time:
+            self.first, self.first_time = valuenum, hours
+        if self.last_time is None or hours >= self.last_time:
+            self.last, self.last_time = valuenum, hours
+        if self.min is None or valuenum < self.min:
+            self.min = valuenum
+        if self.max is None or valuenum > self.max:
+            self.max = valuenum
+        n1 = self.n
+        self.n += 1
+        delta = valuenum - self.mean
+        delta_n = delta / self.n
+        term = delta * delta_n * n1
+        self.mean += delta_n
+        self.M3 += term * delta_n * (self.n - 2) - 3 * delta_n * self.M2
+        self.M2 += term
+        if self.values is not None:
+            bisect.insort(self.values, valuenum)
+
+    def stat(self, name):
+        """ current value of a statistic from preprocessing.EVENT_STATS, nan when undefined """
+        n = self.n
+        if name == 'abnflag':
+            return self.abnormal
+        if name == 'value':
+            return self.value
+        if n == 0:
+            return np.nan
+        if name == 'mean':
+            return self.mean
+        if name == 'min':
+            return self.min
+        if name == 'max':
+            return self.max
+        if name == 'first':
+            return self.first
+        if name == 'last':
+            return self.last
+        if name == 'delta':
+            return self.last - self.first
+        if name == 'slope':
+            hours = self.time_max - self.time_min
+            return (self.last - self.first) / hours if hours > 0 else np.nan
+        if name == 'std':
+            return math.sqrt(self.M2 / (n - 1)) if n > 1 else np.nan
+        if name == 'skew':
+            if n < 3:
+                return np.nan
+            if self.M2 <= 1e-14 * n * max(self.mean * self.mean, 1.0):
+                return 0.0
+            return math.sqrt(n - 1.0) * n / (n - 2.0) * self.M3 / self.M2 ** 1.5
+        if name == 'med':
+            mid = n // 2
+            return self.values[mid] if n % 2 else (self.values[mid - 1] + self.values[mid]) / 2.0
+        raise ValueError("unknown statistic {}".format(name))
+
+
+class StayState(object):
+    """ feature row, decision value and running statistics of one stay """
+    __slots__ = ['x', 'decision', 'stats', 'risk']
+
+    def __init__(self, x, decision):
+        self.x = x
+        self.decision = decision
+        self.stats = {}
+        self.risk = None
+
+
+def _hours(charttime):
+    if isinstance(charttime, (int, float, np.integer, np.floating)):
+        return float(charttime)
+    return pd.Timestamp(charttime).value / 3.6e12
+
+
+class StreamingScorer(object):
+    """ incremental scorer for a stored model with a preprocessing spec.
+
+    :param clf: fitted classifier
+    :param metadata: its artifact metadata, see scoring.load_scorer
+    :param queue_size: events buffered between the source and the scorer
+    :param latency_window: most recent events kept for the latency percentiles
+    """
+
+    def __init__(self, clf, metadata, queue_size=10000, latency_window=100000):
+        self.clf = clf
+        self.spec = metadata['preprocessing']
+        self.features = list(metadata['features'] or self.spec['features'])
+        self.queue_size = queue_size
+        self.stays = {}
+        position = dict((feature, j) for j, feature in enumerate(self.features))
+
+        # (SOURCE, LABEL) -> [(STAT, DEFINITION, [(COLUMN, LEVEL)])] FOR THE EVENT FEATURES
+        self._targets = {}
+        self._keep_values = set()
+        self._static = {}
+        for feature in self.features:
+            base, level = self.spec['columns'][feature]
+            d = self.spec['definitions'][base]
+            if d['source'] in ('chart', 'lab'):
+                entries = self._targets.setdefault((d['source'], d['label']), {})
+                entries.setdefault(base, (d['stat'], d, []))[2].append((position[feature], level))
+                if d['stat'] == 'med':
+                    self._keep_values.add((d['source'], d['label']))
+            else:
+                self._static[base] = d
+        self._targets = dict((key, list(entries.values())) for key, entries in self._targets.items())
+        # SOURCE -> (ITEMID MAP, LABEL MAP) OF THE CONCEPTS, SEE _map_concept
+        self._concept_maps = dict((source, (concepts.item_map(mapped, 'itemid'), concepts.item_map(mapped, 'label')))
+                                  for source, mapped in preprocessing.CONCEPT_SOURCES.items())
+
+        self._coef = None
+        self._intercept = 0.0
+        coef = getattr(clf, 'coef_', None)
+        if coef is not None and np.ndim(coef) == 2 and np.shape(coef)[0] == 1 and hasattr(clf, 'intercept_'):
+            self._coef = np.asarray(coef, dtype=float).ravel()
+            self._intercept = float(np.ravel(clf.intercept_)[0])
+        self._risk_mode = self._probe_risk_mode()
+
+        self._latency = np.zeros(latency_window)
+        self._update_time = np.zeros(latency_window)
+        self.reset_metrics()
+
+    def _probe_risk_mode(self):
+        """ 'decision' or 'sigmoid' when the risk follows from the linear decision value,
+        'model' when the classifier has to be called """
+        probe = np.random.RandomState(0).rand(4, len(self.features))
+        uses_proba = hasattr(self.clf, 'predict_proba') and getattr(self.clf, 'probability', True)
+        if self._coef is None:
+            return 'model'
+        if not uses_proba:
+            return 'decision'
+        decision = probe.dot(self._coef) + self._intercept
+        if np.allclose(self.clf.predict_proba(probe)[:, 1], 1.0 / (1.0 + np.exp(-decision))):
+            return 'sigmoid'
+        return 'model'
+
+    def reset_metrics(self):
+        self.events = 0
+        self.scored = 0
+        self.skipped = 0
+        self.unadmitted = 0
+        self.queue_max = 0
+        self.backpressure_waits = 0
+        self._n_timed = 0
+        self._started = None
+        self._finished = None
+        self._running = 0
+
+    def admit(self, demographics):
+        """ register stays with their demographics and diagnoses and give them a first score.
+
+        :param demographics: PTNT_DEMOG rows of one or more stays
+        :return: series of the initial risk per icustay_id
+        """
+        stays = pd.unique(demographics['icustay_id'])
+        X = np.zeros((len(stays), len(self.features)))
+        if self._static:
+            raw = preprocessing.base_values(self._static, demographics=demographics, stays=stays)
+            sub_spec = {'features': [], 'columns': self.spec['columns'], 'definitions': self.spec['definitions']}
+            columns = [j for j, feature in enumerate(self.features)
+                       if self.spec['columns'][feature][0] in self._static]
+            sub_spec['features'] = [self.features[j] for j in columns]
+            X[:, columns] = preprocessing.encode(raw, sub_spec).values
+        risks = {}
+        for stay, x in zip(stays, X):
+            state = StayState(x, self._decision(x))
+            state.risk = self._risk(state)
+            self.stays[stay] = state
+            risks[stay] = state.risk
+        return pd.Series(risks, name='risk')
+
+    def _decision(self, x):
+        return self._intercept + x.dot(self._coef) if self._coef is not None else 0.0
+
+    def _risk(self, state):
+        if self._risk_mode == 'decision':
+            return state.decision
+        if self._risk_mode == 'sigmoid':
+            return 1.0 / (1.0 + math.exp(-state.decision))
+        return float(scoring.risk_scores(self.clf, state.x[None, :])[0])
+
+    def _map_concept(self, event):
+        # THE itemid WHEN THE EVENT HAS ONE, ITS LABEL OTHERWISE, AS concepts.assign_concepts
+        source = event.get('source', 'chart')
+        maps = self._concept_maps.get(source)
+        if maps is None:
+            return event
+        itemid = event.get('itemid')
+        entry = maps[0].get(itemid) if itemid is not None else maps[1].get(event['label'])
+        if entry is None or (entry[0] == event['label'] and entry[1] == 1 and entry[2] == 0):
+            return event
+        event = dict(event, label=entry[0])
+        valuenum = event.get('valuenum')
+        if valuenum is not None:
+            event['valuenum'] = valuenum * entry[1] + entry[2]
+        return event
+
+    def update(self, event):
+        """ apply one event and re-score its stay.
+
+        :param event: dict with icustay_id, source ('chart' or 'lab'), label, charttime
+                      and valuenum, and value or flag where the model uses them
+        :return: the stay's risk, None when the event does not touch any model feature
+        """
+        self.events += 1
+        event = self._map_concept(event)
+        targets = self._targets.get((event.get('source', 'chart'), event['label']))
+        if targets is None:
+            self.skipped += 1
+            return None
+        stay = event['icustay_id']
+        state = self.stays.get(stay)
+        if state is None:
+            # STAYS NOT ADMITTED WITH THEIR DEMOGRAPHICS SCORE WITH THOSE FEATURES AT 0
+            self.unadmitted += 1
+            x = np.zeros(len(self.features))
+            state = self.stays[stay] = StayState(x, self._decision(x))
+        key = (event.get('source', 'chart'), event['label'])
+        stats = state.stats.get(key)
+        if stats is None:
+            stats = state.stats[key] = RunningStats(key in self._keep_values)
+        stats.add(_hours(event['charttime']), event.get('valuenum'), event.get('value'), event.get('flag'))
+
+        x = state.x
+        coef = self._coef
+        for stat, d, columns in targets:
+            current = stats.stat(stat)
+            for j, new in self._encode(current, d, columns):
+                if new != x[j]:
+                    if coef is not None:
+                        state.decision += coef[j] * (new - x[j])
+                    x[j] = new
+        state.risk = self._risk(state)
+        self.scored += 1
+        return state.risk
+
+    @staticmethod
+    def _encode(current, d, columns):
+        """ (column, value) pairs of the features built from one statistic """
+        encoding = d.get('encoding', 'none')
+        if encoding == 'quartiles':
+            code = -1
+            if current is not None and current == current and d['edges']:
+                lower, upper = d['bounds']
+                if (lower is None or current >= lower) and (upper is None or current <= upper):
+                    code = bisect.bisect_left(d['edges'], current)
+            return [(j, 1.0 if code == int(level[1:]) else 0.0) for j, level in columns]
+        if encoding == 'dummies':
+            return [(j, 1.0 if current is not None and current == current and str(current) == level else 0.0)
+                    for j, level in columns]
+        value = 0.0 if current is None or current != current else float(current)
+        return [(j, value) for j, _ in columns]
+
+    def risks(self):
+        """ current risk of every stay """
+        return pd.Series(dict((stay, state.risk) for stay, state in self.stays.items()), name='risk')
+
+    async def run(self, source, sink=None):
+        """ score every event from an async iterator of event dicts.
+
+        :param source: async iterator, see csv_events, socket_events, queue_events and
+                       replay_events
+        :param sink: optional asyncio.Queue or callable receiving (icustay_id, charttime, risk)
+                     for every re-scored event, a full queue holds the scorer back
+        :return: metrics dict, of every run since reset_metrics when runs overlap
+        :raises: the error of the source, after scoring the events read before it
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        # OVERLAPPING RUNS, E.G. THE CONNECTIONS OF serve, SHARE ONE CLOCK FROM THE FIRST OF THEM
+        if not self._running:
+            self._started = time.perf_counter()
+            self._finished = None
+        self._running += 1
+
+        async def read():
+            try:
+                async for event in source:
+                    if queue.full():
+                        self.backpressure_waits += 1
+                    await queue.put((time.perf_counter(), event))
+                    self.queue_max = max(self.queue_max, queue.qsize())
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                # A FAILING SOURCE STILL ENDS THE SCORER, THE ERROR IS RAISED AFTER IT
+                await queue.put(None)
+                raise
+            await queue.put(None)
+
+        reader = asyncio.ensure_future(read())
+        window = len(self._latency)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                received, event = item
+                start = time.perf_counter()
+                risk = self.update(event)
+                done = time.perf_counter()
+                i = self._n_timed % window
+                self._latency[i] = done - received
+                self._update_time[i] = done - start
+                self._n_timed += 1
+                if risk is not None and sink is not None:
+                    record = (event['icustay_id'], event['charttime'], risk)
+                    if isinstance(sink, asyncio.Queue):
+                        await sink.put(record)
+                    else:
+                        sink(record)
+                # LET THE READER REFILL THE QUEUE NOW AND THEN WHEN IT NEVER HAS TO WAIT
+                if self._n_timed % 256 == 0:
+                    await asyncio.sleep(0)
+        finally:
+            if not reader.done():
+                reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            self._running -= 1
+            if not self._running:
+                self._finished = time.perf_counter()
+        # RE-RAISE AN ERROR OF THE SOURCE, E.G. A RESET SOCKET OR A BAD CSV ROW
+        if not reader.cancelled():
+            reader.result()
+        return self.metrics()
+
+    def metrics(self):
+        """ counts, throughput and latency percentiles in microseconds.
+
+        latency runs from the event entering the queue to its stay being re-scored,
+        update time is the scoring alone. the counts and the latency window are those of
+        the scorer, so with overlapping runs they cover every run, and the elapsed time
+        runs from the first of them to the end of the last.
+        """
+        n = min(self._n_timed, len(self._latency))
+        latency = self._latency[:n] * 1e6
+        update = self._update_time[:n] * 1e6
+        elapsed = ((self._finished or time.perf_counter()) - self._started) if self._started else 0.0
+        report = {'events': self.events, 'scored': self.scored, 'skipped': self.skipped,
+                  'unadmitted': self.unadmitted, 'stays': len(self.stays),
+                  'elapsed': elapsed, 'events_per_sec': self.events / elapsed if elapsed > 0 else np.nan,
+                  'queue_max': self.queue_max, 'backpressure_waits': self.backpressure_waits}
+        for name, values in [('latency', latency), ('update', update)]:
+            for q in [50, 95, 99]:
+                report['{}_p{}_us'.format(name, q)] = np.percentile(values, q) if n else np.nan
+            report['{}_max_us'.format(name)] = values.max() if n else np.nan
+        return report
+
+
+def _event_dicts(frame, source):
+    frame = frame.where(frame.notnull(), None)
+    for event in frame.to_dict('records'):
+        event['source'] = source
+        yield event
+
+
+async def csv_events(path, source='chart', chunksize=10000):
+    """ events of a CHARTEVENTS or LABEVENTS style CSV, read in chunks """
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        for event in _event_dicts(chunk, source):
+            yield event
+        await asyncio.sleep(0)
+
+
+async def socket_events(reader):
+    """ events sent as newline delimited JSON on an asyncio StreamReader """
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        line = line.strip()
+        if line:
+            yield json.loads(line.decode('utf-8'))
+
+
+async def queue_events(queue):
+    """ events put on an asyncio.Queue by another task, None ends the stream """
+    while True:
+        event = await queue.get()
+        if event is None:
+            break
+        yield event
+
+
+async def socket_sink(writer, records):
+    """ write the (icustay_id, charttime, risk) records of a queue to an asyncio
+    StreamWriter as newline delimited JSON, until None """
+    while True:
+        record = await records.get()
+        if record is None:
+            break
+        icustay_id, charttime, risk = record
+        writer.write(json.dumps({'icustay_id': icustay_id, 'charttime': charttime,
+                                 'risk': float(risk)}).encode('utf-8') + b'\n')
+        await writer.drain()
+
+
+async def serve(scorer, host='127.0.0.1', port=8765):
+    """ accept socket connections and score the events each one sends.
+
+    every connection is scored through its own bounded queue, so a connection that
+    sends faster than it is scored stops being read, and the risk of every re-scored
+    event is written back to it as a line of JSON, see socket_sink. a connection that
+    does not read its risks holds its scoring back in the same way.
+
+    the connections share the scorer, so an event updates its stay whatever connection
+    it came in on, and scorer.metrics() reports the service as a whole.
+
+    :return: asyncio server
+    """
+    async def handle(reader, writer):
+        records = asyncio.Queue(maxsize=scorer.queue_size)
+        sender = asyncio.ensure_future(socket_sink(writer, records))
+        try:
+            await scorer.run(socket_events(reader), sink=records)
+            await records.put(None)
+            await sender
+        finally:
+            if not sender.done():
+                sender.cancel()
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+
+def load_events(chart_csv=None, lab_csv=None):
+    """ chart and lab events from CSVs, tagged with their source and ordered by chart time """
+    frames = []
+    for path, source in [(chart_csv, 'chart'), (lab_csv, 'lab')]:
+        if path is not None:
+            frame = pd.read_csv(path, parse_dates=['charttime'])
+            frame['source'] = source
+            frames.append(frame)
+    events = pd.concat(frames, ignore_index=True, sort=False)
+    return events.sort_values('charttime', kind='mergesort').reset_index(drop=True)
+
+
+async def replay_events(events, speedup=None):
+    """ yield historical events in chart time order, speedup times faster than they happened.
+
+    :param events: frame from load_events
+    :param speedup: e.g. 3600 replays an hour per second, None replays as fast as possible
+    """
+    hours = pd.to_datetime(events['charttime']).values.astype('datetime64[ns]').astype(np.int64) / 3.6e12
+    records = events.where(events.notnull(), None).to_dict('records')
+    start = time.perf_counter()
+    for i, event in enumerate(records):
+        event['charttime'] = hours[i]
+        if speedup is not None:
+            wait = (hours[i] - hours[0]) * 3600.0 / speedup - (time.perf_counter() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        elif i % 256 == 0:
+            await asyncio.sleep(0)
+        yield event
+
+
+def replay(scorer, events, demographics=None, speedup=None):
+    """ admit the stays and replay events through the scorer.
+
+    :return: metrics dict and the final risk per stay
+    """
+    if demographics is not None:
+        scorer.admit(demographics)
+    metrics = asyncio.run(scorer.run(replay_events(events, speedup)))
+    return metrics, scorer.risks()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='replay first 24h event CSVs through the streaming scorer')
+    parser.add_argument('--root', required=True, help='artifact store directory')
+    parser.add_argument('--name', required=True, help='model name')
+    parser.add_argument('--version', default=None)
+    parser.add_argument('--chart', default=None, help='chart events CSV')
+    parser.add_argument('--labs', default=None, help='lab events CSV')
+    parser.add_argument('--demographics', default=None, help='PTNT_DEMOG CSV')
+    parser.add_argument('--speedup', type=float, default=None, help='replay speed, default as fast as possible')
+    parser.add_argument('--queue-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    clf, metadata = scoring.load_scorer(args.root, args.name, args.version)
+    scorer = StreamingScorer(clf, metadata, queue_size=args.queue_size)
+    demographics = pd.read_csv(args.demographics) if args.demographics else None
+    metrics, _ = replay(scorer, load_events(args.chart, args.labs), demographics, args.speedup)
+    for key in sorted(metrics):
+        print("{:>20}  {}".format(key, metrics[key]))
+    return metrics
+
+
+if __name__ == '__main__':
+    main()
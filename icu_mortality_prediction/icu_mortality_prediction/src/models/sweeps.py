@@ -0,0 +1,186 @@
+""" warm started sweeps over feature count prefixes and regularization paths.
+
+the notebook retrains every classifier from scratch for each prefix
+all_data.columns[1:num_feats] and each value of C, although neighbouring
+configurations differ only slightly. these sweeps carry work from one step to the next.
+
+linear models walk the C path from strong to weak regularization, starting each fit
+from the previous solution, and start the first C of every prefix from the solution of
+the previous prefix with a zero weight for the new feature. LinearSVC (liblinear)
+cannot be warm started, so the path uses SGDClassifier with the same hinge losses and
+alpha = 1 / (C * n_samples), the equivalent regularization.
+
+the SVC sweep keeps the dot product and squared distance matrices between stays and
+adds one feature's contribution per prefix, so every kernel in the grid is derived
+from them instead of being recomputed from the full design. those matrices are
+n_train x n_train, which is fine for the cohort sizes in the notebook.
+"""
+import time
+import numpy as np
+import pandas as pd
+from sklearn import svm
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import ParameterGrid
+
+from . import candidates
+from . import metrics
+from . import search
+
+
+def linear_sweep(X, y, feature_counts=None, Cs=None, class_weights=None,
+                 losses=('hinge', 'squared_hinge'), test_size=0.30, random_state=42,
+                 max_iter=1000, tol=1e-3):
+    """ warm started linear classifiers over feature count prefixes and the C path.
+
+    :param X: feature frame with columns ranked best first
+    :param y: outcomes
+    :param feature_counts: increasing numbers of leading columns, defaults to 8 .. all
+    :param Cs: C path, defaults to the LSVC grid, swept in increasing order
+    :param class_weights: defaults to the LSVC grid
+    :param losses: hinge losses to sweep
+    :return: frame with one row per (loss, class_weight, features, C) step holding the
+             iterations, fit time and test split scores
+    """
+    columns = list(X.columns)
+    if feature_counts is None:
+        feature_counts = range(min(8, len(columns)), len(columns) + 1)
+    Cs = sorted(candidates.LSVC_PARAMS['C'] if Cs is None else Cs)
+    if class_weights is None:
+        class_weights = candidates.LSVC_PARAMS['class_weight']
+
+    X_train, X_test, y_train, y_test = search.split_arrays(X, y, test_size, random_state)
+    n_train = float(len(y_train))
+
+    rows = []
+    for loss in losses:
+        for cw_id, class_weight in enumerate(class_weights):
+            prefix_coef = None
+            prefix_intercept = None
+            for num_feats in sorted(feature_counts):
+                coef = None
+                intercept = None
+                if prefix_coef is not None:
+                    coef = np.zeros((1, num_feats))
+                    coef[:, :prefix_coef.shape[1]] = prefix_coef
+                    intercept = prefix_intercept
+                for C in Cs:
+                    clf = SGDClassifier(loss=loss, alpha=1.0 / (C * n_train), class_weight=class_weight,
+                                        max_iter=max_iter, tol=tol, random_state=random_state)
+                    start = time.time()
+                    clf.fit(X_train[:, :num_feats], y_train, coef_init=coef, intercept_init=intercept)
+                    fit_time = time.time() - start
+                    coef, intercept = clf.coef_, clf.intercept_
+                    if C == Cs[0]:
+                        prefix_coef, prefix_intercept = coef, intercept
+
+                    row = {'model': 'SGD_' + loss, 'features': num_feats, 'C': C,
+                           'class_weight': cw_id, 'n_iter': clf.n_iter_, 'fit_time': fit_time}
+                    row.update(metrics.score_predictions(y_test, clf.predict(X_test[:, :num_feats])))
+                    rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def incremental_grams(X_train, X_test, feature_counts):
+    """ yield the dot products and squared distances between stays for each prefix.
+
+    going from one prefix to the next only adds the new columns' outer products.
+
+    :return: generator of (num_feats, dict with 'dot', 'sqdist', 'test_dot', 'test_sqdist',
+             'var') where the test matrices are test x train and var is the variance of
+             the prefix, used for gamma='scale'
+    """
+    n_train, n_test = X_train.shape[0], X_test.shape[0]
+    grams = {'dot': np.zeros((n_train, n_train)), 'sqdist': np.zeros((n_train, n_train)),
+             'test_dot': np.zeros((n_test, n_train)), 'test_sqdist': np.zeros((n_test, n_train))}
+    total = 0.0
+    total_sq = 0.0
+    done = 0
+    for num_feats in sorted(feature_counts):
+        new_train = X_train[:, done:num_feats]
+        new_test = X_test[:, done:num_feats]
+        dot = new_train.dot(new_train.T)
+        test_dot = new_test.dot(new_train.T)
+        sq_train = (new_train ** 2).sum(axis=1)
+        sq_test = (new_test ** 2).sum(axis=1)
+        grams['dot'] += dot
+        grams['test_dot'] += test_dot
+        grams['sqdist'] += sq_train[:, None] + sq_train[None, :] - 2 * dot
+        grams['test_sqdist'] += sq_test[:, None] + sq_train[None, :] - 2 * test_dot
+        total += new_train.sum()
+        total_sq += (new_train ** 2).sum()
+        done = num_feats
+
+        n_values = float(n_train * num_feats)
+        grams['var'] = total_sq / n_values - (total / n_values) ** 2
+        yield num_feats, grams
+
+
+def kernel_from_grams(kernel, dot, sqdist, gamma, degree=3, coef0=0.0):
+    """ sklearn's rbf, poly, sigmoid and linear kernels computed from the gram matrices """
+    if kernel == 'rbf':
+        return np.exp(-gamma * np.maximum(sqdist, 0))
+    if kernel == 'poly':
+        return (gamma * dot + coef0) ** degree
+    if kernel == 'sigmoid':
+        return np.tanh(gamma * dot + coef0)
+    if kernel == 'linear':
+        return dot
+    raise ValueError("unsupported kernel {}".format(kernel))
+
+
+def svc_sweep(X, y, feature_counts=None, param_grid=None, test_size=0.30, random_state=42):
+    """ SVC grid over feature count prefixes using precomputed, incrementally updated kernels.
+
+    each kernel matrix is built once per prefix and shared by every C and class weight.
+    settings that cannot change a binary SVC (degree for non poly kernels,
+    decision_function_shape) reuse the scores of the equivalent fit.
+
+    :param param_grid: defaults to the SVC grid from the notebook
+    :return: frame with one row per (features, parameters) step
+    """
+    columns = list(X.columns)
+    if feature_counts is None:
+        feature_counts = range(min(8, len(columns)), len(columns) + 1)
+    grid = list(ParameterGrid(candidates.SVC_PARAMS if param_grid is None else param_grid))
+
+    X_train, X_test, y_train, y_test = search.split_arrays(X, y, test_size, random_state)
+
+    rows = []
+    for num_feats, grams in incremental_grams(X_train, X_test, feature_counts):
+        gamma = 1.0 / (num_feats * grams['var']) if grams['var'] > 0 else 1.0
+        kernels = {}
+        fitted = {}
+        for params_id, params in enumerate(grid):
+            kernel = params.get('kernel', 'rbf')
+            degree = params.get('degree', 3) if kernel == 'poly' else None
+            if (kernel, degree) not in kernels:
+                kernels[(kernel, degree)] = (
+                    kernel_from_grams(kernel, grams['dot'], grams['sqdist'], gamma, degree),
+                    kernel_from_grams(kernel, grams['test_dot'], grams['test_sqdist'], gamma, degree))
+            K_train, K_test = kernels[(kernel, degree)]
+
+            key = (kernel, degree, params.get('C', 1.0), str(params.get('class_weight')))
+            reused = key in fitted
+            fit_time = 0.0
+            if not reused:
+                clf = svm.SVC(kernel='precomputed', C=params.get('C', 1.0),
+                              class_weight=params.get('class_weight'), random_state=random_state)
+                start = time.time()
+                clf.fit(K_train, y_train)
+                fit_time = time.time() - start
+                fitted[key] = metrics.score_predictions(y_test, clf.predict(K_test))
+
+            row = {'model': 'SVC', 'features': num_feats, 'params_id': params_id,
+                   'fit_time': fit_time, 'reused': reused}
+            row.update(fitted[key])
+            rows.append(row)
+    results = pd.DataFrame(rows)
+    results['params'] = [grid[pid] for pid in results['params_id']]
+    return results
+
+
+def run_sweeps(X, y, feature_counts=None, test_size=0.30, random_state=42):
+    """ the linear and SVC sweeps with their per step scores in one table """
+    linear = linear_sweep(X, y, feature_counts, test_size=test_size, random_state=random_state)
+    kernel = svc_sweep(X, y, feature_counts, test_size=test_size, random_state=random_state)
+    return pd.concat([linear, kernel], ignore_index=True, sort=False)
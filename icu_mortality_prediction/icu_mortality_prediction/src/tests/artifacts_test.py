@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from icu_mortality_prediction.src.models import artifacts
+from icu_mortality_prediction.src.models import candidates
+from icu_mortality_prediction.src.tests.fixtures import make_features
+
+
+class artifactStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.X, self.y = make_features()
+        self.features = list(self.X.columns)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        """
+        test that every candidate predicts the same after a save and a memory mapped load
+        """
+        for name in candidates.CANDIDATES:
+            clf = candidates.make_classifier(name, 10, max_iter=50) if name == 'MLP' else \
+                candidates.make_classifier(name, 10)
+            clf.fit(self.X.values, self.y.values)
+            artifacts.save_model(self.root, name, clf, self.features)
+            loaded, metadata = artifacts.load_model(self.root, name)
+            np.testing.assert_array_equal(loaded.predict(self.X.values), clf.predict(self.X.values))
+            self.assertEqual(metadata['features'], self.features)
+
+    def test_knn_arrays_memory_mapped(self):
+        clf = candidates.make_classifier('Kneighbors', algorithm='kd_tree').fit(self.X.values, self.y.values)
+        artifacts.save_model(self.root, 'Kneighbors_f1', clf, self.features)
+        loaded, _ = artifacts.load_model(self.root, 'Kneighbors_f1')
+        self.assertIsInstance(loaded._fit_X, np.memmap)
+        np.testing.assert_array_equal(loaded.kneighbors(self.X.values[:5])[1],
+                                      clf.kneighbors(self.X.values[:5])[1])
+
+    def test_versions_and_metadata(self):
+        clf = candidates.make_classifier('LSVC', class_weight={1: 3, 0: 1}).fit(self.X.values, self.y.values)
+        data_hash = artifacts.hash_data(self.X, self.y)
+        bin_edges = {'age': [50.0, 65.0, 78.0]}
+        artifacts.save_model(self.root, 'LSVC_recall', clf, self.features, bin_edges=bin_edges,
+                             data_hash=data_hash, params={'features': 10})
+        artifacts.save_model(self.root, 'LSVC_recall', clf, self.features[:5])
+
+        self.assertEqual(artifacts.list_models(self.root), ['LSVC_recall'])
+        self.assertEqual(artifacts.list_versions(self.root, 'LSVC_recall'), ['v0001', 'v0002'])
+        metadata = artifacts.load_metadata(self.root, 'LSVC_recall', 1)
+        self.assertEqual(metadata['params']['class_weight'], {1: 3, 0: 1})
+        self.assertEqual(metadata['bin_edges'], bin_edges)
+        self.assertEqual(metadata['data_hash'], data_hash)
+        self.assertEqual(artifacts.load_metadata(self.root, 'LSVC_recall')['features'], self.features[:5])
+        self.assertRaises(KeyError, artifacts.load_model, self.root, 'LSVC_recall', 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from icu_mortality_prediction.src import benchmark
+
+
+def results(wall, peak_mem):
+    return pd.DataFrame({'scale': [1000, 1000, 1000], 'name': ['chart_stats', 'chart_stats.mean', 'lab_stats'],
+                         'parent': [None, 'chart_stats', None], 'wall': wall, 'cpu': wall,
+                         'peak_mem': peak_mem, 'rows_out': [10, 10, 10], 'cols_out': [2, 1, 2]},
+                        columns=benchmark.COLUMNS)
+
+
+class benchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_compare(self):
+        baseline = results([4., 1., .1], [100e6, 50e6, 10e6])
+        self.assertEqual(len(benchmark.compare(baseline, 1., baseline, 1.)), 0)
+        # TWICE AS SLOW ON A MACHINE HALF AS FAST IS NO REGRESSION
+        self.assertEqual(len(benchmark.compare(results([8., 2., .2], [100e6, 50e6, 10e6]), 2., baseline, 1.)), 0)
+
+        regressions = benchmark.compare(results([8., 1., .4], [100e6, 80e6, 10e6]), 1., baseline, 1.)
+        self.assertEqual(list(zip(regressions.name, regressions.metric)),
+                         [('chart_stats', 'wall'), ('chart_stats.mean', 'peak_mem')])
+        self.assertAlmostEqual(regressions.ratio.iloc[0], 2.)
+
+    def test_run_and_baseline(self):
+        frame = benchmark.run_benchmark([300], self.tmp, trace_memory=False)
+        self.assertTrue(set(benchmark.TARGETS) <= set(frame.name))
+        self.assertIn('chart_stats.mean', set(frame.name))
+        self.assertEqual(frame.loc[frame.name == 'chart_events', 'rows_out'].nunique(), 1)
+        self.assertIn('chart_stats', benchmark.format_results(frame))
+
+        path = os.path.join(self.tmp, 'baseline.json')
+        benchmark.save_baseline(frame, path, calibration=.5)
+        baseline, calibration = benchmark.load_baseline(path)
+        self.assertEqual(calibration, .5)
+        self.assertEqual(len(baseline), len(frame))
+        self.assertEqual(len(benchmark.compare(frame, .5, baseline, calibration)), 0)
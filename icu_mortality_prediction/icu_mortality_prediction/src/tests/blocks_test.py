@@ -0,0 +1,75 @@
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.features import blocks
+from icu_mortality_prediction.src.features import chart_events
+from icu_mortality_prediction.src.features import combine
+
+
+def make_matrix(seed=0, n=300):
+    rng = np.random.RandomState(seed)
+    matrix = pd.DataFrame({'hospital_expire_flag': rng.randint(0, 2, n),
+                           'HR_mean': rng.normal(80, 10, n),
+                           'RR_mean': rng.normal(16, 3, n),
+                           'pH_first': rng.normal(7.4, .05, n),
+                           'gender': rng.choice(['F', 'M'], n)},
+                          index=pd.Index(np.arange(200000, 200000 + n), name='icustay_id'))
+    for col, rate in [('HR_mean', .1), ('RR_mean', .3), ('pH_first', .5)]:
+        matrix.loc[rng.rand(n) < rate, col] = np.nan
+    matrix.iloc[3, 1] = np.inf
+    matrix.loc[rng.rand(n) < .05, 'gender'] = None
+    return matrix
+
+
+class blocksTest(unittest.TestCase):
+
+    def test_complete_cases_match_dropna(self):
+        matrix = make_matrix()
+        observed = blocks.observed_mask(matrix)
+        for cols in [['hospital_expire_flag', 'HR_mean', 'RR_mean'], ['HR_mean', 'pH_first', 'gender']]:
+            view = blocks.complete_cases(matrix, cols, observed)
+            expected = matrix[cols].replace([np.inf, -np.inf], np.nan).dropna()
+            pd.testing.assert_frame_equal(view.frame(), expected)
+            self.assertEqual(view.shape, expected.shape)
+            pd.testing.assert_series_equal(view['HR_mean'], expected['HR_mean'])
+            self.assertTrue(np.array_equal(view.values(['HR_mean']), expected[['HR_mean']].values))
+        # THE VIEW HOLDS POSITIONS, NOT VALUES, AND ONLY ITS OWN COLUMNS
+        self.assertIs(view.matrix, matrix)
+        with self.assertRaises(KeyError):
+            view['RR_mean']
+
+    def test_quartile_levels_match_quant_cats(self):
+        matrix = make_matrix(1)
+        view = blocks.complete_cases(matrix, ['hospital_expire_flag', 'HR_mean', 'RR_mean'])
+        frame = matrix.loc[view.index, ['HR_mean', 'RR_mean']].copy()
+        stats = frame.describe()
+        for col in frame.columns:
+            Q1, Q2, Q3 = stats[col].loc['25%'], stats[col].loc['50%'], stats[col].loc['75%']
+            frame[col] = frame[col].apply(lambda x: chart_events.quant_cats(x, Q1, Q2, Q3))
+        levels = blocks.quartile_levels(view, ['HR_mean', 'RR_mean'])
+        pd.testing.assert_frame_equal(levels.astype(object), frame, check_dtype=False)
+        pd.testing.assert_frame_equal(pd.get_dummies(levels), pd.get_dummies(frame))
+
+    def test_views_score_and_combine_like_frames(self):
+        rng = np.random.RandomState(2)
+        matrix = pd.DataFrame((rng.rand(400, 6) < .4).astype(float), columns=['a', 'b', 'c', 'd', 'e', 'f'],
+                              index=pd.Index(np.arange(400), name='icustay_id'))
+        matrix.insert(0, 'hospital_expire_flag', (matrix['a'] + rng.rand(400) > 1).astype(int))
+        matrix.loc[rng.rand(400) < .2, 'e'] = np.nan
+        cols = ['hospital_expire_flag', 'a', 'b', 'e']
+        view = blocks.complete_cases(matrix, cols)
+        frame = matrix[cols].dropna()
+        by_view = chart_events.score_features({'Chart_Features': view}, min_stays=10, alpha=.5)
+        by_frame = chart_events.score_features({'Chart_Features': frame}, min_stays=10, alpha=.5)
+        for got, expected in zip(by_view['Chart_Features'], by_frame['Chart_Features']):
+            pd.testing.assert_frame_equal(got, expected)
+
+        scores = {'Chart_Features': by_frame['Chart_Features'][1]}
+        X_view, y_view = combine.combine_blocks({'Chart_Features': view}, scores, matrix, k=2)
+        X_frame, y_frame = combine.combine_blocks({'Chart_Features': frame}, scores, matrix, k=2)
+        pd.testing.assert_frame_equal(X_view, X_frame)
+        pd.testing.assert_series_equal(y_view, y_frame)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.features import combine
+from icu_mortality_prediction.src.features import feature_store
+
+
+def make_blocks(seed=0):
+    """ three overlapping blocks of binary features with their score frames """
+    rng = np.random.RandomState(seed)
+    blocks = {}
+    scores = {}
+    for name, start, n_cols in [('Chart_Features', 0, 6), ('Lab_Features', 20, 4), ('Ptnt_Demog_Features', 5, 5)]:
+        index = pd.Index(np.arange(200000 + start, 200100), name='icustay_id')
+        cols = ['{}_{}'.format(name.split('_')[0], i) for i in range(n_cols)]
+        frame = pd.DataFrame((rng.rand(len(index), n_cols) < 0.4).astype(float), index=index, columns=cols)
+        frame.insert(0, 'hospital_expire_flag', 0)
+        blocks[name] = frame.sample(frac=1, random_state=seed)
+        scores[name] = pd.DataFrame({'p_values': rng.rand(n_cols) / 100, 'scores': rng.rand(n_cols)}, index=cols)
+    outcomes = pd.DataFrame({'hospital_expire_flag': rng.randint(0, 2, 110)},
+                            index=pd.Index(np.arange(199995, 200105), name='icustay_id'))
+    return blocks, scores, outcomes
+
+
+def notebook_merge(blocks, scores, outcomes, k):
+    """ the merge loop of ICU_MORTALITY_FIRST24.ipynb """
+    all_scores = pd.concat([scores[name] for name in sorted(scores)])
+    top_scores = list(all_scores.sort_values(by='p_values', kind='mergesort').head(k).index)
+    all_data = outcomes
+    for frame in sorted(blocks):
+        for col in blocks[frame].columns:
+            if col in top_scores:
+                all_data = all_data.merge(pd.DataFrame(blocks[frame][col]), left_index=True,
+                                          right_index=True, how='inner', sort=True)
+    return all_data
+
+
+class combineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks, self.scores, self.outcomes = make_blocks()
+
+    def test_matches_notebook_merge(self):
+        X, y = combine.combine_blocks(self.blocks, self.scores, self.outcomes, k=8)
+        expected = notebook_merge(self.blocks, self.scores, self.outcomes, k=8)
+        pd.testing.assert_frame_equal(X, expected[expected.columns[1:]], check_names=False)
+        np.testing.assert_array_equal(y, expected['hospital_expire_flag'])
+
+    def test_outer_and_order(self):
+        X, y = combine.combine_blocks(self.blocks, self.scores, self.outcomes, k=8, how='outer', order='p_value')
+        self.assertEqual(list(X.columns), combine.top_features(self.scores, 8))
+        self.assertEqual(len(X), 100)
+        self.assertTrue(X.index.is_monotonic_increasing)
+        self.assertEqual(len(y), len(X))
+        with self.assertRaises(ValueError):
+            combine.combine_blocks(self.blocks, self.scores, self.outcomes, how='left')
+
+    def test_from_store(self):
+        root = tempfile.mkdtemp()
+        try:
+            for name in sorted(self.blocks):
+                block = self.blocks[name].drop('hospital_expire_flag', axis=1)
+                provenance = dict((col, {'block': name, 'p_value': self.scores[name].loc[col, 'p_values']})
+                                  for col in block.columns)
+                feature_store.write_features(root, block, provenance)
+            feature_store.write_features(root, self.outcomes)
+            X, y = combine.combine_from_store(root, k=8)
+            expected, _ = combine.combine_blocks(self.blocks, self.scores, self.outcomes, k=8, order='p_value')
+            pd.testing.assert_frame_equal(X, expected, check_names=False)
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    unittest.main()
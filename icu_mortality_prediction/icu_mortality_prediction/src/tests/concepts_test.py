@@ -0,0 +1,79 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.data import synthetic
+from icu_mortality_prediction.src.features import chart_events
+from icu_mortality_prediction.src.features import concepts
+from icu_mortality_prediction.src.features import lab_events
+from icu_mortality_prediction.src.utils import pipeline
+
+
+def make_events():
+    # CAREVUE AND METAVISION HEART RATE, TEMPERATURE IN F AND C AND AN ITEM OUTSIDE THE MAP
+    return pd.DataFrame({'icustay_id': [1, 1, 2, 2, 2, 3],
+                         'itemid': [211, 220045, 678, 223762, 223761, 999999],
+                         'label': ['Heart Rate', 'Heart Rate', 'Temperature F', 'Temperature Celsius',
+                                   'Temperature Fahrenheit', 'Some Other Item'],
+                         'valuenum': [80., 90., 98.6, 37.2, 100.4, 5.]})
+
+
+class conceptsTest(unittest.TestCase):
+
+    def test_itemids_merge_items_and_convert_units(self):
+        data = concepts.assign_concepts(make_events(), 'chart')
+        hr, temp = concepts.concept_id('chart', 'HR'), concepts.concept_id('chart', 'TempC')
+        self.assertEqual(data['concept'].dtype, np.int16)
+        self.assertEqual(list(data['concept']), [hr, hr, temp, temp, temp, concepts.UNMAPPED])
+        np.testing.assert_allclose(data['valuenum'], [80., 90., 37., 37.2, 38., 5.])
+        self.assertEqual(list(data['label']), ['Heart Rate'] * 2 + ['Temperature C'] * 3 + ['Some Other Item'])
+        self.assertNotIn('itemid', data.columns)
+        self.assertEqual(concepts.concept_stays(data).to_dict(), {hr: 1, temp: 1})
+
+    def test_labels_give_the_same_concepts(self):
+        by_item = concepts.assign_concepts(make_events(), 'chart')
+        by_label = concepts.assign_concepts(make_events().drop('itemid', axis=1), 'chart')
+        pd.testing.assert_frame_equal(by_label, by_item)
+
+    def test_concept_map_edit_invalidates_ingest(self):
+        """ a changed unit conversion recomputes the cached event stages """
+        chart = pipeline.Pipeline(chart_events.stages())
+        labs = pipeline.Pipeline(lab_events.stages())
+        keys = dict(chart.keys(), **labs.keys())
+        temp = concepts.concept_id('chart', 'TempC')
+        edited = [concept if concept[0] != temp else concept[:5] + (concept[5][:2],) for concept in concepts.CONCEPTS]
+        with mock.patch.object(concepts, 'CONCEPTS', edited):
+            changed = dict(chart.keys(), **labs.keys())
+        self.assertNotEqual(changed['chart_events'], keys['chart_events'])
+        self.assertNotEqual(changed['lab_events'], keys['lab_events'])
+        self.assertEqual(dict(chart.keys(), **labs.keys()), keys)
+
+    def test_missing_measurement_leaves_the_other_names(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                paths = synthetic.write_synthetic(os.path.join(tmp, 'data'), 300, seed=3)
+                data = chart_events.import_chartevents_data(paths['chart'])
+                columns = chart_events.explore_data(data, min_samples=10)
+                stats = chart_events.aggregate_stats(data, *columns)
+                # WITHOUT Art.pH, THE FIRST LABEL IN SORTED ORDER THE SCRIPTS PICKED BY POSITION
+                sparse = data[data['label'] != 'Art.pH']
+                sparse_columns = chart_events.explore_data(sparse, min_samples=10)
+                sparse_stats = chart_events.aggregate_stats(sparse, *sparse_columns)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertNotIn(concepts.concept_id('chart', 'pH2'), sparse_columns[0])
+        self.assertEqual(sparse_columns[1:], columns[1:])
+        self.assertEqual(set(stats[0]['means']) - set(sparse_stats[0]['means']), set(['pH2_mean']))
+        pd.testing.assert_frame_equal(sparse_stats[0]['means']['HR_mean'], stats[0]['means']['HR_mean'])
+        self.assertEqual(list(sparse_stats[1]['Weight'].columns)[0], 'Admission Weight (Kg)')
+        self.assertEqual(list(sparse_stats[2]), ['GCS_Eye', 'GCS_Motor', 'GCS_Verbal', 'GCS_total', 'Cap_refill'])
+
+
+if __name__ == '__main__':
+    unittest.main()
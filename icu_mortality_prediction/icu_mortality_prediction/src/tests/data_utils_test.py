@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src import main
+from icu_mortality_prediction.src.features import blocks
+from icu_mortality_prediction.src.utils import data_utils
+from icu_mortality_prediction.src.utils import executor
+from icu_mortality_prediction.src.utils.pipeline import Pipeline, Stage
+
+
+def make_frame(n=500, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({'icustay_id': np.arange(200000, 200000 + n),
+                         'hospital_expire_flag': rng.randint(0, 2, n),
+                         'GCS_Eye_4': rng.randint(0, 2, n),
+                         'count': rng.randint(0, 1000, n),
+                         'HR_mean': np.round(rng.normal(80, 10, n), 1),
+                         'exact': rng.rand(n) * 1e-3 + 1e6,
+                         'label': rng.choice(['Heart Rate', 'Respiratory Rate'], n),
+                         'note': ['note {}'.format(i) for i in range(n)]})
+
+
+def events(n):
+    return make_frame(n)
+
+
+def stays(frame):
+    return frame[['icustay_id', 'HR_mean', 'label']]
+
+
+class dataUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_plan(self):
+        frame = make_frame()
+        groups = data_utils.columns_by_data_type(frame)
+        self.assertEqual(groups['float64_cols'], ['HR_mean', 'exact'])
+        self.assertEqual(groups['int64_cols'], ['icustay_id', 'hospital_expire_flag', 'GCS_Eye_4', 'count'])
+        plan = data_utils.plan_dtypes(frame)
+        # exact NEEDS MORE DIGITS THAN float32 HOLDS, note HAS A VALUE PER ROW
+        self.assertEqual(plan, {'icustay_id': 'int32', 'hospital_expire_flag': 'int8', 'GCS_Eye_4': 'int8',
+                                'HR_mean': 'float32', 'label': 'category'})
+        compact = data_utils.apply_dtypes(frame, plan)
+        narrowed = list(plan)
+        self.assertLess(compact[narrowed].memory_usage(deep=True).sum(),
+                        frame[narrowed].memory_usage(deep=True).sum() / 2)
+        pd.testing.assert_frame_equal(compact.astype(frame.dtypes.to_dict()), frame, check_exact=False, rtol=1e-6)
+
+    def test_compact_keeps_shared_matrices_shared(self):
+        frame = make_frame().set_index('icustay_id')
+        observed = blocks.observed_mask(frame)
+        views = {'a': blocks.complete_cases(frame, ['hospital_expire_flag', 'HR_mean'], observed),
+                 'b': blocks.complete_cases(frame, ['hospital_expire_flag', 'count'], observed)}
+        result = data_utils.compact((views, [frame['HR_mean']], 3))
+        self.assertIs(result[0]['a'].matrix, result[0]['b'].matrix)
+        self.assertEqual(result[0]['a'].matrix['HR_mean'].dtype, np.float32)
+        self.assertEqual(result[1][0].dtype, np.float32)
+        self.assertEqual(result[2], 3)
+
+    def test_boundary_applies_to_every_stage(self):
+        stages = [Stage('events', events, params={'n': 300}), Stage('stays', stays, ['events'])]
+        plain = Pipeline(stages)
+        compact = Pipeline(stages, boundary=data_utils.compact)
+        self.assertNotEqual(plain.keys()['stays'], compact.keys()['stays'])
+        self.assertEqual(plain.run(['stays'])['stays']['HR_mean'].dtype, np.float64)
+        for results in [compact.run(['events', 'stays']),
+                        executor.Executor(compact, n_jobs=2, scratch_dir=self.tmp).run(['events', 'stays'])]:
+            self.assertEqual(results['events']['icustay_id'].dtype, np.int32)
+            self.assertEqual(results['stays']['HR_mean'].dtype, np.float32)
+            self.assertTrue(isinstance(results['stays']['label'].dtype, pd.CategoricalDtype))
+
+    def test_memory_budget_partitions(self):
+        path = os.path.join(self.tmp, 'events.csv')
+        make_frame(2000).to_csv(path, index=False)
+        parsed = os.path.getsize(path) * main.PARSED_SIZE_FACTOR
+        self.assertIsNone(main.budget_partitions(None, [path]))
+        self.assertIsNone(main.budget_partitions(parsed, [path]))
+        self.assertEqual(main.budget_partitions(parsed // 2, [path]), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from sklearn import metrics as skmetrics
+from sklearn.svm import LinearSVC
+from sklearn.tree import DecisionTreeClassifier
+from icu_mortality_prediction.src.models import evaluation
+from icu_mortality_prediction.src.tests.fixtures import make_features
+
+
+class evaluationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.X, cls.y = make_features(n=400)
+        cls.models = {'Tree': DecisionTreeClassifier(random_state=42),
+                      'LSVC_recall': {'CLF': LinearSVC(class_weight={1: 4, 0: 1}),
+                                      'PARAMS': {'features': 5}}}
+        cls.predictions = evaluation.collect_predictions(cls.models, cls.X, cls.y, cv=4)
+
+    def test_one_fit_per_fold(self):
+        # 4 CV FOLDS AND THE TEST SPLIT FOR EACH MODEL
+        folds = self.predictions.groupby(['model', 'split'])['fold'].nunique()
+        self.assertEqual(folds[('Tree', 'cv')], 4)
+        self.assertEqual(folds[('Tree', 'test')], 1)
+        cv = self.predictions[(self.predictions.model == 'Tree') & (self.predictions.split == 'cv')]
+        self.assertEqual(len(cv), 280)
+        self.assertFalse(cv['stay'].duplicated().any())
+
+    def test_scores_match_sklearn(self):
+        table = evaluation.score_table(self.predictions)
+        for _, row in table.iterrows():
+            group = self.predictions[(self.predictions.model == row['model']) &
+                                     (self.predictions.split == row['split']) &
+                                     (self.predictions.fold == row['fold'])]
+            surv, mort = skmetrics.recall_score(group.y_true, group.y_pred, average=None)
+            self.assertAlmostEqual(row['recall metric'], surv + mort - abs(surv - mort))
+            self.assertAlmostEqual(row['f1'], skmetrics.f1_score(group.y_true, group.y_pred))
+            self.assertAlmostEqual(row['roc auc'], skmetrics.roc_auc_score(group.y_true, group.score))
+            np.testing.assert_array_equal(skmetrics.confusion_matrix(group.y_true, group.y_pred).ravel(),
+                                          row[['tn', 'fp', 'fn', 'tp']].astype(int))
+
+    def test_new_metric_from_cache(self):
+        """ a new metric is computed from the cached arrays, so it works after a reload """
+        scratch = tempfile.mkdtemp()
+        try:
+            path = os.path.join(scratch, 'predictions.csv')
+            evaluation.save_predictions(self.predictions, path)
+            cached = evaluation.load_predictions(path)
+        finally:
+            shutil.rmtree(scratch)
+        kappa = lambda y_true, y_pred, score: skmetrics.cohen_kappa_score(y_true, y_pred)
+        table = evaluation.score_table(cached, by=['model', 'split'], extra_metrics={'kappa': kappa})
+        test = cached[(cached.model == 'Tree') & (cached.split == 'test')]
+        row = table[(table.model == 'Tree') & (table.split == 'test')].iloc[0]
+        self.assertAlmostEqual(row['kappa'], skmetrics.cohen_kappa_score(test.y_true, test.y_pred))
+
+    def test_classification_report_frame(self):
+        report = evaluation.classification_report_frame(self.predictions)
+        test = self.predictions[(self.predictions.model == 'Tree') & (self.predictions.split == 'test')]
+        expected = skmetrics.classification_report(test.y_true, test.y_pred, output_dict=True)
+        rows = report.loc[('Tree', 'test')]
+        self.assertEqual(list(rows.index), ['Survivors', 'Non-Survivors', 'Avg/Total'])
+        self.assertAlmostEqual(rows.loc['Non-Survivors', 'precision'], expected['1']['precision'])
+        self.assertAlmostEqual(rows.loc['Avg/Total', 'f1-score'], expected['weighted avg']['f1-score'])
+        self.assertEqual(rows.loc['Avg/Total', 'support'], len(test))
+
+    def test_summaries(self):
+        table = evaluation.score_table(self.predictions[self.predictions.split == 'cv'])
+        summary = evaluation.summarize(table)
+        self.assertAlmostEqual(summary.loc[('Tree', 'cv'), ('recall', 'mean')],
+                               table[table.model == 'Tree']['recall'].mean())
+        matrices = evaluation.confusion_matrices(self.predictions)
+        self.assertEqual(len(matrices), 4 * 4)
+        self.assertEqual(matrices.groupby(['model', 'split'])['count'].sum()[('Tree', 'test')], 120)
+
+
+if __name__ == "__main__":
+    unittest.main()
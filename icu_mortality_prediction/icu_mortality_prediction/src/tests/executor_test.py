@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from icu_mortality_prediction.src.features import build
+from icu_mortality_prediction.src.utils import executor
+from icu_mortality_prediction.src.utils.pipeline import Pipeline, Stage
+
+
+def load(value, delay=0.0):
+    time.sleep(delay)
+    return [value] * 3
+
+
+def total(values, delay=0.0):
+    time.sleep(delay)
+    return sum(values)
+
+
+def broken(values):
+    raise ValueError("bad block")
+
+
+def merge(*totals):
+    return list(totals)
+
+
+def make_stages(delay=0.0, fail=False):
+    stages = [Stage('merged', merge, ['chart_total', 'lab_total', 'demog_total'])]
+    for i, source in enumerate(['chart', 'lab', 'demog']):
+        stages.append(Stage(source + '_events', load, params={'value': i + 1, 'delay': delay}))
+        func = broken if fail and source == 'lab' else total
+        params = {} if func is broken else {'delay': delay}
+        stages.append(Stage(source + '_total', func, [source + '_events'], params=params, cache=False))
+    return stages
+
+
+class executorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_branches_run_side_by_side(self):
+        pipe = Pipeline(make_stages(delay=0.4), os.path.join(self.tmp, 'cache'))
+        runner = executor.Executor(pipe, n_jobs=3, scratch_dir=self.tmp)
+        self.assertEqual(runner.run(), {'merged': [3, 6, 9]})
+        # THREE BRANCHES OF TWO 0.4S STAGES, CLOSE TO ONE BRANCH RATHER THAN ALL SIX
+        self.assertLess(runner.wall_time, 2.0)
+        self.assertEqual(set(runner.report.status), set(['computed']))
+        self.assertEqual(len(set(runner.report.pid)), 3)
+
+        # MEMOIZED STAGES ARE READ, THEIR INPUTS ARE NOT RECOMPUTED
+        again = executor.Executor(pipe, n_jobs=3, scratch_dir=self.tmp)
+        self.assertEqual(again.run(), {'merged': [3, 6, 9]})
+        self.assertEqual(list(again.report.status), ['loaded'])
+        # NOTHING LEFT IN THE SCRATCH DIRECTORY
+        self.assertEqual(os.listdir(self.tmp), ['cache'])
+
+    def test_failure_report(self):
+        pipe = Pipeline(make_stages(fail=True))
+        with self.assertRaises(executor.PipelineError) as raised:
+            executor.run_parallel(pipe, n_jobs=2, scratch_dir=self.tmp)
+        report = raised.exception.report.set_index('stage')
+        self.assertEqual(report.loc['lab_total', 'status'], 'failed')
+        self.assertIn('bad block', report.loc['lab_total', 'error'])
+        self.assertEqual(report.loc['merged', 'status'], 'skipped')
+        self.assertEqual(report.loc['chart_total', 'status'], 'computed')
+        self.assertIn('lab_total failed', str(raised.exception))
+
+    def test_cancel(self):
+        event = threading.Event()
+        event.set()
+        with self.assertRaises(executor.PipelineError) as raised:
+            executor.run_parallel(Pipeline(make_stages()), n_jobs=2, cancel_event=event)
+        self.assertEqual(set(raised.exception.report.status), set(['cancelled']))
+
+    def test_cross_source_graph(self):
+        pipe = Pipeline(build.stages())
+        self.assertEqual(pipe.upstream(['combined'])[-1], 'combined')
+        for source in ['chart', 'lab', 'demog']:
+            self.assertFalse([name for name in pipe.upstream([source + '_selected'])
+                              if not name.startswith(source)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.features import combine
+from icu_mortality_prediction.src.features import feature_store
+from icu_mortality_prediction.src.tests.fixtures import write_pipeline_features
+
+
+class featureStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.join(tempfile.mkdtemp(), 'store')
+        self.chart = pd.DataFrame({'HR_mean_Q3': np.array([1, 0, 1, 0], dtype=np.uint8),
+                                   'TempC_std': [0.1, np.nan, 0.3, 0.2],
+                                   'gender': ['F', 'M', None, 'F']},
+                                  index=pd.Index([200010, 200003, 200007, 200001], name='icustay_id'))
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.root))
+
+    def test_round_trip_keeps_types(self):
+        feature_store.write_features(self.root, self.chart, {'source': 'chart_events'})
+        frame = feature_store.read_features(self.root)
+        self.assertEqual(list(frame.index), [200001, 200003, 200007, 200010])
+        expected = self.chart.sort_index()
+        self.assertEqual(frame['HR_mean_Q3'].dtype, np.uint8)
+        np.testing.assert_array_equal(frame['HR_mean_Q3'], expected['HR_mean_Q3'])
+        np.testing.assert_array_equal(frame['TempC_std'], expected['TempC_std'])
+        np.testing.assert_array_equal(frame['gender'].isnull(), expected['gender'].isnull())
+        self.assertEqual(list(frame['gender'].dropna()), ['F', 'M', 'F'])
+        self.assertEqual(feature_store.describe(self.root).loc['TempC_std', 'source'], 'chart_events')
+
+    def test_projection_and_stay_filter(self):
+        feature_store.write_features(self.root, self.chart)
+        frame = feature_store.read_features(self.root, columns=['TempC_std'], stays=[200010, 200001])
+        self.assertEqual(list(frame.columns), ['TempC_std'])
+        self.assertEqual(list(frame.index), [200010, 200001])
+        np.testing.assert_array_equal(frame['TempC_std'], [0.1, 0.2])
+        with self.assertRaises(KeyError):
+            feature_store.read_features(self.root, stays=[1])
+
+    def test_versions_and_new_stays(self):
+        """ a block with new stays gives the old columns missing values, old versions stay readable """
+        feature_store.write_features(self.root, self.chart)
+        labs = pd.DataFrame({'Creat_abnflag': [1, 0]}, index=pd.Index([200001, 200099], name='icustay_id'))
+        version = feature_store.write_features(self.root, labs, {'Creat_abnflag': {'source': 'lab_events',
+                                                                                   'statistic': 'abnflag'}})
+        self.assertEqual(feature_store.list_versions(self.root), ['v0001', 'v0002'])
+        self.assertEqual(version, 'v0002')
+
+        frame = feature_store.read_features(self.root)
+        self.assertEqual(len(frame), 5)
+        self.assertTrue(np.isnan(frame.loc[200099, 'HR_mean_Q3']))
+        self.assertTrue(np.isnan(frame.loc[200003, 'Creat_abnflag']))
+        self.assertEqual(frame.loc[200001, 'Creat_abnflag'], 1)
+        complete = feature_store.read_features(self.root, columns=['HR_mean_Q3'], stays=[200001, 200003])
+        self.assertEqual(complete['HR_mean_Q3'].dtype, np.uint8)
+
+        old = feature_store.read_features(self.root, version=1)
+        self.assertEqual(len(old), 4)
+        self.assertNotIn('Creat_abnflag', old.columns)
+
+        feature_store.drop_columns(self.root, ['gender'])
+        self.assertNotIn('gender', feature_store.read_features(self.root).columns)
+        self.assertIn('gender', feature_store.read_features(self.root, version=2).columns)
+
+
+class pipelineStoreTest(unittest.TestCase):
+    """ the store of a features all run, imported from its CSVs and written by features --store """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.written = os.path.join(cls.tmp, 'written')
+        cls.features_dir = write_pipeline_features(cls.tmp, store=cls.written)
+        cls.store = os.path.join(cls.tmp, 'imported')
+        with contextlib.redirect_stdout(io.StringIO()):
+            feature_store.import_feature_csvs(cls.features_dir, cls.store)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_block_provenance(self):
+        schema = feature_store.describe(self.store)
+        features = schema[schema.index != 'hospital_expire_flag']
+        self.assertEqual(sorted(features['source'].unique()), ['chart_events', 'lab_events', 'ptnt_demog'])
+        np.testing.assert_array_equal(features['source'], features['block'].map(feature_store.BLOCK_SOURCES))
+        # combined.csv IS NOT A BLOCK, THE SELECTED COLUMNS KEEP THEIR BLOCK AND P-VALUE
+        combined = pd.read_csv(os.path.join(self.features_dir, 'combined.csv'), index_col=0)
+        self.assertTrue(features.loc[combined.columns[:-1], 'p_value'].notnull().all())
+        self.assertEqual(schema.loc['GCS Total_3', 'block'], 'GCSTotal_Features')
+
+    def test_partial_blocks_stay_numeric(self):
+        frame = feature_store.read_features(self.store)
+        block = pd.read_csv(os.path.join(self.features_dir, 'GCSTotal_Features.csv'), index_col=0)
+        self.assertLess(len(block), len(frame))
+        self.assertEqual(block['GCS Total_3'].dtype, bool)
+        np.testing.assert_array_equal(frame.loc[block.index, 'GCS Total_3'], block['GCS Total_3'].astype(float))
+        self.assertTrue(frame['GCS Total_3'].drop(block.index).isnull().all())
+
+        # select --store GIVES THE DESIGN MATRIX select GIVES FROM THE CSVS
+        X, y = combine.combine_from_store(self.store, k=20)
+        combined = pd.read_csv(os.path.join(self.features_dir, 'combined.csv'), index_col=0)
+        pd.testing.assert_frame_equal(X, combined.drop('hospital_expire_flag', axis=1).astype(float))
+        np.testing.assert_array_equal(y, combined['hospital_expire_flag'])
+
+    def test_features_store_matches_import(self):
+        pd.testing.assert_frame_equal(feature_store.read_features(self.written),
+                                      feature_store.read_features(self.store))
+        pd.testing.assert_frame_equal(feature_store.describe(self.written), feature_store.describe(self.store))
+
+
+if __name__ == "__main__":
+    unittest.main()
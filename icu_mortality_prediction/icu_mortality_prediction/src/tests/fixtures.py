@@ -0,0 +1,87 @@
+""" data shared by the test modules """
+import contextlib
+import io
+import os
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src import main
+
+
+def make_features(n=300, n_feats=10, seed=0):
+    """ binary features, the leading ones correlated with the outcome """
+    rng = np.random.RandomState(seed)
+    y = (rng.rand(n) < 0.2).astype(int)
+    X = (rng.rand(n, n_feats) < 0.3).astype(int)
+    X[:, :3] |= (rng.rand(n, 3) < 0.6) & (y[:, None] == 1)
+    return pd.DataFrame(X, columns=['f{}'.format(i) for i in range(n_feats)]), pd.Series(y)
+
+
+def make_stays(n=60, seed=0):
+    """ raw chart events, lab events and demographics of n synthetic stays """
+    rng = np.random.RandomState(seed)
+    stays = np.arange(200000, 200000 + n)
+    intime = pd.Timestamp('2150-01-01') + pd.to_timedelta(rng.randint(0, 1000, n), unit='D')
+
+    rows = []
+    for label, mean, sd in [('Heart Rate', 90, 15), ('Respiratory Rate', 20, 5), ('GCS Total', 12, 2)]:
+        for i, stay in enumerate(stays):
+            for k in range(rng.randint(2, 8)):
+                value = rng.normal(mean, sd)
+                rows.append({'icustay_id': stay, 'label': label,
+                             'charttime': intime[i] + pd.Timedelta(hours=3 * k),
+                             'valuenum': value, 'value': str(int(round(value)))})
+    events = pd.DataFrame(rows)
+
+    rows = []
+    for i, stay in enumerate(stays):
+        for k in range(rng.randint(1, 4)):
+            value = rng.normal(1.2, 0.5)
+            rows.append({'icustay_id': stay, 'label': 'Creatinine',
+                         'charttime': intime[i] + pd.Timedelta(hours=6 * k), 'valuenum': value,
+                         'flag': 'abnormal' if value > 1.5 else np.nan})
+    labs = pd.DataFrame(rows)
+
+    demographics = pd.DataFrame({'icustay_id': np.repeat(stays, 2),
+                                 'first_careunit': np.repeat(rng.choice(['MICU', 'SICU', 'CCU'], n), 2),
+                                 'dob': np.repeat(intime - pd.to_timedelta(rng.randint(20, 90, n) * 365, unit='D'), 2),
+                                 'intime': np.repeat(intime, 2),
+                                 'outtime': np.repeat(intime + pd.to_timedelta(rng.randint(20, 200, n), unit='h'), 2),
+                                 'admittime': np.repeat(intime - pd.Timedelta(hours=5), 2),
+                                 'dischtime': np.repeat(intime + pd.Timedelta(days=12), 2),
+                                 'icd9_code': rng.choice(['0380', '4280', '5849'], 2 * n)})
+    return events, labs, demographics
+
+
+DEFINITIONS = {'HR_mean': {'source': 'chart', 'label': 'Heart Rate', 'stat': 'mean', 'encoding': 'quartiles'},
+               'HR_slope': {'source': 'chart', 'label': 'Heart Rate', 'stat': 'slope', 'encoding': 'quartiles'},
+               'RR_max': {'source': 'chart', 'label': 'Respiratory Rate', 'stat': 'max', 'encoding': 'quartiles'},
+               'GCS Total': {'source': 'chart', 'label': 'GCS Total', 'stat': 'value', 'encoding': 'dummies'},
+               'Creat_abnflag': {'source': 'lab', 'label': 'Creatinine', 'stat': 'abnflag', 'encoding': 'flag'},
+               'age': {'source': 'demographics', 'label': 'age', 'encoding': 'quartiles', 'bounds': [None, 110]},
+               'first_careunit': {'source': 'demographics', 'label': 'first_careunit', 'encoding': 'dummies'},
+               'Septicemia (except in labor)': {'source': 'diagnoses', 'label': 'Septicemia (except in labor)',
+                                                'codes': ['0380', '99591'], 'encoding': 'flag'}}
+
+FEATURES = ['HR_mean_Q0', 'HR_mean_Q3', 'HR_slope_Q1', 'GCS Total_12', 'Creat_abnflag', 'age_Q3',
+            'first_careunit_MICU', 'Septicemia (except in labor)']
+
+
+def write_pipeline_features(data_dir, n_stays=1000, seed=0, store=None):
+    """ synthetic extract of n_stays under data_dir and the features all output of it.
+
+    the mortality rate is raised so that a block of every source has features with
+    p < .001 at this size.
+
+    :param store: also write the selected blocks to this feature store
+    :return: the features directory
+    """
+    argv = ['--data-dir', data_dir, '--jobs', '1']
+    features = ['features', 'all', '--threshold-scale', str(n_stays / 60000.)] + argv
+    if store is not None:
+        features += ['--store', store]
+    with contextlib.redirect_stdout(io.StringIO()):
+        if main.main(['synthesize', '--stays', str(n_stays), '--seed', str(seed), '--mortality-rate', '.3'] + argv):
+            raise RuntimeError("synthesize failed")
+        if main.main(features):
+            raise RuntimeError("features all failed")
+    return os.path.join(data_dir, os.path.relpath(main.PATHS['features_dir'], main.DATA_DIR))
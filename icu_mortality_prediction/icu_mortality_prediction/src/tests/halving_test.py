@@ -0,0 +1,39 @@
+import unittest
+from icu_mortality_prediction.src.models import halving
+from icu_mortality_prediction.src.models import search
+from icu_mortality_prediction.src.tests.fixtures import make_features
+
+
+class halvingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X, self.y = make_features(n=600)
+
+    def test_resource_schedule(self):
+        self.assertEqual(halving.resource_schedule(40, 900, 100, 3), [100, 300, 900])
+        self.assertEqual(halving.resource_schedule(2, 900, 100, 3), [300, 900])
+        self.assertEqual(halving.resource_schedule(1, 900, 100, 3), [900])
+
+    def test_halving_against_exhaustive(self):
+        history, best = halving.halving_search(self.X, self.y, name='Tree', feature_counts=[4, 6],
+                                               min_resources=40, cv=3)
+        self.assertTrue(best['COMPLETE'])
+        rounds = history.groupby('round').size()
+        self.assertTrue((rounds.diff().dropna() < 0).all())
+
+        cv_results = search.search_classifiers(self.X, self.y, names=['Tree'], feature_counts=[4, 6],
+                                               cv=3)[0]
+        report = halving.compare_to_exhaustive(history, best, cv_results)
+        self.assertAlmostEqual(report['halving_pick'], best['CV_SCORE'])
+        self.assertGreaterEqual(report['rank'], 1)
+        self.assertLess(report['halving_rows'], report['exhaustive_rows'])
+
+    def test_time_budget(self):
+        history, best = halving.halving_search(self.X, self.y, name='Tree', feature_counts=[4, 6],
+                                               min_resources=40, cv=3, time_budget=0)
+        self.assertFalse(best['COMPLETE'])
+        self.assertEqual(history['round'].max(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src import main
+from icu_mortality_prediction.src.features import combine
+from icu_mortality_prediction.src.features import feature_store
+from icu_mortality_prediction.src.models import artifacts
+from icu_mortality_prediction.src.models import incremental
+from icu_mortality_prediction.src.tests import fixtures
+
+
+def make_stays(n_stays=1200, seed=0):
+    # DUMMY FEATURES OF n_STAYS, a AND b PREDICT THE OUTCOME, c IS NOISE
+    rng = np.random.RandomState(seed)
+    y = (rng.rand(n_stays) < .2).astype(int)
+    frame = pd.DataFrame({'hospital_expire_flag': y}, index=pd.Index(np.arange(200001, 200001 + n_stays),
+                                                                     name='icustay_id'))
+    frame['a'] = np.where(rng.rand(n_stays) < .8, y, rng.rand(n_stays) < .2).astype(float)
+    frame['b'] = np.where(rng.rand(n_stays) < .6, y, rng.rand(n_stays) < .2).astype(float)
+    frame['c'] = (rng.rand(n_stays) < .5).astype(float)
+    return frame
+
+
+def write_store(root, frame, p_values):
+    provenance = dict((col, {'block': 'Chart_Features', 'p_value': p}) for col, p in p_values.items())
+    return feature_store.write_features(root, frame, provenance)
+
+
+class incrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = os.path.join(self.tmp, 'store')
+        self.models = os.path.join(self.tmp, 'models')
+        self.frame = make_stays()
+        self.p_values = {'a': 1e-6, 'b': 1e-4, 'c': .5}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def update(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return incremental.update_model(self.store, self.models, 'SGD_log', k=2, batch_size=100, **kwargs)
+
+    def test_updates_continue_the_checkpoint(self):
+        write_store(self.store, self.frame.iloc[:600], self.p_values)
+        first, first_meta = self.update()
+        coef = first.coef_.copy()
+        write_store(self.store, self.frame, self.p_values)
+        second, second_meta = self.update()
+
+        self.assertEqual(second_meta['features'], ['a', 'b'])
+        self.assertEqual(artifacts.list_versions(self.models, 'SGD_log'), ['v0001', 'v0002'])
+        history = second_meta['scores']['history']
+        self.assertEqual([h['store_version'] for h in history], ['v0001', 'v0002'])
+        self.assertEqual([h['refit'] for h in history], [True, False])
+        stays = self.frame.index.values
+        new = stays[600:][~incremental.validation_mask(stays[600:])]
+        self.assertEqual(history[1]['new_stays'], len(new))
+        self.assertEqual(second_meta['extra']['trained_stays'], (~incremental.validation_mask(stays)).sum())
+        self.assertEqual(history[1]['validation_stays'], incremental.validation_mask(stays).sum())
+        self.assertGreater(second_meta['scores']['validation']['recall metric'], .5)
+
+        # THE SECOND VERSION IS THE FIRST CONTINUED ON THE NEW STAYS
+        expected = artifacts.load_model(self.models, 'SGD_log', 1, mmap=False)[0]
+        for X, y in incremental.iter_batches(self.store, new, ['a', 'b'], 100, np.random.RandomState(43)):
+            expected.partial_fit(X, y, classes=incremental.CLASSES)
+        np.testing.assert_allclose(second.coef_, expected.coef_)
+        self.assertFalse(np.allclose(second.coef_, coef))
+
+        # NOTHING NEW, NO NEW VERSION
+        _, same = self.update()
+        self.assertEqual(same['version'], second_meta['version'])
+
+    def test_validation_stays_are_never_trained_on(self):
+        mask = incremental.validation_mask(self.frame.index.values)
+        self.assertTrue(0 < mask.sum() < len(mask) / 5.)
+        np.testing.assert_array_equal(incremental.validation_mask(self.frame.index.values[::-1]), mask[::-1])
+        # FLIPPING THE OUTCOME OF THE VALIDATION STAYS LEAVES THE MODEL AS IT WAS
+        flipped = self.frame.copy()
+        flipped.loc[mask, 'hospital_expire_flag'] = 1 - flipped.loc[mask, 'hospital_expire_flag']
+        write_store(self.store, self.frame, self.p_values)
+        clf, _ = self.update()
+        write_store(self.store, flipped, self.p_values)
+        refit, _ = self.update(refit=True)
+        np.testing.assert_allclose(refit.coef_, clf.coef_)
+
+    def test_feature_change_refits(self):
+        write_store(self.store, self.frame.iloc[:600], self.p_values)
+        self.update()
+        self.p_values['c'] = 1e-8
+        write_store(self.store, self.frame, self.p_values)
+        _, metadata = self.update()
+        self.assertEqual(metadata['features'], ['c', 'a'])
+        self.assertTrue(metadata['scores']['history'][-1]['refit'])
+        self.assertEqual(len(metadata['scores']['history']), 1)
+        self.assertEqual(metadata['extra']['trained_stays'],
+                         (~incremental.validation_mask(self.frame.index.values)).sum())
+
+    def test_update_pipeline_store(self):
+        """ update trains on a store imported from the features all output """
+        features_dir = fixtures.write_pipeline_features(self.tmp)
+        version = feature_store.import_feature_csvs(features_dir, self.store)
+        argv = ['update', '--store', self.store, '--models-dir', self.models, '--name', 'SGD_log', '--k', '10',
+                '--batch-size', '100', '--jobs', '1']
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main.main(argv), 0)
+        clf, metadata = artifacts.load_model(self.models, 'SGD_log')
+        self.assertEqual(metadata['features'], combine.top_store_features(self.store, 10))
+        self.assertEqual(metadata['extra']['store_version'], version)
+
+        # THE STAYS WITHOUT ALL TEN FEATURES ARE COUNTED BUT LEFT OUT OF THE BATCHES
+        stays = feature_store.read_stays(self.store)
+        self.assertEqual(metadata['extra']['trained_stays'], (~incremental.validation_mask(stays)).sum())
+        frame = feature_store.read_features(self.store, columns=['hospital_expire_flag'] + metadata['features'])
+        self.assertTrue(0 < len(frame.dropna()) < len(stays))
+        self.assertIn('recall metric', metadata['scores']['validation'])
+        self.assertEqual(clf.coef_.shape, (1, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction import DATA_DIR, LAB_EVENTS_CSV, MODELS_DIR, REPORTS_DIR
+from icu_mortality_prediction.src import main
+from icu_mortality_prediction.src.features import combine
+from icu_mortality_prediction.src.models import artifacts
+from icu_mortality_prediction.src.tests.fixtures import make_stays, write_pipeline_features
+
+
+class mainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_parse_size(self):
+        self.assertEqual(main.parse_size('512M'), 512 * 2 ** 20)
+        self.assertEqual(main.parse_size('4g'), 4 * 2 ** 30)
+        self.assertEqual(main.parse_size('1.5KB'), 1536)
+        self.assertEqual(main.parse_size('1000'), 1000)
+
+    def test_paths_default_to_data_dir(self):
+        args = main.resolve_paths(main.build_parser().parse_args(['features', 'labs']))
+        self.assertEqual(os.path.abspath(args.labs), os.path.abspath(LAB_EVENTS_CSV))
+        args = main.resolve_paths(main.build_parser().parse_args(['select', '--data-dir', self.tmp]))
+        self.assertEqual(args.features_dir, os.path.join(self.tmp, os.path.relpath(main.PATHS['features_dir'],
+                                                                                      DATA_DIR)))
+        self.assertTrue(args.cache_dir.startswith(self.tmp))
+        self.assertEqual(args.models_dir, os.path.join(self.tmp, 'models', 'store'))
+        self.assertEqual(args.reports_dir, os.path.join(self.tmp, 'reports'))
+        args = main.resolve_paths(main.build_parser().parse_args(['select']))
+        self.assertEqual((args.models_dir, args.reports_dir), (MODELS_DIR, REPORTS_DIR))
+
+    def test_split_by_stay(self):
+        events, labs, demographics = make_stays(n=50, seed=2)
+        stays = pd.Index(demographics['icustay_id'].unique())
+        parts = main.split_by_stay(events, stays, 16)
+        self.assertEqual([part['icustay_id'].nunique() for part in parts], [16, 16, 16, 2])
+        pd.testing.assert_frame_equal(pd.concat(parts).sort_index(), events)
+
+    def test_memory_budget_limits_jobs(self):
+        path = os.path.join(self.tmp, 'events.csv')
+        with open(path, 'w') as f:
+            f.write('a,b\n' + '1,2\n' * 25000)
+        size = os.path.getsize(path)
+        self.assertEqual(main.budget_jobs(8, None, [path]), 8)
+        self.assertEqual(main.budget_jobs(8, size * main.PARSED_SIZE_FACTOR * 2, [path]), 2)
+        self.assertEqual(main.budget_jobs(8, 1, [path]), 1)
+        self.assertEqual(main.budget_chunk_size(path, 10 * 2 ** 20), 10 * 2 ** 20 // 10 // (4 * 4))
+
+    def test_select_train_score_evaluate(self):
+        """ a model stored by train scores the raw CSVs, in batches, as it scores combined.csv """
+        features_dir = write_pipeline_features(self.tmp)
+        argv = ['--data-dir', self.tmp, '--jobs', '1']
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main.main(['select', '--k', '6'] + argv), 0)
+        combined = pd.read_csv(os.path.join(features_dir, 'combined.csv'), index_col=0)
+        self.assertEqual(list(combined.columns[6:]), [combine.OUTCOME])
+
+        profile = os.path.join(self.tmp, 'train.prof')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main.main(['train', '--classifiers', 'Tree', 'LSVC', '--profile', profile] + argv), 0)
+        self.assertTrue(os.path.exists(profile))
+        models_dir = os.path.join(self.tmp, 'models', 'store')
+        self.assertEqual(artifacts.list_models(models_dir), ['LSVC_f1', 'LSVC_recall', 'Tree_f1', 'Tree_recall'])
+        clf, metadata = artifacts.load_model(models_dir, 'LSVC_recall')
+        self.assertEqual(metadata['preprocessing']['features'], list(combined.columns[:-1]))
+
+        scores = {}
+        for chunk_size in ['128', '0']:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(main.main(['score', '--name', 'LSVC_recall', '--chunk-size', chunk_size] + argv), 0)
+            scores[chunk_size] = pd.read_csv(os.path.join(self.tmp, 'reports', 'LSVC_recall_scores.csv'),
+                                             index_col=0)
+        pd.testing.assert_frame_equal(scores['128'], scores['0'])
+        self.assertEqual(len(scores['128']), 1000)
+        X = combined[metadata['features']].astype(float)
+        np.testing.assert_array_equal(scores['128'].loc[X.index, 'prediction'], clf.predict(X.values))
+        np.testing.assert_allclose(scores['128'].loc[X.index, 'risk'], clf.decision_function(X.values))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main.main(['evaluate'] + argv), 0)
+        predictions = pd.read_csv(os.path.join(self.tmp, 'reports', 'predictions.csv'))
+        self.assertEqual(sorted(predictions.model.unique()), ['LSVC_f1', 'LSVC_recall', 'Tree_f1', 'Tree_recall'])
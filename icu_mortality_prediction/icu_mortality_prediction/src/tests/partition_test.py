@@ -0,0 +1,70 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.data import synthetic
+from icu_mortality_prediction.src.features import build
+from icu_mortality_prediction.src.utils import partition
+from icu_mortality_prediction.src.utils.pipeline import Pipeline
+
+
+N_STAYS = 600
+
+
+class partitionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.paths = synthetic.write_synthetic(os.path.join(cls.tmp, 'data'), N_STAYS, seed=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def _selected(self, **kwargs):
+        stages = build.stages(self.paths['chart'], self.paths['labs'], self.paths['demographics'],
+                              self.paths['definitions'], scale=N_STAYS / float(synthetic.REFERENCE_STAYS), **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return Pipeline(stages).run(['chart_selected', 'lab_selected', 'chart_stats', 'lab_outliers'])
+
+    def test_partition_of_is_stable(self):
+        keys = np.arange(1000)
+        parts = partition.partition_of(keys, 7)
+        self.assertTrue(np.array_equal(parts, partition.partition_of(keys.astype(str), 7)))
+        self.assertEqual(set(parts), set(range(7)))
+
+    def test_stays_land_whole_in_one_partition(self):
+        root = os.path.join(self.tmp, 'parts')
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = partition.partition_csv(self.paths['chart'], root, 4, chunksize=5000)
+            # A SECOND RUN REPLACES THE PARTITIONS INSTEAD OF APPENDING TO THEM
+            paths = partition.partition_csv(self.paths['chart'], root, 4, chunksize=5000)
+        events = pd.read_csv(self.paths['chart'])
+        parts = [pd.read_csv(path) for path in paths]
+        self.assertEqual(sum(len(part) for part in parts), len(events))
+        stays = [set(part['icustay_id']) for part in parts]
+        self.assertEqual(sum(len(s) for s in stays), events['icustay_id'].nunique())
+
+    def test_partitioned_features_equal_in_memory_features(self):
+        expected = self._selected()
+        results = self._selected(partitions=3, partition_dir=os.path.join(self.tmp, 'partitions'), n_jobs=2)
+        for target in ['chart_selected', 'lab_selected']:
+            self.assertEqual(sorted(results[target]), sorted(expected[target]))
+            for name in expected[target]:
+                pd.testing.assert_frame_equal(results[target][name][0], expected[target][name][0])
+        for frame in expected['chart_stats'][0]:
+            for col in expected['chart_stats'][0][frame]:
+                pd.testing.assert_frame_equal(results['chart_stats'][0][frame][col],
+                                              expected['chart_stats'][0][frame][col])
+        pd.testing.assert_frame_equal(results['lab_outliers']['mean']['WBC_mean'],
+                                      expected['lab_outliers']['mean']['WBC_mean'])
+
+
+if __name__ == '__main__':
+    unittest.main()
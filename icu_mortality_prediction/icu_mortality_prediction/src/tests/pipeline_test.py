@@ -0,0 +1,172 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from icu_mortality_prediction.src.features import chart_events
+from icu_mortality_prediction.src.features import concepts
+from icu_mortality_prediction.src.features import lab_events
+from icu_mortality_prediction.src.utils import pipeline
+
+STAGES_MODULE = '''
+import pandas as pd
+from icu_mortality_prediction.src.utils.pipeline import Stage
+
+
+def load(path):
+    return pd.read_csv(path)
+
+
+def drop_sparse_data(data):
+    return data.drop(['sparse'], axis=1)
+
+
+def dense_stage(data):
+    return drop_sparse_data(data)
+
+
+def totals(data):
+    return data.sum()
+
+
+def stages(path):
+    return [Stage('events', load, params={'path': path}, files=['path']),
+            Stage('dense', dense_stage, ['events']),
+            Stage('totals', totals, ['dense']),
+            Stage('counts', lambda data: len(data), ['events'])]
+'''
+
+# THE SAME STAGES IN A PACKAGE, THE HELPER CALLED THROUGH ITS MODULE WITH ITS COLUMNS IN MODULE DATA
+HELPERS_MODULE = '''
+DROPPED = ['sparse']
+
+
+def drop_sparse_data(data):
+    return data.drop(DROPPED, axis=1)
+'''
+
+PACKAGE_STAGES_MODULE = STAGES_MODULE.replace('''def drop_sparse_data(data):
+    return data.drop(['sparse'], axis=1)
+
+
+def dense_stage(data):
+    return drop_sparse_data(data)''', '''def dense_stage(data):
+    from . import helpers
+    return helpers.drop_sparse_data(data)''')
+
+
+class pipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'events.csv')
+        pd.DataFrame({'a': [1, 2, 3], 'b': [4, 5, 6], 'sparse': [None, 1, None]}).to_csv(self.path, index=False)
+        self.module_path = os.path.join(self.tmp, 'toy_stages.py')
+        with open(self.module_path, 'w') as f:
+            f.write(STAGES_MODULE)
+        sys.path.insert(0, self.tmp)
+        self.module = importlib.import_module('toy_stages')
+
+    def tearDown(self):
+        sys.path.remove(self.tmp)
+        sys.modules.pop('toy_stages', None)
+        shutil.rmtree(self.tmp)
+
+    def make(self):
+        return pipeline.Pipeline(self.module.stages(self.path), os.path.join(self.tmp, 'cache'))
+
+    def test_memoized_rerun(self):
+        first = self.make()
+        results = first.run()
+        self.assertEqual(sorted(results), ['counts', 'totals'])
+        self.assertEqual(results['totals']['b'], 15)
+        self.assertEqual(sorted(first.computed), ['counts', 'dense', 'events', 'totals'])
+
+        second = self.make()
+        self.assertEqual(second.run()['totals']['a'], 6)
+        self.assertEqual(second.computed, [])
+        # THE INPUTS OF MEMOIZED RESULTS ARE NOT LOADED
+        self.assertEqual(sorted(second.loaded), ['counts', 'totals'])
+
+    def test_helper_change_recomputes_downstream(self):
+        """ editing a helper reruns the stages that call it and the stages after them only """
+        self.make().run()
+        with open(self.module_path, 'w') as f:
+            f.write(STAGES_MODULE.replace("drop(['sparse'], axis=1)", "drop(['sparse', 'b'], axis=1)"))
+        importlib.invalidate_caches()
+        self.module = importlib.reload(self.module)
+
+        rerun = self.make()
+        results = rerun.run()
+        self.assertEqual(sorted(rerun.computed), ['dense', 'totals'])
+        self.assertEqual(sorted(rerun.loaded), ['counts', 'events'])
+        self.assertNotIn('b', results['totals'].index)
+
+    def test_module_helper_and_data_change_recomputes(self):
+        """ helpers called through their module and the module data they read are part of the key """
+        package_dir = os.path.join(self.tmp, 'toy_pkg')
+        os.makedirs(package_dir)
+        open(os.path.join(package_dir, '__init__.py'), 'w').close()
+        with open(os.path.join(package_dir, 'stages.py'), 'w') as f:
+            f.write(PACKAGE_STAGES_MODULE)
+
+        def write_helpers(source):
+            with open(os.path.join(package_dir, 'helpers.py'), 'w') as f:
+                f.write(source)
+            importlib.invalidate_caches()
+            if 'toy_pkg.helpers' in sys.modules:
+                importlib.reload(sys.modules['toy_pkg.helpers'])
+
+        def run():
+            stages = importlib.import_module('toy_pkg.stages')
+            rerun = pipeline.Pipeline(stages.stages(self.path), os.path.join(self.tmp, 'pkg_cache'))
+            return rerun, rerun.run()
+
+        write_helpers(HELPERS_MODULE)
+        try:
+            first, _ = run()
+            self.assertEqual(sorted(first.computed), ['counts', 'dense', 'events', 'totals'])
+            write_helpers(HELPERS_MODULE.replace("DROPPED = ['sparse']", "DROPPED = ['sparse', 'b']"))
+            second, results = run()
+            self.assertEqual(sorted(second.computed), ['dense', 'totals'])
+            self.assertNotIn('b', results['totals'].index)
+            write_helpers(HELPERS_MODULE.replace("axis=1)", "axis=1).head(2)"))
+            third, results = run()
+            self.assertEqual(sorted(third.computed), ['dense', 'totals'])
+            self.assertEqual(results['totals']['a'], 3)
+        finally:
+            for name in ['toy_pkg', 'toy_pkg.stages', 'toy_pkg.helpers']:
+                sys.modules.pop(name, None)
+
+    def test_input_file_and_params_change_key(self):
+        keys = self.make().keys()
+        pd.DataFrame({'a': [1], 'b': [2], 'sparse': [None]}).to_csv(self.path, index=False)
+        os.utime(self.path, (0, 0))
+        changed = self.make().keys()
+        self.assertTrue(all(keys[name] != changed[name] for name in keys))
+
+    def test_declared_stages(self):
+        chart = pipeline.Pipeline(chart_events.stages())
+        self.assertEqual(chart.downstream('chart_dense'),
+                         ['chart_continuous', 'chart_continuous_dummies', 'chart_blocks', 'chart_selected'])
+        lab = pipeline.Pipeline(lab_events.stages())
+        self.assertEqual(lab.upstream(['lab_outliers']), ['lab_events', 'lab_labels', 'lab_stats', 'lab_outliers'])
+        # REPLACING A HELPER CALLED THROUGH ITS MODULE INVALIDATES THE STAGES THAT REACH IT
+        keys = chart.keys()
+
+        def assign_concepts(data, source):
+            return data
+
+        with mock.patch.object(concepts, 'assign_concepts', assign_concepts):
+            changed = pipeline.Pipeline(chart_events.stages()).keys()
+        self.assertEqual(sorted(name for name in keys if keys[name] == changed[name]), [])
+        self.assertEqual(pipeline.Pipeline(chart_events.stages()).keys(), keys)
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline([pipeline.Stage('a', len, ['b']), pipeline.Stage('b', len, ['a'])])
+
+
+if __name__ == "__main__":
+    unittest.main()
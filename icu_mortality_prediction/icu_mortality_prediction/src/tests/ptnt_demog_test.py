@@ -0,0 +1,106 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from icu_mortality_prediction.src.features import ptnt_demog
+
+DEFINITIONS_YAML = """
+"Septicemia (except in labor)":
+  use_in_benchmark: True
+  codes: [ "0380", "99591" ]
+"Congestive heart failure; nonhypertensive":
+  use_in_benchmark: True
+  codes: [ "4280" ]
+"Tuberculosis":
+  use_in_benchmark: False
+  codes: [ "V1201" ]
+"""
+
+
+class diagnosesMatrixTest(unittest.TestCase):
+    """
+        diagnoses frame with one row per (icustay, icd9 code) pair
+        """
+    def setUp(self):
+
+        self.icustays = [10, 11, 12]
+        self.diagnoses = pd.DataFrame({'icd9_code': ['0380', '99591', '4280', '0380', 'V1201'],
+                                       'HCUP_CCS_2015': ['Septicemia', 'Septicemia', 'CHF', 'Septicemia',
+                                                         'Tuberculosis'],
+                                       'USE_IN_BENCHMARK': [1, 1, 1, 1, 0]},
+                                      index=[10, 10, 11, 12, 12])
+
+    def test_benchmark_matrix(self):
+        """
+        test that duplicate categories for a stay collapse to 1 and that
+        categories not used in benchmarking are left out
+        """
+        matrix, categories = ptnt_demog.create_diagnoses_matrix(self.diagnoses, self.icustays,
+                                                                categories=['Septicemia', 'CHF'])
+        self.assertTrue(sparse.isspmatrix_csr(matrix))
+        self.assertEqual(categories, ['Septicemia', 'CHF'])
+        np.testing.assert_array_equal(matrix.toarray(), [[1, 0], [0, 1], [1, 0]])
+
+    def test_ccs_and_icd9_levels(self):
+        """
+        test that the ccs level keeps every category and the icd9 level uses the raw codes
+        """
+        matrix, categories = ptnt_demog.create_diagnoses_matrix(self.diagnoses, self.icustays, level='ccs')
+        self.assertEqual(categories, ['CHF', 'Septicemia', 'Tuberculosis'])
+        np.testing.assert_array_equal(matrix.toarray(), [[0, 1, 0], [1, 0, 0], [0, 1, 1]])
+
+        matrix, categories = ptnt_demog.create_diagnoses_matrix(self.diagnoses, self.icustays, level='icd9')
+        self.assertEqual(categories, ['0380', '4280', '99591', 'V1201'])
+        self.assertEqual(matrix.nnz, 5)
+
+    def test_invalid_level(self):
+        self.assertRaises(ValueError, ptnt_demog.create_diagnoses_matrix, self.diagnoses,
+                          self.icustays, level='icd10')
+
+
+class diagnosesDefsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.definitions = os.path.join(self.tmp, 'definitions.yaml')
+        with open(self.definitions, 'w') as f:
+            f.write(DEFINITIONS_YAML)
+        # TWO STAYS WITH SEVERAL DIAGNOSES EACH, ONE WITH A SINGLE DIAGNOSIS
+        n = 6
+        self.raw = pd.DataFrame({'icustay_id': [10, 10, 10, 11, 11, 12], 'subject_id': [1, 1, 1, 2, 2, 3],
+                                 'hadm_id': [100, 100, 100, 101, 101, 102],
+                                 'icd9_code': ['0380', '4280', 'V1201', '4280', '99591', '5849'],
+                                 'icd9_code.1': ['0380', '4280', 'V1201', '4280', '99591', '5849'],
+                                 'short_title': ['a', 'b', 'c', 'b', 'd', 'e'], 'seq_num': [1, 2, 3, 1, 2, 1],
+                                 'dob': ['2100-01-01'] * n, 'intime': ['2150-01-01'] * n,
+                                 'outtime': ['2150-01-03'] * n, 'admittime': ['2150-01-01'] * n,
+                                 'dischtime': ['2150-01-09'] * n, 'deathtime': [None] * n,
+                                 'first_careunit': ['MICU'] * n, 'gender': ['F'] * n,
+                                 'hospital_expire_flag': [0, 0, 0, 1, 1, 0]})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_every_diagnosis_of_a_stay_is_kept(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            converted = ptnt_demog.demographics_stage(self.raw)
+            diagnoses_bm, diagnoses = ptnt_demog.create_diagnoses_defs(converted, self.definitions)
+        self.assertEqual(len(diagnoses), 6)
+        matrix, categories = ptnt_demog.create_diagnoses_matrix(diagnoses, [10, 11, 12], categories=diagnoses_bm)
+        self.assertEqual(categories, ['Septicemia (except in labor)', 'Congestive heart failure; nonhypertensive'])
+        np.testing.assert_array_equal(matrix.toarray(), [[1, 1], [1, 1], [0, 0]])
+
+    def test_one_row_per_stay_is_refused(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            durations = ptnt_demog.durations_stage(ptnt_demog.demographics_stage(self.raw))
+            with self.assertRaises(ValueError):
+                ptnt_demog.create_diagnoses_defs(durations, self.definitions)
+
+
+if __name__ == "__main__":
+    unittest.main()
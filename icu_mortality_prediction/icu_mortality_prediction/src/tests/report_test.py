@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from scipy.stats import gaussian_kde
+from icu_mortality_prediction.src.visualizations import density
+from icu_mortality_prediction.src.visualizations import report
+
+
+def feature(n, flag='hospital_expire_flag', seed=0):
+    rng = np.random.RandomState(seed)
+    died = (rng.rand(n) < .2).astype(int)
+    return pd.DataFrame({'value': rng.normal(size=n) + died, flag: died,
+                         'gender': np.where(rng.rand(n) < .5, 'M', 'F')},
+                        columns=['value', flag, 'gender'])
+
+
+class reportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_binned_kde_matches_exact_kde(self):
+        rng = np.random.RandomState(0)
+        values = np.concatenate([rng.normal(0, 1, 3000), rng.normal(4, .5, 1000)])
+        grid, estimate = density.binned_kde(values, -5, 8, n_bins=512)
+        exact = gaussian_kde(values)(grid)
+        self.assertLess(np.abs(estimate - exact).max(), 1e-3)
+        self.assertAlmostEqual(np.sum(estimate) * (grid[1] - grid[0]), 1., places=3)
+        self.assertEqual(density.binned_kde([1., 1.], 0, 2)[1].max(), 0)
+
+    def test_shared_densities(self):
+        grid, curves = density.shared_densities({'a': [0., 1., 2.], 'b': [10., 11., np.nan], 'c': []}, n_bins=64)
+        self.assertEqual(len(grid), 64)
+        self.assertLess(grid[0], 0)
+        self.assertGreater(grid[-1], 11)
+        self.assertEqual(curves['c'].max(), 0)
+        self.assertGreater(curves['b'][-20:].sum(), curves['a'][-20:].sum())
+
+    def test_render_report(self):
+        frames = {'means': {'HR mean': feature(300), 'RR/mean': feature(200, 'hospital_expired_flag', 1)},
+                  'categorical': {'GCS': pd.DataFrame({'GCS': ['a', 'b'], 'hospital_expire_flag': [0, 1]})}}
+        paths = report.render_report(frames, os.path.join(self.tmp, 'figures'), n_jobs=2, n_bins=128, dpi=20)
+        names = sorted(os.path.basename(path) for path in paths)
+        self.assertEqual(names, ['means_HR_mean.png', 'means_HR_mean_F.png', 'means_HR_mean_M.png',
+                                 'means_RR_mean.png', 'means_RR_mean_F.png', 'means_RR_mean_M.png'])
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in paths))
+        # RENDERED WITHOUT PYPLOT, SO NO FIGURE IS LEFT OPEN
+        if 'matplotlib.pyplot' in sys.modules:
+            self.assertEqual(sys.modules['matplotlib.pyplot'].get_fignums(), [])
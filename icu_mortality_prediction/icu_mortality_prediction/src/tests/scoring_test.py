@@ -0,0 +1,144 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from icu_mortality_prediction.src.features import ptnt_demog
+from icu_mortality_prediction.src.features import preprocessing
+from icu_mortality_prediction.src.models import artifacts
+from icu_mortality_prediction.src.models import scoring
+from icu_mortality_prediction.src.tests.fixtures import make_stays, DEFINITIONS, FEATURES
+
+
+class preprocessingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events, self.labs, self.demographics = make_stays()
+
+    def test_stats_match_groupby(self):
+        """ test the batched statistics against the per label groupby of the exploratory scripts """
+        stats = preprocessing.event_stats(self.events, [('Heart Rate', 'mean'), ('Heart Rate', 'delta'),
+                                                        ('Respiratory Rate', 'std')])
+        hr = self.events[self.events.label == 'Heart Rate'].groupby('icustay_id')['valuenum']
+        np.testing.assert_allclose(stats[('Heart Rate', 'mean')], hr.mean())
+        np.testing.assert_allclose(stats[('Heart Rate', 'delta')], hr.last() - hr.first())
+        rr = self.events[self.events.label == 'Respiratory Rate'].groupby('icustay_id')['valuenum']
+        np.testing.assert_allclose(stats[('Respiratory Rate', 'std')], rr.std())
+        self.assertEqual(stats.shape[1], 3)
+
+    def test_raw_items_mapped_to_concepts(self):
+        """ Fahrenheit temperatures and MetaVision items give the statistics of the mapped events """
+        celsius = self.events[self.events.label == 'Heart Rate'].assign(label='Temperature C')
+        celsius['valuenum'] = np.random.RandomState(1).normal(37, .8, len(celsius))
+        fahrenheit = celsius.copy()
+        fahrenheit.loc[fahrenheit.index[::2], 'label'] = 'Temperature F'
+        fahrenheit.loc[fahrenheit.index[::2], 'valuenum'] = celsius['valuenum'].values[::2] * 9 / 5. + 32
+        definitions = {'TempC_mean': {'source': 'chart', 'label': 'Temperature C', 'stat': 'mean',
+                                      'encoding': 'quartiles'},
+                       'HR_max': {'source': 'chart', 'label': 'Heart Rate', 'stat': 'max', 'encoding': 'quartiles'}}
+        metavision = self.events.assign(label=self.events['label'].replace({'Heart Rate': 'Pulse'}),
+                                        itemid=np.where(self.events.label == 'Heart Rate', 220045, 0))
+        expected = preprocessing.base_values(definitions, pd.concat([celsius, self.events]))
+        raw = pd.concat([fahrenheit, self.events])
+        pd.testing.assert_frame_equal(preprocessing.base_values(definitions, raw), expected)
+        # THE CALLER'S EVENTS ARE NOT MAPPED IN PLACE
+        self.assertEqual((raw.label == 'Temperature F').sum(), len(fahrenheit.index[::2]))
+        pd.testing.assert_series_equal(preprocessing.base_values(definitions, metavision)['HR_max'],
+                                       expected['HR_max'])
+
+    def test_quartile_levels_match_quant_cats(self):
+        values = np.array([0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, np.nan])
+        levels = preprocessing.quartile_levels(values, [1.0, 2.0, 3.0])
+        expected = [int(ptnt_demog.quant_cats(x, 1.0, 2.0, 3.0)[1]) for x in values[:-1]]
+        np.testing.assert_array_equal(levels, expected + [-1])
+
+    def test_only_used_definitions_kept(self):
+        spec = preprocessing.fit_preprocessing(FEATURES, DEFINITIONS, self.events, self.labs, self.demographics)
+        self.assertNotIn('RR_max', spec['definitions'])
+        self.assertEqual(spec['columns']['GCS Total_12'], ['GCS Total', '12'])
+        lower, upper = spec['definitions']['HR_mean']['bounds']
+        self.assertLess(lower, spec['definitions']['HR_mean']['edges'][0])
+
+        X = preprocessing.transform(spec, self.events, self.labs, self.demographics)
+        self.assertEqual(list(X.columns), FEATURES)
+        self.assertTrue(X.isin([0, 1]).all().all())
+        stays = self.demographics.drop_duplicates('icustay_id').set_index('icustay_id')
+        np.testing.assert_array_equal(X['first_careunit_MICU'], stays['first_careunit'] == 'MICU')
+
+    def test_edge_stays(self):
+        """ the edges come from the given stays and the bounds from all of them """
+        stays = self.demographics['icustay_id'].unique()[:30]
+        spec = preprocessing.fit_preprocessing(FEATURES, DEFINITIONS, self.events, self.labs, self.demographics)
+        part = preprocessing.fit_preprocessing(FEATURES, DEFINITIONS, self.events, self.labs, self.demographics,
+                                               edge_stays={'HR_mean': stays})
+        self.assertEqual(part['definitions']['HR_mean']['bounds'], spec['definitions']['HR_mean']['bounds'])
+        self.assertEqual(part['definitions']['HR_slope'], spec['definitions']['HR_slope'])
+        lower, upper = spec['definitions']['HR_mean']['bounds']
+        values = preprocessing.base_values({'HR_mean': DEFINITIONS['HR_mean']}, self.events)['HR_mean'].loc[stays]
+        values = values[(values >= lower) & (values <= upper)]
+        np.testing.assert_allclose(part['definitions']['HR_mean']['edges'], np.percentile(values, [25, 50, 75]))
+
+    def test_pipeline_definitions(self):
+        """ the definitions of the pipeline's feature names are those written by hand """
+        hcup = {'Septicemia (except in labor)': {'codes': ['0380', '99591'], 'use_in_benchmark': True},
+                'Shock': {'codes': ['78550'], 'use_in_benchmark': True}}
+        definitions = preprocessing.pipeline_definitions(FEATURES, hcup)
+        self.assertEqual(definitions, dict((base, d) for base, d in DEFINITIONS.items() if base != 'RR_max'))
+        self.assertEqual(preprocessing.pipeline_definitions(['RR_med_Q3'])['RR_med']['label'], 'Respiratory Rate')
+
+        # THE CHART AND LAB HEMATOCRIT SHARE THEIR COLUMN NAMES
+        self.assertEqual(preprocessing.pipeline_definitions(['Hemat_mean_Q0'])['Hemat_mean']['source'], 'chart')
+        lab = preprocessing.pipeline_definitions(['Hemat_mean_Q0'], modules={'Hemat_mean_Q0': 'lab_events'})
+        self.assertEqual(lab['Hemat_mean']['source'], 'lab')
+        with self.assertRaises(ValueError):
+            preprocessing.pipeline_definitions(['Shock'])
+        with self.assertRaises(ValueError):
+            preprocessing.pipeline_definitions(['Hemat_mean_Q0', 'Hemat_mean_Q1'],
+                                               modules={'Hemat_mean_Q1': 'lab_events'})
+
+
+class scoringTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.events, self.labs, self.demographics = make_stays()
+        self.spec = preprocessing.fit_preprocessing(FEATURES, DEFINITIONS, self.events, self.labs,
+                                                    self.demographics)
+        self.X = preprocessing.transform(self.spec, self.events, self.labs, self.demographics)
+        y = (self.X['HR_mean_Q3'] + np.random.RandomState(0).rand(len(self.X)) > 0.8).astype(int)
+        self.clf = LogisticRegression().fit(self.X.values, y)
+        artifacts.save_model(self.root, 'LR', self.clf, FEATURES, preprocessing=self.spec)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_scores_match_training_encoding(self):
+        scores = scoring.score_stays(self.events, self.labs, self.demographics, self.root, 'LR')
+        np.testing.assert_allclose(scores['risk'], self.clf.predict_proba(self.X.values)[:, 1])
+        np.testing.assert_array_equal(scores['prediction'], self.clf.predict(self.X.values))
+
+    def test_new_stays_use_persisted_edges(self):
+        """ a batch of one stay is encoded with the training edges, not its own """
+        stay = self.X.index[5]
+        scores = scoring.score_stays(self.events[self.events.icustay_id == stay],
+                                     self.labs[self.labs.icustay_id == stay],
+                                     self.demographics[self.demographics.icustay_id == stay],
+                                     self.root, 'LR')
+        self.assertAlmostEqual(scores['risk'].iloc[0], self.clf.predict_proba(self.X.values[5:6])[0, 1])
+        self.assertEqual(artifacts.load_metadata(self.root, 'LR')['bin_edges']['HR_mean'],
+                         self.spec['definitions']['HR_mean']['edges'])
+
+    def test_model_without_spec(self):
+        artifacts.save_model(self.root, 'bare', self.clf, FEATURES)
+        with self.assertRaises(ValueError):
+            scoring.score_stays(self.events, self.labs, self.demographics, self.root, 'bare')
+
+    def test_benchmark(self):
+        report = scoring.benchmark_scoring(self.events, self.labs, self.demographics, self.root, 'LR', repeats=2)
+        self.assertEqual(report['stays'], 60)
+        self.assertGreater(report['stays_per_sec'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
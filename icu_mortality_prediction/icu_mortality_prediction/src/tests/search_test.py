@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+import pandas as pd
+from sklearn import metrics as skmetrics
+from icu_mortality_prediction.src.models import metrics
+from icu_mortality_prediction.src.models import search
+from icu_mortality_prediction.src.tests.fixtures import make_features
+
+
+class metricsTest(unittest.TestCase):
+
+    def test_scores_match_sklearn(self):
+        rng = np.random.RandomState(1)
+        y_true = rng.randint(0, 2, 200)
+        y_pred = rng.randint(0, 2, 200)
+        scores = metrics.score_predictions(y_true, y_pred)
+        surv, mort = skmetrics.recall_score(y_true, y_pred, average=None)
+        self.assertAlmostEqual(scores['recall'], mort)
+        self.assertAlmostEqual(scores['recall metric'], mort + surv - abs(mort - surv))
+        surv, mort = skmetrics.f1_score(y_true, y_pred, average=None)
+        self.assertAlmostEqual(scores['f1 metric'], mort + surv - abs(mort - surv))
+        self.assertAlmostEqual(scores['precision'], skmetrics.precision_score(y_true, y_pred))
+
+    def test_no_positive_predictions(self):
+        scores = metrics.score_predictions([0, 1, 1], [0, 0, 0])
+        self.assertEqual(scores['precision'], 0.0)
+        self.assertEqual(scores['recall'], 0.0)
+
+
+class searchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X, self.y = make_features()
+
+    def test_every_fold_fitted_once(self):
+        cv_results, test_results, optimized_clfs = search.search_classifiers(
+            self.X, self.y, names=['Tree'], feature_counts=[4, 6], cv=3)
+        # 20 PARAMETER SETS X 2 FEATURE COUNTS X 3 FOLDS
+        self.assertEqual(cv_results.shape[0], 120)
+        self.assertFalse(cv_results.duplicated(['features', 'params_id', 'fold']).any())
+        self.assertEqual(sorted(optimized_clfs), ['Tree_f1', 'Tree_recall'])
+        self.assertEqual(test_results.shape[0], 4)
+        best = optimized_clfs['Tree_recall']
+        self.assertEqual(best['FEATURES'], list(self.X.columns[:best['PARAMS']['features']]))
+
+    def test_pool_matches_serial(self):
+        serial = search.search_classifiers(self.X, self.y, names=['Tree'], feature_counts=[5], cv=3)[0]
+        pooled = search.search_classifiers(self.X, self.y, names=['Tree'], feature_counts=[5], cv=3,
+                                           n_jobs=2)[0]
+        cols = ['params_id', 'fold', 'f1', 'recall', 'recall metric']
+        pd.testing.assert_frame_equal(serial[cols], pooled[cols])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.svm import LinearSVC
+from sklearn.tree import DecisionTreeClassifier
+from icu_mortality_prediction.src.models import metrics
+from icu_mortality_prediction.src.models import sensitivity
+from icu_mortality_prediction.src.tests.fixtures import make_features
+
+
+class sensitivityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X, self.y = make_features()
+        self.models = {'Tree_f1': DecisionTreeClassifier(random_state=42),
+                       'LSVC_recall': {'CLF': LinearSVC(class_weight={1: 4, 0: 1}), 'PARAMS': {'features': 5}}}
+
+    def test_grid_and_scores(self):
+        results = sensitivity.split_size_sweep(self.models, self.X, self.y, test_sizes=[0.2, 0.4],
+                                               seeds=[1, 2, 3], n_jobs=1)
+        self.assertEqual(len(results), 2 * 2 * 3)
+        self.assertEqual(list(results['classifier'].unique()), ['Tree_f1', 'LSVC_recall'])
+        self.assertTrue((results['fit_time'] >= 0).all())
+
+        # SAME SPLIT AND SCORES AS FITTING BY HAND
+        row = results[(results.classifier == 'LSVC_recall') & (results.test_size == 0.4) &
+                      (results.seed == 2)].iloc[0]
+        X_train, X_test, y_train, y_test = train_test_split(self.X.values[:, :5], self.y.values,
+                                                            test_size=0.4, random_state=2)
+        y_pred = LinearSVC(class_weight={1: 4, 0: 1}).fit(X_train, y_train).predict(X_test)
+        self.assertAlmostEqual(row['recall metric'], metrics.score_predictions(y_test, y_pred)['recall metric'])
+        self.assertEqual(row['n_test'], len(y_test))
+
+        summary = sensitivity.summarize_sweep(results)
+        self.assertEqual(summary.loc[('Tree_f1', 0.2), ('recall', 'count')], 3)
+        best = sensitivity.best_test_sizes(results)
+        self.assertEqual(best.loc['LSVC_recall', 'metric'], 'recall metric')
+        self.assertIn(best.loc['Tree_f1', 'test_size'], [0.2, 0.4])
+
+    def test_pool_matches_serial(self):
+        serial = sensitivity.split_size_sweep(self.models, self.X, self.y, test_sizes=[0.1, 0.3], n_jobs=1)
+        pooled = sensitivity.split_size_sweep(self.models, self.X, self.y, test_sizes=[0.1, 0.3], n_jobs=2)
+        cols = ['classifier', 'test_size', 'seed', 'f1', 'recall metric']
+        pd.testing.assert_frame_equal(serial[cols], pooled[cols])
+
+
+if __name__ == "__main__":
+    unittest.main()
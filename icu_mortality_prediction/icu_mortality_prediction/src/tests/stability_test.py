@@ -0,0 +1,66 @@
+import contextlib
+import io
+import unittest
+import numpy as np
+import pandas as pd
+from sklearn.feature_selection import chi2, mutual_info_classif
+from icu_mortality_prediction.src.features import blocks
+from icu_mortality_prediction.src.features import stability
+
+
+def make_blocks(seed=0):
+    # TWO BLOCKS OVER OVERLAPPING STAYS, a PREDICTS THE OUTCOME AND THE REST IS NOISE
+    rng = np.random.RandomState(seed)
+    y = pd.Series((rng.rand(1200) < .12).astype(int), index=pd.Index(np.arange(1200), name='icustay_id'),
+                  name='hospital_expire_flag')
+
+    def block(ids, cols):
+        frame = pd.DataFrame((rng.rand(len(ids), len(cols)) < .3).astype(float), columns=cols,
+                             index=y.index[ids])
+        frame.insert(0, 'hospital_expire_flag', y.values[ids])
+        return frame
+
+    first = block(np.arange(0, 800), ['a', 'b', 'c'])
+    first['a'] = np.where(rng.rand(800) < .8, first['hospital_expire_flag'], first['a'])
+    second = block(np.arange(400, 1200), ['d', 'e'])
+    return {'First_Features': first, 'Second_Features': second}
+
+
+class stabilityTest(unittest.TestCase):
+
+    def test_scores_match_sklearn_per_block(self):
+        frames = make_blocks()
+        encoded = dict(frames, Second_Features=blocks.as_view(frames['Second_Features']))
+        arrays, features = stability.encode(encoded)
+        self.assertEqual(list(features.index), ['a', 'b', 'c', 'd', 'e'])
+        X, indicator = stability._matrix(arrays)
+        scores, mutual_info = stability.weighted_scores(X, indicator, arrays, np.ones(len(arrays['y'])))
+        for name in sorted(frames):
+            frame = frames[name]
+            cols = features.index[features['block'] == name]
+            positions = features.index.get_indexer(cols)
+            np.testing.assert_allclose(scores[positions], chi2(frame[cols], frame['hospital_expire_flag'])[0])
+            np.testing.assert_allclose(mutual_info[positions], mutual_info_classif(
+                frame[cols], frame['hospital_expire_flag'], discrete_features=True))
+
+    def test_workers_agree_and_rank_the_signal_first(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial, n = stability.stability_selection(make_blocks(), n_resamples=40, k=1, batch_size=10)
+            pooled, _ = stability.stability_selection(make_blocks(), n_resamples=40, k=1, batch_size=10, n_jobs=2)
+        self.assertEqual(n, 40)
+        pd.testing.assert_frame_equal(serial, pooled)
+        self.assertEqual(serial.index[0], 'a')
+        self.assertEqual(serial.loc['a', 'chi2_frequency'], 1.)
+        self.assertEqual(serial.loc['a', 'mi_frequency'], 1.)
+        self.assertEqual(serial.loc['a', 'chi2_rank_high'], 1.)
+        self.assertEqual(serial['chi2_frequency'].drop('a').sum(), 0.)
+
+    def test_time_budget_stops_after_the_first_round(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            report, n = stability.stability_selection(make_blocks(), n_resamples=100, batch_size=10, time_budget=0)
+        self.assertEqual(n, 10)
+        self.assertTrue(report['chi2_frequency'].between(0, 1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
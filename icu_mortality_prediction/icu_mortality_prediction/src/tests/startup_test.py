@@ -0,0 +1,42 @@
+import json
+import subprocess
+import sys
+import unittest
+from icu_mortality_prediction import ROOT_DIR
+
+# SECONDS ALLOWED FOR IMPORTING THE PACKAGE AND THE COMMAND LINE IN A FRESH INTERPRETER,
+# ABOUT TWICE WHAT pandas ALONE TAKES
+STARTUP_BUDGET = 1.5
+
+HEAVY = ['matplotlib', 'sklearn', 'scipy', 'yaml', 'seaborn']
+
+SCRIPT = '''
+import json, sys, time
+start = time.time()
+import icu_mortality_prediction
+import icu_mortality_prediction.src.main
+import icu_mortality_prediction.src.features.build
+elapsed = time.time() - start
+print(json.dumps({'elapsed': elapsed, 'loaded': sorted(set(name.split('.')[0] for name in sys.modules))}))
+'''
+
+
+class startupTest(unittest.TestCase):
+
+    def startup(self):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT_DIR)
+        return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    def test_no_heavy_imports(self):
+        loaded = self.startup()['loaded']
+        self.assertEqual([name for name in HEAVY if name in loaded], [])
+
+    def test_startup_budget(self):
+        # BEST OF THREE, THE FIRST RUN MAY PAY FOR COLD FILE CACHES
+        elapsed = min(self.startup()['elapsed'] for _ in range(3))
+        self.assertLess(elapsed, STARTUP_BUDGET)
+
+    def test_plots_load_on_demand(self):
+        from icu_mortality_prediction.src.visualizations import plots
+        self.assertTrue(callable(plots.plot_features))
+        self.assertIn('matplotlib', sys.modules)
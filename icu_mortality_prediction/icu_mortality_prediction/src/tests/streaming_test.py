@@ -0,0 +1,180 @@
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+from icu_mortality_prediction.src.features import preprocessing
+from icu_mortality_prediction.src.models import artifacts
+from icu_mortality_prediction.src.models import scoring
+from icu_mortality_prediction.src.models import streaming
+from icu_mortality_prediction.src.tests.fixtures import make_stays, DEFINITIONS
+
+
+FEATURES = ['HR_mean_Q0', 'HR_mean_Q3', 'HR_slope_Q1', 'HR_std_Q2', 'HR_skew_Q0', 'HR_med_Q3',
+            'RR_max_Q3', 'GCS Total_12', 'Creat_abnflag', 'age_Q3', 'first_careunit_MICU']
+
+
+def make_definitions():
+    definitions = dict(DEFINITIONS)
+    for stat in ['std', 'skew', 'med']:
+        definitions['HR_' + stat] = {'source': 'chart', 'label': 'Heart Rate', 'stat': stat,
+                                     'encoding': 'quartiles'}
+    return definitions
+
+
+class streamingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.chart, self.labs, self.demographics = make_stays(n=40, seed=3)
+        spec = preprocessing.fit_preprocessing(FEATURES, make_definitions(), self.chart, self.labs,
+                                               self.demographics)
+        self.X = preprocessing.transform(spec, self.chart, self.labs, self.demographics)
+        y = (self.X['HR_mean_Q3'] + np.random.RandomState(0).rand(len(self.X)) > 0.8).astype(int)
+        artifacts.save_model(self.root, 'LR', LogisticRegression().fit(self.X.values, y), FEATURES,
+                             preprocessing=spec)
+        artifacts.save_model(self.root, 'Tree', DecisionTreeClassifier(random_state=0).fit(self.X.values, y),
+                             FEATURES, preprocessing=spec)
+        chart = self.chart.assign(source='chart')
+        labs = self.labs.assign(source='lab')
+        self.events = pd.concat([chart, labs], ignore_index=True, sort=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def stream(self, name, events, **kwargs):
+        scorer = streaming.StreamingScorer(*scoring.load_scorer(self.root, name), **kwargs)
+        scorer.admit(self.demographics)
+        metrics, risks = streaming.replay(scorer, events)
+        return scorer, metrics, risks
+
+    def test_streamed_features_match_batch(self):
+        """ test that out of order events end at the batch features and scores """
+        shuffled = self.events.sample(frac=1, random_state=0).reset_index(drop=True)
+        for name in ['LR', 'Tree']:
+            scorer, metrics, risks = self.stream(name, shuffled)
+            streamed = np.array([scorer.stays[stay].x for stay in self.X.index])
+            np.testing.assert_allclose(streamed, self.X.values)
+            batch = scoring.score_stays(self.chart, self.labs, self.demographics, self.root, name)
+            np.testing.assert_allclose(risks.loc[batch.index], batch['risk'])
+            self.assertEqual(metrics['events'], len(shuffled))
+
+    def test_raw_items_mapped_to_concepts(self):
+        """ events of a MetaVision item under another label stream to the batch features """
+        heart_rate = self.events['label'] == 'Heart Rate'
+        raw = self.events.assign(label=self.events['label'].where(~heart_rate, 'Pulse'),
+                                 itemid=np.where(heart_rate, 220045, None))
+        scorer, _, _ = self.stream('LR', raw)
+        np.testing.assert_allclose(np.array([scorer.stays[stay].x for stay in self.X.index]), self.X.values)
+        self.assertEqual(scorer.skipped, 0)
+
+    def test_running_stats(self):
+        values = np.random.RandomState(0).normal(size=25)
+        stats = streaming.RunningStats(keep_values=True)
+        for i, value in enumerate(values):
+            stats.add(float(i), value)
+        series = pd.Series(values)
+        self.assertAlmostEqual(stats.stat('std'), series.std())
+        self.assertAlmostEqual(stats.stat('skew'), series.skew())
+        self.assertAlmostEqual(stats.stat('med'), series.median())
+        self.assertAlmostEqual(stats.stat('slope'), (values[-1] - values[0]) / 24.0)
+
+    def test_linear_fast_path(self):
+        scorer = streaming.StreamingScorer(*scoring.load_scorer(self.root, 'LR'))
+        self.assertEqual(scorer._risk_mode, 'sigmoid')
+        scorer = streaming.StreamingScorer(*scoring.load_scorer(self.root, 'Tree'))
+        self.assertEqual(scorer._risk_mode, 'model')
+
+    def test_backpressure_and_sink(self):
+        """ a small queue makes the reader wait, a sink gets one record per scored event """
+        scorer = streaming.StreamingScorer(*scoring.load_scorer(self.root, 'LR'), queue_size=4)
+        records = []
+
+        async def produce(queue):
+            for event in self.events.to_dict('records'):
+                await queue.put(event)
+            await queue.put(None)
+
+        async def main():
+            queue = asyncio.Queue()
+            producer = asyncio.ensure_future(produce(queue))
+            metrics = await scorer.run(streaming.queue_events(queue), sink=records.append)
+            await producer
+            return metrics
+
+        metrics = asyncio.run(main())
+        self.assertLessEqual(metrics['queue_max'], 4)
+        self.assertGreater(metrics['backpressure_waits'], 0)
+        self.assertEqual(len(records), metrics['scored'])
+        self.assertEqual(metrics['unadmitted'], 40)
+        self.assertLessEqual(metrics['update_p50_us'], metrics['latency_p50_us'])
+
+    def test_serve_writes_risks_back(self):
+        """ every connection gets the risks of the events it sent, the stays end at the batch scores """
+        scorer = streaming.StreamingScorer(*scoring.load_scorer(self.root, 'LR'))
+        scorer.admit(self.demographics)
+        events = self.events.assign(charttime=self.events['charttime'].values.astype('datetime64[ns]')
+                                    .astype(np.int64) / 3.6e12)
+        stays = self.X.index.values
+        parts = [events[events.icustay_id.isin(stays[:20])], events[events.icustay_id.isin(stays[20:])]]
+
+        async def send(port, part):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for event in part.to_dict('records'):
+                writer.write(json.dumps(event).encode('utf-8') + b'\n')
+            await writer.drain()
+            writer.write_eof()
+            lines = [json.loads(line) for line in (await reader.read()).decode('utf-8').splitlines()]
+            writer.close()
+            return lines
+
+        async def main():
+            server = await streaming.serve(scorer, port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await asyncio.wait_for(asyncio.gather(*[send(port, part) for part in parts]), timeout=30)
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        replies = asyncio.run(main())
+        batch = scoring.score_stays(self.chart, self.labs, self.demographics, self.root, 'LR')
+        for part, lines in zip(parts, replies):
+            self.assertEqual(len(lines), len(part))
+            self.assertEqual(set(line['icustay_id'] for line in lines), set(part.icustay_id))
+            last = pd.Series(dict((line['icustay_id'], line['risk']) for line in lines))
+            np.testing.assert_allclose(last, batch['risk'].loc[last.index])
+        metrics = scorer.metrics()
+        self.assertEqual(metrics['events'], len(events))
+        self.assertGreater(metrics['elapsed'], 0)
+
+    def test_failing_source_raises(self):
+        """ an error of the source ends the run with that error after the events read before it """
+        scorer = streaming.StreamingScorer(*scoring.load_scorer(self.root, 'LR'), queue_size=4)
+        events = self.events.to_dict('records')[:10]
+
+        async def source():
+            for event in events:
+                yield event
+            raise ConnectionResetError("connection reset")
+
+        async def main():
+            return await asyncio.wait_for(scorer.run(source()), timeout=10)
+
+        with self.assertRaises(ConnectionResetError):
+            asyncio.run(main())
+        self.assertEqual(scorer.events, 10)
+
+    def test_unused_labels_skipped(self):
+        events = self.events.copy()
+        events.loc[::2, 'label'] = 'Unused Label'
+        scorer, metrics, _ = self.stream('LR', events)
+        self.assertEqual(metrics['skipped'], len(events[::2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from sklearn import svm
+from sklearn.metrics.pairwise import euclidean_distances
+from icu_mortality_prediction.src.models import search
+from icu_mortality_prediction.src.models import sweeps
+from icu_mortality_prediction.src.tests.fixtures import make_features
+
+
+class sweepsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X, self.y = make_features(n=200)
+
+    def test_incremental_grams(self):
+        X_train, X_test, _, _ = search.split_arrays(self.X, self.y)
+        for num_feats, grams in sweeps.incremental_grams(X_train, X_test, [3, 5, 10]):
+            sub_train, sub_test = X_train[:, :num_feats], X_test[:, :num_feats]
+            np.testing.assert_allclose(grams['dot'], sub_train.dot(sub_train.T))
+            np.testing.assert_allclose(grams['test_sqdist'],
+                                       euclidean_distances(sub_test, sub_train, squared=True), atol=1e-9)
+            self.assertAlmostEqual(grams['var'], sub_train.var())
+
+    def test_svc_sweep_matches_svc(self):
+        grid = {'C': [0.5, 1], 'kernel': ['rbf', 'sigmoid'], 'degree': [2, 3]}
+        results = sweeps.svc_sweep(self.X, self.y, feature_counts=[4, 6], param_grid=grid)
+        self.assertEqual(results.shape[0], 16)
+        # DEGREE DOES NOT CHANGE RBF OR SIGMOID KERNELS
+        self.assertEqual(results['reused'].sum(), 8)
+
+        X_train, X_test, y_train, y_test = search.split_arrays(self.X, self.y)
+        clf = svm.SVC(C=0.5, kernel='rbf', gamma='scale').fit(X_train[:, :6], y_train)
+        expected = np.mean(clf.predict(X_test[:, :6]) == y_test)
+        row = results[(results.features == 6) & (results.params_id == 0)].iloc[0]
+        self.assertAlmostEqual(row['accuracy'], expected)
+
+    def test_linear_sweep_table(self):
+        results = sweeps.linear_sweep(self.X, self.y, feature_counts=[4, 6], Cs=[1, 0.1],
+                                      class_weights=[None], losses=['hinge'])
+        self.assertEqual(list(results['C']), [0.1, 1, 0.1, 1])
+        self.assertEqual(list(results['features']), [4, 4, 6, 6])
+        self.assertTrue((results['n_iter'] > 0).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
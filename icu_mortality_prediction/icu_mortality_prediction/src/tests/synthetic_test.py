@@ -0,0 +1,46 @@
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from icu_mortality_prediction.src.data import synthetic
+from icu_mortality_prediction.src.features import chart_events
+from icu_mortality_prediction.src.features import lab_events
+
+
+class syntheticTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.paths = synthetic.write_synthetic(os.path.join(self.tmp, 'a'), 600, seed=3, batch_stays=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_columns_of_the_original_queries(self):
+        self.assertEqual(list(pd.read_csv(self.paths['chart'], nrows=5).columns), synthetic.CHART_COLUMNS)
+        self.assertEqual(list(pd.read_csv(self.paths['labs'], nrows=5).columns), synthetic.LAB_COLUMNS)
+        self.assertEqual(list(pd.read_csv(self.paths['demographics'], nrows=5).columns), synthetic.DEMOG_COLUMNS)
+        self.assertTrue(os.path.exists(self.paths['definitions']))
+
+        events = chart_events.import_chartevents_data(self.paths['chart'])
+        self.assertEqual(events['icustay_id'].nunique(), 600)
+        self.assertTrue((events.groupby('icustay_id')['charttime'].apply(lambda t: t.is_monotonic_increasing)).all())
+        labs = lab_events.import_labevents_data(self.paths['labs'])
+        self.assertLessEqual(labs['icustay_id'].nunique(), 600)
+
+    def test_sampling_rates_and_mortality(self):
+        events = pd.read_csv(self.paths['chart'])
+        stays = events.groupby('label')['icustay_id'].nunique()
+        self.assertEqual(stays['Heart Rate'], 600)
+        self.assertLess(stays['Arterial BP [Systolic]'], 300)
+        demographics = pd.read_csv(self.paths['demographics'])
+        outcomes = demographics.drop_duplicates('icustay_id')['hospital_expire_flag']
+        self.assertEqual(len(outcomes), 600)
+        self.assertTrue(.05 < outcomes.mean() < .2)
+
+    def test_same_seed_same_files(self):
+        paths = synthetic.write_synthetic(os.path.join(self.tmp, 'b'), 600, seed=3, batch_stays=250)
+        for source in ['chart', 'labs', 'demographics']:
+            self.assertTrue(filecmp.cmp(self.paths[source], paths[source], shallow=False))
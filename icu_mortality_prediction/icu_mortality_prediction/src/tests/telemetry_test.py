@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.utils import executor
+from icu_mortality_prediction.src.utils import telemetry
+from icu_mortality_prediction.src.utils.pipeline import Pipeline, Stage
+
+
+def events(n):
+    return pd.DataFrame({'icustay_id': np.arange(n) % 10, 'valuenum': np.arange(n, dtype=float)})
+
+
+def stats(data):
+    frames = {}
+    for calc in ['mean', 'max']:
+        with telemetry.section('stats.' + calc) as record:
+            frames[calc] = data.groupby('icustay_id')[['valuenum']].agg(calc)
+            # 8 MB HELD ONLY WHILE THE SECTION RUNS
+            scratch = np.ones(2 ** 20)
+            del scratch
+            record.output(frames[calc])
+    return frames
+
+
+def make_stages():
+    return [Stage('events', events, params={'n': 1000}), Stage('stats', stats, ['events'])]
+
+
+class telemetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        telemetry.disable()
+        shutil.rmtree(self.tmp)
+
+    def test_off_by_default(self):
+        self.assertIsNone(telemetry.current())
+        self.assertIs(telemetry.section('stats.mean'), telemetry.section('stats.max'))
+        self.assertEqual(telemetry.measure('sum', sum, [1, 2]), 3)
+        self.assertEqual(sorted(stats(events(100))), ['max', 'mean'])
+
+    def test_shapes(self):
+        self.assertEqual(telemetry.shape_of(events(5)), (5, 2))
+        self.assertEqual(telemetry.shape_of(np.zeros((4, 2, 3))), (4, 6))
+        self.assertEqual(telemetry.shape_of({'a': events(5), 'b': events(3)['valuenum']}), (5, 3))
+        self.assertEqual(telemetry.shape_of('label'), (None, None))
+
+    def test_pipeline_stages_and_sections(self):
+        recorder = telemetry.enable()
+        Pipeline(make_stages()).run()
+        telemetry.disable()
+        frame = recorder.frame().set_index('name')
+        self.assertEqual(sorted(frame.index), ['events', 'stats', 'stats.max', 'stats.mean'])
+        self.assertEqual(frame.loc['stats.mean', 'parent'], 'stats')
+        self.assertEqual(tuple(frame.loc['events', ['rows_out', 'cols_out']]), (1000, 2))
+        self.assertEqual(tuple(frame.loc['stats', ['rows_in', 'cols_in', 'rows_out', 'cols_out']]),
+                         (1000, 2, 10, 2))
+        # THE PEAK OF A SECTION COUNTS TOWARDS THE STAGE AROUND IT
+        self.assertGreaterEqual(frame.loc['stats.max', 'peak_mem'], 8 * 2 ** 20)
+        self.assertGreaterEqual(frame.loc['stats', 'peak_mem'], frame.loc['stats.max', 'peak_mem'])
+        self.assertTrue((frame.wall >= 0).all())
+
+    def test_executor_collects_worker_records(self):
+        profile_dir = os.path.join(self.tmp, 'profiles')
+        recorder = telemetry.enable(trace_memory=False, profile_dir=profile_dir)
+        executor.Executor(Pipeline(make_stages()), n_jobs=2, scratch_dir=self.tmp).run(['stats'])
+        telemetry.disable()
+        frame = recorder.frame()
+        self.assertEqual(sorted(frame.name), ['events', 'stats', 'stats.max', 'stats.mean'])
+        self.assertTrue(frame.peak_mem.isnull().all())
+        self.assertEqual(sorted(os.listdir(profile_dir)), ['events.prof', 'stats.prof'])
+
+    def test_write_report(self):
+        recorder = telemetry.enable(trace_memory=False)
+        telemetry.measure('events', events, 20)
+        telemetry.disable()
+        frame = recorder.frame()
+        telemetry.write_report(frame, os.path.join(self.tmp, 'report.json'))
+        telemetry.write_report(frame, os.path.join(self.tmp, 'report.csv'))
+        with open(os.path.join(self.tmp, 'report.json')) as f:
+            self.assertEqual(json.load(f)[0]['rows_out'], 20)
+        self.assertEqual(list(pd.read_csv(os.path.join(self.tmp, 'report.csv')).columns), telemetry.COLUMNS)
+        self.assertIn('events', telemetry.format_report(frame))
@@ -0,0 +1,97 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from icu_mortality_prediction.src.data import synthetic
+from icu_mortality_prediction.src.features import chart_events
+from icu_mortality_prediction.src.features import lab_events
+from icu_mortality_prediction.src.features import tensor
+
+
+class tensorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _build(self, frames, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return tensor.build_tensor(frames, os.path.join(self.tmp, 'tensor'), **kwargs)
+
+    def test_aggregators(self):
+        events = pd.DataFrame({
+            'icustay_id': [1, 1, 1, 1, 2, 2, 2],
+            'label': ['HR', 'HR', 'HR', 'RR', 'HR', 'RR', 'RR'],
+            'charttime': pd.to_datetime(['2100-01-01 00:10', '2100-01-01 00:50', '2100-01-01 00:30',
+                                         '2100-01-01 05:30', '2100-01-02 10:00', '2100-01-02 10:15',
+                                         '2100-01-03 11:00']),
+            'valuenum': [80., 90., 100., 12., 70., 20., 30.]})
+        expected = {'last': 90., 'mean': 90., 'max': 100.}
+        for aggregator in tensor.AGGREGATORS:
+            stays, channels, values, packed = self._build({'chart': events}, aggregator=aggregator)
+            observed = tensor.unpack_observed(packed, 24)
+            self.assertEqual(values.dtype, np.float32)
+            self.assertEqual(values.shape, (2, 2, 24))
+            self.assertEqual(list(stays), [1, 2])
+            self.assertEqual(channels, [('chart', 'HR'), ('chart', 'RR')])
+            self.assertEqual(values[0, 0, 0], expected[aggregator])
+            self.assertEqual(values[0, 1, 5], 12.)
+            self.assertEqual(values[1, 1, 0], 20.)
+            # 25 HOURS AFTER THE FIRST EVENT OF THE STAY, OUTSIDE THE WINDOW
+            self.assertEqual(observed.sum(), 4)
+            self.assertTrue(np.array_equal(observed, np.isfinite(values)))
+
+    def test_empty_selection(self):
+        """ channels absent from the events or no event inside the window give an empty tensor """
+        events = pd.DataFrame({'icustay_id': [1, 2], 'label': ['HR', 'HR'],
+                               'charttime': pd.to_datetime(['2100-01-01 00:10', '2100-01-02 10:00']),
+                               'valuenum': [80., 70.]})
+        # EVERY EVENT BEFORE THE START OF ITS STAY
+        start = pd.Series(pd.to_datetime(['2100-02-01', '2100-02-01']), index=[1, 2])
+        for kwargs in [{'channels': [('chart', 'RR')]}, {'start': start}]:
+            for aggregator in tensor.AGGREGATORS:
+                stays, channels, values, packed = self._build({'chart': events}, aggregator=aggregator, **kwargs)
+                self.assertEqual(values.shape, (2, 1, 24))
+                self.assertTrue(np.isnan(values).all())
+                self.assertFalse(tensor.unpack_observed(packed, 24).any())
+
+    def test_matches_pivot_and_streams_batches(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = synthetic.write_synthetic(os.path.join(self.tmp, 'data'), 200, seed=2)
+            chart = chart_events.import_chartevents_data(paths['chart'])
+            labs = lab_events.import_labevents_data(paths['labs'])
+        stays, channels, values, packed = self._build({'chart': chart, 'labs': labs}, aggregator='mean')
+
+        events = pd.concat([chart.assign(source='chart'), labs.assign(source='labs')],
+                           ignore_index=True)[['source'] + tensor.COLUMNS].dropna(subset=['valuenum'])
+        events['hour'] = tensor.hour_bins(events['icustay_id'].values, events['charttime'].values)
+        events = events[events['hour'] < 24]
+        pivot = events.pivot_table(index=['icustay_id', 'source', 'label', 'hour'], values='valuenum', aggfunc='mean')
+        cells = pivot.index.to_frame(index=False)
+        found = values[np.searchsorted(stays, cells['icustay_id']),
+                       [channels.index(key) for key in zip(cells['source'], cells['label'])],
+                       cells['hour'].astype(int)]
+        np.testing.assert_allclose(found, pivot['valuenum'].values.astype(np.float32), rtol=1e-6)
+        self.assertEqual(np.isfinite(values).sum(), len(pivot))
+        # THE CHART AND LAB HEMATOCRIT ARE TWO CHANNELS
+        self.assertIn(('chart', 'Hematocrit'), channels)
+        self.assertIn(('labs', 'Hematocrit'), channels)
+
+        seen = []
+        for ids, batch, observed in tensor.iter_batches(os.path.join(self.tmp, 'tensor'), batch_size=64,
+                                                        shuffle=True):
+            self.assertLessEqual(len(ids), 64)
+            self.assertTrue(np.array_equal(observed, np.isfinite(batch)))
+            np.testing.assert_array_equal(batch, values[np.searchsorted(stays, ids)])
+            seen.extend(ids)
+        self.assertEqual(sorted(seen), list(stays))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,127 @@
+""" column dtypes of the pipeline frames and a planner that narrows them.
+
+group_column_names_by_data_type sorts the columns of a frame by dtype. plan_dtypes
+builds on it to choose a narrower dtype for each column that can take one,
+
+    icustay_id, subject_id, hadm_id         int64 -> int32
+    outcomes and 0 / 1 dummies              int64 -> int8, bool stays bool
+    measurements                            float64 -> float32 when no value has
+                                            more significant digits than float32 keeps
+    strings with few distinct values        object -> category
+
+and compact applies the plan to every frame in a stage result, so the pipeline can
+narrow the results at each stage boundary (see pipeline.Pipeline's boundary).
+
+the ids, flags and categories keep their values. a float32 measurement is only the
+nearest float32 to the float64 value, about 1e-7 off, and statistics computed from
+float32 inputs differ in their last digits. a stay on an outlier bound or a quartile
+edge can change sides, which changes the features, so compaction is opt-in.
+"""
+import numpy as np
+import pandas as pd
+
+
+ID_COLUMNS = ['icustay_id', 'subject_id', 'hadm_id']
+
+OUTCOME_COLUMNS = ['hospital_expire_flag', 'hospital_expired_flag']
+
+_INT32 = np.iinfo(np.int32)
+
+
+def columns_by_data_type(frame):
+    """ dict of float64_cols, categorical_cols, bool_cols and int64_cols -> column names """
+    dtypes = list(frame.dtypes.items())
+    return {'float64_cols': [index for index, val in dtypes if val == 'float64'],
+            'categorical_cols': [index for index, val in dtypes
+                                 if val == 'object' or (pd.api.types.is_string_dtype(val)
+                                                        and not isinstance(val, pd.CategoricalDtype))],
+            'bool_cols': [index for index, val in dtypes if val == 'bool'],
+            'int64_cols': [index for index, val in dtypes if val == 'int64']}
+
+
 def group_column_names_by_data_type(self):
-    self.columns_by_data_type_dict = {}
     # collect feature column names by type
-    self.columns_by_data_type_dict["float64_cols"] = [index for index, val in
-                                                      self.data.dtypes.iteritems() if val == 'float64']
-    # uint_cols = [index for index, val in labels_and_features_dropped_null_cols_df.dtypes.iteritems() if val=='uint8']
-    self.columns_by_data_type_dict["categorical_cols"] = [index for index, val in
-                                                          self.data.dtypes.iteritems() if val == 'object']
-    self.columns_by_data_type_dict["bool_cols"] = [index for index, val in
-                                                   self.data.dtypes.iteritems() if val == 'bool']
-    self.columns_by_data_type_dict["int64_cols"] = [index for index, val in
-                                                    self.data.dtypes.iteritems() if val == 'int64']
+    self.columns_by_data_type_dict = columns_by_data_type(self.data)
+
+
+def _is_id(name):
+    return name in ID_COLUMNS or str(name).endswith('_id')
+
+
+def fits_float32(values, significant=7):
+    """ True when every finite value is within the float32 range and has at most
+    significant digits, so float32 keeps the value as it was recorded """
+    finite = values[np.isfinite(values)]
+    nonzero = finite[finite != 0]
+    if not len(nonzero):
+        return True
+    if np.abs(nonzero).max() > np.finfo(np.float32).max or np.abs(nonzero).min() < np.finfo(np.float32).tiny:
+        return False
+    scale = 10.0 ** (significant - 1 - np.floor(np.log10(np.abs(nonzero))))
+    return bool(np.allclose(np.round(nonzero * scale) / scale, nonzero, rtol=1e-12, atol=0))
+
+
+def plan_dtypes(frame, significant=7, max_category_ratio=.1):
+    """ dict of column -> narrower dtype for the columns of frame that can take one.
+
+    :param significant: float columns whose values have at most this many significant
+                        digits become float32, computed statistics keep float64
+    :param max_category_ratio: strings become categories when they have at most this
+                               many distinct values per row
+    """
+    groups = columns_by_data_type(frame)
+    plan = {}
+    for col in groups['int64_cols']:
+        values = frame[col].values
+        if not len(values):
+            continue
+        low, high = values.min(), values.max()
+        if col in OUTCOME_COLUMNS or (low >= 0 and high <= 1):
+            plan[col] = 'int8'
+        elif _is_id(col) and low >= _INT32.min and high <= _INT32.max:
+            plan[col] = 'int32'
+    for col in groups['float64_cols']:
+        if _is_id(col):
+            continue
+        if fits_float32(frame[col].values, significant):
+            plan[col] = 'float32'
+    for col in groups['categorical_cols']:
+        values = frame[col]
+        present = values.dropna()
+        if not len(present) or not all(isinstance(value, str) for value in present.values[:1000]):
+            continue
+        if present.nunique() <= max(1, max_category_ratio * len(values)):
+            plan[col] = 'category'
+    return plan
+
+
+def apply_dtypes(frame, plan):
+    """ a copy of frame with the planned dtypes """
+    return frame.astype(plan) if plan else frame
+
+
+def compact(result, **kwargs):
+    """ the frames of a stage result, nested in dicts, lists and tuples, with narrowed dtypes.
+
+    block views keep their rows and columns over a narrowed copy of their matrix, one
+    copy per shared matrix. other objects are returned as they are.
+    """
+    from ..features.blocks import BlockView
+    compacted = {}
+
+    def visit(obj):
+        if isinstance(obj, pd.DataFrame):
+            if id(obj) not in compacted:
+                compacted[id(obj)] = (obj, apply_dtypes(obj, plan_dtypes(obj, **kwargs)))
+            return compacted[id(obj)][1]
+        if isinstance(obj, pd.Series):
+            return visit(obj.to_frame())[obj.name if obj.name is not None else 0]
+        if isinstance(obj, BlockView):
+            return BlockView(visit(obj.matrix), obj.rows, obj.positions)
+        if isinstance(obj, dict):
+            return type(obj)((key, visit(value)) for key, value in obj.items())
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(visit(value) for value in obj)
+        return obj
+
+    return visit(result)
@@ -0,0 +1,221 @@
+""" run the stages of a pipeline.Pipeline in a process pool.
+
+a stage is handed to a worker as soon as every stage it takes inputs from has
+finished, so independent branches such as the chart, lab and demographics stages run
+side by side and the wall time approaches that of the longest branch. among the ready
+stages the one with the longest chain of stages after it goes first.
+
+results pass between processes through pickles on disk: memoized stages write to the
+pipeline's cache, the others to a scratch directory removed when the run ends, so
+each result is written once and read by every stage that needs it.
+
+a failing stage does not stop the branches that do not depend on it. stages after it
+are skipped, and once the run is done a PipelineError carries the report of every
+stage. cancel(), a set cancel event or Ctrl-C stops new stages from starting and
+waits for the running ones.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+
+from . import parallel
+from . import pipeline
+from . import telemetry
+
+
+class PipelineError(RuntimeError):
+    """ raised when stages failed or were cancelled, report holds the status of every stage """
+
+    def __init__(self, message, report):
+        RuntimeError.__init__(self, message)
+        self.report = report
+
+
+def _run_stage(task):
+    """ run one stage in a worker, reading its inputs from and writing its result to disk """
+    stage, input_paths, output_path, telemetry_settings, boundary = task
+    # A FORKED WORKER INHERITS THE PARENT'S RECORDER, ITS RECORDS WOULD NEVER BE SEEN
+    if telemetry_settings is None:
+        telemetry.disable()
+    else:
+        telemetry.enable(**telemetry_settings)
+    start = time.time()
+    cpu = time.process_time()
+    try:
+        inputs = []
+        for path in input_paths:
+            with open(path, 'rb') as f:
+                inputs.append(pickle.load(f))
+        result = pipeline.run_stage(stage, inputs, boundary)
+        directory = os.path.dirname(output_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '{}.{}.tmp'.format(output_path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, output_path)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    recorder = telemetry.disable()
+    return {'stage': stage.name, 'pid': os.getpid(), 'start': start, 'wall': time.time() - start,
+            'cpu': time.process_time() - cpu, 'error': error,
+            'telemetry': recorder.rows if recorder is not None else []}
+
+
+def _chain_lengths(pipe, names):
+    """ number of stages on the longest chain from each stage to the end of the run """
+    lengths = {}
+    for name in reversed(pipe.order):
+        if name in names:
+            after = [lengths[other] for other in names if name in pipe.stages[other].inputs]
+            lengths[name] = 1 + max(after or [0])
+    return lengths
+
+
+class Executor(object):
+    """ schedules the stages of a pipeline on a process pool.
+
+    :param pipe: pipeline.Pipeline, its cache_dir is used for memoized results
+    :param n_jobs: worker processes, -1 for one per core
+    :param scratch_dir: parent directory for the results of stages that are not memoized
+    :param cancel_event: optional threading or multiprocessing Event, the run is
+                         cancelled once it is set
+    """
+
+    def __init__(self, pipe, n_jobs=-1, scratch_dir=None, cancel_event=None):
+        self.pipe = pipe
+        self.n_jobs = parallel.resolve_jobs(n_jobs)
+        self.scratch_dir = scratch_dir
+        self.cancel_event = cancel_event
+        self.cancelled = False
+        self.report = None
+        self.wall_time = None
+
+    def cancel(self):
+        """ start no further stages """
+        self.cancelled = True
+
+    def plan(self, targets, keys):
+        """ stages to run and memoized stages to read, walking up from the targets """
+        to_run = set()
+        to_load = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name in to_run or name in to_load:
+                continue
+            if self.pipe.is_cached(name, keys[name]):
+                to_load.add(name)
+            else:
+                to_run.add(name)
+                pending.extend(self.pipe.stages[name].inputs)
+        return to_run, to_load
+
+    def run(self, targets=None):
+        """ results of the target stages.
+
+        :param targets: stage names, defaults to the stages nothing depends on
+        :return: dict of stage name -> result, the per stage report is left in
+                 self.report and the elapsed time in self.wall_time
+        """
+        pipe = self.pipe
+        if targets is None:
+            used = set(dep for stage in pipe.stages.values() for dep in stage.inputs)
+            targets = [name for name in pipe.order if name not in used]
+        keys = pipe.keys()
+        to_run, to_load = self.plan(targets, keys)
+        scratch = tempfile.mkdtemp(prefix='icu_pipeline_', dir=self.scratch_dir)
+
+        def result_path(name):
+            if pipe.cache_dir is not None and pipe.stages[name].cache:
+                return pipe.cache_path(name, keys[name])
+            return os.path.join(scratch, name + '.pkl')
+
+        rows = dict((name, {'stage': name, 'status': 'loaded'}) for name in to_load)
+        done = set(to_load)
+        waiting = set(to_run)
+        priority = _chain_lengths(pipe, to_run)
+        recorder = telemetry.current()
+        telemetry_settings = recorder.settings() if recorder is not None else None
+        started = time.time()
+        print("running {} stages on {} workers, {} memoized".format(len(to_run), self.n_jobs, len(to_load)))
+        try:
+            with ProcessPoolExecutor(max_workers=max(1, min(self.n_jobs, len(to_run)))) as pool:
+                running = {}
+                while waiting or running:
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        self.cancelled = True
+                    if not self.cancelled:
+                        ready = [name for name in waiting if all(dep in done for dep in pipe.stages[name].inputs)]
+                        ready.sort(key=lambda name: (-priority[name], pipe.order.index(name)))
+                        for name in ready[:self.n_jobs - len(running)]:
+                            stage = pipe.stages[name]
+                            task = (stage, [result_path(dep) for dep in stage.inputs], result_path(name),
+                                    telemetry_settings, pipe.boundary)
+                            running[pool.submit(_run_stage, task)] = name
+                            waiting.discard(name)
+                    if not running:
+                        break
+                    finished, _ = wait(list(running), timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        row = future.result()
+                        records = row.pop('telemetry')
+                        if recorder is not None:
+                            recorder.extend(records)
+                        row['start'] -= started
+                        row['status'] = 'failed' if row['error'] else 'computed'
+                        rows[name] = row
+                        if row['error']:
+                            print("stage {} failed".format(name))
+                            for other in pipe.downstream(name):
+                                if other in waiting:
+                                    waiting.discard(other)
+                                    rows[other] = {'stage': other, 'status': 'skipped',
+                                                   'error': 'input {} failed'.format(name)}
+                        else:
+                            print("finished {} in {:.1f}s".format(name, row['wall']))
+                            done.add(name)
+        except KeyboardInterrupt:
+            self.cancelled = True
+        finally:
+            for name in waiting:
+                if name not in rows:
+                    rows[name] = {'stage': name, 'status': 'cancelled'}
+            self.report = pd.DataFrame([rows[name] for name in pipe.order if name in rows],
+                                       columns=['stage', 'status', 'pid', 'start', 'wall', 'cpu', 'error'])
+            self.wall_time = time.time() - started
+
+        try:
+            problems = self.report[self.report.status.isin(['failed', 'skipped', 'cancelled'])]
+            if len(problems):
+                raise PipelineError(format_report(self.report), self.report)
+            results = {}
+            for name in targets:
+                with open(result_path(name), 'rb') as f:
+                    results[name] = pickle.load(f)
+            return results
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def run_parallel(pipe, targets=None, n_jobs=-1, scratch_dir=None, cancel_event=None):
+    """ run the pipeline on a process pool, see Executor.run """
+    return Executor(pipe, n_jobs, scratch_dir, cancel_event).run(targets)
+
+
+def format_report(report):
+    """ one line per stage with its status and time, followed by the tracebacks of failed stages """
+    lines = []
+    for row in report.itertuples():
+        timing = '' if pd.isnull(row.wall) else ' {:.1f}s'.format(row.wall)
+        lines.append('{:<28} {}{}'.format(row.stage, row.status, timing))
+    for row in report[report.status == 'failed'].itertuples():
+        lines.append('\n{} failed:\n{}'.format(row.stage, row.error))
+    return '\n'.join(lines)
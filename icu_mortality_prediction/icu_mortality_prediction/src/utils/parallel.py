@@ -0,0 +1,71 @@
+""" helpers for spreading work across a process pool.
+
+arrays are written once to a scratch directory as .npy files and the workers open
+them with mmap, so every process reads the same pages instead of receiving its own
+pickled copy of the data with each task.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+# ARRAYS ALREADY OPENED BY THIS PROCESS, KEYED BY PATH
+_opened = {}
+
+
+def resolve_jobs(n_jobs):
+    """ convert a joblib style n_jobs value (-1 = all cores) to a worker count """
+    cores = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, cores + 1 + n_jobs)
+    return n_jobs
+
+
+@contextmanager
+def shared_arrays(arrays, scratch_dir=None):
+    """ write arrays to .npy files for memory mapped access by worker processes.
+
+    :param arrays: dict of name -> numeric array
+    :param scratch_dir: parent directory for the files, defaults to the system temp dir
+    :return: dict of name -> .npy path, removed again when the context exits
+    """
+    directory = tempfile.mkdtemp(prefix='icu_shared_', dir=scratch_dir)
+    try:
+        paths = {}
+        for name, arr in arrays.items():
+            paths[name] = os.path.join(directory, name + '.npy')
+            np.save(paths[name], np.ascontiguousarray(arr))
+        yield paths
+    finally:
+        for path in paths.values():
+            _opened.pop(path, None)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def load_shared(paths):
+    """ open shared arrays read-only with mmap, reusing arrays this process already opened """
+    arrays = {}
+    for name, path in paths.items():
+        if path not in _opened:
+            _opened[path] = np.load(path, mmap_mode='r')
+        arrays[name] = _opened[path]
+    return arrays
+
+
+def run_tasks(func, tasks, n_jobs=1, chunksize=1):
+    """ apply func to every task, in a process pool when n_jobs > 1.
+
+    results come back in the order of tasks. with a single job the tasks run in
+    this process, which keeps tracebacks readable when debugging.
+    """
+    n_jobs = resolve_jobs(n_jobs)
+    tasks = list(tasks)
+    if n_jobs == 1 or len(tasks) < 2:
+        return [func(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+        return list(pool.map(func, tasks, chunksize=chunksize))
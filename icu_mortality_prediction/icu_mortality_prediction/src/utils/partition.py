@@ -0,0 +1,82 @@
+""" hash partitioning of event CSVs by ICU stay for out-of-core feature computation.
+
+the per stay statistics need every event of a stay at once, but not every stay at
+once. partition_csv reads an event CSV in chunks, one pass, and appends each row to
+one of n partition files chosen by a hash of its icustay_id, so every stay lands
+whole in exactly one partition. the partitions keep the columns and text of the
+original file, so the importers read them unchanged.
+
+map_partitions then runs a function on every partition in a process pool, so at most
+one partition per worker is in memory, and concat_partitions joins the per stay
+results of the partitions. steps over all stays are merged from summaries of the
+partitions, e.g. the number of stays per label adds up across partitions because no
+stay is split.
+"""
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+from . import parallel
+
+
+PARTITION_NAME = 'part-{:04d}.csv'
+
+
+def partition_of(keys, n_partitions):
+    """ partition number of every key, the same in every process and run """
+    keys = np.asarray(keys).astype(str).astype(object)
+    return (pd.util.hash_array(keys) % np.uint64(n_partitions)).astype(np.int64)
+
+
+def partition_csv(path, root, n_partitions, key='icustay_id', chunksize=None):
+    """ split the CSV at path into up to n_partitions files under root by a hash of the key column.
+
+    :param root: directory for the partition files, partitions left from an earlier
+                 run are removed first
+    :param chunksize: CSV rows read at a time, 500000 by default
+    :return: sorted paths of the partitions holding at least one row
+    """
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    for old in glob.glob(os.path.join(root, PARTITION_NAME.replace('{:04d}', '*'))):
+        os.remove(old)
+    written = set()
+    # EVERY FIELD AS TEXT, SO THE PARTITIONS HOLD EXACTLY THE TEXT OF THE ORIGINAL FILE
+    reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize or 500000)
+    rows = 0
+    for chunk in reader:
+        parts = partition_of(chunk[key].values, n_partitions)
+        for part, frame in chunk.groupby(parts, sort=False):
+            part_path = os.path.join(root, PARTITION_NAME.format(part))
+            frame.to_csv(part_path, index=False, mode='a', header=part_path not in written)
+            written.add(part_path)
+        rows += len(chunk)
+    print("partitioned {} rows of {} into {} files".format(rows, os.path.basename(path), len(written)))
+    return sorted(written)
+
+
+def _call(task):
+    func, path, args = task
+    return func(path, *args)
+
+
+def map_partitions(func, paths, n_jobs=1, *args):
+    """ [func(path, *args) for path in paths], one partition per task in a process pool """
+    return parallel.run_tasks(_call, [(func, path, args) for path in paths], n_jobs=n_jobs)
+
+
+def concat_partitions(parts):
+    """ join the results of several partitions that share one structure.
+
+    frames and series are concatenated and sorted by their index (the icustay_id of
+    per stay results), dicts and tuples are joined item by item and numbers are added.
+    """
+    first = parts[0]
+    if isinstance(first, dict):
+        return dict((key, concat_partitions([part[key] for part in parts])) for key in first)
+    if isinstance(first, (tuple, list)):
+        return type(first)(concat_partitions(list(items)) for items in zip(*parts))
+    if isinstance(first, (pd.DataFrame, pd.Series)):
+        return pd.concat(parts).sort_index(kind='mergesort')
+    return sum(parts)
@@ -0,0 +1,377 @@
+""" a small stage pipeline with on-disk memoization.
+
+each stage is a plain function declared with the stages it takes its inputs from and
+the parameters it is called with. the key of a stage is a hash of its code, its
+parameters, the size and modification time of any input files and the keys of the
+stages before it. results are pickled under cache_dir/<stage>/<key>.pkl, so a re-run
+loads every stage whose key is unchanged and recomputes only the stages whose code,
+parameters or inputs changed and the stages after them.
+
+the code of a stage covers its own source, the source of the package functions and
+classes it uses, called by name (chart_events.drop_sparse_data) or through a module
+(blocks.complete_cases), recursively, and the module level data of the package they
+read, such as concepts.CONCEPTS. editing a helper or the concept map invalidates every
+stage that uses it.
+
+a boundary function, e.g. data_utils.compact, is applied to every stage result before
+it is memoized or handed on, and its code is part of every key.
+"""
+import dis
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import os
+import pickle
+import types
+import numpy as np
+
+from . import telemetry
+
+
+PACKAGE = __name__.split('.')[0]
+
+
+class Stage(object):
+    """ one step of a pipeline.
+
+    :param name: unique stage name
+    :param func: function called as func(*inputs, **params)
+    :param inputs: names of the stages whose results are passed positionally
+    :param params: keyword arguments, part of the stage key
+    :param files: names of params that are file paths, their size and modification
+                  time are part of the stage key
+    :param cache: False for cheap stages not worth writing to disk
+    :param untracked: names of params left out of the key, settings such as a read
+                      chunk size that do not change the result
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, files=(), cache=True, untracked=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = dict(params or {})
+        self.files = list(files)
+        self.cache = cache
+        self.untracked = list(untracked)
+
+    def __repr__(self):
+        return "Stage({!r}, {}, inputs={})".format(self.name, self.func.__name__, self.inputs)
+
+
+# VALUES OF MODULE LEVEL NAMES HASHED AS DATA, E.G. concepts.CONCEPTS OR OUTCOME
+_DATA_TYPES = (bool, int, float, complex, str, bytes, tuple, list, dict, set, frozenset, type(None), np.ndarray)
+
+_MISSING = object()
+
+
+def _in_package(module_name, own_module=None):
+    # A MODULE OF THIS PACKAGE OR OF THE PACKAGE THE REFERRING FUNCTION IS DEFINED IN
+    roots = [PACKAGE] + ([own_module.split('.')[0]] if own_module else [])
+    return module_name is not None and (module_name == own_module or module_name.split('.')[0] in roots)
+
+
+def _import(name, level, package):
+    # ONLY MODULES OF THE PACKAGE ARE IMPORTED TO FOLLOW A FUNCTION LEVEL IMPORT
+    try:
+        if level:
+            name = importlib.util.resolve_name('.' * level + name, package)
+        if not _in_package(name, package):
+            return _MISSING
+        return importlib.import_module(name)
+    except (ImportError, ValueError):
+        return _MISSING
+
+
+def _code_references(code, func_globals, package):
+    """ (module, name, object) of the globals a code object loads, the attributes it
+    loads from modules and classes, chained as in concepts.CONCEPTS, and the names it
+    imports inside the function, for the code and the code objects nested in it """
+    found = []
+    local_values = {}
+    consts = []
+    importing = _MISSING
+    last = _MISSING
+    for ins in dis.get_instructions(code):
+        op = ins.opname
+        current = _MISSING
+        owner = None
+        if op in ('LOAD_GLOBAL', 'LOAD_NAME'):
+            current = func_globals.get(ins.argval, _MISSING)
+            owner = func_globals.get('__name__')
+        elif op in ('LOAD_ATTR', 'LOAD_METHOD') and isinstance(last, (types.ModuleType, type)):
+            current = getattr(last, ins.argval, _MISSING)
+            owner = last.__name__ if isinstance(last, types.ModuleType) else last.__module__
+        elif op in ('LOAD_FAST', 'LOAD_DEREF', 'LOAD_CLOSURE'):
+            current = local_values.get(ins.argval, _MISSING)
+        elif op == 'IMPORT_NAME':
+            level = consts[-2] if len(consts) > 1 and isinstance(consts[-2], int) else 0
+            importing = current = _import(ins.argval, level, package)
+            if current is not _MISSING and level == 0 and not (consts and consts[-1]):
+                # import a.b.c BINDS a
+                current = importlib.import_module(ins.argval.split('.')[0])
+        elif op == 'IMPORT_FROM' and isinstance(importing, types.ModuleType):
+            current = getattr(importing, ins.argval, _MISSING)
+            if current is _MISSING:
+                current = _import('{}.{}'.format(importing.__name__, ins.argval), 0, package)
+            owner = importing.__name__
+        elif op in ('STORE_FAST', 'STORE_DEREF', 'STORE_NAME') and last is not _MISSING:
+            local_values[ins.argval] = last
+        if op == 'LOAD_CONST':
+            consts.append(ins.argval)
+        if current is not _MISSING and owner is not None:
+            found.append((owner, ins.argval, current))
+        last = current
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            found.extend(_code_references(const, func_globals, package))
+    return found
+
+
+def _referenced_objects(func):
+    """ package functions and classes func refers to, by name, through a module attribute
+    such as blocks.complete_cases or by a function level import, and the module level data
+    of the package it reads, as ('data', qualified name, value) """
+    package = func.__module__.rpartition('.')[0] if func.__module__ else None
+    found = []
+    for owner, name, obj in _code_references(func.__code__, func.__globals__, package):
+        if isinstance(obj, types.FunctionType):
+            if _in_package(obj.__module__, func.__module__):
+                found.append(obj)
+        elif isinstance(obj, type):
+            if _in_package(obj.__module__, func.__module__):
+                found.append(obj)
+        elif isinstance(obj, _DATA_TYPES) and _in_package(owner, func.__module__):
+            found.append(('data', '{}.{}'.format(owner, name), obj))
+    return found
+
+
+def _data_fingerprint(value):
+    if isinstance(value, np.ndarray):
+        return '{} {} {}'.format(value.dtype, value.shape, hashlib.sha1(np.ascontiguousarray(value)).hexdigest())
+    if isinstance(value, (set, frozenset)):
+        # SET ORDER DEPENDS ON THE HASH SEED
+        return repr(sorted(_data_fingerprint(item) for item in value))
+    if isinstance(value, dict):
+        return repr([(_data_fingerprint(key), _data_fingerprint(item)) for key, item in value.items()])
+    if isinstance(value, (list, tuple)):
+        return repr([_data_fingerprint(item) for item in value])
+    return repr(value)
+
+
+def _class_functions(cls):
+    # THE METHODS OF A CLASS, THEIR REFERENCES ARE FOLLOWED LIKE THOSE OF A FUNCTION
+    functions = []
+    for value in vars(cls).values():
+        if isinstance(value, (staticmethod, classmethod)):
+            value = value.__func__
+        if isinstance(value, property):
+            value = value.fget
+        if isinstance(value, types.FunctionType):
+            functions.append(value)
+    return functions
+
+
+def code_fingerprint(func):
+    """ hash of the source of func and of the package functions and classes it uses,
+    recursively, and of the module level data of the package they read """
+    digest = hashlib.sha1()
+    seen = set()
+    pending = [func]
+    while pending:
+        current = pending.pop()
+        if isinstance(current, tuple):
+            _, name, value = current
+            if ('data', name) not in seen:
+                seen.add(('data', name))
+                digest.update('{} = {}\n'.format(name, _data_fingerprint(value)).encode('utf-8'))
+            continue
+        ident = (current.__module__, current.__qualname__)
+        if ident in seen:
+            continue
+        seen.add(ident)
+        try:
+            source = inspect.getsource(current)
+        except (OSError, TypeError):
+            source = repr(current.__code__.co_code) if hasattr(current, '__code__') else ''
+        digest.update('{}.{}\n{}'.format(current.__module__, current.__qualname__, source).encode('utf-8'))
+        if isinstance(current, type):
+            pending.extend(_class_functions(current))
+        else:
+            pending.extend(_referenced_objects(current))
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """ path, size and modification time of an input file, cheap enough for large CSVs """
+    if not os.path.exists(path):
+        return (os.path.abspath(path), None, None)
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def run_stage(stage, inputs, boundary=None):
+    """ call a stage on the results of its input stages and apply the boundary to its result """
+    result = telemetry.measure(stage.name, stage.func, *inputs, **stage.params)
+    return result if boundary is None else boundary(result)
+
+
+class Pipeline(object):
+    """ a DAG of stages with memoized results.
+
+    :param stages: list of Stage, in any order
+    :param cache_dir: directory for the pickled results, None disables memoization
+    :param boundary: optional function applied to the result of every stage
+    """
+
+    def __init__(self, stages, cache_dir=None, boundary=None):
+        self.stages = dict((stage.name, stage) for stage in stages)
+        if len(self.stages) != len(stages):
+            raise ValueError("duplicate stage names")
+        for stage in stages:
+            unknown = [name for name in stage.inputs if name not in self.stages]
+            if unknown:
+                raise ValueError("stage {} takes inputs from unknown stages {}".format(stage.name, unknown))
+        self.cache_dir = cache_dir
+        self.boundary = boundary
+        self.order = self._topological_order()
+        # STAGE NAMES RUN OR LOADED BY THE LAST CALL TO run
+        self.computed = []
+        self.loaded = []
+
+    def _topological_order(self):
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError("cycle in pipeline: {}".format(' -> '.join(path + [name])))
+            state[name] = 'visiting'
+            for dep in self.stages[name].inputs:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in sorted(self.stages):
+            visit(name, [])
+        return order
+
+    def upstream(self, targets):
+        """ names of the targets and every stage they depend on, in run order """
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise KeyError("unknown stage {}".format(name))
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].inputs)
+        return [name for name in self.order if name in needed]
+
+    def downstream(self, name):
+        """ names of the stages that depend on name, directly or not, in run order """
+        affected = set([name])
+        for stage_name in self.order:
+            if any(dep in affected for dep in self.stages[stage_name].inputs):
+                affected.add(stage_name)
+        return [stage_name for stage_name in self.order if stage_name in affected and stage_name != name]
+
+    def keys(self):
+        """ dict of stage name -> memoization key """
+        keys = {}
+        for name in self.order:
+            stage = self.stages[name]
+            digest = hashlib.sha1()
+            digest.update(code_fingerprint(stage.func).encode('utf-8'))
+            if self.boundary is not None:
+                digest.update(code_fingerprint(self.boundary).encode('utf-8'))
+            tracked = [(param, value) for param, value in stage.params.items() if param not in stage.untracked]
+            digest.update(repr(sorted(tracked)).encode('utf-8'))
+            for param in stage.files:
+                digest.update(repr(file_fingerprint(stage.params[param])).encode('utf-8'))
+            for dep in stage.inputs:
+                digest.update(keys[dep].encode('utf-8'))
+            keys[name] = digest.hexdigest()
+        return keys
+
+    def cache_path(self, name, key):
+        return os.path.join(self.cache_dir, name, key + '.pkl')
+
+    def is_cached(self, name, key):
+        return self.cache_dir is not None and self.stages[name].cache and \
+            os.path.exists(self.cache_path(name, key))
+
+    def load(self, name, key):
+        with open(self.cache_path(name, key), 'rb') as f:
+            return pickle.load(f)
+
+    def store(self, name, key, result):
+        """ pickle a result, written to a temporary file first so an interrupted run leaves no partial file """
+        if self.cache_dir is None or not self.stages[name].cache:
+            return
+        path = self.cache_path(name, key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def run_stage(self, name, inputs):
+        """ call one stage on the results of its input stages """
+        return run_stage(self.stages[name], inputs, self.boundary)
+
+    def run(self, targets=None):
+        """ results of the target stages, loading memoized results where the key is unchanged.
+
+        stages upstream of a memoized result are neither run nor loaded.
+
+        :param targets: stage names, defaults to the stages nothing depends on
+        :return: dict of stage name -> result for the targets
+        """
+        if targets is None:
+            used = set(dep for stage in self.stages.values() for dep in stage.inputs)
+            targets = [name for name in self.order if name not in used]
+        keys = self.keys()
+        results = {}
+        self.computed = []
+        self.loaded = []
+
+        def resolve(name):
+            if name in results:
+                return results[name]
+            key = keys[name]
+            if self.is_cached(name, key):
+                print("loading {} from cache".format(name))
+                results[name] = self.load(name, key)
+                self.loaded.append(name)
+            else:
+                inputs = [resolve(dep) for dep in self.stages[name].inputs]
+                print("running {}".format(name))
+                results[name] = self.run_stage(name, inputs)
+                self.store(name, key, results[name])
+                self.computed.append(name)
+            return results[name]
+
+        for name in targets:
+            resolve(name)
+        return dict((name, results[name]) for name in targets)
+
+    def clear(self, keep_current=True):
+        """ remove memoized results, by default only those no longer matching a stage key """
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return 0
+        keys = self.keys() if keep_current else {}
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            stage_dir = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(stage_dir):
+                continue
+            for filename in os.listdir(stage_dir):
+                if filename != keys.get(name, '') + '.pkl':
+                    os.remove(os.path.join(stage_dir, filename))
+                    removed += 1
+        return removed
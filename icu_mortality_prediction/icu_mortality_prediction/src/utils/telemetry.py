@@ -0,0 +1,259 @@
+""" per stage timing, memory and shape records.
+
+telemetry is off until enable() is called. while it is off measure() is a plain
+function call and section() returns a shared no-op context, so the stages and the
+statistic loops can stay instrumented at no measurable cost.
+
+when it is on, every measured stage and section records
+
+    name, parent    the stage or section and the one enclosing it
+    pid, start      the process it ran in and when it started
+    wall, cpu       elapsed and process CPU seconds
+    peak_mem        peak bytes allocated above the memory in use when it started,
+                    traced with tracemalloc (trace_memory=False leaves it empty)
+    rows_in, cols_in, rows_out, cols_out
+                    shapes of the frames and arrays it took and returned. dicts,
+                    lists and tuples of frames count the largest number of rows
+                    and the total number of columns
+
+and with a profile_dir each measured stage also writes a cProfile dump to
+<profile_dir>/<name>.prof. the records are written with write_report as JSON or CSV.
+"""
+import cProfile
+import os
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ['name', 'parent', 'pid', 'start', 'wall', 'cpu', 'peak_mem', 'rows_in', 'cols_in',
+           'rows_out', 'cols_out']
+
+# THE ACTIVE RECORDER, None WHILE TELEMETRY IS OFF
+_recorder = None
+
+
+def shape_of(obj):
+    """ (rows, columns) of a frame, series, array or a container of them, (None, None) otherwise """
+    if isinstance(obj, pd.DataFrame):
+        return obj.shape
+    if isinstance(obj, pd.Series):
+        return len(obj), 1
+    if isinstance(obj, np.ndarray):
+        return (obj.shape[0], int(np.prod(obj.shape[1:]))) if obj.ndim else (None, None)
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if isinstance(obj, (list, tuple)):
+        shapes = [shape for shape in map(shape_of, obj) if shape[0] is not None]
+        if shapes:
+            return max(rows for rows, _ in shapes), sum(cols for _, cols in shapes)
+    return None, None
+
+
+class _Record(object):
+    """ an open stage or section, closed by Recorder.close """
+
+    def __init__(self, recorder, name, parent):
+        self.row = dict.fromkeys(COLUMNS)
+        self.row.update({'name': name, 'parent': parent, 'pid': os.getpid()})
+        self.peak = 0
+        self.base = 0
+        if recorder.trace_memory:
+            self.base, peak = tracemalloc.get_traced_memory()
+            if recorder.stack:
+                recorder.stack[-1].peak = max(recorder.stack[-1].peak, peak)
+            _reset_peak()
+        self.row['start'] = time.time()
+        self.cpu = time.process_time()
+
+    def inputs(self, obj):
+        self.row['rows_in'], self.row['cols_in'] = shape_of(obj)
+
+    def output(self, obj):
+        self.row['rows_out'], self.row['cols_out'] = shape_of(obj)
+
+
+class _NoRecord(object):
+    """ stands in for a _Record while telemetry is off """
+
+    def inputs(self, obj):
+        pass
+
+    def output(self, obj):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_RECORD = _NoRecord()
+
+
+def _reset_peak():
+    # tracemalloc.reset_peak IS NEW IN PYTHON 3.9, BEFORE IT THE PEAK COVERS THE WHOLE TRACE
+    reset = getattr(tracemalloc, 'reset_peak', None)
+    if reset is not None:
+        reset()
+
+
+class Recorder(object):
+    """ collects the records of the stages and sections run while it is active.
+
+    :param trace_memory: trace allocations with tracemalloc for peak_mem, which slows
+                         allocation heavy code down
+    :param profile_dir: directory for a cProfile dump of every measured stage
+    """
+
+    def __init__(self, trace_memory=True, profile_dir=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.rows = []
+        self.stack = []
+        self.started = time.time()
+        self._profiling = False
+        self._started_tracing = False
+
+    def settings(self):
+        """ keyword arguments for a Recorder in a worker process """
+        return {'trace_memory': self.trace_memory, 'profile_dir': self.profile_dir}
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def open(self, name):
+        record = _Record(self, name, self.stack[-1].row['name'] if self.stack else None)
+        self.stack.append(record)
+        return record
+
+    def close(self, record):
+        row = record.row
+        row['wall'] = time.time() - row['start']
+        row['cpu'] = time.process_time() - record.cpu
+        if self.trace_memory:
+            peak = max(record.peak, tracemalloc.get_traced_memory()[1])
+            row['peak_mem'] = max(0, peak - record.base)
+        self.stack.remove(record)
+        if self.trace_memory and self.stack:
+            # THE PEAK WAS RESET FOR THIS RECORD, CARRY IT OVER TO THE ONE ENCLOSING IT
+            self.stack[-1].peak = max(self.stack[-1].peak, peak)
+            _reset_peak()
+        self.rows.append(row)
+
+    def extend(self, rows):
+        """ add the records sent back by a worker process """
+        self.rows.extend(rows)
+
+    def frame(self):
+        """ the records in start order, start in seconds since the recorder was created """
+        frame = pd.DataFrame(self.rows, columns=COLUMNS)
+        frame['start'] = frame['start'] - self.started
+        return frame.sort_values('start').reset_index(drop=True)
+
+
+def enable(trace_memory=True, profile_dir=None):
+    """ start recording, returns the active Recorder """
+    global _recorder
+    disable()
+    _recorder = Recorder(trace_memory, profile_dir)
+    _recorder.start()
+    return _recorder
+
+
+def disable():
+    """ stop recording, returns the Recorder that was active or None """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.stop()
+    return recorder
+
+
+def current():
+    """ the active Recorder, None while telemetry is off """
+    return _recorder
+
+
+def measure(name, func, *args, **kwargs):
+    """ call func(*args, **kwargs), recording it under name when telemetry is on """
+    recorder = _recorder
+    if recorder is None:
+        return func(*args, **kwargs)
+    record = recorder.open(name)
+    record.inputs(list(args) + list(kwargs.values()))
+    profiler = None
+    if recorder.profile_dir is not None and not recorder._profiling:
+        profiler = cProfile.Profile()
+        recorder._profiling = True
+    try:
+        if profiler is None:
+            result = func(*args, **kwargs)
+        else:
+            result = profiler.runcall(func, *args, **kwargs)
+    finally:
+        if profiler is not None:
+            recorder._profiling = False
+            if not os.path.isdir(recorder.profile_dir):
+                os.makedirs(recorder.profile_dir)
+            profiler.dump_stats(os.path.join(recorder.profile_dir, '{}.prof'.format(name)))
+        recorder.close(record)
+    record.output(result)
+    return result
+
+
+class _Section(object):
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.record = self.recorder.open(self.name)
+        return self.record
+
+    def __exit__(self, *exc):
+        self.recorder.close(self.record)
+        return False
+
+
+def section(name):
+    """ context manager recording the block under name when telemetry is on.
+
+    the value it yields takes record.output(obj) for the shape of what the block made.
+    """
+    if _recorder is None:
+        return _NO_RECORD
+    return _Section(_recorder, name)
+
+
+def write_report(frame, path):
+    """ write a frame of records as JSON (.json) or CSV (any other extension) """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if path.endswith('.json'):
+        frame.to_json(path, orient='records', indent=2)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def format_report(frame, top=15):
+    """ the records taking the most wall time, with memory in MB """
+    lines = ['{:<36} {:>8} {:>8} {:>9} {:>14} {:>14}'.format('stage', 'wall', 'cpu', 'peak MB', 'in', 'out')]
+    for row in frame.sort_values('wall', ascending=False).head(top).itertuples():
+        name = row.name if pd.isnull(row.parent) else '{}/{}'.format(row.parent, row.name)
+        peak = '' if pd.isnull(row.peak_mem) else '{:.1f}'.format(row.peak_mem / 2. ** 20)
+        shapes = ['' if pd.isnull(rows) else '{:.0f}x{:.0f}'.format(rows, cols)
+                  for rows, cols in [(row.rows_in, row.cols_in), (row.rows_out, row.cols_out)]]
+        lines.append('{:<36} {:>8.2f} {:>8.2f} {:>9} {:>14} {:>14}'.format(name, row.wall, row.cpu, peak, *shapes))
+    return '\n'.join(lines)
@@ -0,0 +1,257 @@
+""" plots of the chart and lab features for survivors and non-survivors.
+
+moved out of chart_events.py and lab_events.py so that importing the feature
+pipeline does not import matplotlib. import this module only to plot. these draw one
+interactive pyplot figure at a time, report.py writes the whole set to disk.
+"""
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as plt
+
+
+def plot_feature_density(dummy, col, save_flag):
+
+    x25 = dummy[col].dropna().quantile(0.25)
+    x50 = dummy[col].dropna().quantile(0.50)
+    x75 = dummy[col].dropna().quantile(0.75)
+    
+    plt.subplots(figsize=(10,6))
+    print("plotting feature {}".format(col))
+    dummy[dummy.hospital_expired_flag==1][col].dropna().plot.kde(
+            alpha=1.0,label='Non-survival')
+    dummy[dummy.hospital_expired_flag==0][col].dropna().plot.kde(
+            alpha=1.0,label='Survival')
+
+    plt.subplots_adjust(left = 0.1, bottom = 0.1, 
+                    right = 0.9, top = 0.9)
+
+
+
+    plt.axvline(x = x25, color='k', linestyle='-')
+    plt.text(x25+0.05,0.05,'Q1',rotation=0)
+    plt.axvline(x = x50, color = 'k', linestyle = '-')
+    plt.text(x50+0.05,0.05,'Q2',rotation=0)
+    plt.axvline(x = x75, color = 'k', linestyle = '-')
+    plt.text(x75+0.05,0.05,'Q3 ',rotation=0)
+
+    plt.title('Mean Temperature Measurement Distributions for Survivors and Non-Survivors ')
+    plt.xlabel(col)
+    plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
+    if save_flag:
+        save_file_name = "../figures/" + col + "_" + "plot.png"
+        print("saving {}".format(save_file_name))
+        plt.savefig(save_file_name)
+    plt.show()
+    plt.close()
+
+
+def plot_categorical_features(cat_dict, save_flag):
+    for col in cat_dict.keys():
+        col2 = cat_dict[col].columns[0]
+        #print col
+        #print col2
+        vals = list(cat_dict[col][col2].unique())
+        #display(vals)
+        total = cat_dict[col].groupby(col2)[col2].count()
+   
+        dead = cat_dict[col][cat_dict[col].hospital_expired_flag == 1].groupby(col2)[col2].count()
+        dead.name = 'Survivors'
+        dead_percent = 100.00*(dead / total)
+        live = cat_dict[col][cat_dict[col].hospital_expired_flag == 0].groupby(col2)[col2].count()
+        live.name = 'Non_Survivors'
+        live_percent = 100.00*(live / total)
+        monkey = pd.concat([live_percent, dead_percent], axis = 1)
+
+        #display(monkey)
+        plt.subplots(figsize=(10,6))
+        print("plotting feature {}".format(col))
+        monkey.plot.bar(stacked = True, figsize = (10,6), edgecolor = 'black', linewidth = 3, 
+                                    alpha = 0.5, title = "Survival Rate for " + col)
+        
+        plt.subplots_adjust(left = 0.1, bottom = 0.3, 
+                    right = 0.9, top = 0.9)    
+        plt.xticks(rotation = 15, ha = 'right')  
+                          
+        if save_flag:
+            save_file_name = "../figures/" + col + "_" + col2 + "_" + "plot.png"
+            print("saving {}".format(save_file_name))
+            plt.savefig(save_file_name)
+        plt.close('all')
+
+
+def plot_continuous_features(frame, save_flag):
+    # PLOT MEAN DISTRIBUTION
+    for col in frame.keys():
+        dummy = frame[col]
+        col2 = dummy.columns[0]
+       
+        plt.subplots(figsize=(10,6))
+        print("plotting feature {}".format(col))
+        dummy[col2][dummy.hospital_expired_flag==1].dropna().plot.kde(
+            alpha=1.0,label='Non-survival')
+        dummy[col2][dummy.hospital_expired_flag==0].dropna().plot.kde(
+            alpha=1.0,label='Survival')
+
+            # add title, labels etc.
+        plt.subplots_adjust(left = 0.1, bottom = 0.1, 
+                    right = 0.9, top = 0.9) 
+        plt.title('{} measurement on ICU admission '.format(col) +
+                    'vs ICU mortality \n')
+        plt.xlabel(col)
+        plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
+        
+        if save_flag:
+            save_file_name = "../figures/" + col + "_" + "plot.png"
+            print("saving {}".format(save_file_name))
+            plt.savefig(save_file_name)
+        plt.close()
+        
+    
+    print("complete")
+
+
+def plot_constant_features(const_dict, save_flag):
+
+    # PLOTTING CONSTANT VALUES LIKE HEIGHT AND WEIGHT
+    for col in const_dict.keys():
+
+        col2 = const_dict[col].columns[0]
+        vals = list(const_dict[col][col2].unique())
+
+        gender = ['M', 'F'] 
+
+        for gend in gender:
+    
+            print(gend)
+            dead = const_dict[col][(const_dict[col].hospital_expired_flag == 1)&
+                                  (const_dict[col].gender == gend)]
+                              #&(const_dict[col][col2] >20)]
+            dead.name = 'Non_Survivors'
+            live = const_dict[col][(const_dict[col].hospital_expired_flag == 0)&
+                                  (const_dict[col].gender == gend)]
+                              #&(const_dict[col][col2] >20)]
+            live.name = 'Survivors'
+
+
+            #display(dummy.head())
+        
+            maxx = 0.99
+            minn = 0.01
+
+            live_max = live[col2].quantile(maxx)
+            live_min = live[col2].quantile(minn)
+            dead_max = dead[col2].quantile(maxx)
+            dead_min = dead[col2].quantile(minn)
+            maxlim = max(live_max, dead_max)
+            minlim = min(live_min, dead_min)
+
+
+            plt.subplots(figsize=(10,6))
+    
+       
+            live[(live[col2] < live_max) & (live[col2] > live_min)][col2].plot.hist(bins = 100, 
+                                                                                alpha=0.3,label='Survivors')
+
+            dead[(dead[col2] < dead_max) & (dead[col2] > dead_min)][col2].plot.hist(bins = 100, 
+                                                                                alpha=1.0,label='Non-Survivors')
+            # add title, labels etc.
+            plt.subplots_adjust(left = 0.1, bottom = 0.1, 
+                    right = 0.9, top = 0.9) 
+                
+            plt.title('{} measurement on ICU admission'.format(col) + 
+                       'vs ICU mortality by gender = {}\n'.format(gend))
+            plt.xlabel(col)
+            plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
+
+
+            print("{}    {}".format(maxlim, minlim))
+            plt.xlim(minlim, maxlim)
+        
+            if save_flag:
+                save_file_name = "../figures/" + col + "_" + gend + "_" + "plot.png"
+                print("saving {}".format(save_file_name))
+                plt.savefig(save_file_name)
+            plt.close()
+
+
+# code for displaying affinity maps. not essential but including. 
+# 
+def affinity_maps(num_samps_df):
+    missing = num_samps_df.copy()
+
+    for col in missing.columns:
+            missing[col] = missing[col].apply(lambda x: 1 if pd.isnull(x) else 0)
+        
+
+    missing = missing.sort_values(by ='Oxygen Saturation', axis = 0, ascending = True)
+    #plt.rc('font', size=15)   
+    #plt.figure(figsize= (5,8))
+    plt.xticks(np.arange(0.5, len(missing.columns), 1), missing.columns)
+    plt.xticks(rotation = 30, ha = 'right')
+    plt.margins(0.0)
+    plt.subplots_adjust(bottom = 0.25)
+    print("plotting colormap")
+    plt.pcolor(missing)
+    #ax.set_ylim([0.0,missing.shape[0]])
+    plt.savefig("affinity_plot.png")
+    plt.show()
+    
+    plt.close()
+
+
+def plot_features(dummy):
+    
+    for col in dummy.keys():
+    
+        col2 = dummy[col].columns[0]
+    
+    
+        gender = ['M', 'F'] 
+    
+        for gend in gender:
+        
+            #print gend
+            dead = dummy[col][(dummy[col].hospital_expire_flag == 1)&
+                                  (dummy[col].gender == gend)]
+                              #&(const_dict[col][col2] >20)]
+            dead.name = 'Non_Survivors'
+            live = dummy[col][(dummy[col].hospital_expire_flag == 0)&
+                                  (dummy[col].gender == gend)]
+                              #&(const_dict[col][col2] >20)]
+            live.name = 'Survivors'
+    
+    
+            maxx = 0.99
+            minn = 0.01
+    
+            live_max = live[col2].dropna().max()#quantile(0.999)
+            live_min = live[col2].dropna().min()#quantile(0.001)
+            dead_max = dead[col2].dropna().max()#quantile(0.999)
+            dead_min = dead[col2].dropna().min()#quantile(0.001)
+            maxlim = max(live_max, dead_max)
+            minlim = min(live_min, dead_min)
+        
+            
+            plt.subplots(figsize = (10,6))
+            live[(live[col2] < live_max) & (live[col2] > live_min)][col2].plot.kde(
+                                                                                alpha=1.0,label='Survival')
+            dead[(dead[col2] < dead_max) & (dead[col2] > dead_min)][col2].plot.kde(
+                                                                                alpha=1.0,label='Non-Survivors')
+            
+            
+            plt.subplots_adjust(left = 0.1, bottom = 0.1, 
+                    right = 0.9, top = 0.9)
+            plt.xlim(minlim, maxlim)
+            plt.title('{} measurement on ICU admission'.format(col) + 
+                       'vs ICU mortality by gender = {}\n'.format(gend))
+            plt.xlabel(col)
+
+            
+            
+            # add title, labels etc.
+           
+            plt.legend(loc="upper left", bbox_to_anchor=(0.75,0.75),fontsize=12)
+            save_file_name = "../figures/" + col + "_" + gend + "_" + "plot.png"
+            print("saving {}".format(save_file_name))
+            plt.savefig(save_file_name)
+            plt.close()
@@ -0,0 +1,121 @@
+""" survivor / non-survivor density plots of every feature, rendered in one batch.
+
+render_report takes the per label frames of the stats stages (a value column, the
+mortality flag and gender), estimates the densities of both groups with the binned
+KDE of density.py in this process and hands only the curves to a process pool, where
+each worker draws them on matplotlib Figure objects with the Agg canvas. nothing goes
+through pyplot, so no display is needed and no figure is left open.
+
+    python -m icu_mortality_prediction.src.main figures --jobs 8
+"""
+import math
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from . import density
+from ..utils import parallel
+
+
+# THE CHART STAGES SPELL THE FLAG hospital_expired_flag, THE LAB STAGES hospital_expire_flag
+FLAGS = ['hospital_expire_flag', 'hospital_expired_flag']
+
+GROUPS = [(0, 'Survival'), (1, 'Non-survival')]
+
+
+def flatten(nested, prefix=''):
+    """ name -> frame from dicts of frames nested to any depth, names joined with '/' """
+    frames = {}
+    for name, value in nested.items():
+        name = '{}/{}'.format(prefix, name) if prefix else str(name)
+        if isinstance(value, dict):
+            frames.update(flatten(value, name))
+        elif isinstance(value, pd.DataFrame):
+            frames[name] = value
+    return frames
+
+
+def file_name(name, suffix=''):
+    """ a file name for a feature name, without the characters paths cannot hold """
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') + suffix
+
+
+def _flag(frame):
+    for flag in FLAGS:
+        if flag in frame.columns:
+            return flag
+    return None
+
+
+def feature_plots(name, frame, by_gender=True, n_bins=512):
+    """ plot specs of one feature frame, one for all stays and one per gender if by_gender.
+
+    frames without a numeric value column or a mortality flag give no plots.
+    """
+    flag = _flag(frame)
+    column = frame.columns[0]
+    if flag is None or column == flag or not pd.api.types.is_numeric_dtype(frame[column]):
+        return []
+    subsets = [('', frame)]
+    if by_gender and 'gender' in frame.columns:
+        subsets += [(gender, frame[frame['gender'] == gender]) for gender in sorted(frame['gender'].dropna().unique())]
+    plots = []
+    for gender, subset in subsets:
+        values = subset[column].to_numpy(dtype=float)
+        outcome = subset[flag].to_numpy()
+        grid, curves = density.shared_densities(
+            dict((label, values[outcome == group]) for group, label in GROUPS), n_bins=n_bins)
+        finite = values[np.isfinite(values)]
+        if len(finite) < 2:
+            continue
+        title = '{} measurement on ICU admission vs ICU mortality'.format(name)
+        if gender:
+            title += ' by gender = {}'.format(gender)
+        plots.append({'name': name + ('_' + gender if gender else ''), 'title': title, 'xlabel': column,
+                      'grid': grid, 'curves': curves, 'quartiles': np.percentile(finite, [25, 50, 75])})
+    return plots
+
+
+def render_plot(task):
+    """ draw one plot spec to path with the Agg canvas, returns the path """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    plot, path, dpi = task
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    for label, curve in plot['curves'].items():
+        axes.plot(plot['grid'], curve, label=label)
+    for quartile, value in zip(['Q1', 'Q2', 'Q3'], plot['quartiles']):
+        axes.axvline(x=value, color='k', linestyle='-', linewidth=.8)
+        axes.text(value, 0, ' ' + quartile, va='bottom')
+    axes.set_title(plot['title'])
+    axes.set_xlabel(plot['xlabel'])
+    axes.set_ylabel('Density')
+    axes.legend(loc='upper right', fontsize=12)
+    figure.subplots_adjust(left=.1, bottom=.1, right=.9, top=.9)
+    figure.savefig(path, dpi=dpi)
+    return path
+
+
+def render_report(frames, root, n_jobs=-1, by_gender=True, n_bins=512, dpi=80, fmt='png'):
+    """ write the density plot of every feature, and per gender if by_gender, to root.
+
+    :param frames: name -> frame, or dicts of them nested as the stats stages return them
+    :param root: output directory, created if missing
+    :param n_jobs: rendering processes, -1 for one per core
+    :return: list of the written paths
+    """
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    tasks = []
+    for name, frame in sorted(flatten(frames).items()):
+        for plot in feature_plots(name, frame, by_gender, n_bins):
+            tasks.append((plot, os.path.join(root, file_name(plot['name'], '.' + fmt)), dpi))
+    jobs = parallel.resolve_jobs(n_jobs)
+    # A FEW CHUNKS PER WORKER KEEPS THEM BUSY WITHOUT A ROUND TRIP PER FIGURE
+    chunksize = max(1, int(math.ceil(len(tasks) / (4. * jobs))))
+    paths = parallel.run_tasks(render_plot, tasks, n_jobs=jobs, chunksize=chunksize)
+    print("wrote {} figures to {}".format(len(paths), root))
+    return paths
@@ -39,6 +39,9 @@ config = {
 					#  'PyYAML'],
 	'packages': find_packages(),
 	'scripts': [],
+	'entry_points': {
+				'console_scripts': ['icu-mortality = icu_mortality_prediction.src.main:main']
+	},
 	'extras_require':  {
 				'testing': tests_require
 	},